@@ -37,6 +37,11 @@ DIRECTOR_REPO_DIR = os.path.join(uptane.WORKING_DIR, DIRECTOR_REPO_NAME)
 DIRECTOR_SERVER_HOST = '0.0.0.0' #'localhost'
 DIRECTOR_SERVER_PORT = 30501
 
+# The Director's signing server (demo_signer.py), which holds the Director's
+# private keys when the demo Director is run with use_signing_server=True.
+DIRECTOR_SIGNER_HOST = 'localhost'
+DIRECTOR_SIGNER_PORT = 30901
+
 # These two are are being added solely to provide an interface to the demo web
 # frontend.
 MAIN_REPO_SERVICE_HOST = 'localhost'
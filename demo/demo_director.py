@@ -30,7 +30,7 @@ demo_director.kill_server()
   XMLRPC interface presented TO THE DEMO WEBSITE:
     add_new_vehicle(vin)
     add_target_to_director(target_filepath, filepath_in_repo, vin, ecu_serial) <--- assign to vehicle
-    write_director_repo() <--- move staged to live / add newly added targets to live repo
+    write_director_repo() <--- publish metadata for vehicles whose targets changed
     get_last_vehicle_manifest(vin)
     get_last_ecu_manifest(ecu_serial)
     register_ecu_serial(ecu_serial, ecu_key, vin, is_primary=False)
@@ -44,6 +44,10 @@ import demo
 import uptane
 import uptane.services.director as director
 import uptane.services.inventorydb as inventory
+import uptane.services.inventory_backends as inventory_backends
+import uptane.services.vehicle_metadata as vehicle_metadata
+import uptane.services.signing as signing
+import uptane.services.manifest_ingestion as manifest_ingestion
 import tuf.formats
 
 import uptane.encoding.asn1_codec as asn1_codec
@@ -67,11 +71,29 @@ KNOWN_VINS = ['111', '112', '113']
 repo_server_process = None
 director_service_instance = None
 director_service_thread = None
+metadata_refresher = None
+manifest_ingestion_queue = None
 
 
-def clean_slate(use_new_keys=False):
+def clean_slate(
+    use_new_keys=False, inventory_db_fname=None, use_signing_server=False):
+  """
+  Sets up a fresh demo Director. If inventory_db_fname is given, the
+  Director's inventory (ECU registrations and received manifests) is stored
+  persistently in a SQLite database at that path instead of in memory.
+
+  If use_signing_server is True, the Director does not load its private keys;
+  it has the signing server run by demo_signer.py (which must already be
+  running) sign its metadata instead.
+  """
 
   global director_service_instance
+  global metadata_refresher
+  global manifest_ingestion_queue
+
+  if inventory_db_fname is not None:
+    inventory.set_backend(
+        inventory_backends.SQLiteInventoryBackend(inventory_db_fname))
 
 
   director_dir = os.path.join(uptane.WORKING_DIR, 'director')
@@ -92,13 +114,25 @@ def clean_slate(use_new_keys=False):
 
 
   key_dirroot_pub = demo.import_public_key('directorroot')
-  key_dirroot_pri = demo.import_private_key('directorroot')
   key_dirtime_pub = demo.import_public_key('directortimestamp')
-  key_dirtime_pri = demo.import_private_key('directortimestamp')
   key_dirsnap_pub = demo.import_public_key('directorsnapshot')
-  key_dirsnap_pri = demo.import_private_key('directorsnapshot')
   key_dirtarg_pub = demo.import_public_key('director')
-  key_dirtarg_pri = demo.import_private_key('director')
+
+  if use_signing_server:
+    # The signing server holds the private keys.
+    signer = signing.RemoteSigner('http://' + demo.DIRECTOR_SIGNER_HOST + ':' +
+        str(demo.DIRECTOR_SIGNER_PORT))
+    key_dirroot_pri = key_dirroot_pub
+    key_dirtime_pri = key_dirtime_pub
+    key_dirsnap_pri = key_dirsnap_pub
+    key_dirtarg_pri = key_dirtarg_pub
+
+  else:
+    signer = None
+    key_dirroot_pri = demo.import_private_key('directorroot')
+    key_dirtime_pri = demo.import_private_key('directortimestamp')
+    key_dirsnap_pri = demo.import_private_key('directorsnapshot')
+    key_dirtarg_pri = demo.import_private_key('director')
 
 
   # Create the demo Director instance.
@@ -111,7 +145,8 @@ def clean_slate(use_new_keys=False):
       key_snapshot_pri=key_dirsnap_pri,
       key_snapshot_pub=key_dirsnap_pub,
       key_targets_pri=key_dirtarg_pri,
-      key_targets_pub=key_dirtarg_pub)
+      key_targets_pub=key_dirtarg_pub,
+      signer=signer)
 
   for vin in KNOWN_VINS:
     director_service_instance.add_new_vehicle(vin)
@@ -128,8 +163,8 @@ def clean_slate(use_new_keys=False):
   # Director starts off with. (Currently 3)
   # This copies the file to each repository's targets directory from the
   # main repository.
-  for vin in inventory.ecus_by_vin:
-    for ecu in inventory.ecus_by_vin[vin]:
+  for vin in inventory.get_registered_vins():
+    for ecu in inventory.get_ecu_serials_in_vehicle(vin):
       add_target_to_director(
           os.path.join(demo.MAIN_REPO_TARGETS_DIR, 'infotainment_firmware.txt'),
           'infotainment_firmware.txt',
@@ -138,6 +173,21 @@ def clean_slate(use_new_keys=False):
 
   write_to_live()
 
+  # Re-sign each vehicle's timestamp metadata shortly before it expires.
+  if metadata_refresher is not None:
+    metadata_refresher.stop()
+  metadata_refresher = vehicle_metadata.MetadataRefresher(
+      director_service_instance.vehicle_metadata)
+  metadata_refresher.start()
+
+  # Vehicle Manifests submitted are queued and validated in the background,
+  # so that one slow submission does not hold up the others.
+  if manifest_ingestion_queue is not None:
+    manifest_ingestion_queue.stop()
+  manifest_ingestion_queue = manifest_ingestion.ManifestIngestionQueue(
+      director_service_instance)
+  manifest_ingestion_queue.start()
+
   host()
 
   listen()
@@ -147,48 +197,24 @@ def clean_slate(use_new_keys=False):
 
 
 def write_to_live(vin_to_update=None):
-  # Release updated metadata.
+  """
+  Release updated metadata: for each vehicle whose Director metadata has
+  changed since it was last released (or just the vehicle with VIN
+  vin_to_update, if given), write new metadata and atomically switch the
+  live metadata directory to it. Vehicles whose metadata has not changed are
+  not touched. See uptane.services.vehicle_metadata.
+  """
 
   global director_service_instance
 
-  # For each vehicle repository:
-  #   - write metadata.staged
-  #   - copy metadata.staged to the live metadata directory
-  for vin in director_service_instance.vehicle_repositories:
-    if vin_to_update is not None and vin != vin_to_update:
-      continue
-    repo = director_service_instance.vehicle_repositories[vin]
-    repo_dir = repo._repository_directory
-
-    repo.mark_dirty(['timestamp', 'snapshot'])
-    repo.write() # will be writeall() in most recent TUF branch
+  generator = director_service_instance.vehicle_metadata
 
-    assert(os.path.exists(os.path.join(repo_dir, 'metadata.staged'))), \
-        'Programming error: a repository write just occurred; why is ' + \
-        'there no metadata.staged directory where it is expected?'
+  if vin_to_update is not None:
+    generator.publish_metadata(vin_to_update)
 
-    # This shouldn't exist, but just in case something was interrupted,
-    # warn and remove it.
-    if os.path.exists(os.path.join(repo_dir, 'metadata.livetemp')):
-      print(YELLOW + 'Warning: metadata.livetemp existed already. '
-          'Some previous process was interrupted, or there is a programming '
-          'error.' + ENDCOLORS)
-      shutil.rmtree(os.path.join(repo_dir, 'metadata.livetemp'))
-
-    # Copy the staged metadata to a temp directory we'll move into place
-    # atomically in a moment.
-    shutil.copytree(
-        os.path.join(repo_dir, 'metadata.staged'),
-        os.path.join(repo_dir, 'metadata.livetemp'))
-
-    # Empty the existing (old) live metadata directory (relatively fast).
-    if os.path.exists(os.path.join(repo_dir, 'metadata')):
-      shutil.rmtree(os.path.join(repo_dir, 'metadata'))
+  else:
+    generator.publish()
 
-    # Atomically move the new metadata into place.
-    os.rename(
-        os.path.join(repo_dir, 'metadata.livetemp'),
-        os.path.join(repo_dir, 'metadata'))
 
 
 
@@ -223,19 +249,14 @@ def revoke_and_add_new_keys_and_write_to_live():
   demo.generate_key('director')
   new_targets_public_key = demo.import_public_key('director')
   new_targets_private_key = demo.import_private_key('director')
-  old_targets_public_key = director_service_instance.key_dirtarg_pub
 
   demo.generate_key('directortimestamp')
   new_timestamp_public_key = demo.import_public_key('directortimestamp')
   new_timestamp_private_key = demo.import_private_key('directortimestamp')
-  old_timestamp_public_key = director_service_instance.key_dirtime_pub
-  old_timestamp_private_key = director_service_instance.key_dirtime_pri
 
   demo.generate_key('directorsnapshot')
   new_snapshot_public_key = demo.import_public_key('directorsnapshot')
   new_snapshot_private_key = demo.import_private_key('directorsnapshot')
-  old_snapshot_public_key = director_service_instance.key_dirsnap_pub
-  old_snapshot_private_key = director_service_instance.key_dirsnap_pri
 
   # Set the new public and private Targets keys in the director service.
   # These keys are shared between all vehicle repositories.
@@ -246,28 +267,18 @@ def revoke_and_add_new_keys_and_write_to_live():
   director_service_instance.key_dirsnap_pub = new_snapshot_public_key
   director_service_instance.key_dirsnap_pri = new_snapshot_private_key
 
-  for vin in director_service_instance.vehicle_repositories:
-    repository = director_service_instance.vehicle_repositories[vin]
-
-    # Swap verification keys for the three roles.
-    repository.targets.remove_verification_key(old_targets_public_key)
-    repository.targets.add_verification_key(new_targets_public_key)
-
-    repository.timestamp.remove_verification_key(old_timestamp_public_key)
-    repository.timestamp.add_verification_key(new_timestamp_public_key)
-
-    repository.snapshot.remove_verification_key(old_snapshot_public_key)
-    repository.snapshot.add_verification_key(new_snapshot_public_key)
-
-    # Load the new signing keys to write metadata. The root key is unchanged,
-    # and in the demo it is already loaded.
-    repository.targets.load_signing_key(new_targets_private_key)
-    repository.snapshot.load_signing_key(new_snapshot_private_key)
-    repository.timestamp.load_signing_key(new_timestamp_private_key)
-
-    # Write all the metadata changes to disk.  Note: write() will be writeall()
-    # in the latest version of the TUF codebase.
-    repository.write()
+  # Swap the keys for the three roles. All vehicles share these keys and the
+  # root metadata listing them, so this is done once. The root key is
+  # unchanged, and signs the new root metadata.
+  generator = director_service_instance.vehicle_metadata
+  generator.set_role_keys({
+      'targets': (new_targets_public_key, new_targets_private_key),
+      'timestamp': (new_timestamp_public_key, new_timestamp_private_key),
+      'snapshot': (new_snapshot_public_key, new_snapshot_private_key)})
+
+  # Write all the metadata changes to disk and make them live. Replacing the
+  # keys marks every vehicle's metadata as changed.
+  write_to_live()
 
 
 
@@ -308,19 +319,25 @@ def add_target_to_director(target_fname, filepath_in_repo, vin, ecu_serial):
   tuf.formats.RELPATH_SCHEMA.check_match(target_fname)
   tuf.formats.RELPATH_SCHEMA.check_match(filepath_in_repo)
 
-  if vin not in director_service_instance.vehicle_repositories:
-    raise uptane.UnknownVehicle('The VIN provided, ' + repr(vin) + ' is not '
-        'that of a vehicle known to this Director.')
-
-  repo = director_service_instance.vehicle_repositories[vin]
-  repo_dir = repo._repository_directory
+  # Raises uptane.UnknownVehicle if the vehicle is not known.
+  repo_dir = director_service_instance.vehicle_metadata.get_vehicle_directory(
+      vin)
 
   print('Copying target file into place.')
   destination_filepath = os.path.join(repo_dir, 'targets', filepath_in_repo)
 
-  # TODO: This should probably place the file into a common targets directory
-  # that is then softlinked to all repositories.
-  shutil.copy(target_fname, destination_filepath)
+  # Hard-link the image into place where possible rather than copying it, so
+  # that assigning the same image to many vehicles does not copy it each
+  # time. Anything that alters a target file in a vehicle's repository, or the
+  # file it was linked from (e.g. in the Image Repository or the current
+  # working directory), must therefore replace the file rather than write to
+  # it in place.
+  if os.path.lexists(destination_filepath):
+    os.remove(destination_filepath)
+  try:
+    os.link(target_fname, destination_filepath)
+  except (OSError, AttributeError): # e.g. across filesystems, or on Windows
+    shutil.copy(target_fname, destination_filepath)
 
   print('Adding target ' + repr(target_fname) + ' for ECU ' + repr(ecu_serial))
 
@@ -406,9 +423,17 @@ def register_vehicle_manifest_wrapper(
   XMLRPC has to wrap binary data in a Binary() object, and the raw data has to
   be extracted before it is passed to the underlying director.py (in the
   reference implementation), which doesn't know anything about XMLRPC.
+
+  The manifest is only queued here, to be validated and saved by the
+  ingestion queue's worker threads. Returns manifest_ingestion.ACCEPTED, or
+  manifest_ingestion.BUSY if the queue is full and the Primary should submit
+  again later.
   """
-  director_service_instance.register_vehicle_manifest(
-      vin, primary_ecu_serial, signed_vehicle_manifest.data)
+  if tuf.conf.METADATA_FORMAT == 'der':
+    signed_vehicle_manifest = signed_vehicle_manifest.data
+
+  return manifest_ingestion_queue.submit(
+      vin, primary_ecu_serial, signed_vehicle_manifest)
 
 
 
@@ -446,6 +471,9 @@ def listen():
   server.register_function(
       director_service_instance.register_ecu_serial, 'register_ecu_serial')
 
+  server.register_function(
+      manifest_ingestion_queue.get_stats, 'get_manifest_ingestion_stats')
+
 
   # Interface available for the demo website frontend.
   server.register_function(
@@ -521,6 +549,11 @@ def mitm_arbitrary_package_attack(vin, target_filepath):
     os.rename(image_repo_full_target_filepath,
         image_repo_backup_full_target_filepath)
 
+  # The image may be hard-linked into other repositories (see
+  # add_target_to_director()), so replace it rather than writing to it.
+  if os.path.exists(full_target_filepath):
+    os.remove(full_target_filepath)
+
   with open(full_target_filepath, 'w') as file_object:
     file_object.write('EVIL UPDATE: ARBITRARY PACKAGE ATTACK TO BE'
         ' DELIVERED FROM MITM (no keys compromised).')
@@ -665,7 +698,8 @@ def restore_timestamp(vin):
 
 
 def clear_vehicle_targets(vin):
-  director_service_instance.vehicle_repositories[vin].targets.clear_targets()
+  director_service_instance.vehicle_metadata.clear_targets(vin)
+  director_service_instance.manifest_analyzer.clear_assigned_images(vin)
 
 
 
@@ -681,6 +715,12 @@ def add_target_and_write_to_live(filename, file_content, vin, ecu_serial):
   # ideally be to a temporary destination.  The demo code will eventually
   # be modified to use temporary directories (which will cleaned up after
   # running the demo code).
+  # A previous version of the file may be hard-linked into vehicles'
+  # repositories (see add_target_to_director()), so replace it rather than
+  # writing to it.
+  if os.path.exists(filename):
+    os.remove(filename)
+
   with open(filename, 'w') as file_object:
     file_object.write(file_content)
 
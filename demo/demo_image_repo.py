@@ -305,6 +305,11 @@ def mitm_arbitrary_package_attack(target_filepath):
   if os.path.exists(full_target_filepath):
     shutil.copy(full_target_filepath, backup_target_filepath)
 
+  # The image may be hard-linked into the Director's vehicle repositories (see
+  # demo_director.add_target_to_director()), so replace it rather than writing
+  # to it, which would alter the Director's copies too.
+  os.remove(full_target_filepath)
+
   with open(full_target_filepath, 'w') as fobj:
     fobj.write('EVIL UPDATE: ARBITRARY PACKAGE ATTACK TO BE DELIVERED FROM '
         'MITM / bad mirror (no keys compromised).')
@@ -356,6 +361,12 @@ def add_target_and_write_to_live(filename, file_content):
   # ideally be to a temporary destination.  The demo code will eventually
   # be modified to use temporary directories (which will cleaned up after
   # running demo code).
+  # The file may also be hard-linked into the Director's vehicle repositories
+  # (see demo_director.add_target_to_director()), so replace it rather than
+  # writing to it.
+  if os.path.exists(filename):
+    os.remove(filename)
+
   with open(filename, 'w') as file_object:
     file_object.write(file_content)
 
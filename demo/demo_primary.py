@@ -23,6 +23,7 @@ import demo
 import uptane
 import uptane.common # for canonical key construction and signing
 import uptane.clients.primary as primary
+import uptane.clients.image_transfer as image_transfer
 import uptane.encoding.asn1_codec as asn1_codec
 from uptane import GREEN, RED, YELLOW, ENDCOLORS
 from demo.uptane_banners import *
@@ -397,11 +398,18 @@ def submit_vehicle_manifest_to_director(signed_vehicle_manifest=None):
 
   print("Submitting the Primary's manifest to the Director.")
 
-  server.submit_vehicle_manifest(
+  result = server.submit_vehicle_manifest(
       primary_ecu.vin,
       primary_ecu.ecu_serial,
       signed_vehicle_manifest)
 
+  if result == uptane.MANIFEST_BUSY:
+    # The Director's ingestion queue is full. The manifest will be submitted
+    # again in the next update cycle.
+    print(YELLOW + 'The Director is busy and did not accept the Vehicle '
+        'Manifest. Try again later.' + ENDCOLORS)
+    return
+
 
   print(GREEN + 'Submission of Vehicle Manifest complete.' + ENDCOLORS)
 
@@ -608,6 +616,86 @@ def get_image_for_ecu(ecu_serial):
 
 
 
+def _get_image_fnames_for_ecu(ecu_serial):
+  """
+  Returns the full filename of the image to distribute to the given ECU and
+  its filename relative to the targets directory, or raises uptane.Error if
+  there is none.
+  """
+  # Ensure serial is correct format & registered
+  primary_ecu._check_ecu_serial(ecu_serial)
+
+  image_fname = primary_ecu.get_image_fname_for_ecu(ecu_serial)
+
+  if image_fname is None or not os.path.exists(image_fname):
+    raise uptane.Error('ECU Serial ' + repr(ecu_serial) + ' requested an '
+        'image, but this Primary has no update for that ECU.')
+
+  relative_fname = os.path.relpath(
+      image_fname, os.path.join(primary_ecu.full_client_dir, 'targets'))
+
+  return image_fname, relative_fname
+
+
+
+
+
+def get_image_file_for_ecu(ecu_serial, image_request):
+  """
+  For full-verification Secondaries via XMLRPC that receive their image a
+  block at a time (see uptane.clients.image_transfer), rather than all at once
+  from get_image_for_ecu.
+
+  image_request is a DER-encoded ImageRequest for the image (its filename
+  relative to the targets directory), in xmlrpc.Binary format. If that is the
+  image to distribute to the given ECU, returns a DER-encoded ImageFile
+  describing it, in xmlrpc.Binary format. The blocks of the image can then be
+  retrieved with get_image_blocks_for_ecu.
+
+  <Exceptions>
+    uptane.Error, if there is no image for the ECU, or it is not the image
+    requested.
+  """
+  image_fname, relative_fname = _get_image_fnames_for_ecu(ecu_serial)
+
+  requested_fname = image_transfer.get_filename_from_image_request(
+      image_request.data)
+
+  if requested_fname != relative_fname:
+    raise uptane.Error('ECU Serial ' + repr(ecu_serial) + ' requested image ' +
+        repr(requested_fname) + ', but the image for that ECU is ' +
+        repr(relative_fname))
+
+  print('Distributing image to ECU ' + repr(ecu_serial) + ' in blocks.')
+
+  return xmlrpc_client.Binary(
+      image_transfer.get_image_file(image_fname, relative_fname))
+
+
+
+
+
+def get_image_blocks_for_ecu(ecu_serial, first_block_number, count):
+  """
+  Returns a list of up to count consecutive blocks (but no more than
+  image_transfer.MAX_BLOCKS_PER_REQUEST) of the image for the given ECU,
+  starting from first_block_number (numbered from 1), each a DER-encoded
+  ImageBlock in xmlrpc.Binary format. Only those blocks are read from disk.
+
+  <Exceptions>
+    uptane.Error, if there is no image for the ECU or it has no block
+    first_block_number.
+  """
+  image_fname, relative_fname = _get_image_fnames_for_ecu(ecu_serial)
+
+  return [xmlrpc_client.Binary(image_block) for image_block in
+      image_transfer.get_image_blocks(
+      image_fname, relative_fname, first_block_number, count)]
+
+
+
+
+
 def get_metadata_for_ecu(ecu_serial, force_partial_verification=False):
   """
   Send a zip archive of the most recent consistent set of the Primary's client
@@ -718,6 +806,56 @@ def get_metadata_for_ecu(ecu_serial, force_partial_verification=False):
 
 
 
+def get_metadata_bundle_for_ecu(
+    ecu_serial, held_bundle_id='', force_partial_verification=False):
+  """
+  As get_metadata_for_ecu, but identifying the metadata sent (the "bundle")
+  and sending it only if the requester doesn't already hold it.
+
+  held_bundle_id is the identifier of the bundle the requester last received
+  ('' if none). Returns a dictionary:
+    {'bundle_id': <identifier of the current bundle>,
+     'modified': <False if held_bundle_id is that identifier, else True>,
+     'data': <the bundle, as xmlrpc_client.Binary; only if modified>}
+
+  Secondaries on a CAN interface are sent the bundle via CAN, as by
+  get_metadata_for_ecu, unless they hold it; 'data' is then not included.
+
+  <Exceptions>
+    As for get_metadata_for_ecu.
+  """
+  # Ensure serial is correct format & registered
+  primary_ecu._check_ecu_serial(ecu_serial)
+
+  partial = force_partial_verification or \
+      (use_can_interface and ecu_serial in SECONDARY_ID_ENUM)
+
+  # Get the identifier before reading the file, so that it never identifies a
+  # bundle newer than the one sent. (See Primary.get_full_metadata_archive_id.)
+  if partial:
+    bundle_id = primary_ecu.get_partial_metadata_id()
+  else:
+    bundle_id = primary_ecu.get_full_metadata_archive_id()
+
+  if bundle_id is None:
+    raise uptane.Error('This Primary does not have a collection of metadata '
+        'to distribute to Secondaries.')
+
+  if held_bundle_id == bundle_id:
+    print('ECU ' + repr(ecu_serial) + ' already holds the current metadata.')
+    return {'bundle_id': bundle_id, 'modified': False}
+
+  data = get_metadata_for_ecu(ecu_serial, force_partial_verification)
+
+  if data is None: # Sent via CAN.
+    return {'bundle_id': bundle_id, 'modified': True}
+
+  return {'bundle_id': bundle_id, 'modified': True, 'data': data}
+
+
+
+
+
 def get_time_attestation_for_ecu(ecu_serial):
   """
   """
@@ -858,8 +996,18 @@ def listen():
   # Deployment Considerations document.
   server.register_function(get_image_for_ecu, 'get_image')
 
+  # Images may also be distributed a block at a time, so that neither the
+  # Primary nor the Secondary need hold a whole image in memory, and an
+  # interrupted transfer can be resumed.
+  server.register_function(get_image_file_for_ecu, 'get_image_file')
+  server.register_function(get_image_blocks_for_ecu, 'get_image_blocks')
+
   server.register_function(get_metadata_for_ecu, 'get_metadata')
 
+  # Secondaries polling for metadata they may already hold should use this
+  # instead, to avoid being sent the same metadata again.
+  server.register_function(get_metadata_bundle_for_ecu, 'get_metadata_bundle')
+
   # This again is for convenience in the demo. While I don't see an obvious
   # security issue, it should be considered whether or not checking such a bit
   # before trying to update foils reporting or otherwise creates a security
@@ -30,6 +30,7 @@ import demo
 import uptane
 import uptane.common # for canonical key construction and signing
 import uptane.clients.secondary as secondary
+import uptane.clients.image_transfer as image_transfer
 from uptane import GREEN, RED, YELLOW, ENDCOLORS
 from demo.uptane_banners import *
 import tuf.keys
@@ -60,6 +61,10 @@ nonce = None
 attacks_detected = ''
 
 most_recent_signed_ecu_manifest = None
+# The identifier of the metadata bundle last received from the Primary and
+# processed, or '' if none has been. Sent to the Primary so that it need not
+# send the same metadata again.
+metadata_bundle_id = ''
 
 
 def clean_slate(
@@ -80,6 +85,7 @@ def clean_slate(
   global nonce
   global client_directory
   global attacks_detected
+  global metadata_bundle_id
 
   _vin = vin
   _ecu_serial = ecu_serial
@@ -92,6 +98,7 @@ def clean_slate(
 
   client_directory = os.path.join(
       uptane.WORKING_DIR, CLIENT_DIRECTORY_PREFIX + demo.get_random_string(5))
+  metadata_bundle_id = ''
 
   # Load the public timeserver key.
   key_timeserver_pub = demo.import_public_key('timeserver')
@@ -272,6 +279,7 @@ def update_cycle():
   global secondary_ecu
   global current_firmware_fileinfo
   global attacks_detected
+  global metadata_bundle_id
 
   # Connect to the Primary
   pserver = xmlrpc_client.ServerProxy(
@@ -280,9 +288,11 @@ def update_cycle():
   # Download the time attestation from the Primary.
   time_attestation = pserver.get_last_timeserver_attestation()
 
-  # Download the metadata from the Primary in the form of an archive. This
-  # returns the binary data that we need to write to file.
-  metadata_archive = pserver.get_metadata(secondary_ecu.ecu_serial)
+  # Download the metadata from the Primary in the form of an archive, unless
+  # we already have the archive the Primary holds. If we don't, the reply
+  # includes the binary data that we need to write to file.
+  metadata_bundle = pserver.get_metadata_bundle(
+      secondary_ecu.ecu_serial, metadata_bundle_id)
 
   # Validate the time attestation and internalize the time. Continue
   # regardless.
@@ -304,12 +314,21 @@ def update_cycle():
   archive_fname = os.path.join(
       secondary_ecu.full_client_dir, 'metadata_archive.zip')
 
-  with open(archive_fname, 'wb') as fobj:
-    fobj.write(metadata_archive.data)
+  if metadata_bundle['modified']:
+    # Forget the previous bundle until this one has been validated.
+    metadata_bundle_id = ''
+    with open(archive_fname, 'wb') as fobj:
+      fobj.write(metadata_bundle['data'].data)
+
+  else:
+    print('Metadata from the Primary is unchanged; validating the archive '
+        'already held.')
 
   # Now tell the Secondary reference implementation code where the archive file
-  # is and let it expand and validate the metadata.
+  # is and let it expand and validate the metadata. (Even if the archive is
+  # unchanged, it is validated again, since metadata may have expired.)
   secondary_ecu.process_metadata(archive_fname)
+  metadata_bundle_id = metadata_bundle['bundle_id']
 
 
   # As part of the process_metadata call, the secondary will have saved
@@ -360,18 +379,24 @@ def update_cycle():
     submit_ecu_manifest_to_primary()
     return
 
-  # Download the image for this ECU from the Primary.
-  (image_fname, image) = pserver.get_image(secondary_ecu.ecu_serial)
+  # Download the image for this ECU from the Primary, block by block.
+  unverified_targets_dir = os.path.join(client_directory, 'unverified_targets')
+  if not os.path.exists(unverified_targets_dir):
+    os.mkdir(unverified_targets_dir)
 
-  if image is None:
+  try:
+    image_fname = download_image_from_primary(pserver, expected_image_fname,
+        expected_target_info, unverified_targets_dir)
+
+  except (xmlrpc_client.Fault, uptane.Error, tuf.FormatError) as e:
     print(YELLOW + 'Requested image from Primary but received none. Update '
-        'terminated.' + ENDCOLORS)
+        'terminated. Error: ' + type(e).__name__ + ': ' + str(e) + ENDCOLORS)
     attacks_detected += 'Requested image from Primary but received none.\n'
     generate_signed_ecu_manifest()
     submit_ecu_manifest_to_primary()
     return
 
-  elif not secondary_ecu.validated_targets_for_this_ecu:
+  if not secondary_ecu.validated_targets_for_this_ecu:
     print(RED + 'Requested and received image from Primary, but metadata '
         'indicates no valid targets from the Director intended for this ECU. '
         'Update terminated.' + ENDCOLORS)
@@ -397,13 +422,6 @@ def update_cycle():
     submit_ecu_manifest_to_primary()
     return
 
-  # Write the downloaded image binary data to disk.
-  unverified_targets_dir = os.path.join(client_directory, 'unverified_targets')
-  if not os.path.exists(unverified_targets_dir):
-    os.mkdir(unverified_targets_dir)
-  with open(os.path.join(unverified_targets_dir, image_fname), 'wb') as fobj:
-    fobj.write(image.data)
-
 
   # Validate the image against the metadata.
   try:
@@ -503,6 +521,62 @@ def update_cycle():
 
 
 
+def download_image_from_primary(
+    pserver, image_fname, expected_target_info, unverified_targets_dir):
+  """
+  Requests the image with the given filename from the Primary and receives it
+  a block at a time (see uptane.clients.image_transfer), so that memory use
+  does not grow with the size of the image. The image is written to
+  unverified_targets_dir under image_fname, which is returned. No more than
+  the length in expected_target_info is accepted.
+
+  If an earlier download of the same image (by the hashes in
+  expected_target_info) was interrupted, it is resumed from where it left
+  off. The image still has to be validated. If the Primary offers an image
+  with a filename other than the one requested, that filename is returned
+  without downloading the image.
+  """
+  image_file = pserver.get_image_file(secondary_ecu.ecu_serial,
+      xmlrpc_client.Binary(image_transfer.get_image_request(image_fname)))
+
+  # Check the filename before any partial file is created for it.
+  offered_fname = image_transfer.get_filename_from_image_file(image_file.data)
+  if offered_fname != image_fname:
+    return offered_fname
+
+  # Name the partial download after the image expected, so that only a
+  # download of the same image is resumed. No more data than the length in
+  # its metadata is accepted.
+  digest = sorted(expected_target_info['fileinfo']['hashes'].items())[0][1]
+  receiver = image_transfer.ImageReceiver(image_file.data, os.path.join(
+      unverified_targets_dir, image_fname.replace('/', '_') + '.' + digest +
+      '.part'), expected_target_info['fileinfo']['length'])
+
+  if receiver.next_block_number > 1:
+    print('Resuming download of image ' + repr(image_fname) + ' from block ' +
+        repr(receiver.next_block_number) + ' of ' +
+        repr(receiver.number_of_blocks))
+
+  while not receiver.is_complete():
+    image_blocks = pserver.get_image_blocks(secondary_ecu.ecu_serial,
+        receiver.next_block_number, image_transfer.MAX_BLOCKS_PER_REQUEST)
+    if not image_blocks:
+      raise uptane.Error('Primary sent no image blocks.')
+    for image_block in image_blocks:
+      receiver.receive_block(image_block.data)
+
+  full_image_fname = os.path.join(unverified_targets_dir, receiver.filename)
+  enforce_jail(receiver.filename, unverified_targets_dir)
+  if not os.path.exists(os.path.dirname(full_image_fname)):
+    os.makedirs(os.path.dirname(full_image_fname))
+  receiver.finish(full_image_fname)
+
+  return receiver.filename
+
+
+
+
+
 def generate_signed_ecu_manifest():
 
   global secondary_ecu
@@ -0,0 +1,46 @@
+"""
+<Program Name>
+  demo_signer.py
+
+<Purpose>
+  Runs a stand-in signing daemon for the demo Director: a separate process
+  that holds the Director's private keys and signs metadata on the Director's
+  behalf over XML-RPC (see uptane.services.signing). With it running, the
+  demo Director can be started without its private keys:
+
+    import demo.demo_director as dd
+    dd.clean_slate(use_signing_server=True)
+
+  Use:
+    python demo_signer.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import demo
+import uptane.services.signing as signing
+
+
+
+
+
+def listen():
+  """
+  Listens on DIRECTOR_SIGNER_PORT for signing requests from the Director,
+  signing with the Director's root, timestamp, snapshot, and targets keys.
+  """
+  keys = [demo.import_private_key(keyname) for keyname in [
+      'directorroot', 'directortimestamp', 'directorsnapshot', 'director']]
+
+  print('Director signing server will now listen on port ' +
+      str(demo.DIRECTOR_SIGNER_PORT))
+  signing.SigningServer(keys).listen(
+      demo.DIRECTOR_SIGNER_HOST, demo.DIRECTOR_SIGNER_PORT)
+
+
+
+
+
+if __name__ == '__main__':
+  listen()
@@ -447,6 +447,56 @@ class TestASN1(unittest.TestCase):
 
 
 
+  def test_21_signed_der_slices(self):
+    """
+    The slices of received DER that signatures are checked over must be
+    identical to the only-signed encodings that the signatures were made over.
+    """
+    vehicle_manifest_der = asn1_codec.convert_signed_metadata_to_der(
+        SAMPLE_VEHICLE_MANIFEST_SIGNABLE, datatype='vehicle_manifest')
+
+    slices = asn1_codec.get_signed_der_slices(
+        vehicle_manifest_der, datatype='vehicle_manifest')
+
+    self.assertEqual(
+        asn1_codec.convert_signed_metadata_to_der(
+        SAMPLE_VEHICLE_MANIFEST_SIGNABLE, only_signed=True,
+        datatype='vehicle_manifest'),
+        slices['signed'].tobytes())
+
+    ecu_manifests = \
+        SAMPLE_VEHICLE_MANIFEST_SIGNABLE['signed']['ecu_version_manifests']
+    self.assertEqual(
+        sorted(ecu_manifests), sorted(slices['ecu_version_manifests']))
+
+    for ecu_serial in ecu_manifests:
+      self.assertEqual(len(ecu_manifests[ecu_serial]),
+          len(slices['ecu_version_manifests'][ecu_serial]))
+      for manifest, signed_der in zip(
+          ecu_manifests[ecu_serial], slices['ecu_version_manifests'][ecu_serial]):
+        self.assertEqual(
+            asn1_codec.convert_signed_metadata_to_der(
+            manifest, only_signed=True, datatype='ecu_manifest'),
+            signed_der.tobytes())
+
+    # A standalone ECU Manifest has only the 'signed' slice.
+    ecu_manifest_der = asn1_codec.convert_signed_metadata_to_der(
+        SAMPLE_ECU_MANIFEST_SIGNABLE, datatype='ecu_manifest')
+    self.assertEqual(
+        asn1_codec.convert_signed_metadata_to_der(
+        SAMPLE_ECU_MANIFEST_SIGNABLE, only_signed=True, datatype='ecu_manifest'),
+        asn1_codec.get_signed_der_slices(
+        ecu_manifest_der, datatype='ecu_manifest')['signed'].tobytes())
+
+    # Truncated DER is rejected.
+    with self.assertRaises(tuf.Error):
+      asn1_codec.get_signed_der_slices(
+          vehicle_manifest_der[:-5], datatype='vehicle_manifest')
+
+
+
+
+
 
 def conversion_tester(signable_pydict, datatype, cls): # cls: clunky
   """
@@ -0,0 +1,401 @@
+"""
+<Program Name>
+  test_director.py
+
+<Purpose>
+  Unit testing for uptane/services/director.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.common
+import uptane.services.director as director
+import uptane.services.inventorydb as inventory
+import uptane.services.inventory_backends as inventory_backends
+import tuf
+import tuf.conf
+
+import unittest
+import os
+import shutil
+import time
+import multiprocessing
+
+import demo # for import_public_key, import_private_key
+
+
+TEST_DATA_DIR = os.path.join(uptane.WORKING_DIR, 'tests', 'test_data')
+TEMP_DIRECTOR_DIR = os.path.join(TEST_DATA_DIR, 'temp_test_director')
+
+VIN = 'vin_director'
+PRIMARY_ECU_SERIAL = 'primary_director'
+SECONDARY_ECU_SERIAL = 'secondary_director'
+
+
+KEY_A = {
+    'keytype': 'ed25519',
+    'keyid': 'a' * 64,
+    'keyid_hash_algorithms': ['sha256', 'sha512'],
+    'keyval': {'public': '1' * 64}}
+
+KEY_B = {
+    'keytype': 'ed25519',
+    'keyid': 'b' * 64,
+    'keyid_hash_algorithms': ['sha256', 'sha512'],
+    'keyval': {'public': '2' * 64}}
+
+SIGNATURE = {'keyid': 'a' * 64, 'method': 'ed25519', 'sig': 'f' * 128}
+
+
+
+class TestSignatureVerificationCache(unittest.TestCase):
+
+  def test_01_keys(self):
+    make_key = director.SignatureVerificationCache.make_key
+
+    key = make_key(KEY_A, SIGNATURE, b'data')
+    self.assertEqual(key, make_key(dict(KEY_A), dict(SIGNATURE), b'data'))
+
+    # JSON metadata is keyed on its canonical encoding.
+    self.assertEqual(make_key(KEY_A, SIGNATURE, {'a': 1, 'b': 2}),
+        make_key(KEY_A, SIGNATURE, {'b': 2, 'a': 1}))
+
+    self.assertNotEqual(key, make_key(KEY_A, SIGNATURE, b'other data'))
+    self.assertNotEqual(key, make_key(KEY_A,
+        dict(SIGNATURE, sig='e' * 128), b'data'))
+
+    # The key is identified by its material, not by the keyid it claims.
+    self.assertNotEqual(key, make_key(dict(KEY_B, keyid=KEY_A['keyid']),
+        SIGNATURE, b'data'))
+    self.assertEqual(key, make_key(dict(KEY_A, keyid=KEY_B['keyid']),
+        SIGNATURE, b'data'))
+
+
+
+
+
+  def test_05_hits_misses_and_eviction(self):
+    with self.assertRaises(tuf.FormatError):
+      director.SignatureVerificationCache(max_entries=-1)
+
+    cache = director.SignatureVerificationCache(max_entries=2)
+    make_key = cache.make_key
+    keys = [make_key(KEY_A, SIGNATURE, data) for data in [b'1', b'2', b'3']]
+
+    self.assertIsNone(cache.get(keys[0]))
+    cache.put(keys[0], True)
+    cache.put(keys[1], False)
+
+    # Invalid results are cached as well as valid ones.
+    self.assertIs(True, cache.get(keys[0]))
+    self.assertIs(False, cache.get(keys[1]))
+    self.assertEqual({'hits': 2, 'misses': 1, 'entries': 2, 'max_entries': 2},
+        cache.stats())
+
+    # Using keys[0] after keys[1] leaves keys[1] the least recently used, so
+    # it is evicted to make room.
+    cache.get(keys[1])
+    cache.get(keys[0])
+    cache.put(keys[2], True)
+    self.assertIsNone(cache.get(keys[1]))
+    self.assertIs(True, cache.get(keys[0]))
+    self.assertIs(True, cache.get(keys[2]))
+    self.assertEqual(2, cache.stats()['entries'])
+
+    # With no room, nothing is cached.
+    cache = director.SignatureVerificationCache(max_entries=0)
+    cache.put(keys[0], True)
+    self.assertIsNone(cache.get(keys[0]))
+    self.assertEqual(0, cache.stats()['entries'])
+
+
+
+
+
+def make_signed_ecu_manifest(ecu_serial, key, filepath='/firmware.img'):
+  """
+  Returns an ECU Manifest from the given ECU, reporting the given image
+  installed, signed with the given key.
+  """
+  clock = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+  return uptane.common.sign_signable({
+      'signed': {
+          'ecu_serial': ecu_serial,
+          'timeserver_time': clock,
+          'previous_timeserver_time': clock,
+          'attacks_detected': '',
+          'installed_image': {
+              'filepath': filepath,
+              'fileinfo': {'length': 10, 'hashes': {'sha256': '1' * 64}}}},
+      'signatures': []}, [key])
+
+
+
+
+
+def make_signed_vehicle_manifest(primary_ecu_serial, ecu_manifests, key,
+    vin=VIN):
+  """
+  Returns a Vehicle Manifest from the given Primary, holding the given ECU
+  Manifests (a dictionary mapping ECU Serials to lists of ECU Manifests),
+  signed with the given key.
+  """
+  return uptane.common.sign_signable({
+      'signed': {
+          'vin': vin,
+          'primary_ecu_serial': primary_ecu_serial,
+          'ecu_version_manifests': ecu_manifests},
+      'signatures': []}, [key])
+
+
+
+
+
+class TestDirector(unittest.TestCase):
+  """
+  Tests of manifest registration, against a Director with one vehicle, with
+  one Primary and one Secondary, using the demo keys and JSON metadata.
+  """
+
+  @classmethod
+  def setUpClass(cls):
+    cls.original_format = tuf.conf.METADATA_FORMAT
+    cls.original_backend = inventory.get_backend()
+    tuf.conf.METADATA_FORMAT = 'json'
+    inventory.set_backend(inventory_backends.MemoryInventoryBackend())
+
+    director_keys = []
+    for keyname in [
+        'directorroot', 'directortimestamp', 'directorsnapshot', 'director']:
+      director_keys.extend([demo.import_private_key(keyname),
+          demo.import_public_key(keyname)])
+
+    cls.primary_key = uptane.common.canonical_key_from_pub_and_pri(
+        demo.import_public_key('primary'), demo.import_private_key('primary'))
+    cls.secondary_key = uptane.common.canonical_key_from_pub_and_pri(
+        demo.import_public_key('secondary'),
+        demo.import_private_key('secondary'))
+
+    if os.path.exists(TEMP_DIRECTOR_DIR):
+      shutil.rmtree(TEMP_DIRECTOR_DIR)
+    os.makedirs(TEMP_DIRECTOR_DIR)
+
+    cls.director = director.Director(TEMP_DIRECTOR_DIR, *director_keys)
+
+    cls.director.add_new_vehicle(VIN)
+    cls.director.register_ecu_serial(PRIMARY_ECU_SERIAL,
+        uptane.common.public_key_from_canonical(cls.primary_key), VIN,
+        is_primary=True)
+    cls.director.register_ecu_serial(SECONDARY_ECU_SERIAL,
+        uptane.common.public_key_from_canonical(cls.secondary_key), VIN)
+
+
+
+
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.director.close()
+    tuf.conf.METADATA_FORMAT = cls.original_format
+    inventory.set_backend(cls.original_backend)
+    shutil.rmtree(TEMP_DIRECTOR_DIR)
+
+
+
+
+
+  def test_05_register_vehicle_manifests_batch(self):
+    ecu_manifest = make_signed_ecu_manifest(
+        SECONDARY_ECU_SERIAL, self.secondary_key, '/batch_firmware.img')
+    valid = make_signed_vehicle_manifest(PRIMARY_ECU_SERIAL,
+        {SECONDARY_ECU_SERIAL: [ecu_manifest]}, self.primary_key)
+
+    # Signed by the Secondary's key rather than the Primary's.
+    badly_signed = make_signed_vehicle_manifest(PRIMARY_ECU_SERIAL,
+        {SECONDARY_ECU_SERIAL: [ecu_manifest]}, self.secondary_key)
+
+    vehicle_manifests = [
+        (VIN, PRIMARY_ECU_SERIAL, valid),
+        (VIN, PRIMARY_ECU_SERIAL), # not a 3-tuple
+        (5, PRIMARY_ECU_SERIAL, valid), # malformed VIN
+        ('unknown_vin', PRIMARY_ECU_SERIAL, valid),
+        (VIN, 'unknown_primary', make_signed_vehicle_manifest(
+            'unknown_primary', {}, self.primary_key)),
+        (VIN, SECONDARY_ECU_SERIAL, valid), # not the Primary it names
+        (VIN, PRIMARY_ECU_SERIAL, {'signed': {}, 'signatures': []}),
+        (VIN, PRIMARY_ECU_SERIAL, badly_signed)]
+
+    results = self.director.register_vehicle_manifests_batch(
+        vehicle_manifests, processes=2)
+
+    # Each manifest's problem is reported in its place; the others are still
+    # registered.
+    self.assertEqual(len(vehicle_manifests), len(results))
+    self.assertIsNone(results[0])
+    self.assertIsInstance(results[1], ValueError)
+    self.assertIsInstance(results[2], tuf.FormatError)
+    self.assertIsInstance(results[3], uptane.UnknownVehicle)
+    self.assertIsInstance(results[4], uptane.UnknownECU)
+    self.assertIsInstance(results[5], uptane.Spoofing)
+    self.assertIsInstance(results[6], tuf.FormatError)
+    self.assertIsInstance(results[7], tuf.BadSignatureError)
+
+    self.assertEqual(valid, inventory.get_last_vehicle_manifest(VIN))
+    self.assertEqual(
+        ecu_manifest, inventory.get_last_ecu_manifest(SECONDARY_ECU_SERIAL))
+
+    # The pool started for the first batch is reused for the next.
+    self.assertEqual([2], list(self.director._batch_pools))
+    pool = self.director._batch_pools[2]
+    self.assertEqual([None], self.director.register_vehicle_manifests_batch(
+        [(VIN, PRIMARY_ECU_SERIAL, valid)], processes=2))
+    self.assertIs(pool, self.director._batch_pools[2])
+
+    # Nothing to validate.
+    self.assertEqual([], self.director.register_vehicle_manifests_batch([]))
+
+
+
+
+
+  def test_10_ecu_manifests_in_vehicle_manifest(self):
+    valid = make_signed_ecu_manifest(
+        SECONDARY_ECU_SERIAL, self.secondary_key, '/firmware_10.img')
+    badly_signed = make_signed_ecu_manifest(
+        SECONDARY_ECU_SERIAL, self.primary_key, '/badly_signed.img')
+    vehicle_manifest = make_signed_vehicle_manifest(PRIMARY_ECU_SERIAL, {
+        SECONDARY_ECU_SERIAL: [badly_signed, valid],
+        'unknown_ecu': [make_signed_ecu_manifest(
+            'unknown_ecu', self.secondary_key)],
+        # Listed under an ECU Serial other than its own
+        PRIMARY_ECU_SERIAL: [valid]}, self.primary_key)
+
+    # With signatures checked in this process, then by a pool of workers, the
+    # valid ECU Manifest is saved and the others discarded.
+    for verification_pool in [None, multiprocessing.Pool(2)]:
+      self.director.verification_pool = verification_pool
+      self.director.signature_cache = director.SignatureVerificationCache()
+      try:
+        self.director.register_vehicle_manifest(
+            VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)
+
+        self.assertEqual([valid],
+            inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL)[-1:])
+        self.assertNotIn(badly_signed,
+            inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+        self.assertEqual([], inventory.get_ecu_manifests(PRIMARY_ECU_SERIAL))
+
+        # The same Vehicle Manifest submitted again is checked against the
+        # cached results, with the same outcome.
+        stats = self.director.signature_cache.stats()
+        self.director.register_vehicle_manifest(
+            VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)
+        self.assertEqual(stats['misses'],
+            self.director.signature_cache.stats()['misses'])
+        self.assertEqual(stats['hits'] + 3,
+            self.director.signature_cache.stats()['hits'])
+        self.assertEqual([valid],
+            inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL)[-1:])
+        self.assertNotIn(badly_signed,
+            inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+
+      finally:
+        self.director.verification_pool = None
+        if verification_pool is not None:
+          verification_pool.close()
+          verification_pool.join()
+
+    # Once the Secondary is registered again with a new key, ECU Manifests
+    # signed with its old key are rejected, although they were accepted (and
+    # the result cached) before.
+    secondary2_key = uptane.common.canonical_key_from_pub_and_pri(
+        demo.import_public_key('secondary2'),
+        demo.import_private_key('secondary2'))
+    inventory.register_ecu(False, VIN, SECONDARY_ECU_SERIAL,
+        uptane.common.public_key_from_canonical(secondary2_key))
+
+    try:
+      self.director.register_vehicle_manifest(
+          VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)
+      self.assertEqual([], inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+
+      valid2 = make_signed_ecu_manifest(
+          SECONDARY_ECU_SERIAL, secondary2_key, '/firmware_10.img')
+      self.director.register_vehicle_manifest(VIN, PRIMARY_ECU_SERIAL,
+          make_signed_vehicle_manifest(PRIMARY_ECU_SERIAL,
+          {SECONDARY_ECU_SERIAL: [valid2]}, self.primary_key))
+      self.assertEqual(
+          [valid2], inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+
+    finally:
+      inventory.register_ecu(False, VIN, SECONDARY_ECU_SERIAL,
+          uptane.common.public_key_from_canonical(self.secondary_key))
+
+
+
+
+
+  def test_15_batch_signature_cache_and_key_change(self):
+    ecu_manifest = make_signed_ecu_manifest(
+        SECONDARY_ECU_SERIAL, self.secondary_key, '/firmware_15.img')
+    vehicle_manifest = make_signed_vehicle_manifest(PRIMARY_ECU_SERIAL,
+        {SECONDARY_ECU_SERIAL: [ecu_manifest]}, self.primary_key)
+
+    # Signatures checked for one batch are not checked again for the next.
+    self.director.signature_cache = director.SignatureVerificationCache()
+    self.assertEqual([None], self.director.register_vehicle_manifests_batch(
+        [(VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)], processes=2))
+    stats = self.director.signature_cache.stats()
+    self.assertEqual(2, stats['misses'])
+
+    self.assertEqual([None], self.director.register_vehicle_manifests_batch(
+        [(VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)], processes=2))
+    self.assertEqual(stats['misses'],
+        self.director.signature_cache.stats()['misses'])
+    self.assertEqual(stats['hits'] + 2,
+        self.director.signature_cache.stats()['hits'])
+    self.assertEqual([ecu_manifest, ecu_manifest],
+        inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL)[-2:])
+
+    # If the Secondary is registered again with a new key after its ECU
+    # Manifest's signature was checked against the old key, the ECU Manifest
+    # is validated again against the new key, and so discarded.
+    secondary2_key = uptane.common.canonical_key_from_pub_and_pri(
+        demo.import_public_key('secondary2'),
+        demo.import_private_key('secondary2'))
+    run_signature_checks = self.director._run_signature_checks
+
+    def run_signature_checks_then_register(*args):
+      run_signature_checks(*args)
+      inventory.register_ecu(False, VIN, SECONDARY_ECU_SERIAL,
+          uptane.common.public_key_from_canonical(secondary2_key))
+
+    self.director._run_signature_checks = run_signature_checks_then_register
+    try:
+      self.assertEqual([None], self.director.register_vehicle_manifests_batch(
+          [(VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)], processes=2))
+      self.assertEqual([], inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+      self.assertEqual(
+          vehicle_manifest, inventory.get_last_vehicle_manifest(VIN))
+
+      # Likewise for a single Vehicle Manifest.
+      inventory.register_ecu(False, VIN, SECONDARY_ECU_SERIAL,
+          uptane.common.public_key_from_canonical(self.secondary_key))
+      self.director.register_vehicle_manifest(
+          VIN, PRIMARY_ECU_SERIAL, vehicle_manifest)
+      self.assertEqual([], inventory.get_ecu_manifests(SECONDARY_ECU_SERIAL))
+
+    finally:
+      del self.director._run_signature_checks
+      inventory.register_ecu(False, VIN, SECONDARY_ECU_SERIAL,
+          uptane.common.public_key_from_canonical(self.secondary_key))
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,226 @@
+"""
+<Program Name>
+  test_fileinfo_cache.py
+
+<Purpose>
+  Unit testing for uptane/services/fileinfo_cache.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.services.fileinfo_cache as fileinfo_cache
+import tuf
+import tuf.conf
+import tuf.util
+
+import unittest
+import os
+import shutil
+import time
+
+
+TEST_DATA_DIR = os.path.join(uptane.WORKING_DIR, 'tests', 'test_data')
+TEMP_TEST_DIR = os.path.join(TEST_DATA_DIR, 'temp_test_fileinfo_cache')
+
+
+
+def destroy_temp_dir():
+  # Clean up anything that may currently exist in the temp test directory.
+  if os.path.exists(TEMP_TEST_DIR):
+    shutil.rmtree(TEMP_TEST_DIR)
+
+
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  destroy_temp_dir()
+  os.makedirs(TEMP_TEST_DIR)
+
+
+
+
+
+def tearDownModule():
+  """This is run once for the full module, after all tests."""
+  destroy_temp_dir()
+
+
+
+
+
+def write_file(fname, contents):
+  fname = os.path.join(TEMP_TEST_DIR, fname)
+  if os.path.exists(fname):
+    os.remove(fname)
+  with open(fname, 'wb') as fobj:
+    fobj.write(contents)
+  return fname
+
+
+
+
+
+class TestFileinfoCache(unittest.TestCase):
+
+  def setUp(self):
+    self.cache = fileinfo_cache.FileinfoCache()
+    self.hash_calls = 0
+
+    real_get_file_details = tuf.util.get_file_details
+
+    def counting_get_file_details(filepath, hash_algorithms):
+      self.hash_calls += 1
+      return real_get_file_details(filepath, hash_algorithms)
+
+    tuf.util.get_file_details = counting_get_file_details
+    self.addCleanup(setattr, tuf.util, 'get_file_details',
+        real_get_file_details)
+
+
+
+
+
+  def test_01_init(self):
+
+    with self.assertRaises(tuf.FormatError):
+      fileinfo_cache.FileinfoCache(max_entries=0)
+
+    with self.assertRaises(tuf.FormatError):
+      fileinfo_cache.FileinfoCache(max_entries='10')
+
+    with self.assertRaises(tuf.FormatError):
+      self.cache.get_fileinfo(5)
+
+    with self.assertRaises(tuf.Error):
+      self.cache.get_fileinfo(os.path.join(TEMP_TEST_DIR, 'nonexistent'))
+
+    with self.assertRaises(tuf.Error):
+      self.cache.get_fileinfo(TEMP_TEST_DIR)
+
+
+
+
+
+  def test_05_reuse(self):
+    fname = write_file('image1.img', b'firmware image 1')
+
+    fileinfo = self.cache.get_fileinfo(fname)
+    self.assertEqual(16, fileinfo['length'])
+    self.assertEqual(tuf.util.get_file_details(
+        fname, tuf.conf.REPOSITORY_HASH_ALGORITHMS)[1], fileinfo['hashes'])
+    self.assertEqual(set(tuf.conf.REPOSITORY_HASH_ALGORITHMS),
+        set(fileinfo['hashes']))
+    self.hash_calls = 0
+
+    # An unchanged file is not read again, whatever the form of its path.
+    for i in range(5):
+      self.assertIs(fileinfo, self.cache.get_fileinfo(fname))
+    self.assertIs(fileinfo, self.cache.get_fileinfo(os.path.join(
+        TEMP_TEST_DIR, '..', os.path.basename(TEMP_TEST_DIR), 'image1.img')))
+    self.assertEqual(0, self.hash_calls)
+    self.assertEqual(1, self.cache.misses)
+    self.assertEqual(6, self.cache.hits)
+
+    # Hard links to the same file share its fileinfo. Linking changes the
+    # file's ctime, so it is hashed once more.
+    if hasattr(os, 'link'):
+      link_fname = os.path.join(TEMP_TEST_DIR, 'image1_link.img')
+      os.link(fname, link_fname)
+      fileinfo = self.cache.get_fileinfo(link_fname)
+      self.assertIs(fileinfo, self.cache.get_fileinfo(fname))
+      self.assertIs(fileinfo, self.cache.get_fileinfo(link_fname))
+      self.assertEqual(1, self.hash_calls)
+
+
+
+
+
+  def test_10_invalidation(self):
+    fname = write_file('image2.img', b'firmware image 2')
+    fileinfo = self.cache.get_fileinfo(fname)
+
+    # Replacing the file (new inode, size) causes it to be hashed again.
+    fname = write_file('image2.img', b'firmware image 2, version 2')
+    new_fileinfo = self.cache.get_fileinfo(fname)
+    self.assertEqual(2, self.hash_calls)
+    self.assertEqual(27, new_fileinfo['length'])
+    self.assertNotEqual(fileinfo['hashes'], new_fileinfo['hashes'])
+
+    # So does modifying it in place (new mtime).
+    with open(fname, 'r+b') as fobj:
+      fobj.write(b'F')
+    os.utime(fname, (0, 12345))
+    modified_fileinfo = self.cache.get_fileinfo(fname)
+    self.assertNotEqual(new_fileinfo['hashes'], modified_fileinfo['hashes'])
+    self.assertEqual(3, self.hash_calls)
+
+    # And modifying it in place without changing its size, then setting its
+    # mtime back (which does not set back its ctime).
+    stat = os.stat(fname)
+    time.sleep(0.01)
+    with open(fname, 'r+b') as fobj:
+      fobj.write(b'G')
+    os.utime(fname, (stat.st_atime, stat.st_mtime))
+    new_fileinfo = self.cache.get_fileinfo(fname)
+    self.assertNotEqual(modified_fileinfo['hashes'], new_fileinfo['hashes'])
+    self.assertEqual(4, self.hash_calls)
+
+    # Even if a hard link to it is created at the same time.
+    if hasattr(os, 'link'):
+      stat = os.stat(fname)
+      time.sleep(0.01)
+      with open(fname, 'r+b') as fobj:
+        fobj.write(b'H')
+      os.link(fname, os.path.join(TEMP_TEST_DIR, 'image2_link.img'))
+      os.utime(fname, (stat.st_atime, stat.st_mtime))
+      self.assertNotEqual(new_fileinfo['hashes'],
+          self.cache.get_fileinfo(fname)['hashes'])
+      self.assertEqual(5, self.hash_calls)
+
+    # Adding a hash algorithm causes files to be hashed again.
+    original_algorithms = tuf.conf.REPOSITORY_HASH_ALGORITHMS
+    tuf.conf.REPOSITORY_HASH_ALGORITHMS = ['sha256', 'sha512']
+    hash_calls = self.hash_calls
+    try:
+      fileinfo = self.cache.get_fileinfo(fname)
+      self.assertEqual(set(['sha256', 'sha512']), set(fileinfo['hashes']))
+      self.assertEqual(hash_calls + 1, self.hash_calls)
+    finally:
+      tuf.conf.REPOSITORY_HASH_ALGORITHMS = original_algorithms
+
+
+
+
+
+  def test_15_max_entries(self):
+    cache = fileinfo_cache.FileinfoCache(max_entries=2)
+    fnames = [write_file('lru' + str(i) + '.img', b'image ' + str(i).encode())
+        for i in range(3)]
+
+    for fname in fnames:
+      cache.get_fileinfo(fname)
+    self.assertEqual(3, self.hash_calls)
+
+    # fnames[0] was dropped, fnames[2] was not.
+    cache.get_fileinfo(fnames[2])
+    self.assertEqual(3, self.hash_calls)
+    cache.get_fileinfo(fnames[0])
+    self.assertEqual(4, self.hash_calls)
+
+    cache.clear()
+    cache.get_fileinfo(fnames[2])
+    self.assertEqual(5, self.hash_calls)
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
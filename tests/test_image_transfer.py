@@ -0,0 +1,212 @@
+"""
+<Program Name>
+  test_image_transfer.py
+
+<Purpose>
+  Unit testing for uptane/clients/image_transfer.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.clients.image_transfer as image_transfer
+import tuf
+
+import unittest
+import os
+import shutil
+
+
+TEST_DATA_DIR = os.path.join(uptane.WORKING_DIR, 'tests', 'test_data')
+TEMP_TEST_DIR = os.path.join(TEST_DATA_DIR, 'temp_test_image_transfer')
+
+IMAGE_FNAME = os.path.join(TEMP_TEST_DIR, 'image.img')
+PARTIAL_FNAME = os.path.join(TEMP_TEST_DIR, 'image.img.part')
+RECEIVED_FNAME = os.path.join(TEMP_TEST_DIR, 'received.img')
+
+# Two full blocks and one short one.
+IMAGE = bytes(bytearray(range(256))) * 16 + b'tail'
+
+
+
+def destroy_temp_dir():
+  # Clean up anything that may currently exist in the temp test directory.
+  if os.path.exists(TEMP_TEST_DIR):
+    shutil.rmtree(TEMP_TEST_DIR)
+
+
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  destroy_temp_dir()
+  os.makedirs(TEMP_TEST_DIR)
+  with open(IMAGE_FNAME, 'wb') as fobj:
+    fobj.write(IMAGE)
+
+
+
+
+
+def tearDownModule():
+  """This is run once for the full module, after all tests."""
+  destroy_temp_dir()
+
+
+
+
+
+class TestImageTransfer(unittest.TestCase):
+
+  def tearDown(self):
+    for fname in [PARTIAL_FNAME, RECEIVED_FNAME]:
+      if os.path.exists(fname):
+        os.remove(fname)
+
+
+
+
+
+  def test_01_request_and_describe(self):
+    image_request = image_transfer.get_image_request('image.img')
+    self.assertEqual('image.img',
+        image_transfer.get_filename_from_image_request(image_request))
+
+    with self.assertRaises(tuf.FormatError):
+      image_transfer.get_filename_from_image_request(b'not DER')
+
+    with self.assertRaises(tuf.FormatError):
+      image_transfer.get_image_file(IMAGE_FNAME, 'image.img',
+          block_size=image_transfer.MAX_BLOCK_SIZE + 1)
+
+    image_file = image_transfer.get_image_file(IMAGE_FNAME, 'image.img')
+    self.assertEqual('image.img',
+        image_transfer.get_filename_from_image_file(image_file))
+    with self.assertRaises(tuf.FormatError):
+      image_transfer.get_filename_from_image_file(
+          image_transfer.get_image_request('image.img'))
+
+    receiver = image_transfer.ImageReceiver(
+        image_file, PARTIAL_FNAME, len(IMAGE))
+    self.assertEqual('image.img', receiver.filename)
+    self.assertEqual(3, receiver.number_of_blocks)
+    self.assertEqual(image_transfer.DEFAULT_BLOCK_SIZE, receiver.block_size)
+    self.assertEqual(1, receiver.next_block_number)
+    self.assertFalse(receiver.is_complete())
+
+    with self.assertRaises(uptane.Error):
+      image_transfer.get_image_block(IMAGE_FNAME, 'image.img', 0)
+    with self.assertRaises(uptane.Error):
+      image_transfer.get_image_block(IMAGE_FNAME, 'image.img', 4)
+
+
+
+
+
+  def test_05_transfer(self):
+    receiver = image_transfer.ImageReceiver(
+        image_transfer.get_image_file(IMAGE_FNAME, 'image.img'), PARTIAL_FNAME,
+        len(IMAGE))
+
+    # Blocks must arrive in order, for the right image.
+    with self.assertRaises(uptane.Error):
+      receiver.receive_block(
+          image_transfer.get_image_block(IMAGE_FNAME, 'image.img', 2))
+    with self.assertRaises(uptane.Error):
+      receiver.receive_block(
+          image_transfer.get_image_block(IMAGE_FNAME, 'other.img', 1))
+
+    blocks = image_transfer.get_image_blocks(IMAGE_FNAME, 'image.img', 1, 10)
+    self.assertEqual(3, len(blocks))
+
+    for block in blocks:
+      receiver.receive_block(block)
+
+    self.assertTrue(receiver.is_complete())
+    with self.assertRaises(uptane.Error):
+      receiver.receive_block(blocks[-1])
+    receiver.finish(RECEIVED_FNAME)
+
+    with open(RECEIVED_FNAME, 'rb') as fobj:
+      self.assertEqual(IMAGE, fobj.read())
+
+
+
+
+
+  def test_10_resume(self):
+    image_file = image_transfer.get_image_file(
+        IMAGE_FNAME, 'image.img', block_size=1024)
+
+    receiver = image_transfer.ImageReceiver(
+        image_file, PARTIAL_FNAME, len(IMAGE))
+    self.assertEqual(5, receiver.number_of_blocks)
+    for block in image_transfer.get_image_blocks(
+        IMAGE_FNAME, 'image.img', 1, 2, block_size=1024):
+      receiver.receive_block(block)
+
+    with self.assertRaises(uptane.Error):
+      receiver.finish(RECEIVED_FNAME)
+
+    # The transfer is interrupted partway through writing block 3.
+    with open(PARTIAL_FNAME, 'ab') as fobj:
+      fobj.write(b'\x00' * 100)
+
+    receiver = image_transfer.ImageReceiver(
+        image_file, PARTIAL_FNAME, len(IMAGE))
+    self.assertEqual(3, receiver.next_block_number)
+    self.assertEqual(2048, os.path.getsize(PARTIAL_FNAME))
+
+    while not receiver.is_complete():
+      receiver.receive_block(image_transfer.get_image_block(
+          IMAGE_FNAME, 'image.img', receiver.next_block_number, 1024))
+    receiver.finish(RECEIVED_FNAME)
+
+    with open(RECEIVED_FNAME, 'rb') as fobj:
+      self.assertEqual(IMAGE, fobj.read())
+
+
+
+
+
+  def test_15_expected_length(self):
+    image_file = image_transfer.get_image_file(IMAGE_FNAME, 'image.img')
+
+    # An ImageFile offering more (or fewer) blocks than the expected length
+    # calls for is refused before anything is written.
+    for expected_length in [2 * 2048, 2 * 2048 - 1, 4 * 2048 + 1, 0]:
+      with self.assertRaises(uptane.Error):
+        image_transfer.ImageReceiver(
+            image_file, PARTIAL_FNAME, expected_length)
+      self.assertFalse(os.path.exists(PARTIAL_FNAME))
+
+    # The number of blocks matches, but the last block holds more than the
+    # expected length allows.
+    receiver = image_transfer.ImageReceiver(
+        image_file, PARTIAL_FNAME, len(IMAGE) - 1)
+    blocks = image_transfer.get_image_blocks(IMAGE_FNAME, 'image.img', 1, 3)
+    receiver.receive_block(blocks[0])
+    receiver.receive_block(blocks[1])
+    with self.assertRaises(uptane.Error):
+      receiver.receive_block(blocks[2])
+    self.assertEqual(2 * 2048, os.path.getsize(PARTIAL_FNAME))
+
+    # A partial file longer than the expected length is cut back.
+    with open(PARTIAL_FNAME, 'ab') as fobj:
+      fobj.write(b'\x00' * 5000)
+    receiver = image_transfer.ImageReceiver(
+        image_file, PARTIAL_FNAME, len(IMAGE))
+    self.assertEqual(3, receiver.next_block_number)
+    self.assertEqual(2 * 2048, os.path.getsize(PARTIAL_FNAME))
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
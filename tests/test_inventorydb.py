@@ -0,0 +1,602 @@
+"""
+<Program Name>
+  test_inventorydb.py
+
+<Purpose>
+  Unit testing for uptane/services/inventorydb.py and its storage backends in
+  uptane/services/inventory_backends.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.formats
+import uptane.services.inventorydb as inventory
+import uptane.services.inventory_backends as inventory_backends
+import tuf
+
+import unittest
+import os
+import copy
+import time
+import threading
+import shutil
+
+# For temporary convenience:
+import demo # for import_public_key
+
+
+TEST_DATA_DIR = os.path.join(uptane.WORKING_DIR, 'tests', 'test_data')
+TEMP_TEST_DIR = os.path.join(TEST_DATA_DIR, 'temp_test_inventorydb')
+
+# Initialize these in setUpModule below.
+primary_key = None
+secondary_key = None
+
+
+
+def destroy_temp_dir():
+  # Clean up anything that may currently exist in the temp test directory.
+  if os.path.exists(TEMP_TEST_DIR):
+    shutil.rmtree(TEMP_TEST_DIR)
+
+
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  global primary_key
+  global secondary_key
+
+  destroy_temp_dir()
+  os.makedirs(TEMP_TEST_DIR)
+
+  primary_key = demo.import_public_key('primary')
+  secondary_key = demo.import_public_key('secondary')
+
+
+
+
+
+def tearDownModule():
+  """This is run once for the full module, after all tests."""
+  inventory.set_backend(inventory_backends.MemoryInventoryBackend())
+  destroy_temp_dir()
+
+
+
+
+
+def make_ecu_manifest(ecu_serial, filepath):
+  """
+  Returns a copy of the sample ECU Manifest, altered to come from the given
+  ECU and report the given installed image. (The signature will not match; the
+  inventory does not check signatures.)
+  """
+  ecu_manifest = copy.deepcopy(SAMPLE_ECU_MANIFEST_SIGNABLE)
+  ecu_manifest['signed']['ecu_serial'] = ecu_serial
+  ecu_manifest['signed']['installed_image']['filepath'] = filepath
+  return ecu_manifest
+
+
+
+
+
+def make_vehicle_manifest(vin, primary_ecu_serial, ecu_manifests):
+  return {
+      'signed': {
+          'vin': vin,
+          'primary_ecu_serial': primary_ecu_serial,
+          'ecu_version_manifests': {
+              m['signed']['ecu_serial']: [m] for m in ecu_manifests}},
+      'signatures': copy.deepcopy(SAMPLE_ECU_MANIFEST_SIGNABLE['signatures'])}
+
+
+
+
+
+class InventoryTests(object):
+  """
+  Tests run against inventorydb with each backend. Subclasses provide
+  make_backend().
+  """
+
+  def setUp(self):
+    self.backend = self.make_backend()
+    inventory.set_backend(self.backend)
+
+
+
+  def tearDown(self):
+    self.backend.close()
+
+
+
+  def test_01_set_backend(self):
+    self.assertIs(self.backend, inventory.get_backend())
+
+    with self.assertRaises(uptane.Error):
+      inventory.set_backend({})
+
+    self.assertIs(self.backend, inventory.get_backend())
+
+
+
+  def test_02_register(self):
+    with self.assertRaises(uptane.UnknownVehicle):
+      inventory.check_vin_registered('vin1')
+
+    with self.assertRaises(uptane.UnknownECU):
+      inventory.check_ecu_registered('ecu1')
+
+    with self.assertRaises(uptane.UnknownECU):
+      inventory.get_ecu_public_key('ecu1')
+
+    inventory.register_vehicle('vin1')
+    inventory.check_vin_registered('vin1')
+    self.assertIsNone(inventory.get_primary_ecu_serial('vin1'))
+    self.assertEqual([], inventory.get_ecu_serials_in_vehicle('vin1'))
+
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+    # Registering an ECU for an unknown VIN registers the VIN as well.
+    inventory.register_ecu(False, 'vin2', 'ecu3', secondary_key)
+
+    self.assertEqual(['vin1', 'vin2'], sorted(inventory.get_registered_vins()))
+    self.assertEqual(
+        ['ecu1', 'ecu2'], inventory.get_ecu_serials_in_vehicle('vin1'))
+    self.assertEqual(['ecu3'], inventory.get_ecu_serials_in_vehicle('vin2'))
+    self.assertEqual('ecu1', inventory.get_primary_ecu_serial('vin1'))
+    self.assertIsNone(inventory.get_primary_ecu_serial('vin2'))
+    self.assertEqual(primary_key, inventory.get_ecu_public_key('ecu1'))
+    self.assertEqual(secondary_key, inventory.get_ecu_public_key('ecu2'))
+
+    # Without overwrite, a second Primary for the vehicle is rejected, and a
+    # known ECU Serial is left untouched.
+    with self.assertRaises(uptane.Spoofing):
+      inventory.register_ecu(
+          True, 'vin1', 'ecu4', secondary_key, overwrite=False)
+
+    with self.assertRaises(uptane.Spoofing):
+      inventory.register_vehicle('vin1', overwrite=False)
+
+    inventory.register_ecu(False, 'vin1', 'ecu2', primary_key, overwrite=False)
+    self.assertEqual(secondary_key, inventory.get_ecu_public_key('ecu2'))
+
+    # With overwrite, the key is replaced, and the ECU is not listed twice.
+    inventory.register_ecu(False, 'vin1', 'ecu2', primary_key)
+    self.assertEqual(primary_key, inventory.get_ecu_public_key('ecu2'))
+    self.assertEqual(
+        ['ecu1', 'ecu2'], inventory.get_ecu_serials_in_vehicle('vin1'))
+
+    with self.assertRaises(tuf.FormatError):
+      inventory.register_vehicle(5)
+
+
+
+  def test_03_save_and_get_manifests(self):
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+
+    self.assertIsNone(inventory.get_last_vehicle_manifest('vin1'))
+    self.assertIsNone(inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual([], inventory.get_vehicle_manifests('vin1'))
+
+    ecu_manifest_a = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    ecu_manifest_b = make_ecu_manifest('ecu2', '/firmware_b.txt')
+    vehicle_manifest_a = make_vehicle_manifest('vin1', 'ecu1', [ecu_manifest_a])
+    vehicle_manifest_b = make_vehicle_manifest('vin1', 'ecu1', [ecu_manifest_b])
+
+    inventory.save_vehicle_manifest('vin1', vehicle_manifest_a)
+    inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest_a)
+    inventory.save_vehicle_manifest('vin1', vehicle_manifest_b)
+    inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest_b)
+
+    self.assertEqual(
+        vehicle_manifest_b, inventory.get_last_vehicle_manifest('vin1'))
+    self.assertEqual([vehicle_manifest_a, vehicle_manifest_b],
+        inventory.get_vehicle_manifests('vin1'))
+    self.assertEqual(ecu_manifest_b, inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual(
+        [ecu_manifest_a, ecu_manifest_b], inventory.get_ecu_manifests('ecu2'))
+    self.assertEqual(
+        {'ecu1': [], 'ecu2': [ecu_manifest_a, ecu_manifest_b]},
+        inventory.get_all_ecu_manifests_from_vehicle('vin1'))
+
+    # Saved manifests come back in a form that still matches the schemas.
+    uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
+        inventory.get_last_vehicle_manifest('vin1'))
+    uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.check_match(
+        inventory.get_last_ecu_manifest('ecu2'))
+
+    # Bad manifests and unknown ECUs and vehicles are rejected.
+    with self.assertRaises(tuf.FormatError):
+      inventory.save_ecu_manifest('vin1', 'ecu2', vehicle_manifest_a)
+
+    with self.assertRaises(uptane.UnknownECU):
+      inventory.save_ecu_manifest('vin1', 'ecu9', ecu_manifest_a)
+
+    with self.assertRaises(uptane.UnknownVehicle):
+      inventory.save_vehicle_manifest('vin9', vehicle_manifest_a)
+
+    # Given the key the ECU Manifest was checked against, it is saved only if
+    # the ECU is still registered with that key.
+    self.assertFalse(inventory.save_ecu_manifest(
+        'vin1', 'ecu2', ecu_manifest_a, primary_key))
+    self.assertEqual(ecu_manifest_b, inventory.get_last_ecu_manifest('ecu2'))
+    self.assertTrue(inventory.save_ecu_manifest(
+        'vin1', 'ecu2', ecu_manifest_a, secondary_key))
+    self.assertEqual(ecu_manifest_a, inventory.get_last_ecu_manifest('ecu2'))
+
+    # Re-registering an ECU discards its old manifests.
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+    self.assertEqual([], inventory.get_ecu_manifests('ecu2'))
+
+    # Re-registering a vehicle discards its old manifests.
+    inventory.register_vehicle('vin1')
+    self.assertEqual([], inventory.get_vehicle_manifests('vin1'))
+
+
+
+
+  def use_retention_policy(self, **kwargs):
+    self.backend.close()
+    self.backend = self.make_backend(
+        inventory_backends.RetentionPolicy(**kwargs))
+    inventory.set_backend(self.backend)
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+
+
+
+  def test_04_retention_max_manifests(self):
+    self.use_retention_policy(max_manifests=2)
+
+    ecu_manifests = [make_ecu_manifest('ecu2', '/firmware_' + str(i) + '.txt')
+        for i in range(4)]
+
+    for ecu_manifest in ecu_manifests:
+      inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest)
+      inventory.save_vehicle_manifest(
+          'vin1', make_vehicle_manifest('vin1', 'ecu1', [ecu_manifest]))
+
+    self.assertEqual(ecu_manifests[2:], inventory.get_ecu_manifests('ecu2'))
+    self.assertEqual(ecu_manifests[3], inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual(2, len(inventory.get_vehicle_manifests('vin1')))
+    self.assertEqual(make_vehicle_manifest('vin1', 'ecu1', [ecu_manifests[3]]),
+        inventory.get_last_vehicle_manifest('vin1'))
+
+    with self.assertRaises(tuf.FormatError):
+      inventory_backends.RetentionPolicy(max_manifests=0)
+
+
+
+  def test_05_retention_only_changes(self):
+    self.use_retention_policy(only_changes=True)
+
+    manifest_a1 = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    manifest_a2 = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    manifest_a2['signed']['timeserver_time'] = '2017-03-28T16:19:17Z'
+    manifest_b = make_ecu_manifest('ecu2', '/firmware_b.txt')
+
+    for ecu_manifest in [manifest_a1, manifest_a2, manifest_b]:
+      inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest)
+      inventory.save_vehicle_manifest(
+          'vin1', make_vehicle_manifest('vin1', 'ecu1', [ecu_manifest]))
+
+    # The second report of the same state replaced the first.
+    self.assertEqual(
+        [manifest_a2, manifest_b], inventory.get_ecu_manifests('ecu2'))
+    self.assertEqual(
+        [make_vehicle_manifest('vin1', 'ecu1', [manifest_a2]),
+        make_vehicle_manifest('vin1', 'ecu1', [manifest_b])],
+        inventory.get_vehicle_manifests('vin1'))
+
+
+
+  def test_06_retention_max_age(self):
+    # With a maximum age of 0, only the latest manifest is ever kept.
+    self.use_retention_policy(max_age=0)
+
+    manifest_a = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    manifest_b = make_ecu_manifest('ecu2', '/firmware_b.txt')
+    inventory.save_ecu_manifest('vin1', 'ecu2', manifest_a)
+    time.sleep(0.01)
+    inventory.save_ecu_manifest('vin1', 'ecu2', manifest_b)
+    self.assertEqual([manifest_b], inventory.get_ecu_manifests('ecu2'))
+
+    inventory.save_vehicle_manifest(
+        'vin1', make_vehicle_manifest('vin1', 'ecu1', [manifest_a]))
+    inventory.prune_expired()
+    self.assertEqual(manifest_b, inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual(1, len(inventory.get_vehicle_manifests('vin1')))
+
+    # Pruning can run while manifests are being saved.
+    errors = []
+    def save():
+      try:
+        for i in range(50):
+          manifest = make_ecu_manifest('ecu2', '/firmware_' + str(i) + '.txt')
+          inventory.save_ecu_manifest('vin1', 'ecu2', manifest)
+          inventory.save_vehicle_manifest(
+              'vin1', make_vehicle_manifest('vin1', 'ecu1', [manifest]))
+      except Exception as e:
+        errors.append(e)
+
+    thread = threading.Thread(target=save)
+    thread.start()
+    while thread.is_alive():
+      inventory.prune_expired()
+    thread.join()
+
+    self.assertEqual([], errors)
+    inventory.prune_expired()
+    self.assertEqual(1, len(inventory.get_ecu_manifests('ecu2')))
+    self.assertEqual(1, len(inventory.get_vehicle_manifests('vin1')))
+
+
+
+
+  def test_07_concurrent_updates(self):
+    """
+    Many threads registering ECUs and saving manifests for several vehicles at
+    once should leave every vehicle's registration consistent, with no
+    manifests lost.
+    """
+    vins = ['vin' + str(i) for i in range(8)]
+    errors = []
+
+    def report(vin):
+      try:
+        for i in range(20):
+          # Keep switching the vehicle's Primary, and checking registration.
+          primary_serial = vin + '_ecu' + str(i % 2)
+          inventory.register_ecu(True, vin, primary_serial, primary_key)
+          inventory.check_vin_registered(vin)
+          ecu_manifest = make_ecu_manifest(primary_serial, '/firmware.txt')
+          inventory.save_ecu_manifest(vin, primary_serial, ecu_manifest)
+          inventory.save_vehicle_manifest(vin,
+              make_vehicle_manifest(vin, primary_serial, [ecu_manifest]))
+      except Exception as e:
+        errors.append(e)
+
+    threads = [threading.Thread(target=report, args=(vin,))
+        for vin in vins for i in range(3)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual([], errors)
+    self.assertEqual(sorted(vins), sorted(inventory.get_registered_vins()))
+    for vin in vins:
+      self.assertEqual([vin + '_ecu0', vin + '_ecu1'],
+          sorted(inventory.get_ecu_serials_in_vehicle(vin)))
+      self.assertEqual(60, len(inventory.get_vehicle_manifests(vin)))
+
+
+
+
+  def test_08_installed_image_index(self):
+    sha256 = SAMPLE_ECU_MANIFEST_SIGNABLE['signed']['installed_image'][
+        'fileinfo']['hashes']['sha256']
+
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+    inventory.register_ecu(True, 'vin2', 'ecu3', primary_key)
+
+    self.assertEqual([], inventory.get_ecus_with_image('/firmware_a.txt', sha256))
+    self.assertEqual(0, inventory.count_ecus_with_image(
+        '/firmware_a.txt', sha256))
+
+    for vin, ecu_serial in [('vin1', 'ecu1'), ('vin1', 'ecu2'), ('vin2', 'ecu3')]:
+      inventory.save_ecu_manifest(
+          vin, ecu_serial, make_ecu_manifest(ecu_serial, '/firmware_a.txt'))
+
+    self.assertEqual(['ecu1', 'ecu2', 'ecu3'],
+        inventory.get_ecus_with_image('/firmware_a.txt', sha256))
+    self.assertEqual(3, inventory.count_ecus_with_image(
+        '/firmware_a.txt', sha256))
+    self.assertEqual(['vin1', 'vin2'],
+        inventory.get_vehicles_with_image('/firmware_a.txt', sha256))
+
+    # Only each ECU's latest manifest counts.
+    inventory.save_ecu_manifest(
+        'vin1', 'ecu2', make_ecu_manifest('ecu2', '/firmware_b.txt'))
+    self.assertEqual(['ecu1', 'ecu3'],
+        inventory.get_ecus_with_image('/firmware_a.txt', sha256))
+    self.assertEqual(['ecu2'],
+        inventory.get_ecus_with_image('/firmware_b.txt', sha256))
+
+    # A different hash is a different image.
+    self.assertEqual(0, inventory.count_ecus_with_image(
+        '/firmware_a.txt', '0' * 64))
+
+    # Re-registering an ECU discards its manifests, so it is unindexed.
+    inventory.register_ecu(True, 'vin2', 'ecu3', primary_key)
+    self.assertEqual(['vin1'],
+        inventory.get_vehicles_with_image('/firmware_a.txt', sha256))
+
+    with self.assertRaises(tuf.FormatError):
+      inventory.count_ecus_with_image('/firmware_a.txt', 5)
+
+
+
+
+
+class TestMemoryInventory(InventoryTests, unittest.TestCase):
+
+  def make_backend(self, retention_policy=None):
+    return inventory_backends.MemoryInventoryBackend(retention_policy)
+
+
+
+  def test_11_snapshot(self):
+    snapshot_fname = os.path.join(TEMP_TEST_DIR, 'inventory.snapshot')
+    sha256 = SAMPLE_ECU_MANIFEST_SIGNABLE['signed']['installed_image'][
+        'fileinfo']['hashes']['sha256']
+
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+    inventory.register_vehicle('vin2')
+    ecu_manifests = [make_ecu_manifest('ecu2', '/firmware_' + str(i) + '.txt')
+        for i in range(3)]
+    for ecu_manifest in ecu_manifests:
+      inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest)
+    vehicle_manifest = make_vehicle_manifest('vin1', 'ecu1', ecu_manifests[2:])
+    inventory.save_vehicle_manifest('vin1', vehicle_manifest)
+
+    inventory.dump_snapshot(snapshot_fname)
+    inventory.load_snapshot(snapshot_fname)
+    self.backend = inventory.get_backend()
+    self.assertIsInstance(self.backend, inventory_backends.MemoryInventoryBackend)
+
+    # Registrations and the installed image index are loaded at once...
+    self.assertEqual(['vin1', 'vin2'], sorted(inventory.get_registered_vins()))
+    self.assertEqual(['ecu1', 'ecu2'], inventory.get_ecu_serials_in_vehicle('vin1'))
+    self.assertEqual('ecu1', inventory.get_primary_ecu_serial('vin1'))
+    self.assertIsNone(inventory.get_primary_ecu_serial('vin2'))
+    self.assertEqual(secondary_key, inventory.get_ecu_public_key('ecu2'))
+    self.assertEqual(['vin1'],
+        inventory.get_vehicles_with_image('/firmware_2.txt', sha256))
+
+    # ...and manifests when first needed.
+    self.assertIn('ecu2', self.backend._unloaded_ecu_manifests)
+    self.assertEqual(ecu_manifests, inventory.get_ecu_manifests('ecu2'))
+    self.assertNotIn('ecu2', self.backend._unloaded_ecu_manifests)
+    self.assertEqual(ecu_manifests[2], inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual([], inventory.get_ecu_manifests('ecu1'))
+
+    # A snapshot of a partly loaded backend is complete.
+    inventory.save_ecu_manifest('vin1', 'ecu1',
+        make_ecu_manifest('ecu1', '/firmware_p.txt'))
+    inventory.dump_snapshot(snapshot_fname)
+    self.backend.close()
+
+    # The retention policy given applies to manifests from the snapshot.
+    inventory.load_snapshot(snapshot_fname,
+        inventory_backends.RetentionPolicy(max_manifests=1))
+    self.backend = inventory.get_backend()
+    self.assertEqual(ecu_manifests[2:], inventory.get_ecu_manifests('ecu2'))
+    self.assertEqual(
+        vehicle_manifest, inventory.get_last_vehicle_manifest('vin1'))
+    self.assertEqual(1, inventory.count_ecus_with_image(
+        '/firmware_p.txt', sha256))
+
+    not_snapshot_fname = os.path.join(TEMP_TEST_DIR, 'not.snapshot')
+    with open(not_snapshot_fname, 'wb') as fileobj:
+      fileobj.write(b'Not a snapshot.')
+    with self.assertRaises(uptane.Error):
+      inventory.load_snapshot(not_snapshot_fname)
+
+
+
+  def test_12_manifest_store(self):
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+
+    ecu_manifest = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    vehicle_manifest = make_vehicle_manifest('vin1', 'ecu1', [ecu_manifest])
+
+    # Saved as the Director does: the Vehicle Manifest, then each ECU Manifest
+    # in it (here, a separately decoded copy), twice over.
+    for i in range(2):
+      inventory.save_vehicle_manifest('vin1', copy.deepcopy(vehicle_manifest))
+      inventory.save_ecu_manifest('vin1', 'ecu2', copy.deepcopy(ecu_manifest))
+
+    ecu_manifests = inventory.get_ecu_manifests('ecu2')
+    vehicle_manifests = inventory.get_vehicle_manifests('vin1')
+    self.assertEqual([ecu_manifest, ecu_manifest], ecu_manifests)
+    self.assertEqual([vehicle_manifest, vehicle_manifest], vehicle_manifests)
+
+    # Only one copy of each is stored.
+    ecu_records = self.backend.ecu_manifests['ecu2']
+    vehicle_records = self.backend.vehicle_manifests['vin1']
+    self.assertIs(ecu_records[0], ecu_records[1])
+    self.assertIs(vehicle_records[0], vehicle_records[1])
+    self.assertIs(ecu_records[0],
+        vehicle_records[0].ecu_version_manifests[0][1][0])
+
+    # Matching signatures on different content (not validly signed) are not
+    # confused.
+    other_ecu_manifest = make_ecu_manifest('ecu2', '/firmware_b.txt')
+    inventory.save_ecu_manifest('vin1', 'ecu2', other_ecu_manifest)
+    self.assertEqual(other_ecu_manifest, inventory.get_last_ecu_manifest('ecu2'))
+    self.assertEqual(ecu_manifest, inventory.get_ecu_manifests('ecu2')[0])
+
+
+
+
+
+class TestSQLiteInventory(InventoryTests, unittest.TestCase):
+
+  def make_backend(self, retention_policy=None):
+    db_fname = os.path.join(TEMP_TEST_DIR, self.id() + '.db')
+    if os.path.exists(db_fname):
+      os.remove(db_fname)
+    return inventory_backends.SQLiteInventoryBackend(
+        db_fname, retention_policy)
+
+
+
+  def test_10_persistence(self):
+    """
+    Data saved in the SQLite backend should still be there after reopening the
+    database file.
+    """
+    inventory.register_ecu(True, 'vin1', 'ecu1', primary_key)
+    inventory.register_ecu(False, 'vin1', 'ecu2', secondary_key)
+    ecu_manifest = make_ecu_manifest('ecu2', '/firmware_a.txt')
+    inventory.save_ecu_manifest('vin1', 'ecu2', ecu_manifest)
+
+    self.backend.close()
+    self.backend = inventory_backends.SQLiteInventoryBackend(
+        self.backend.db_fname)
+    inventory.set_backend(self.backend)
+
+    self.assertEqual(['vin1'], inventory.get_registered_vins())
+    self.assertEqual('ecu1', inventory.get_primary_ecu_serial('vin1'))
+    self.assertEqual(secondary_key, inventory.get_ecu_public_key('ecu2'))
+    self.assertEqual(ecu_manifest, inventory.get_last_ecu_manifest('ecu2'))
+
+    # The database is already persistent; snapshots are not supported.
+    with self.assertRaises(uptane.Error):
+      inventory.dump_snapshot(self.backend.db_fname + '.snapshot')
+
+    self.assertEqual(['ecu2'], inventory.get_ecus_with_image('/firmware_a.txt',
+        ecu_manifest['signed']['installed_image']['fileinfo']['hashes'][
+        'sha256']))
+
+
+
+
+
+SAMPLE_ECU_MANIFEST_SIGNABLE = {
+  'signed': {
+    'timeserver_time': '2017-03-27T16:19:17Z',
+    'previous_timeserver_time': '2017-03-27T16:19:17Z',
+    'ecu_serial': '22222',
+    'attacks_detected': '',
+    'installed_image': {
+      'filepath': '/secondary_firmware.txt',
+      'fileinfo': {
+        'length': 37,
+        'hashes': {
+          'sha256': '6b9f987226610bfed08b824c93bf8b2f59521fce9a2adef80c495f363c1c9c44',
+          'sha512': '706c283972c5ae69864b199e1cdd9b4b8babc14f5a454d0fd4d3b35396a04ca0b40af731671b74020a738b5108a78deb032332c36d6ae9f31fae2f8a70f7e1ce'}}}},
+  'signatures': [{
+    'sig': '42e6f4b398dbad0404cca847786a926972b54ca2ae71c7334f3d87fc62a10d08e01f7b5aa481cd3add61ef36f2037a9f68beca9f6ea26d2f9edc6f4ba0ba2a06',
+    'method': 'ed25519',
+    'keyid': '49309f114b857e4b29bfbff1c1c75df59f154fbc45539b2eb30c8a867843b2cb'}]}
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,187 @@
+"""
+<Program Name>
+  test_manifest_analysis.py
+
+<Purpose>
+  Unit testing for uptane/services/manifest_analysis.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.services.manifest_analysis as manifest_analysis
+import tuf
+
+import unittest
+import calendar
+import time
+
+
+# 2017-03-27T16:19:17Z
+BASE_TIME = calendar.timegm((2017, 3, 27, 16, 19, 17))
+
+IMAGE_1 = {'length': 10, 'hashes': {'sha256': '1' * 64}}
+IMAGE_2 = {'length': 20, 'hashes': {'sha256': '2' * 64}}
+IMAGE_3 = {'length': 30, 'hashes': {'sha256': '3' * 64}}
+
+
+
+def make_ecu_manifest(timeserver_time, fileinfo, attacks_detected=''):
+  """
+  Returns an ECU Manifest from ECU 'ecu1' reporting the given timeserver time
+  (seconds since the epoch) and installed image. (Not actually signed; the
+  analyzer expects manifests already validated.)
+  """
+  clock = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timeserver_time))
+  return {
+      'signed': {
+          'ecu_serial': 'ecu1',
+          'timeserver_time': clock,
+          'previous_timeserver_time': clock,
+          'attacks_detected': attacks_detected,
+          'installed_image': {
+              'filepath': '/firmware.img',
+              'fileinfo': fileinfo}},
+      'signatures': []}
+
+
+
+
+
+class TestManifestAnalyzer(unittest.TestCase):
+
+  def setUp(self):
+    self.analyzer = manifest_analysis.ManifestAnalyzer()
+
+
+  def analyze(self, timeserver_time, fileinfo, now, attacks_detected=''):
+    """Returns the types of the anomalies noted."""
+    anomalies = self.analyzer.analyze_ecu_manifest('vin1', 'ecu1',
+        make_ecu_manifest(timeserver_time, fileinfo, attacks_detected), now)
+    return [anomaly['type'] for anomaly in anomalies]
+
+
+
+
+
+  def test_01_normal_operation(self):
+    with self.assertRaises(tuf.FormatError):
+      self.analyzer.analyze_ecu_manifest('vin1', 5,
+          make_ecu_manifest(BASE_TIME, IMAGE_1), BASE_TIME)
+
+    self.assertEqual([], self.analyze(BASE_TIME, IMAGE_1, BASE_TIME))
+    self.assertEqual([], self.analyze(BASE_TIME + 60, IMAGE_1, BASE_TIME + 60))
+
+    # An assigned image is installed.
+    self.analyzer.set_assigned_image('vin1', 'ecu1', IMAGE_2, BASE_TIME + 100)
+    self.assertEqual([], self.analyze(BASE_TIME + 200, IMAGE_2, BASE_TIME + 200))
+
+    state = self.analyzer.get_ecu_state('vin1', 'ecu1')
+    self.assertEqual(BASE_TIME + 200, state.last_timeserver_time)
+    self.assertEqual('2' * 64, state.image_hash)
+    self.assertEqual('1' * 64, state.previous_image_hash)
+    self.assertEqual(BASE_TIME + 200, state.last_change_time)
+
+    self.assertEqual([], self.analyzer.get_anomalies('vin1'))
+    self.assertIsNone(self.analyzer.get_ecu_state('vin1', 'ecu2'))
+
+
+
+
+
+  def test_05_time_anomalies(self):
+    self.assertEqual([], self.analyze(BASE_TIME, IMAGE_1, BASE_TIME))
+
+    # A replayed (older) time attestation.
+    self.assertEqual(['time_regression'],
+        self.analyze(BASE_TIME - 10, IMAGE_1, BASE_TIME + 10))
+
+    # Time has not advanced for too long. Noted once.
+    self.assertEqual(['stale_time'], self.analyze(BASE_TIME, IMAGE_1,
+        BASE_TIME + manifest_analysis.MAX_TIME_LAG + 1))
+    self.assertEqual([], self.analyze(BASE_TIME, IMAGE_1,
+        BASE_TIME + manifest_analysis.MAX_TIME_LAG + 1))
+
+    self.assertEqual(['attacks_reported'], self.analyze(
+        BASE_TIME + manifest_analysis.MAX_TIME_LAG, IMAGE_1,
+        BASE_TIME + manifest_analysis.MAX_TIME_LAG + 2, 'Freeze attack!'))
+
+    anomalies = self.analyzer.get_anomalies('vin1')
+    self.assertEqual(['time_regression', 'stale_time', 'attacks_reported'],
+        [anomaly['type'] for anomaly in anomalies])
+    self.assertEqual('ecu1', anomalies[0]['ecu_serial'])
+    self.assertEqual('Freeze attack!', anomalies[2]['detail'])
+
+
+
+
+
+  def test_10_image_anomalies(self):
+    self.assertEqual([], self.analyze(BASE_TIME, IMAGE_1, BASE_TIME))
+    self.analyzer.set_assigned_image('vin1', 'ecu1', IMAGE_2, BASE_TIME)
+    self.assertEqual([], self.analyze(BASE_TIME + 1, IMAGE_2, BASE_TIME + 1))
+
+    # Back to the image replaced, which is also not the image assigned.
+    self.assertEqual(['image_reverted', 'unassigned_image'],
+        self.analyze(BASE_TIME + 2, IMAGE_1, BASE_TIME + 2))
+
+    # Some other image, not assigned.
+    self.assertEqual(['unassigned_image'],
+        self.analyze(BASE_TIME + 3, IMAGE_3, BASE_TIME + 3))
+
+    # No assignment, no complaint.
+    self.analyzer.clear_assigned_images('vin1')
+    self.assertEqual([], self.analyze(BASE_TIME + 4, IMAGE_2, BASE_TIME + 4))
+
+
+
+
+
+  def test_15_update_not_installed(self):
+    deadline = manifest_analysis.UPDATE_DEADLINE
+    now = BASE_TIME
+
+    self.assertEqual([], self.analyze(now, IMAGE_1, now))
+    self.analyzer.set_assigned_image('vin1', 'ecu1', IMAGE_2, now)
+
+    now += deadline
+    self.assertEqual([], self.analyze(now, IMAGE_1, now))
+
+    # Noted once only.
+    now += 1
+    self.assertEqual(['update_not_installed'], self.analyze(now, IMAGE_1, now))
+    now += 1
+    self.assertEqual([], self.analyze(now, IMAGE_1, now))
+
+    # Assigning the same image again doesn't reset the deadline; assigning
+    # another does.
+    self.analyzer.set_assigned_image('vin1', 'ecu1', IMAGE_2, now)
+    now += 1
+    self.assertEqual([], self.analyze(now, IMAGE_1, now))
+    self.analyzer.set_assigned_image('vin1', 'ecu1', IMAGE_3, now)
+    now += deadline + 1
+    self.assertEqual(['update_not_installed'], self.analyze(now, IMAGE_1, now))
+
+    # Forgetting an ECU discards its state and anomalies, not those of the
+    # vehicle's other ECUs.
+    self.analyzer.analyze_ecu_manifest('vin1', 'ecu2',
+        make_ecu_manifest(now, IMAGE_1, 'attack'), now)
+    self.analyzer.forget_ecu('vin1', 'ecu1')
+    self.assertIsNone(self.analyzer.get_ecu_state('vin1', 'ecu1'))
+    self.assertIsNotNone(self.analyzer.get_ecu_state('vin1', 'ecu2'))
+    self.assertEqual([('ecu2', 'attacks_reported')],
+        [(anomaly['ecu_serial'], anomaly['type'])
+        for anomaly in self.analyzer.get_anomalies('vin1')])
+
+    self.analyzer.forget_vehicle('vin1')
+    self.assertEqual([], self.analyzer.get_anomalies('vin1'))
+    self.assertIsNone(self.analyzer.get_ecu_state('vin1', 'ecu2'))
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,209 @@
+"""
+<Program Name>
+  test_manifest_ingestion.py
+
+<Purpose>
+  Unit testing for uptane/services/manifest_ingestion.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.services.inventorydb as inventory
+import uptane.services.inventory_backends as inventory_backends
+import uptane.services.manifest_ingestion as manifest_ingestion
+import tuf
+import tuf.conf
+
+import unittest
+import threading
+import time
+
+
+VIN = 'vin_ingestion'
+
+# Only the format of the manifests matters here; the Director below does not
+# check signatures.
+MANIFEST = {
+    'signed': {
+        'vin': VIN,
+        'primary_ecu_serial': 'primary1',
+        'ecu_version_manifests': {}},
+    'signatures': []}
+
+
+
+class RecordingDirector(object):
+  """
+  Stands in for a Director: records the manifests registered, waiting for
+  'release' to be set before each one, and rejects those from Primary 'bad'.
+  Those from Primary 'broken' fail with an unexpected error.
+  """
+  def __init__(self):
+    self.verification_pool = None
+    self.registered = []
+    self.release = threading.Event()
+
+  def register_vehicle_manifest(self, vin, primary_ecu_serial, manifest):
+    self.release.wait()
+    if primary_ecu_serial == 'bad':
+      raise uptane.Spoofing('Rejected.')
+    elif primary_ecu_serial == 'broken':
+      raise KeyError('broken')
+    self.registered.append((vin, primary_ecu_serial))
+
+
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  global original_backend
+  global original_format
+
+  original_backend = inventory.get_backend()
+  original_format = tuf.conf.METADATA_FORMAT
+
+  inventory.set_backend(inventory_backends.MemoryInventoryBackend())
+  tuf.conf.METADATA_FORMAT = 'json'
+  inventory.register_vehicle(VIN)
+
+
+
+
+
+def tearDownModule():
+  """This is run once for the full module, after all tests."""
+  inventory.set_backend(original_backend)
+  tuf.conf.METADATA_FORMAT = original_format
+
+
+
+
+
+class TestManifestIngestionQueue(unittest.TestCase):
+
+  def test_01_init_and_cheap_checks(self):
+    director = RecordingDirector()
+
+    with self.assertRaises(tuf.FormatError):
+      manifest_ingestion.ManifestIngestionQueue(director, max_queue_size=0)
+
+    with self.assertRaises(tuf.FormatError):
+      manifest_ingestion.ManifestIngestionQueue(director, workers='2')
+
+    ingestion_queue = manifest_ingestion.ManifestIngestionQueue(director)
+
+    with self.assertRaises(tuf.FormatError):
+      ingestion_queue.submit(VIN, 'primary1', {'signed': {}})
+
+    with self.assertRaises(uptane.UnknownVehicle):
+      ingestion_queue.submit('unknown_vin', 'primary1', MANIFEST)
+
+    self.assertEqual(0, ingestion_queue.get_stats()['accepted'])
+
+
+
+
+
+  def test_05_backpressure(self):
+    director = RecordingDirector()
+    ingestion_queue = manifest_ingestion.ManifestIngestionQueue(
+        director, max_queue_size=3, batch_size=1)
+
+    # With no workers running, the queue fills up and further submissions
+    # are refused.
+    for i in range(3):
+      self.assertEqual(manifest_ingestion.ACCEPTED,
+          ingestion_queue.submit(VIN, 'primary' + str(i), MANIFEST))
+    self.assertEqual(manifest_ingestion.BUSY,
+        ingestion_queue.submit(VIN, 'primary3', MANIFEST))
+
+    stats = ingestion_queue.get_stats()
+    self.assertEqual(3, stats['queue_depth'])
+    self.assertEqual(3, stats['peak_queue_depth'])
+    self.assertEqual(3, stats['accepted'])
+    self.assertEqual(1, stats['rejected_busy'])
+    self.assertEqual(0, stats['registered'])
+
+    director.release.set()
+    ingestion_queue.start()
+    ingestion_queue.join()
+
+    # Registered in the order submitted.
+    self.assertEqual([(VIN, 'primary0'), (VIN, 'primary1'), (VIN, 'primary2')],
+        director.registered)
+
+    self.assertEqual(manifest_ingestion.ACCEPTED,
+        ingestion_queue.submit(VIN, 'bad', MANIFEST))
+    ingestion_queue.stop()
+
+    stats = ingestion_queue.get_stats()
+    self.assertEqual(0, stats['queue_depth'])
+    self.assertEqual(3, stats['registered'])
+    self.assertEqual(1, stats['failed'])
+
+
+
+
+
+  def test_10_failed_batch_counts_wait(self):
+    director = RecordingDirector()
+
+    def register_vehicle_manifests_batch(vehicle_manifests):
+      raise RuntimeError('Unexpected failure.')
+    director.verification_pool = 'pool'
+    director.register_vehicle_manifests_batch = register_vehicle_manifests_batch
+
+    ingestion_queue = manifest_ingestion.ManifestIngestionQueue(
+        director, batch_size=2)
+
+    for i in range(2):
+      ingestion_queue.submit(VIN, 'primary' + str(i), MANIFEST)
+    time.sleep(0.05)
+
+    # The worker survives the failed batch, and the time its manifests spent
+    # queued still counts toward the mean wait.
+    ingestion_queue.start()
+    ingestion_queue.join()
+    ingestion_queue.stop()
+
+    stats = ingestion_queue.get_stats()
+    self.assertEqual(0, stats['registered'])
+    self.assertEqual(2, stats['failed'])
+    self.assertGreaterEqual(stats['mean_wait'], 0.05)
+
+
+
+
+
+  def test_15_unexpected_error_fails_one_manifest(self):
+    director = RecordingDirector()
+    director.release.set()
+    ingestion_queue = manifest_ingestion.ManifestIngestionQueue(
+        director, batch_size=3)
+
+    for primary_ecu_serial in ['primary0', 'broken', 'primary2']:
+      ingestion_queue.submit(VIN, primary_ecu_serial, MANIFEST)
+
+    # The other manifests in the same batch are still registered.
+    ingestion_queue.start()
+    ingestion_queue.join()
+    ingestion_queue.stop()
+
+    self.assertEqual([(VIN, 'primary0'), (VIN, 'primary2')],
+        director.registered)
+    stats = ingestion_queue.get_stats()
+    self.assertEqual(2, stats['registered'])
+    self.assertEqual(1, stats['failed'])
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
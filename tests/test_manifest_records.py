@@ -0,0 +1,129 @@
+"""
+<Program Name>
+  test_manifest_records.py
+
+<Purpose>
+  Unit testing for uptane/manifest_records.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.manifest_records as manifest_records
+import tuf
+
+import unittest
+import copy
+
+
+SAMPLE_ECU_MANIFEST_SIGNABLE = {
+  'signed': {
+    'timeserver_time': '2017-03-27T16:19:17Z',
+    'previous_timeserver_time': '2017-03-27T16:18:00Z',
+    'ecu_serial': '22222',
+    'attacks_detected': '',
+    'installed_image': {
+      'filepath': '/secondary_firmware.txt',
+      'fileinfo': {
+        'length': 37,
+        'hashes': {
+          'sha256': '6b9f987226610bfed08b824c93bf8b2f59521fce9a2adef80c495f363c1c9c44',
+          'sha512': '706c283972c5ae69864b199e1cdd9b4b8babc14f5a454d0fd4d3b35396a04ca0b40af731671b74020a738b5108a78deb032332c36d6ae9f31fae2f8a70f7e1ce'}}}},
+  'signatures': [{
+    'sig': '42e6f4b398dbad0404cca847786a926972b54ca2ae71c7334f3d87fc62a10d08e01f7b5aa481cd3add61ef36f2037a9f68beca9f6ea26d2f9edc6f4ba0ba2a06',
+    'method': 'ed25519',
+    'keyid': '49309f114b857e4b29bfbff1c1c75df59f154fbc45539b2eb30c8a867843b2cb'}]}
+
+
+
+class TestManifestRecords(unittest.TestCase):
+
+  def test_01_ecu_manifest(self):
+    with self.assertRaises(tuf.FormatError):
+      manifest_records.ecu_manifest_from_dict({'signed': {}, 'signatures': []})
+
+    record = manifest_records.ecu_manifest_from_dict(
+        SAMPLE_ECU_MANIFEST_SIGNABLE)
+
+    self.assertEqual('22222', record.ecu_serial)
+    self.assertEqual(1490631557, record.timeserver_time)
+    self.assertEqual(1490631480, record.previous_timeserver_time)
+    self.assertEqual('/secondary_firmware.txt', record.filepath)
+    self.assertEqual(37, record.length)
+    self.assertEqual(['sha256', 'sha512'], [h[0] for h in record.hashes])
+    self.assertEqual(32, len(record.hashes[0][1]))
+    self.assertEqual(32, len(record.signatures[0].keyid))
+    self.assertEqual(64, len(record.signatures[0].sig))
+    self.assertIsNone(record.custom)
+
+    # Lossless.
+    self.assertEqual(SAMPLE_ECU_MANIFEST_SIGNABLE, record.to_dict())
+    self.assertEqual(record, manifest_records.ecu_manifest_from_dict(
+        record.to_dict()))
+
+    # Values without an exact compact form are kept as given.
+    manifest = copy.deepcopy(SAMPLE_ECU_MANIFEST_SIGNABLE)
+    manifest['signatures'][0]['sig'] = 'ABC'
+    manifest['signed']['installed_image']['fileinfo']['custom'] = {'type': 'x'}
+    record = manifest_records.ecu_manifest_from_dict(manifest)
+    self.assertEqual('ABC', record.signatures[0].sig)
+    self.assertEqual(manifest, record.to_dict())
+    self.assertNotEqual(record, manifest_records.ecu_manifest_from_dict(
+        SAMPLE_ECU_MANIFEST_SIGNABLE))
+
+    # Equal ECU Serials and filepaths from different manifests are shared
+    # (where strings can be interned, i.e. Python 3).
+    manifest = copy.deepcopy(SAMPLE_ECU_MANIFEST_SIGNABLE)
+    manifest['signed']['ecu_serial'] = ''.join(['2222', '2'])
+    other_record = manifest_records.ecu_manifest_from_dict(manifest)
+    if str is not bytes:
+      self.assertIs(record.ecu_serial, other_record.ecu_serial)
+      self.assertIs(record.filepath, other_record.filepath)
+
+
+
+
+
+  def test_05_vehicle_manifest(self):
+    ecu_manifest_2 = copy.deepcopy(SAMPLE_ECU_MANIFEST_SIGNABLE)
+    ecu_manifest_2['signed']['ecu_serial'] = '33333'
+    vehicle_manifest = {
+        'signed': {
+            'vin': '111',
+            'primary_ecu_serial': '11111',
+            'ecu_version_manifests': {
+                '22222': [SAMPLE_ECU_MANIFEST_SIGNABLE,
+                    SAMPLE_ECU_MANIFEST_SIGNABLE],
+                '33333': [ecu_manifest_2]}},
+        'signatures': SAMPLE_ECU_MANIFEST_SIGNABLE['signatures']}
+
+    with self.assertRaises(tuf.FormatError):
+      manifest_records.vehicle_manifest_from_dict(SAMPLE_ECU_MANIFEST_SIGNABLE)
+
+    record = manifest_records.vehicle_manifest_from_dict(vehicle_manifest)
+    self.assertEqual('111', record.vin)
+    self.assertEqual(['22222', '33333'],
+        [ecu_serial for ecu_serial, unused in record.ecu_version_manifests])
+    self.assertEqual(vehicle_manifest, record.to_dict())
+
+    # ECU Manifests can be converted by a given function, e.g. to reuse
+    # records.
+    records = []
+    def convert(signed_ecu_manifest):
+      records.append(
+          manifest_records.ecu_manifest_from_dict(signed_ecu_manifest))
+      return records[0]
+
+    record = manifest_records.vehicle_manifest_from_dict(
+        vehicle_manifest, ecu_manifest_from_dict=convert)
+    self.assertEqual(3, len(records))
+    self.assertIs(records[0], record.ecu_version_manifests[1][1][0])
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
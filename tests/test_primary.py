@@ -31,6 +31,7 @@ import time
 import copy
 import shutil
 import hashlib
+import threading
 
 # For temporary convenience:
 import demo # for generate_key, import_public_key, import_private_key
@@ -252,6 +253,19 @@ class TestPrimary(unittest.TestCase):
           timeserver_public_key=clock, # INVALID
           my_secondaries=[])
 
+    # Invalid number of download threads
+    with self.assertRaises(tuf.FormatError):
+      p = primary.Primary(
+          full_client_dir=TEMP_CLIENT_DIR,
+          director_repo_name=demo.DIRECTOR_REPO_NAME,
+          vin=vin,
+          ecu_serial=primary_ecu_serial,
+          primary_key=primary_ecu_key,
+          time=clock,
+          timeserver_public_key=key_timeserver_pub,
+          my_secondaries=[],
+          download_threads=0) # INVALID
+
 
     print(TEMP_CLIENT_DIR)
 
@@ -284,6 +298,10 @@ class TestPrimary(unittest.TestCase):
     self.assertIsInstance(primary_instance.updater, tuf.client.updater.Updater)
     tuf.formats.ANYKEY_SCHEMA.check_match(primary_instance.timeserver_public_key)
     self.assertEqual([], primary_instance.my_secondaries)
+    self.assertEqual(primary.DEFAULT_DOWNLOAD_THREADS,
+        primary_instance.download_threads)
+    self.assertIsNone(primary_instance.get_full_metadata_archive_id())
+    self.assertIsNone(primary_instance.get_partial_metadata_id())
 
 
 
@@ -601,6 +619,151 @@ class TestPrimary(unittest.TestCase):
 
 
 
+  def test_55_download_targets(self):
+    # Rather than spin up repositories, replace the updater with one that
+    # writes each target (or fails to), waiting until the others have started,
+    # so that this only completes if the downloads run concurrently.
+    targets_directory = os.path.join(TEMP_CLIENT_DIR, 'targets')
+    if not os.path.exists(targets_directory):
+      os.makedirs(targets_directory)
+    barrier_lock = threading.Lock()
+    all_started = threading.Event()
+    started = []
+
+    class FakeUpdater(object):
+      def download_target(self, target, destination_directory):
+        with barrier_lock:
+          started.append(target['filepath'])
+          if len(started) == 3:
+            all_started.set()
+        all_started.wait(5)
+        if target['filepath'] == '/bad.img':
+          raise tuf.NoWorkingMirrorError({'http://mirror/bad.img': URLError('')})
+        with open(os.path.join(destination_directory,
+            target['filepath'].lstrip('/')), 'w') as fobj:
+          fobj.write(target['filepath'])
+
+    targets = [{'filepath': filepath, 'fileinfo': {'length': 1, 'hashes': {}}}
+        for filepath in ['/1.img', '/bad.img', '/2.img']]
+    full_fnames = [os.path.join(targets_directory, t['filepath'][1:])
+        for t in targets]
+
+    original_updater = primary_instance.updater
+    primary_instance.updater = FakeUpdater()
+    try:
+      errors = primary_instance._download_targets(
+          targets, full_fnames, targets_directory)
+    finally:
+      primary_instance.updater = original_updater
+
+    self.assertTrue(all_started.is_set())
+    self.assertIsNone(errors[0])
+    self.assertIsInstance(errors[1], tuf.NoWorkingMirrorError)
+    self.assertIsNone(errors[2])
+    self.assertTrue(os.path.exists(full_fnames[0]))
+    self.assertFalse(os.path.exists(full_fnames[1]))
+    self.assertTrue(os.path.exists(full_fnames[2]))
+
+
+
+
+
+
+  def test_60_get_validated_target_infos(self):
+    # Rather than spin up repositories, replace the updater with one that
+    # records the targets it is asked to validate.
+    validated = []
+
+    class FakeUpdater(object):
+      def target(self, target_filepath, multi_custom=False):
+        validated.append(target_filepath)
+        if target_filepath == '/unknown.img':
+          raise tuf.UnknownTargetError('Unknown target.')
+        return {demo.DIRECTOR_REPO_NAME: {'filepath': target_filepath,
+            'fileinfo': {'length': 1, 'hashes': {'sha256': '1' * 64}}}}
+
+    with self.assertRaises(tuf.FormatError):
+      primary_instance.get_validated_target_infos('/1.img')
+
+    original_updater = primary_instance.updater
+    primary_instance.updater = FakeUpdater()
+    extra_fname = os.path.join(TEMP_CLIENT_DIR, 'metadata',
+        demo.DIRECTOR_REPO_NAME, 'current', 'extra.' + tuf.conf.METADATA_FORMAT)
+    try:
+      infos = primary_instance.get_validated_target_infos(
+          ['/1.img', '/unknown.img', '/1.img'])
+      self.assertEqual(['/1.img'], list(infos))
+      self.assertEqual('/1.img', infos['/1.img']['filepath'])
+      self.assertEqual(['/1.img', '/unknown.img'], validated)
+
+      # While the metadata is unchanged, results are reused.
+      self.assertEqual(infos['/1.img'],
+          primary_instance.get_validated_target_info('/1.img'))
+      with self.assertRaises(tuf.UnknownTargetError):
+        primary_instance.get_validated_target_info('/unknown.img')
+      self.assertEqual(['/1.img', '/unknown.img'], validated)
+
+      # Once it changes, targets are validated again.
+      with open(extra_fname, 'w') as fobj:
+        fobj.write('{}')
+      primary_instance.get_validated_target_infos(['/1.img'])
+      self.assertEqual(['/1.img', '/unknown.img', '/1.img'], validated)
+
+    finally:
+      primary_instance.updater = original_updater
+      if os.path.exists(extra_fname):
+        os.remove(extra_fname)
+
+
+
+
+
+
+  def test_65_save_distributable_metadata_files(self):
+    director_dir = os.path.join(
+        TEMP_CLIENT_DIR, 'metadata', demo.DIRECTOR_REPO_NAME, 'current')
+    director_targets_fname = os.path.join(
+        director_dir, 'targets.' + tuf.conf.METADATA_FORMAT)
+    extra_fname = os.path.join(director_dir, 'extra.' + tuf.conf.METADATA_FORMAT)
+
+    # Without the repositories running, there may be no targets metadata yet.
+    if not os.path.exists(director_targets_fname):
+      with open(director_targets_fname, 'w') as fobj:
+        fobj.write('{}')
+
+    primary_instance.save_distributable_metadata_files()
+    archive_fname = primary_instance.get_full_metadata_archive_fname()
+    inode = os.stat(archive_fname).st_ino
+    archive_id = primary_instance.get_full_metadata_archive_id()
+    partial_id = primary_instance.get_partial_metadata_id()
+
+    # The files are identified by their contents.
+    with open(archive_fname, 'rb') as fobj:
+      self.assertEqual(hashlib.sha256(fobj.read()).hexdigest(), archive_id)
+    with open(director_targets_fname, 'rb') as fobj:
+      self.assertEqual(hashlib.sha256(fobj.read()).hexdigest(), partial_id)
+
+    # Nothing has changed, so the archive is not rebuilt.
+    primary_instance.save_distributable_metadata_files()
+    self.assertEqual(inode, os.stat(archive_fname).st_ino)
+    self.assertEqual(archive_id, primary_instance.get_full_metadata_archive_id())
+
+    # Once metadata changes, it is.
+    try:
+      with open(extra_fname, 'w') as fobj:
+        fobj.write('{}')
+      primary_instance.save_distributable_metadata_files()
+      self.assertNotEqual(inode, os.stat(archive_fname).st_ino)
+      self.assertNotEqual(
+          archive_id, primary_instance.get_full_metadata_archive_id())
+      self.assertEqual(partial_id, primary_instance.get_partial_metadata_id())
+    finally:
+      os.remove(extra_fname)
+
+
+
+
+
 # Run unit test.
 if __name__ == '__main__':
   unittest.main()
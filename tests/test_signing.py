@@ -0,0 +1,153 @@
+"""
+<Program Name>
+  test_signing.py
+
+<Purpose>
+  Unit testing for uptane/services/signing.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.services.signing as signing
+import tuf
+import tuf.keys
+
+import unittest
+import hashlib
+import threading
+
+# For temporary convenience:
+import demo # for import_private_key
+
+
+# Initialize these in setUpModule below.
+timestamp_key = None
+snapshot_key = None
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  global timestamp_key
+  global snapshot_key
+
+  timestamp_key = demo.import_private_key('directortimestamp')
+  snapshot_key = demo.import_private_key('directorsnapshot')
+
+
+
+
+
+SIGNED = {'_type': 'Timestamp', 'version': 1,
+    'expires': '2030-01-01T00:00:00Z', 'meta': {}}
+
+DATA = hashlib.sha256(b'DER-encoded metadata').digest()
+
+
+
+
+
+class TestSigning(unittest.TestCase):
+
+  def check_signer(self, signer):
+    """
+    Checks that the given signer (holding timestamp_key and snapshot_key)
+    produces valid signatures over dictionaries and bytes.
+    """
+    signature = signer.sign(timestamp_key['keyid'], SIGNED)
+    self.assertEqual(timestamp_key['keyid'], signature['keyid'])
+    self.assertTrue(tuf.keys.verify_signature(timestamp_key, signature, SIGNED))
+
+    signature = signer.sign(snapshot_key['keyid'], DATA)
+    self.assertTrue(tuf.keys.verify_signature(
+        snapshot_key, signature, DATA, is_binary_data=True))
+
+    signatures = signer.sign_batch([(timestamp_key['keyid'], SIGNED),
+        (snapshot_key['keyid'], SIGNED), (timestamp_key['keyid'], DATA)])
+    self.assertEqual(3, len(signatures))
+    self.assertEqual([timestamp_key['keyid'], snapshot_key['keyid'],
+        timestamp_key['keyid']], [s['keyid'] for s in signatures])
+    self.assertTrue(tuf.keys.verify_signature(
+        timestamp_key, signatures[2], DATA, is_binary_data=True))
+
+    with self.assertRaises(uptane.Error):
+      signer.sign('0' * 64, SIGNED)
+
+
+
+
+
+  def test_01_local_signer(self):
+
+    with self.assertRaises(tuf.FormatError):
+      signing.LocalSigner([demo.import_public_key('directortimestamp')])
+
+    signer = signing.LocalSigner([timestamp_key])
+    signer.add_key(snapshot_key)
+    self.check_signer(signer)
+
+
+
+
+
+  def test_05_process_pool_signer(self):
+    signer = signing.ProcessPoolSigner(
+        [timestamp_key, snapshot_key], processes=2, max_batch_size=4)
+
+    try:
+      self.check_signer(signer)
+
+      # Requests from many threads at once are all answered.
+      signatures = [None] * 20
+      def sign(i):
+        signatures[i] = signer.sign(timestamp_key['keyid'], SIGNED)
+
+      threads = [threading.Thread(target=sign, args=(i,)) for i in range(20)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+
+      for signature in signatures:
+        self.assertTrue(
+            tuf.keys.verify_signature(timestamp_key, signature, SIGNED))
+
+    finally:
+      signer.close()
+
+
+
+
+
+  def test_10_signing_server(self):
+    # Call the server's XML-RPC method directly; RemoteSigner only adds the
+    # transport.
+    server = signing.SigningServer([timestamp_key])
+
+    self.assertEqual([timestamp_key['keyid']], server.get_keyids())
+
+    signatures = server.sign_batch([[timestamp_key['keyid'], SIGNED]])
+    self.assertTrue(
+        tuf.keys.verify_signature(timestamp_key, signatures[0], SIGNED))
+
+    with self.assertRaises(uptane.Error):
+      server.sign_batch([[snapshot_key['keyid'], SIGNED]])
+
+    remote_signer = signing.RemoteSigner('http://localhost:1')
+    try:
+      with self.assertRaises(uptane.Error):
+        remote_signer.add_key(timestamp_key)
+    finally:
+      remote_signer.close()
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
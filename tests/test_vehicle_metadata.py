@@ -0,0 +1,623 @@
+"""
+<Program Name>
+  test_vehicle_metadata.py
+
+<Purpose>
+  Unit testing for uptane/services/vehicle_metadata.py
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.services.vehicle_metadata as vehicle_metadata
+import uptane.services.signing as signing
+import tuf
+import tuf.conf
+
+import unittest
+import os
+import shutil
+import json
+import threading
+import time
+
+# For temporary convenience:
+import demo # for import_public_key
+
+
+TEST_DATA_DIR = os.path.join(uptane.WORKING_DIR, 'tests', 'test_data')
+TEMP_TEST_DIR = os.path.join(TEST_DATA_DIR, 'temp_test_vehicle_metadata')
+
+# Initialize these in setUpModule below.
+role_keys = None # role name -> public key
+initial_metadata_format = None
+
+
+
+def destroy_temp_dir():
+  # Clean up anything that may currently exist in the temp test directory.
+  if os.path.exists(TEMP_TEST_DIR):
+    shutil.rmtree(TEMP_TEST_DIR)
+
+
+
+
+
+def setUpModule():
+  """
+  This is run once for the full module, before all tests.
+  """
+  global role_keys
+  global initial_metadata_format
+
+  role_keys = {
+      'root': demo.import_public_key('directorroot'),
+      'timestamp': demo.import_public_key('directortimestamp'),
+      'snapshot': demo.import_public_key('directorsnapshot'),
+      'targets': demo.import_public_key('director')}
+
+  initial_metadata_format = tuf.conf.METADATA_FORMAT
+  tuf.conf.METADATA_FORMAT = 'json'
+
+  destroy_temp_dir()
+  os.makedirs(TEMP_TEST_DIR)
+
+
+
+
+
+def tearDownModule():
+  """This is run once for the full module, after all tests."""
+  tuf.conf.METADATA_FORMAT = initial_metadata_format
+  destroy_temp_dir()
+
+
+
+
+
+class RecordingSigner(signing.Signer):
+  """
+  A signer holding no private keys, which records the roles it is asked to
+  sign for and returns placeholder signatures, so that metadata can be
+  generated without the crypto libraries. While fail is set, signing raises
+  error.
+  """
+
+  def __init__(self):
+    self.signed_roles = []
+    self.fail = False
+    self.error = uptane.Error('Signing failed.')
+
+
+
+  def sign_batch(self, requests):
+    if self.fail:
+      raise self.error
+
+    signatures = []
+    for keyid, data in requests:
+      self.signed_roles.extend([rolename for rolename in role_keys
+          if role_keys[rolename]['keyid'] == keyid])
+      signatures.append({'keyid': keyid, 'method': 'ed25519', 'sig': '00'})
+
+    return signatures
+
+
+
+
+
+def make_generator(director_repos_dir, signer=None, **kwargs):
+  """
+  Returns a VehicleMetadataGenerator for director_repos_dir, signing with the
+  given RecordingSigner (or a new one).
+  """
+  if signer is None:
+    signer = RecordingSigner()
+
+  return vehicle_metadata.VehicleMetadataGenerator(director_repos_dir,
+      role_keys['root'], role_keys['root'],
+      role_keys['timestamp'], role_keys['timestamp'],
+      role_keys['snapshot'], role_keys['snapshot'],
+      role_keys['targets'], role_keys['targets'],
+      signer=signer, **kwargs)
+
+
+
+
+
+def add_image(generator, vin, ecu_serial, filename, data):
+  """
+  Writes an image into the vehicle's targets directory and assigns it to the
+  given ECU.
+  """
+  filepath = os.path.join(
+      generator.get_vehicle_directory(vin), 'targets', filename)
+  with open(filepath, 'wb') as fobj:
+    fobj.write(data)
+  generator.add_target(vin, ecu_serial, filepath)
+
+
+
+
+
+def set_timestamp_expiration(generator, vin, timestamp_expires):
+  """
+  Changes the expiration of the vehicle's published timestamp metadata noted
+  in its saved record, as though it had been published earlier.
+  """
+  record_fname = os.path.join(generator.get_vehicle_directory(vin),
+      vehicle_metadata.RECORD_FNAME)
+  with open(record_fname, 'rb') as fobj:
+    saved = json.loads(fobj.read().decode('utf-8'))
+  saved['live']['timestamp_expires'] = timestamp_expires
+  with open(record_fname, 'wb') as fobj:
+    fobj.write(json.dumps(saved).encode('utf-8'))
+
+
+
+
+
+def read_metadata(metadata_dir, rolename):
+  with open(os.path.join(metadata_dir, rolename + '.json'), 'rb') as fobj:
+    return json.loads(fobj.read().decode('utf-8'))['signed']
+
+
+
+
+
+class TestVehicleMetadataGenerator(unittest.TestCase):
+
+  def test_01_init(self):
+    director_repos_dir = os.path.join(TEMP_TEST_DIR, 'init')
+
+    with self.assertRaises(tuf.FormatError):
+      make_generator(director_repos_dir, max_resident_vehicles=0)
+    with self.assertRaises(tuf.FormatError):
+      vehicle_metadata.VehicleMetadataGenerator(director_repos_dir,
+          role_keys['root'], role_keys['root'], 'not a key', 'not a key',
+          role_keys['snapshot'], role_keys['snapshot'],
+          role_keys['targets'], role_keys['targets'], signer=RecordingSigner())
+
+    signer = RecordingSigner()
+    generator = make_generator(director_repos_dir, signer)
+    self.assertEqual(1, generator.root_version)
+    self.assertEqual(['root'], signer.signed_roles)
+    self.assertEqual([], generator.get_vins())
+
+    with self.assertRaises(uptane.UnknownVehicle):
+      generator.get_targets('unknown_vin')
+    with self.assertRaises(uptane.UnknownVehicle):
+      generator.get_targets('../init')
+
+
+
+
+
+  def test_05_write_metadata(self):
+    signer = RecordingSigner()
+    generator = make_generator(os.path.join(TEMP_TEST_DIR, 'write'), signer)
+    vehicle_dir = generator.add_vehicle('vin1')
+    self.assertTrue(generator.has_vehicle('vin1'))
+    self.assertEqual(['vin1'], generator.get_vins())
+
+    add_image(generator, 'vin1', 'ecu1', 'firmware1.img', b'firmware 1')
+    with self.assertRaises(tuf.Error):
+      generator.add_target('vin1', 'ecu1', os.path.join(vehicle_dir, 'x.img'))
+
+    targets = generator.get_targets('vin1')
+    self.assertEqual(['firmware1.img'], list(targets))
+    self.assertEqual(len(b'firmware 1'), targets['firmware1.img']['length'])
+    self.assertEqual('ecu1', targets['firmware1.img']['custom']['ecu_serial'])
+
+    del signer.signed_roles[:]
+    metadata_dir = generator.write_metadata('vin1')
+    self.assertEqual(
+        os.path.join(vehicle_dir, vehicle_metadata.STAGED_METADATA_DIRNAME),
+        metadata_dir)
+    self.assertEqual(['snapshot', 'targets', 'timestamp'],
+        sorted(signer.signed_roles))
+    self.assertEqual(
+        targets, read_metadata(metadata_dir, 'targets')['targets'])
+    self.assertEqual(1, read_metadata(metadata_dir, 'root')['version'])
+
+    # Unless the targets change, the signed targets metadata is reused.
+    del signer.signed_roles[:]
+    generator.write_metadata('vin1')
+    self.assertEqual(['snapshot', 'timestamp'], sorted(signer.signed_roles))
+    self.assertEqual(1, read_metadata(metadata_dir, 'targets')['version'])
+    self.assertEqual(2, read_metadata(metadata_dir, 'snapshot')['version'])
+    self.assertEqual(2, read_metadata(metadata_dir, 'timestamp')['version'])
+
+    add_image(generator, 'vin1', 'ecu2', 'firmware2.img', b'firmware 2')
+    generator.write_metadata('vin1')
+    self.assertEqual(2, read_metadata(metadata_dir, 'targets')['version'])
+    self.assertEqual(['firmware1.img', 'firmware2.img'],
+        sorted(read_metadata(metadata_dir, 'targets')['targets']))
+
+    generator.clear_targets('vin1')
+    self.assertEqual({}, generator.get_targets('vin1'))
+
+    # Adding a vehicle again replaces its record.
+    add_image(generator, 'vin1', 'ecu1', 'firmware1.img', b'firmware 1')
+    generator.add_vehicle('vin1')
+    self.assertEqual({}, generator.get_targets('vin1'))
+
+
+
+
+
+  def test_10_eviction_and_reload(self):
+    director_repos_dir = os.path.join(TEMP_TEST_DIR, 'eviction')
+    generator = make_generator(director_repos_dir, max_resident_vehicles=2)
+
+    vins = ['vin' + str(i) for i in range(5)]
+    for vin in vins:
+      generator.add_vehicle(vin)
+      add_image(generator, vin, 'ecu_' + vin, 'firmware.img',
+          b'firmware for ' + vin.encode('utf-8'))
+      self.assertLessEqual(len(generator.vehicles), 2)
+
+    # Evicted records were saved, and are loaded again as needed, the most
+    # recently used ones staying in memory.
+    self.assertEqual(['vin3', 'vin4'], list(generator.vehicles))
+    self.assertEqual(vins, generator.get_vins())
+    self.assertEqual('ecu_vin0',
+        generator.get_targets('vin0')['firmware.img']['custom']['ecu_serial'])
+    self.assertEqual(['vin4', 'vin0'], list(generator.vehicles))
+
+    # Identical images assigned to different vehicles share their fileinfo.
+    add_image(generator, 'vin1', 'ecu_vin1', 'copy.img', b'firmware for vin0')
+    self.assertIs(generator.vehicles['vin0'].targets['firmware.img'][0],
+        generator.vehicles['vin1'].targets['copy.img'][0])
+
+    generator.write_metadata('vin0')
+    generator.write_metadata('vin0')
+    generator.flush()
+
+    # A new generator (e.g. after a restart) finds every vehicle and its
+    # targets, continues each vehicle's versions, and reuses the root
+    # metadata, since the role keys have not changed.
+    signer = RecordingSigner()
+    generator = make_generator(director_repos_dir, signer)
+    self.assertEqual(1, generator.root_version)
+    self.assertEqual([], signer.signed_roles)
+    self.assertEqual(vins, generator.get_vins())
+    self.assertEqual(0, len(generator.vehicles))
+    self.assertEqual(['copy.img', 'firmware.img'],
+        sorted(generator.get_targets('vin1')))
+
+    metadata_dir = generator.write_metadata('vin0')
+    self.assertEqual(['snapshot', 'timestamp'], sorted(signer.signed_roles))
+    self.assertEqual(3, read_metadata(metadata_dir, 'timestamp')['version'])
+
+    # Replacing a role key produces new root metadata. A generator created
+    # with the original keys again does not reuse it, but moves on from its
+    # version.
+    generator.set_role_keys({'timestamp': (
+        role_keys['targets'], role_keys['targets'])})
+    self.assertEqual(2, generator.root_version)
+    self.assertEqual(3, make_generator(director_repos_dir).root_version)
+
+
+
+
+
+  def test_15_publish(self):
+    generator = make_generator(os.path.join(TEMP_TEST_DIR, 'publish'))
+    for vin in ['vin1', 'vin2']:
+      generator.add_vehicle(vin)
+      add_image(generator, vin, 'ecu1', 'firmware.img', b'firmware')
+
+    vehicle_dir = generator.get_vehicle_directory('vin1')
+    live_dir = os.path.join(vehicle_dir, vehicle_metadata.LIVE_METADATA_DIRNAME)
+
+    # Only vehicles changed since they were last published are published.
+    self.assertEqual(['vin1', 'vin2'], generator.get_unpublished_vins())
+    self.assertEqual(['vin1', 'vin2'], generator.publish())
+    self.assertEqual([], generator.get_unpublished_vins())
+    self.assertEqual([], generator.publish())
+
+    self.assertTrue(os.path.islink(live_dir))
+    self.assertEqual('metadata.1', os.readlink(live_dir))
+    self.assertEqual(['firmware.img'],
+        list(read_metadata(live_dir, 'targets')['targets']))
+
+    add_image(generator, 'vin1', 'ecu2', 'firmware2.img', b'firmware 2')
+    self.assertEqual(['vin1'], generator.get_unpublished_vins())
+    self.assertEqual(['vin1'], generator.publish())
+    self.assertEqual(['firmware.img', 'firmware2.img'],
+        sorted(read_metadata(live_dir, 'targets')['targets']))
+
+    # The previously published directory is kept; older ones are removed.
+    generator.publish_metadata('vin1')
+    self.assertEqual('metadata.3', os.readlink(live_dir))
+    self.assertEqual(['metadata', 'metadata.2', 'metadata.3'], sorted(
+        dirname for dirname in os.listdir(vehicle_dir)
+        if dirname.startswith('metadata')))
+
+    # While metadata is published over and over, the live metadata is never
+    # missing or incomplete.
+    missing = []
+    done = threading.Event()
+
+    def read_live_metadata():
+      while not done.is_set():
+        for rolename in vehicle_metadata.TOP_LEVEL_ROLES:
+          if not os.path.exists(os.path.join(live_dir, rolename + '.json')):
+            missing.append(rolename)
+
+    reader = threading.Thread(target=read_live_metadata)
+    reader.start()
+    try:
+      for i in range(20):
+        generator.publish_metadata('vin1')
+    finally:
+      done.set()
+      reader.join()
+
+    self.assertEqual([], missing)
+    self.assertEqual('metadata.23', os.readlink(live_dir))
+
+    # Live metadata in a plain directory (not written by this module) is
+    # replaced by the symlink, and kept as the previous directory until the
+    # next publish.
+    vehicle_dir = generator.get_vehicle_directory('vin2')
+    live_dir = os.path.join(vehicle_dir, vehicle_metadata.LIVE_METADATA_DIRNAME)
+    os.remove(live_dir)
+    shutil.copytree(os.path.join(vehicle_dir, 'metadata.1'), live_dir)
+
+    generator.publish_metadata('vin2')
+    self.assertEqual('metadata.2', os.readlink(live_dir))
+    self.assertTrue(os.path.isdir(os.path.join(vehicle_dir, 'metadata.0')))
+    self.assertFalse(os.path.exists(os.path.join(vehicle_dir, 'metadata.1')))
+
+    generator.publish_metadata('vin2')
+    self.assertEqual('metadata.3', os.readlink(live_dir))
+    self.assertFalse(os.path.exists(os.path.join(vehicle_dir, 'metadata.0')))
+
+
+
+
+
+  def test_20_refresh_metadata(self):
+    signer = RecordingSigner()
+    generator = make_generator(os.path.join(TEMP_TEST_DIR, 'refresh'), signer)
+    vehicle_dir = generator.add_vehicle('vin1')
+    live_dir = os.path.join(vehicle_dir, vehicle_metadata.LIVE_METADATA_DIRNAME)
+    add_image(generator, 'vin1', 'ecu1', 'firmware.img', b'firmware')
+
+    # Metadata that has not been published is not refreshed.
+    self.assertIsNone(generator.refresh_metadata('vin1'))
+
+    generator.publish()
+    add_image(generator, 'vin1', 'ecu2', 'firmware2.img', b'firmware 2')
+
+    # Only the timestamp metadata is re-signed, the other files being linked
+    # into the new directory, and unpublished changes are not published.
+    del signer.signed_roles[:]
+    metadata_dir = generator.refresh_metadata('vin1')
+    self.assertEqual(os.path.join(vehicle_dir, 'metadata.2'), metadata_dir)
+    self.assertEqual('metadata.2', os.readlink(live_dir))
+    self.assertEqual(['timestamp'], signer.signed_roles)
+    for rolename in ['root', 'targets', 'snapshot']:
+      self.assertTrue(os.path.samefile(
+          os.path.join(vehicle_dir, 'metadata.1', rolename + '.json'),
+          os.path.join(metadata_dir, rolename + '.json')))
+    self.assertEqual(2, read_metadata(live_dir, 'timestamp')['version'])
+    self.assertEqual(['firmware.img'],
+        list(read_metadata(live_dir, 'targets')['targets']))
+    self.assertEqual(['vin1'], generator.get_unpublished_vins())
+
+    # Snapshot metadata that would expire first is re-signed too.
+    generator.vehicles['vin1'].live['snapshot_expires'] = 0
+    del signer.signed_roles[:]
+    generator.refresh_metadata('vin1')
+    self.assertEqual(['snapshot', 'timestamp'], sorted(signer.signed_roles))
+    self.assertEqual(2, read_metadata(live_dir, 'snapshot')['version'])
+    self.assertEqual(['firmware.img'],
+        list(read_metadata(live_dir, 'targets')['targets']))
+
+    # Targets metadata that would expire first means a full publish, with new
+    # targets metadata, even though the targets have not changed since.
+    generator.publish()
+    record = generator.vehicles['vin1']
+    record.targets_expires = record.live['targets_expires'] = 0
+    del signer.signed_roles[:]
+    generator.refresh_metadata('vin1')
+    self.assertEqual(['snapshot', 'targets', 'timestamp'],
+        sorted(signer.signed_roles))
+    self.assertEqual(3, read_metadata(live_dir, 'targets')['version'])
+    self.assertGreater(
+        generator.vehicles['vin1'].live['targets_expires'], time.time())
+
+    # So does replacing a role key.
+    generator.set_role_keys({'snapshot': (
+        role_keys['snapshot'], role_keys['snapshot'])})
+    del signer.signed_roles[:]
+    generator.refresh_metadata('vin1')
+    self.assertEqual(['snapshot', 'targets', 'timestamp'],
+        sorted(signer.signed_roles))
+    self.assertEqual(2, read_metadata(live_dir, 'root')['version'])
+    self.assertEqual([], generator.get_unpublished_vins())
+
+
+
+
+
+  def test_25_refresh_due_metadata(self):
+    director_repos_dir = os.path.join(TEMP_TEST_DIR, 'refresh_due')
+    generator = make_generator(director_repos_dir)
+    generator.timestamp_refresh_spread = 0
+    vins = ['vin1', 'vin2', 'vin3']
+    for vin in vins:
+      generator.add_vehicle(vin)
+    generator.publish()
+
+    # Nothing is due until shortly before the timestamp metadata expires.
+    self.assertEqual([], generator.refresh_due_metadata())
+    self.assertAlmostEqual(time.time() + vehicle_metadata.TIMESTAMP_EXPIRATION -
+        generator.timestamp_refresh_margin,
+        generator.get_next_refresh_time(), delta=10)
+
+    # Vehicles published by an earlier generator are scheduled from their
+    # saved records, and refreshed soonest-expiring first.
+    now = time.time()
+    for vin, timestamp_expires in [
+        ('vin1', now + 300), ('vin2', now + 100), ('vin3', now + 200)]:
+      set_timestamp_expiration(generator, vin, timestamp_expires)
+
+    signer = RecordingSigner()
+    generator = make_generator(director_repos_dir, signer)
+    generator.timestamp_refresh_spread = 0
+    self.assertIsNone(generator.get_next_refresh_time())
+    generator.schedule_refreshes()
+    self.assertEqual(0, len(generator.vehicles))
+
+    self.assertEqual(['vin2', 'vin3'], generator.refresh_due_metadata(2))
+    self.assertEqual(['vin1'], generator.refresh_due_metadata())
+    self.assertEqual([], generator.refresh_due_metadata())
+    self.assertEqual(['timestamp'] * 3, signer.signed_roles)
+
+    # A vehicle that cannot be refreshed is tried again later.
+    set_timestamp_expiration(generator, 'vin1', now)
+    with open(os.path.join(generator.get_vehicle_directory('vin1'),
+        'metadata', 'root.json'), 'rb') as fobj:
+      root_metadata_file = fobj.read()
+
+    signer = RecordingSigner()
+    signer.fail = True
+    generator = make_generator(director_repos_dir, signer)
+    generator.schedule_refreshes()
+
+    self.assertEqual([], generator.refresh_due_metadata())
+    self.assertAlmostEqual(now + vehicle_metadata.REFRESH_RETRY_DELAY,
+        generator.get_next_refresh_time(), delta=10)
+    self.assertEqual([], generator.refresh_due_metadata())
+
+    # After a restart, with signing working again, the refresh succeeds. The
+    # failed attempt's directory, whose name is reused, held hard links to the
+    # live metadata files; they are left intact.
+    generator = make_generator(director_repos_dir)
+    generator.schedule_refreshes()
+    self.assertEqual(['vin1'], generator.refresh_due_metadata())
+
+    vehicle_dir = generator.get_vehicle_directory('vin1')
+    live_dir = os.path.join(vehicle_dir, vehicle_metadata.LIVE_METADATA_DIRNAME)
+    self.assertEqual('metadata.3', os.readlink(live_dir))
+    for dirname in ['metadata.2', 'metadata.3']:
+      with open(os.path.join(vehicle_dir, dirname, 'root.json'), 'rb') as fobj:
+        self.assertEqual(root_metadata_file, fobj.read())
+
+
+
+
+
+  def test_30_metadata_refresher(self):
+    generator = make_generator(os.path.join(TEMP_TEST_DIR, 'refresher'))
+    vehicle_dir = generator.add_vehicle('vin1')
+    live_dir = os.path.join(vehicle_dir, vehicle_metadata.LIVE_METADATA_DIRNAME)
+    generator.publish()
+    set_timestamp_expiration(generator, 'vin1', time.time())
+
+    with self.assertRaises(tuf.FormatError):
+      vehicle_metadata.MetadataRefresher(generator, batch_size=0)
+
+    generator = make_generator(os.path.join(TEMP_TEST_DIR, 'refresher'))
+    refresher = vehicle_metadata.MetadataRefresher(
+        generator, batch_interval=0.01, max_sleep=0.05)
+    refresher.start()
+    try:
+      with self.assertRaises(uptane.Error):
+        refresher.start()
+
+      # The vehicle, due when the refresher started, is refreshed.
+      for i in range(500):
+        if os.readlink(live_dir) != 'metadata.1':
+          break
+        time.sleep(0.01)
+
+    finally:
+      refresher.stop()
+
+    self.assertEqual('metadata.2', os.readlink(live_dir))
+    self.assertGreater(generator.get_next_refresh_time(), time.time())
+
+    # Stopping again does nothing.
+    refresher.stop()
+
+
+
+
+
+  def test_35_unexpected_errors(self):
+    director_repos_dir = os.path.join(TEMP_TEST_DIR, 'unexpected_errors')
+    generator = make_generator(director_repos_dir)
+    vins = ['vin1', 'vin2', 'vin3']
+    for vin in vins:
+      generator.add_vehicle(vin)
+    generator.publish()
+    now = time.time()
+    for vin in vins:
+      set_timestamp_expiration(generator, vin, now)
+
+    # Errors other than the expected ones, here from the signer and from a
+    # damaged record, still leave every vehicle to be tried again.
+    signer = RecordingSigner()
+    signer.fail = True
+    signer.error = RuntimeError('Unexpected signing service error')
+    generator = make_generator(director_repos_dir, signer)
+    generator.schedule_refreshes()
+
+    with open(os.path.join(director_repos_dir, 'vin3',
+        vehicle_metadata.RECORD_FNAME), 'wb') as fobj:
+      fobj.write(b'{"targets": ')
+
+    initial_retry_delay = vehicle_metadata.REFRESH_RETRY_DELAY
+    vehicle_metadata.REFRESH_RETRY_DELAY = 0
+    try:
+      self.assertEqual([], generator.refresh_due_metadata())
+      signer.fail = False
+      self.assertEqual(['vin1', 'vin2'], generator.refresh_due_metadata())
+      self.assertEqual([], generator.refresh_due_metadata())
+      self.assertLessEqual(generator.get_next_refresh_time(), time.time())
+
+      # A generator that starts with the record damaged schedules it too.
+      generator = make_generator(director_repos_dir)
+      generator.schedule_refreshes()
+      self.assertLessEqual(generator.get_next_refresh_time(), time.time())
+
+    finally:
+      vehicle_metadata.REFRESH_RETRY_DELAY = initial_retry_delay
+
+    # The refresher's thread carries on after an unexpected error.
+    calls = []
+    refresh_due_metadata = generator.refresh_due_metadata
+
+    def failing_refresh_due_metadata(*args):
+      calls.append(args)
+      if len(calls) == 1:
+        raise RuntimeError('Unexpected error')
+      return refresh_due_metadata(*args)
+
+    generator.refresh_due_metadata = failing_refresh_due_metadata
+    refresher = vehicle_metadata.MetadataRefresher(
+        generator, batch_interval=0.01, max_sleep=0.01)
+    refresher.start()
+    try:
+      for i in range(500):
+        if len(calls) > 2:
+          break
+        time.sleep(0.01)
+    finally:
+      refresher.stop()
+
+    self.assertGreater(len(calls), 2)
+
+
+
+
+
+# Run unit tests.
+if __name__ == '__main__':
+  unittest.main()
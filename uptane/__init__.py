@@ -53,6 +53,13 @@ class BadTimeAttestation(Error):
   pass
 
 
+# Results of submitting a Vehicle Manifest to the Director, which may be busy
+# (see uptane.services.manifest_ingestion). Shared by the Director and
+# Primaries.
+MANIFEST_ACCEPTED = 'accepted'
+MANIFEST_BUSY = 'busy'
+
+
 # Logging configuration
 
 ## General logging configuration:
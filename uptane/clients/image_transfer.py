@@ -0,0 +1,408 @@
+"""
+<Program Name>
+  image_transfer.py
+
+<Purpose>
+  Block-by-block transfer of image files from a Primary to its Secondaries,
+  using the ImageRequest, ImageFile, and ImageBlock types from Uptane's ASN.1
+  definitions (uptane/encoding/asn1_definitions.py), DER-encoded.
+
+  Rather than sending an image in a single message (so that the memory used
+  by both sides and the size of the message grow with the size of the image),
+  the Primary describes the image in an ImageFile (its filename, its number of
+  blocks, and their size) and then sends the image a block at a time, each
+  block in an ImageBlock. Blocks are numbered from 1. Each block is read from
+  disk as it is requested, and written to disk as it is received, so the
+  memory used does not depend on the size of the image.
+
+  The Secondary writes the blocks it receives to a partial file. If the
+  transfer is interrupted, a new ImageReceiver for the same partial file
+  resumes from the first block not yet written. The image received is not
+  trusted on that account: as before, the Secondary must validate the
+  complete image against its metadata before using it. It does, though, give
+  the receiver the length its metadata lists for the image, and the receiver
+  refuses an ImageFile or blocks that do not add up to that length, so that
+  a Primary cannot make it write an endless stream of data.
+
+  Usage, on the Primary, where image_fname is the image assigned to the
+  Secondary, and filename the name under which it is sent:
+
+    filename = get_filename_from_image_request(image_request)
+    image_file = get_image_file(image_fname, filename)
+    image_block = get_image_block(image_fname, filename, block_number)
+
+  On the Secondary, where expected_length is the image's length according to
+  its metadata:
+
+    image_request = get_image_request(filename)
+    if get_filename_from_image_file(<image_file from Primary>) != filename:
+      <the Primary offers a different image>
+    receiver = ImageReceiver(
+        <image_file from Primary>, partial_fname, expected_length)
+    while not receiver.is_complete():
+      receiver.receive_block(<image block receiver.next_block_number from
+          Primary>)
+    receiver.finish(image_fname)
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import tuf
+import tuf.formats
+
+import os
+
+from pyasn1.type import tag
+import pyasn1.error
+import pyasn1.codec.der.encoder as p_der_encoder
+import pyasn1.codec.der.decoder as p_der_decoder
+
+import uptane.encoding.asn1_definitions as asn1_spec
+
+
+# The size of the blocks images are sent in, and the largest permitted: a
+# block is an OctetString, limited to 2048 bytes in the ASN.1 definitions.
+DEFAULT_BLOCK_SIZE = 2048
+MAX_BLOCK_SIZE = 2048
+
+# The most blocks to send in reply to a single request for several, keeping
+# the size of each reply bounded. (See get_image_blocks().)
+MAX_BLOCKS_PER_REQUEST = 64
+
+
+
+
+
+def get_image_request(filename):
+  """
+  Returns a DER-encoded ImageRequest for the image with the given filename.
+  """
+  tuf.formats.RELPATH_SCHEMA.check_match(filename)
+
+  image_request = asn1_spec.ImageRequest()
+  image_request['filename'] = filename
+
+  return p_der_encoder.encode(image_request)
+
+
+
+
+
+def get_filename_from_image_request(der_image_request):
+  """
+  Returns the filename requested in the given DER-encoded ImageRequest.
+
+  <Exceptions>
+    tuf.FormatError if der_image_request is not a DER-encoded ImageRequest.
+  """
+  image_request = _decode(der_image_request, asn1_spec.ImageRequest)
+  return str(image_request['filename'])
+
+
+
+
+
+def get_image_file(image_fname, filename, block_size=DEFAULT_BLOCK_SIZE):
+  """
+  <Purpose>
+    Returns a DER-encoded ImageFile describing the image in the file
+    image_fname, to be sent as filename in blocks of block_size bytes.
+
+  <Arguments>
+    image_fname
+      The image file on disk.
+
+    filename
+      The name under which to send the image, e.g. its filepath relative to
+      the targets directory.
+
+    block_size (optional)
+      The size of each block (except perhaps the last, which may be smaller),
+      at most MAX_BLOCK_SIZE.
+
+  <Exceptions>
+    tuf.FormatError, if an argument is not correctly formatted.
+
+    OSError or IOError, if image_fname cannot be read.
+  """
+  tuf.formats.PATH_SCHEMA.check_match(image_fname)
+  tuf.formats.RELPATH_SCHEMA.check_match(filename)
+  _check_block_size(block_size)
+
+  length = os.path.getsize(image_fname)
+
+  image_file = asn1_spec.ImageFile()
+  image_file['filename'] = filename
+  image_file['numberOfBlocks'] = (length + block_size - 1) // block_size
+  image_file['blockSize'] = block_size
+
+  return p_der_encoder.encode(image_file)
+
+
+
+
+
+def get_filename_from_image_file(der_image_file):
+  """
+  Returns the filename of the image described by the given DER-encoded
+  ImageFile, e.g. to check that it is the image requested before receiving
+  any of it.
+
+  <Exceptions>
+    tuf.FormatError if der_image_file is not a DER-encoded ImageFile.
+  """
+  image_file = _decode(der_image_file, asn1_spec.ImageFile)
+  return str(image_file['filename'])
+
+
+
+
+
+def get_image_block(
+    image_fname, filename, block_number, block_size=DEFAULT_BLOCK_SIZE):
+  """
+  <Purpose>
+    Returns a DER-encoded ImageBlock containing the given block (numbered
+    from 1) of the image in the file image_fname, as described by
+    get_image_file() with the same arguments. Only that block is read.
+
+  <Exceptions>
+    tuf.FormatError, if an argument is not correctly formatted.
+
+    uptane.Error, if the image has no such block.
+
+    OSError or IOError, if image_fname cannot be read.
+  """
+  tuf.formats.PATH_SCHEMA.check_match(image_fname)
+  tuf.formats.RELPATH_SCHEMA.check_match(filename)
+  tuf.formats.LENGTH_SCHEMA.check_match(block_number)
+  _check_block_size(block_size)
+
+  data = b''
+  if block_number >= 1:
+    with open(image_fname, 'rb') as fobj:
+      fobj.seek((block_number - 1) * block_size)
+      data = fobj.read(block_size)
+
+  if not data:
+    raise uptane.Error('Image ' + repr(filename) + ' has no block number ' +
+        repr(block_number))
+
+  image_block = asn1_spec.ImageBlock()
+  image_block['filename'] = filename
+  image_block['blockNumber'] = block_number
+
+  block = asn1_spec.BinaryData().subtype(explicitTag=tag.Tag(
+      tag.tagClassContext, tag.tagFormatConstructed, 2))
+  block['octetString'] = asn1_spec.OctetString(data).subtype(
+      implicitTag=tag.Tag(tag.tagClassContext, tag.tagFormatSimple, 1))
+  image_block['block'] = block
+
+  return p_der_encoder.encode(image_block)
+
+
+
+
+
+def get_image_blocks(image_fname, filename, first_block_number, count,
+    block_size=DEFAULT_BLOCK_SIZE):
+  """
+  <Purpose>
+    Returns a list of up to count (and at most MAX_BLOCKS_PER_REQUEST)
+    consecutive DER-encoded ImageBlocks, as get_image_block() returns them,
+    starting at first_block_number and stopping early at the end of the image.
+    Lets a Secondary fetch several blocks per round trip.
+
+  <Exceptions>
+    As for get_image_block(), if the image has no block first_block_number.
+  """
+  tuf.formats.LENGTH_SCHEMA.check_match(count)
+
+  image_blocks = [get_image_block(
+      image_fname, filename, first_block_number, block_size)]
+  length = os.path.getsize(image_fname)
+
+  for block_number in range(first_block_number + 1,
+      first_block_number + min(count, MAX_BLOCKS_PER_REQUEST)):
+    if (block_number - 1) * block_size >= length:
+      break
+    image_blocks.append(
+        get_image_block(image_fname, filename, block_number, block_size))
+
+  return image_blocks
+
+
+
+
+
+class ImageReceiver(object):
+  """
+  <Purpose>
+    Receives an image block by block, writing the blocks in order to a
+    partial file, and resuming from any blocks already in that file.
+
+  <Fields>
+
+    filename, number_of_blocks, block_size
+      As in the ImageFile the receiver was created with.
+
+    expected_length
+      The length of the image, as listed in its metadata. Only that much
+      data is accepted.
+
+    partial_fname
+      The file the blocks received are written to.
+
+    next_block_number
+      The number of the block expected next. Blocks already in the partial
+      file when the receiver is created are not requested again; a partial
+      block at the end of it (e.g. from an interrupted write) is discarded.
+  """
+
+  def __init__(self, der_image_file, partial_fname, expected_length):
+    """
+    <Exceptions>
+      tuf.FormatError, if der_image_file is not a DER-encoded ImageFile or
+      its block size is greater than MAX_BLOCK_SIZE.
+
+      uptane.Error, if the number and size of the blocks in the ImageFile do
+      not match expected_length. The partial file is then left untouched.
+    """
+    tuf.formats.PATH_SCHEMA.check_match(partial_fname)
+    tuf.formats.LENGTH_SCHEMA.check_match(expected_length)
+
+    image_file = _decode(der_image_file, asn1_spec.ImageFile)
+    self.filename = str(image_file['filename'])
+    self.number_of_blocks = int(image_file['numberOfBlocks'])
+    self.block_size = int(image_file['blockSize'])
+    self.partial_fname = partial_fname
+    self.expected_length = expected_length
+
+    _check_block_size(self.block_size)
+
+    if self.number_of_blocks != \
+        (expected_length + self.block_size - 1) // self.block_size:
+      raise uptane.Error('Image ' + repr(self.filename) + ' is offered as ' +
+          repr(self.number_of_blocks) + ' blocks of ' + repr(self.block_size) +
+          ' bytes, which does not match its expected length, ' +
+          repr(expected_length))
+
+    # Keep the full blocks already received, within the expected length. A
+    # short block at the end may have been cut off mid-write, so it is
+    # received again.
+    blocks_held = 0
+    if os.path.exists(partial_fname):
+      blocks_held = min(os.path.getsize(partial_fname),
+          expected_length) // self.block_size
+
+    with open(partial_fname, 'ab') as fobj:
+      fobj.truncate(blocks_held * self.block_size)
+
+    self.next_block_number = blocks_held + 1
+
+
+
+
+
+  def is_complete(self):
+    """
+    Returns True if every block of the image has been received.
+    """
+    return self.next_block_number > self.number_of_blocks
+
+
+
+
+
+  def receive_block(self, der_image_block):
+    """
+    <Purpose>
+      Writes the given DER-encoded ImageBlock to the partial file.
+
+    <Exceptions>
+      tuf.FormatError, if der_image_block is not a DER-encoded ImageBlock.
+
+      uptane.Error, if the block is not the one expected next for this image
+      (wrong filename or number), or is not of the size expected: every
+      block is block_size bytes, except the last, which holds the remainder
+      of expected_length.
+    """
+    image_block = _decode(der_image_block, asn1_spec.ImageBlock)
+
+    filename = str(image_block['filename'])
+    block_number = int(image_block['blockNumber'])
+    data = bytes(image_block['block']['octetString'])
+
+    if self.is_complete():
+      raise uptane.Error('Image ' + repr(self.filename) + ' is already '
+          'complete; received block ' + repr(block_number))
+
+    if filename != self.filename or block_number != self.next_block_number:
+      raise uptane.Error('Expected block ' + repr(self.next_block_number) +
+          ' of image ' + repr(self.filename) + '; received block ' +
+          repr(block_number) + ' of image ' + repr(filename))
+
+    expected_size = min(self.block_size,
+        self.expected_length - (block_number - 1) * self.block_size)
+
+    if len(data) != expected_size:
+      raise uptane.Error('Block ' + repr(block_number) + ' of image ' +
+          repr(self.filename) + ' has an unexpected size: ' + repr(len(data)))
+
+    with open(self.partial_fname, 'ab') as fobj:
+      fobj.write(data)
+
+    self.next_block_number += 1
+
+
+
+
+
+  def finish(self, image_fname):
+    """
+    Moves the complete image from the partial file to image_fname.
+
+    <Exceptions>
+      uptane.Error, if the image is not yet complete.
+    """
+    tuf.formats.PATH_SCHEMA.check_match(image_fname)
+
+    if not self.is_complete():
+      raise uptane.Error('Image ' + repr(self.filename) + ' is incomplete: '
+          'next expecting block ' + repr(self.next_block_number) + ' of ' +
+          repr(self.number_of_blocks))
+
+    os.rename(self.partial_fname, image_fname)
+
+
+
+
+
+def _check_block_size(block_size):
+  tuf.formats.LENGTH_SCHEMA.check_match(block_size)
+  if not 1 <= block_size <= MAX_BLOCK_SIZE:
+    raise tuf.FormatError('Block size must be from 1 to ' +
+        str(MAX_BLOCK_SIZE) + ' bytes; given ' + repr(block_size))
+
+
+
+
+
+def _decode(der_data, asn1_type):
+  """
+  Returns the DER data given decoded as an instance of asn1_type, raising
+  tuf.FormatError if it cannot be.
+  """
+  try:
+    decoded, remainder = p_der_decoder.decode(der_data, asn1Spec=asn1_type())
+  except (pyasn1.error.PyAsn1Error, TypeError, ValueError) as e:
+    raise tuf.FormatError('Expected a DER-encoded ' + asn1_type.__name__ +
+        ': ' + str(e))
+
+  if remainder:
+    raise tuf.FormatError('Unexpected data after DER-encoded ' +
+        asn1_type.__name__)
+
+  return decoded
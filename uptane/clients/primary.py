@@ -11,6 +11,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import uptane.formats
+import uptane.common
 import tuf.formats
 import tuf.conf
 from uptane.common import sign_signable
@@ -28,12 +29,17 @@ import random # for nonces
 from uptane import GREEN, RED, YELLOW, ENDCOLORS
 import zipfile
 import hashlib # if we're using DER encoding
+import multiprocessing.pool # for concurrent target downloads
 
 log = uptane.logging.getLogger('primary')
 log.addHandler(uptane.file_handler)
 log.addHandler(uptane.console_handler)
 log.setLevel(uptane.logging.DEBUG)
 
+# The default number of target files the Primary downloads at once during an
+# update cycle.
+DEFAULT_DOWNLOAD_THREADS = 4
+
 
 
 class Primary(object): # Consider inheriting from Secondary and refactoring.
@@ -91,6 +97,10 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       A dict mapping ECU Serial to the target file info that the Director has
       instructed that ECU to install.
 
+    download_threads:
+      The most target files that primary_update_cycle() downloads at once.
+      Defaults to DEFAULT_DOWNLOAD_THREADS. 1 downloads them one at a time.
+
     nonces_to_send:
       The list of nonces sent to us from Secondaries and not yet sent to the
       Timeserver.
@@ -121,6 +131,12 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       each update cycle, once it is safe to use. This is atomically moved into
       place (renamed) after it has been fully written, to avoid race conditions.
 
+    distributable_full_metadata_archive_id:
+    distributable_partial_metadata_id:
+      Identifiers (hex SHA-256 digests of the contents) of the two files
+      above, or None before they are first saved. A Secondary that holds the
+      file with a given identifier need not be sent it again.
+
 
   Methods, as called: ("self" arguments excluded):
 
@@ -138,6 +154,7 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       refresh_toplevel_metadata_from_repositories()
       get_target_list_from_director()
       get_validated_target_info()
+      get_validated_target_infos()
       validate_time_attestation(timeserver_attestation)
 
     Components of the interface available to a Secondary client:
@@ -147,10 +164,14 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       get_image_fname_for_ecu(ecu_serial)
       get_full_metadata_archive_fname()
       get_partial_metadata_fname()
+      get_full_metadata_archive_id()
+      get_partial_metadata_id()
       register_new_secondary(ecu_serial)
 
     Private methods:
       _check_ecu_serial(ecu_serial)
+      _validate_target_info(target_filepath)
+      _download_targets(targets, full_fnames, full_targets_directory)
 
 
   Use:
@@ -191,7 +212,8 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     primary_key,
     time,
     timeserver_public_key,
-    my_secondaries=[]):
+    my_secondaries=[],
+    download_threads=DEFAULT_DOWNLOAD_THREADS):
 
     """
     See class docstring.
@@ -204,6 +226,9 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
     tuf.formats.ANYKEY_SCHEMA.check_match(timeserver_public_key)
     tuf.formats.ANYKEY_SCHEMA.check_match(primary_key)
+    tuf.formats.LENGTH_SCHEMA.check_match(download_threads)
+    if download_threads < 1:
+      raise tuf.FormatError('download_threads must be at least 1.')
     # TODO: Should also check that primary_key is a private key, not a
     # public key.
 
@@ -216,6 +241,7 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     self.primary_key = primary_key
     self.my_secondaries = my_secondaries
     self.director_repo_name = director_repo_name
+    self.download_threads = download_threads
 
     self.temp_full_metadata_archive_fname = os.path.join(
         full_client_dir, 'metadata', 'temp_full_metadata_archive.zip')
@@ -229,6 +255,8 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     self.distributable_partial_metadata_fname = os.path.join(
         full_client_dir, 'metadata', 'director_targets.' +
         tuf.conf.METADATA_FORMAT)
+    self.distributable_full_metadata_archive_id = None
+    self.distributable_partial_metadata_id = None
 
     # Initializations not directly related to arguments.
     self.nonces_to_send = []
@@ -240,6 +268,17 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     # support the case in which multiple manifests have come from that ECU.
     self.ecu_manifests = {}
 
+    # Target info validated by get_validated_target_infos(), indexed by target
+    # filepath, kept while the metadata is unchanged. Each value is either the
+    # Director's target info or the tuf.UnknownTargetError raised in trying to
+    # validate it.
+    self._validated_target_infos = uptane.common.MetadataFingerprintMemo(
+        self.full_client_dir)
+
+    # The fingerprint of the metadata last saved for distribution to
+    # Secondaries by save_distributable_metadata_files().
+    self._distributed_metadata_fingerprint = None
+
 
     # Create a TUF-TAP-4-compliant updater object. This will read pinning.json
     # and create single-repository updaters within it to handle connections to
@@ -311,6 +350,9 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       This method returns only the Director's version of this target file info,
       which includes that "custom" field with ECU Serial assignments.
 
+      Results are kept while the metadata is unchanged, as described in
+      get_validated_target_infos().
+
     <Returns>
       Target file info compliant with tuf.formats.TARGETFILE_INFO_SCHEMA,
 
@@ -331,6 +373,64 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     """
     tuf.formats.RELPATH_SCHEMA.check_match(target_filepath)
 
+    result = self._validated_target_infos.get_results([target_filepath],
+        self._validate_target_info, tuf.UnknownTargetError)[target_filepath]
+
+    if isinstance(result, tuf.UnknownTargetError):
+      raise result
+
+    return result
+
+
+
+
+
+  def get_validated_target_infos(self, target_filepaths):
+    """
+    <Purpose>
+      Returns trustworthy target information for each of the given target
+      files, as get_validated_target_info() does for one, resolving them all
+      in one pass.
+
+      Results are kept for as long as the metadata this Primary holds is
+      unchanged (see uptane.common.MetadataFingerprintMemo), so in an
+      update cycle in which no new metadata was received, target info is not
+      validated again.
+
+    <Arguments>
+      target_filepaths
+        A list of target filepaths (tuf.formats.RELPATHS_SCHEMA).
+
+    <Returns>
+      A dictionary mapping each target filepath for which trustworthy target
+      info was found to the Director's target info for it (conforming to
+      tuf.formats.TARGETFILE_SCHEMA). Filepaths for which
+      get_validated_target_info() would raise tuf.UnknownTargetError are left
+      out. The target info returned should not be modified.
+
+    <Exceptions>
+      tuf.FormatError, if target_filepaths is not correctly formatted.
+
+      tuf.NoWorkingMirrorError or tuf.Error, as for
+      get_validated_target_info().
+    """
+    tuf.formats.RELPATHS_SCHEMA.check_match(target_filepaths)
+
+    results = self._validated_target_infos.get_results(target_filepaths,
+        self._validate_target_info, tuf.UnknownTargetError)
+
+    return {target_filepath: result for target_filepath, result in
+        results.items() if not isinstance(result, tuf.UnknownTargetError)}
+
+
+
+
+
+  def _validate_target_info(self, target_filepath):
+    """
+    Validates the given target's info through the updater, uncached, as
+    described in get_validated_target_info().
+    """
     validated_target_info = self.updater.target(
         target_filepath, multi_custom=True)
 
@@ -423,7 +523,7 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
     log.debug('Retrieving validated image file metadata from Director and OEM '
       'Repositories.')
 
-    # This next block employs get_validated_target_info calls to determine what
+    # This next block employs get_validated_target_infos to determine what
     # the right fileinfo (hash, length, etc) for each target file is. This
     # begins by matching paths/patterns in pinned.json to determine which
     # repository to connect to. Since pinned.json will generally assigns all
@@ -437,15 +537,14 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
 
     # This will contain a list of tuf.formats.TARGETFILE_SCHEMA objects.
     verified_targets = []
+    validated_target_infos = self.get_validated_target_infos(
+        [targetinfo['filepath'] for targetinfo in directed_targets])
     for targetinfo in directed_targets:
       target_filepath = targetinfo['filepath']
-      try:
-        # targetinfos = self.get_validated_target_info(target_filepath)
-        # for repo in targetinfos:
-        #   tuf.formats.TARGETFILE_SCHEMA.check_match(targetinfos[repo])
-        verified_targets.append(self.get_validated_target_info(target_filepath))
+      if target_filepath in validated_target_infos:
+        verified_targets.append(validated_target_infos[target_filepath])
 
-      except tuf.UnknownTargetError:
+      else:
         log.warning(RED + 'Director has instructed us to download a target (' +
             target_filepath + ') that is not validated by the combination of '
             'Director + OEM repositories. That update IS BEING SKIPPED. It may '
@@ -486,6 +585,12 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
         repr(verified_target_filepaths))
 
 
+    full_targets_directory = os.path.abspath(os.path.join(
+        self.full_client_dir, 'targets'))
+
+    # The targets to download, as (target, filepath, full_fname) tuples.
+    targets_to_download = []
+
     # For each target for which we have verified metadata:
     for target in verified_targets:
 
@@ -526,37 +631,38 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       # (In other words, enforce a jail.)
       # TODO: Do a proper review of this, and determine if it's necessary and
       # how to do it properly.
-      full_targets_directory = os.path.abspath(os.path.join(
-          self.full_client_dir, 'targets'))
       filepath = target['filepath']
       if filepath[0] == '/':
         filepath = filepath[1:]
       full_fname = os.path.join(full_targets_directory, filepath)
       enforce_jail(filepath, full_targets_directory)
 
-      # TODO: Remove this. It's here for convenience during dev & testing.
-      # Considerations on the ground by implementers / users of the reference
-      # implementation will decide what to do with target files after they've
-      # been used.
-      # Delete existing targets.
-      if os.path.exists(full_fname):
-        os.remove(full_fname)
-
-      # Download each target.
-      # Now that we have fileinfo for all targets listed by both the Director and
-      # the Supplier (mainrepo) -- which should include file2.txt in this test --
-      # we can download the target files and only keep each if it matches the
-      # verified fileinfo. This call will try every mirror on every repository
-      # within the appropriate delegation in pinned.json until one of them works.
-      # In this case, both the Director and OEM Repo are hosting the
-      # file, just for my convenience in setup. If you remove the file from the
-      # Director before calling this, it will still work (assuming OEM still
-      # has it). (The second argument here is just where to put the files.)
-      # This should include file2.txt.
-      try:
-        self.updater.download_target(target, full_targets_directory)
-
-      except tuf.NoWorkingMirrorError as e:
+      targets_to_download.append((target, filepath, full_fname))
+
+
+    # Download each target.
+    # Now that we have fileinfo for all targets listed by both the Director and
+    # the Supplier (mainrepo) -- which should include file2.txt in this test --
+    # we can download the target files and only keep each if it matches the
+    # verified fileinfo. This call will try every mirror on every repository
+    # within the appropriate delegation in pinned.json until one of them works.
+    # In this case, both the Director and OEM Repo are hosting the
+    # file, just for my convenience in setup. If you remove the file from the
+    # Director before calling this, it will still work (assuming OEM still
+    # has it). (The second argument here is just where to put the files.)
+    # This should include file2.txt.
+    # The downloads are independent of each other, so they are run
+    # concurrently, in up to self.download_threads threads, and the results
+    # are then reported here in order. See _download_targets().
+    download_errors = self._download_targets(
+        [target for target, unused, full_fname in targets_to_download],
+        [full_fname for unused, unused, full_fname in targets_to_download],
+        full_targets_directory)
+
+    for (target, filepath, full_fname), e in zip(
+        targets_to_download, download_errors):
+
+      if e is not None:
         print('')
         print(YELLOW + 'In downloading target ' + repr(filepath) + ', am unable '
             'to find a mirror providing a trustworthy file.\nChecking the mirrors'
@@ -568,7 +674,7 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
         print_banner(BANNER_DEFENDED, color=WHITE+DARK_BLUE_BG,
             text='No image was found that exactly matches the signed metadata '
             'from the Director and Image Repositories. Not keeping '
-            'untrustworthy files. ' + repr(target_filepath), sound=TADA)
+            'untrustworthy files. ' + repr(target['filepath']), sound=TADA)
         import time
         time.sleep(3)
 
@@ -584,8 +690,6 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
         print(GREEN + 'We have rejected these. Firmware not updated.\n' + ENDCOLORS)
 
       else:
-        assert(os.path.exists(full_fname)), 'Programming error: no download ' + \
-            'error, but file still does not exist.'
         print(GREEN + 'Successfully downloaded a trustworthy ' + repr(filepath) +
             ' image.' + ENDCOLORS)
 
@@ -634,6 +738,85 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
 
 
 
+  def _download_targets(self, targets, full_fnames, full_targets_directory):
+    """
+    <Purpose>
+      Downloads the given targets (tuf.formats.TARGETFILE_SCHEMA) into
+      full_targets_directory, up to self.download_threads of them at once,
+      deleting any file already at each target's location first. The wall
+      clock time taken is then close to that of the largest download, rather
+      than the sum of them all.
+
+      The updater only reads its trusted metadata when downloading a target,
+      and each download goes to its own temporary file, so downloads may run
+      concurrently. Targets with the same location on disk (full_fnames) are
+      downloaded one after another, in the order given, by the same thread.
+
+    <Exceptions>
+      Any exception other than tuf.NoWorkingMirrorError raised in downloading
+      a target.
+
+    <Returns>
+      A list with, for each target in order, None if it was downloaded, or the
+      tuf.NoWorkingMirrorError raised if no mirror provided a trustworthy
+      file.
+    """
+    # Group the targets by location, keeping the order they were given in.
+    indices_by_fname = {}
+    groups = []
+    for i, full_fname in enumerate(full_fnames):
+      if full_fname not in indices_by_fname:
+        indices_by_fname[full_fname] = []
+        groups.append(indices_by_fname[full_fname])
+      indices_by_fname[full_fname].append(i)
+
+    def download_group(indices):
+      errors = []
+      for i in indices:
+        # TODO: Remove this. It's here for convenience during dev & testing.
+        # Considerations on the ground by implementers / users of the
+        # reference implementation will decide what to do with target files
+        # after they've been used.
+        # Delete existing targets.
+        if os.path.exists(full_fnames[i]):
+          os.remove(full_fnames[i])
+
+        try:
+          self.updater.download_target(targets[i], full_targets_directory)
+
+        except tuf.NoWorkingMirrorError as e:
+          errors.append(e)
+
+        else:
+          assert(os.path.exists(full_fnames[i])), 'Programming error: no ' + \
+              'download error, but file still does not exist.'
+          errors.append(None)
+
+      return errors
+
+    if self.download_threads == 1 or len(groups) <= 1:
+      group_errors = [download_group(indices) for indices in groups]
+
+    else:
+      pool = multiprocessing.pool.ThreadPool(
+          min(self.download_threads, len(groups)))
+      try:
+        group_errors = pool.map(download_group, groups)
+      finally:
+        pool.close()
+        pool.join()
+
+    errors = [None] * len(targets)
+    for indices, errors_in_group in zip(groups, group_errors):
+      for i, error in zip(indices, errors_in_group):
+        errors[i] = error
+
+    return errors
+
+
+
+
+
   def get_image_fname_for_ecu(self, ecu_serial):
     """
     Given an ECU serial, returns:
@@ -696,6 +879,35 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
 
 
 
+  def get_full_metadata_archive_id(self):
+    """
+    Returns an identifier for the current contents of the full metadata
+    archive (see get_full_metadata_archive_fname()): a hex SHA-256 digest of
+    the file, which changes whenever the file does. Returns None if this
+    Primary has never completed an update cycle.
+
+    The identifier is updated just after the file is replaced, so a caller
+    that gets the identifier before reading the file may read a newer file
+    than identified (and later be sent it again unnecessarily), but never an
+    older one.
+    """
+    return self.distributable_full_metadata_archive_id
+
+
+
+
+
+  def get_partial_metadata_id(self):
+    """
+    As get_full_metadata_archive_id(), for the Director's targets metadata
+    file (see get_partial_metadata_fname()).
+    """
+    return self.distributable_partial_metadata_id
+
+
+
+
+
   def update_exists_for_ecu(self, ecu_serial):
     """
     Returns True if the Director has sent us instructions for the Secondary ECU
@@ -1035,10 +1247,23 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
   def save_distributable_metadata_files(self):
     """
     # TODO: Docstring.
+
+    If the metadata is unchanged since the files were last saved (per
+    uptane.common.compute_metadata_fingerprint), they are left as they are.
     """
 
     metadata_base_dir = os.path.join(self.full_client_dir, 'metadata')
 
+    fingerprint = uptane.common.compute_metadata_fingerprint(
+        self.full_client_dir)
+
+    if fingerprint == self._distributed_metadata_fingerprint and \
+        os.path.exists(self.distributable_full_metadata_archive_fname) and \
+        os.path.exists(self.distributable_partial_metadata_fname):
+      log.debug('Metadata unchanged; not rebuilding the metadata for '
+          'distribution to Secondaries.')
+      return
+
 
     # Save a gzipped version of all of the metadata.
     # TODO: <~> Update this for ASN.1 / DER.
@@ -1092,6 +1317,11 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
       os.remove(self.temp_partial_metadata_fname)
     shutil.copyfile(director_targets_file, self.temp_partial_metadata_fname)
 
+    # Identify the new files by their contents.
+    partial_metadata_id = _file_sha256(self.temp_partial_metadata_fname)
+    full_metadata_archive_id = _file_sha256(
+        self.temp_full_metadata_archive_fname)
+
     # Now move both files into place. For each file, this happens atomically
     # on POSIX-compliant systems and replaces any existing file.
     os.rename(
@@ -1101,6 +1331,27 @@ class Primary(object): # Consider inheriting from Secondary and refactoring.
         self.temp_full_metadata_archive_fname,
         self.distributable_full_metadata_archive_fname)
 
+    # Only after the files are in place, so that an identifier never refers to
+    # a file older than the one in place. See get_full_metadata_archive_id().
+    self.distributable_partial_metadata_id = partial_metadata_id
+    self.distributable_full_metadata_archive_id = full_metadata_archive_id
+
+    self._distributed_metadata_fingerprint = fingerprint
+
+
+
+
+
+def _file_sha256(fname):
+  """
+  Returns the hex SHA-256 digest of the contents of the given file.
+  """
+  digest = hashlib.sha256()
+  with open(fname, 'rb') as fobj:
+    for chunk in iter(lambda: fobj.read(65536), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
 
 
 
@@ -100,6 +100,7 @@ class Secondary(object):
       _expand_metadata_archive(metadata_archive_fname)
       fully_validate_metadata()
       get_validated_target_info(target_filepath)
+      get_validated_target_infos(target_filepaths)
       validate_image(image_fname)
 
 
@@ -151,6 +152,13 @@ class Secondary(object):
     # each repository.
     self.updater = tuf.client.updater.Updater('updater')
 
+    # Target info validated by get_validated_target_infos(), indexed by target
+    # filepath, kept while the metadata is unchanged. Each value is either the
+    # Director's target info or the tuf.UnknownTargetError raised in trying to
+    # validate it.
+    self._validated_target_infos = uptane.common.MetadataFingerprintMemo(
+        self.full_client_dir)
+
     # We load the given time twice for simplicity in later code.
     self.all_valid_timeserver_times = [time, time]
 
@@ -361,6 +369,7 @@ class Secondary(object):
 
     # Comb through the Director's direct instructions, picking out only the
     # target(s) earmarked for this ECU (by ECU Serial)
+    target_filepaths_for_this_ecu = []
     for target in self.updater.targets_of_role(
         rolename='targets', repo_name=self.director_repo_name):
 
@@ -370,16 +379,21 @@ class Secondary(object):
           self.ecu_serial != target['fileinfo']['custom']['ecu_serial']:
         continue
 
-      # Fully validate the target info for our target(s).
-      try:
+      target_filepaths_for_this_ecu.append(target['filepath'])
+
+    # Fully validate the target info for our target(s).
+    validated_target_infos = self.get_validated_target_infos(
+        target_filepaths_for_this_ecu)
+
+    for target_filepath in target_filepaths_for_this_ecu:
+      if target_filepath in validated_target_infos:
         validated_targets_for_this_ecu.append(
-            self.get_validated_target_info(target['filepath']))
-      except tuf.UnknownTargetError:
+            validated_target_infos[target_filepath])
+      else:
         log.error(RED + 'Unable to validate target ' +
-            repr(target['filepath']) + ', which the Director assigned to this '
+            repr(target_filepath) + ', which the Director assigned to this '
             'Secondary ECU, using the validation rules in pinned.json' +
             ENDCOLORS)
-        continue
 
 
     self.validated_targets_for_this_ecu = validated_targets_for_this_ecu
@@ -390,12 +404,86 @@ class Secondary(object):
 
   def get_validated_target_info(self, target_filepath):
     """
-    COPIED EXACTLY, MINUS COMMENTS, from primary.py.
-    # TODO: <~> Refactor later.
-    Throws tuf.UnknownTargetError if unable to find/validate a target.
+    <Purpose>
+      Returns trustworthy target information for the given target file, from
+      the Director, validated against the other repositories as required by
+      this Secondary's pinned.json, using the metadata this Secondary holds.
+      Only the Director's version of the target info, which includes the
+      "custom" field with the ECU Serial assignment, is returned.
+
+      Results are kept while the metadata is unchanged, as described in
+      get_validated_target_infos().
+
+    <Returns>
+      Target file info compliant with tuf.formats.TARGETFILE_SCHEMA.
+
+    <Exceptions>
+      tuf.UnknownTargetError
+        if the target is not listed by the consensus of the repositories
+        required by pinned.json.
+
+      tuf.NoWorkingMirrorError
+        if reliable target info cannot be validated for the target (e.g. if
+        the repositories do not agree).
     """
     tuf.formats.RELPATH_SCHEMA.check_match(target_filepath)
 
+    result = self._validated_target_infos.get_results([target_filepath],
+        self._validate_target_info, tuf.UnknownTargetError)[target_filepath]
+
+    if isinstance(result, tuf.UnknownTargetError):
+      raise result
+
+    return result
+
+
+
+
+
+  def get_validated_target_infos(self, target_filepaths):
+    """
+    <Purpose>
+      Returns trustworthy target information for each of the given target
+      files, as get_validated_target_info() does for one.
+
+      Results are kept for as long as the metadata this Secondary holds is
+      unchanged (see uptane.common.MetadataFingerprintMemo), so target info
+      is not validated again until new metadata is processed.
+
+    <Arguments>
+      target_filepaths
+        A list of target filepaths (tuf.formats.RELPATHS_SCHEMA).
+
+    <Returns>
+      A dictionary mapping each target filepath for which trustworthy target
+      info was found to the Director's target info for it (conforming to
+      tuf.formats.TARGETFILE_SCHEMA). Filepaths for which
+      get_validated_target_info() would raise tuf.UnknownTargetError are left
+      out. The target info returned should not be modified.
+
+    <Exceptions>
+      tuf.FormatError, if target_filepaths is not correctly formatted.
+
+      tuf.NoWorkingMirrorError or tuf.Error, as for
+      get_validated_target_info().
+    """
+    tuf.formats.RELPATHS_SCHEMA.check_match(target_filepaths)
+
+    results = self._validated_target_infos.get_results(target_filepaths,
+        self._validate_target_info, tuf.UnknownTargetError)
+
+    return {target_filepath: result for target_filepath, result in
+        results.items() if not isinstance(result, tuf.UnknownTargetError)}
+
+
+
+
+
+  def _validate_target_info(self, target_filepath):
+    """
+    Validates the given target's info through the updater, uncached, as
+    described in get_validated_target_info().
+    """
     validated_target_info = self.updater.target(
         target_filepath, multi_custom=True)
 
@@ -11,6 +11,7 @@ import json
 import os
 import shutil
 import copy
+import hashlib
 
 SUPPORTED_KEY_TYPES = ['ed25519', 'rsa']
 
@@ -192,6 +193,122 @@ def create_directory_structure_for_client(
 
 
 
+
+def compute_metadata_fingerprint(client_dir):
+  """
+  Returns a fingerprint (a hex SHA-256 digest) of the current metadata a
+  client holds from all its repositories, i.e. of the files
+  <client_dir>/metadata/*/current/*, as created by
+  create_directory_structure_for_client. The fingerprint changes whenever any
+  of those files is added, removed, or changed, so results derived from the
+  metadata can be kept for as long as the fingerprint stays the same.
+  """
+  tuf.formats.PATH_SCHEMA.check_match(client_dir)
+
+  metadata_base_dir = os.path.join(client_dir, 'metadata')
+  digest = hashlib.sha256()
+
+  if not os.path.isdir(metadata_base_dir):
+    return digest.hexdigest()
+
+  for repo_dir in sorted(os.listdir(metadata_base_dir)):
+    abs_repo_dir = os.path.join(metadata_base_dir, repo_dir, 'current')
+    if not os.path.isdir(abs_repo_dir):
+      continue
+
+    for role_fname in sorted(os.listdir(abs_repo_dir)):
+      role_abs_fname = os.path.join(abs_repo_dir, role_fname)
+      if not os.path.isfile(role_abs_fname):
+        continue
+
+      with open(role_abs_fname, 'rb') as fobj:
+        data = fobj.read()
+
+      # Include names and lengths, so that files cannot run into each other.
+      for part in (repo_dir, role_fname):
+        part = part.encode('utf-8')
+        digest.update(str(len(part)).encode('ascii') + b':' + part)
+      digest.update(str(len(data)).encode('ascii') + b':' + data)
+
+  return digest.hexdigest()
+
+
+
+
+
+class MetadataFingerprintMemo(object):
+  """
+  Keeps results derived from the metadata a client holds for as long as that
+  metadata is unchanged, as judged by compute_metadata_fingerprint. The
+  Primary and Secondary clients use this so that, in an update cycle in which
+  no new metadata was received, target info is not validated again.
+  """
+
+  def __init__(self, client_dir):
+    tuf.formats.PATH_SCHEMA.check_match(client_dir)
+
+    self.client_dir = client_dir
+
+    # Results indexed by key, for the metadata with the fingerprint below.
+    self._results = {}
+    self._fingerprint = None
+
+
+
+
+
+  def get_results(self, keys, compute, expected_errors=()):
+    """
+    <Purpose>
+      Returns the result of compute(key) for each of the given keys, computing
+      only those not already kept for the current metadata. All kept results
+      are discarded first if the metadata has changed since they were
+      computed.
+
+    <Arguments>
+      keys
+        A list of hashable keys, e.g. target filepaths. Duplicates are
+        computed only once.
+
+      compute
+        A function taking one key and returning its result.
+
+      expected_errors (optional)
+        An exception class, or a tuple of them, that compute may raise to
+        report a result that should also be kept (e.g.
+        tuf.UnknownTargetError). Other exceptions are raised to the caller and
+        nothing is kept for that key.
+
+    <Returns>
+      A dictionary mapping each key to its result, or to the exception of one
+      of the expected_errors types raised in computing it.
+    """
+    fingerprint = compute_metadata_fingerprint(self.client_dir)
+
+    if fingerprint != self._fingerprint:
+      self._results = {}
+      self._fingerprint = fingerprint
+
+    results = {}
+
+    for key in keys:
+      if key in results:
+        continue
+
+      if key not in self._results:
+        try:
+          self._results[key] = compute(key)
+        except expected_errors as e:
+          self._results[key] = e
+
+      results[key] = self._results[key]
+
+    return results
+
+
+
+
+
 def scrub_filename(fname, expected_containing_dir):
   """
   DO NOT ASSUME THAT THIS TEMPORARY FUNCTION IS SECURE.
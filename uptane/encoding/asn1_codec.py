@@ -23,6 +23,7 @@ import tuf.formats
 import uptane.formats
 import logging
 import hashlib
+import six
 
 logger = logging.getLogger('uptane.asn1_codec')
 
@@ -194,6 +195,161 @@ def convert_signed_der_to_dersigned_json(der_data, datatype='time_attestation'):
 
 
 
+def get_signed_der_slices(der_data, datatype='time_attestation'):
+  """
+  <Purpose>
+    Locate the DER encoding of the 'signed' element(s) of the given
+    DER-encoded signable, without decoding or re-encoding anything, so that
+    signatures can be checked over the exact bytes that were received.
+
+    Signatures on Uptane DER metadata are over the DER encoding of the 'signed'
+    element, which is the first element of the signable's outermost
+    SEQUENCE. Rather than calling convert_signed_metadata_to_der(...,
+    only_signed=True) after decoding (a full pyasn1 encode that reproduces
+    bytes we already have), callers can hash the slices this returns.
+
+    Only the tag-length-value headers along the way are read; the slices
+    returned are memoryviews into der_data, so no data is copied.
+
+  <Arguments>
+    der_data:
+      DER-encoded signable metadata, as bytes, matching
+      uptane.formats.DER_DATA_SCHEMA.
+
+    datatype:
+      String chosen from SUPPORTED_ASN1_METADATA_MODULES. See
+      convert_signed_der_to_dersigned_json.
+
+  <Returns>
+    A dictionary. 'signed' maps to a memoryview of the DER encoding of the
+    'signed' element.
+
+    If datatype is 'vehicle_manifest', there is also an
+    'ecu_version_manifests' entry, mapping each ECU Serial to a list of
+    memoryviews of the DER encodings of the 'signed' elements of the ECU
+    Manifests from that ECU contained in the Vehicle Manifest, in the order in
+    which they appear. (This is also the order of the lists of ECU Manifests
+    produced by convert_signed_der_to_dersigned_json.)
+
+  <Exceptions>
+    tuf.Error if der_data is not well-formed DER of the expected structure.
+  """
+  uptane.formats.DER_DATA_SCHEMA.check_match(der_data)
+  ensure_valid_metadata_type_for_asn1(datatype)
+
+  der_view = memoryview(der_data)
+
+  # The signable is a SEQUENCE whose first element is 'signed'.
+  signed_start = _read_der_header(der_data, 0)[1]
+  (signed_content_start, signed_end) = _read_der_header(
+      der_data, signed_start)[1:]
+  slices = {'signed': der_view[signed_start:signed_end]}
+
+  if datatype != 'vehicle_manifest':
+    return slices
+
+  # Find ecuVersionManifests ([3]) among the elements of the Vehicle
+  # Manifest's 'signed' element. Each of its elements is an ECU Manifest: a
+  # SEQUENCE whose first element is its own 'signed' element, the first
+  # element of which is the ECU Serial (ecuIdentifier, [0]).
+  ecu_slices = {}
+  for (tag_number, element_start, content_start, content_end) in \
+      _iter_der_elements(der_data, signed_content_start, signed_end):
+
+    if tag_number != 3:
+      continue
+
+    for (unused, manifest_start, manifest_content_start, manifest_end) in \
+        _iter_der_elements(der_data, content_start, content_end):
+
+      ecu_signed_start = manifest_content_start
+      (ecu_signed_content_start, ecu_signed_end) = _read_der_header(
+          der_data, ecu_signed_start)[1:]
+      (serial_tag, serial_start, serial_end) = _read_der_header(
+          der_data, ecu_signed_content_start)
+
+      if serial_tag != 0:
+        raise tuf.Error('Unexpected DER structure: ECU Manifest does not '
+            'begin with an ECU Serial.')
+
+      ecu_serial = der_view[serial_start:serial_end].tobytes().decode('ascii')
+      ecu_slices.setdefault(ecu_serial, []).append(
+          der_view[ecu_signed_start:ecu_signed_end])
+
+  slices['ecu_version_manifests'] = ecu_slices
+
+  return slices
+
+
+
+
+
+def _read_der_header(der_data, offset):
+  """
+  Reads the tag and length of the DER element beginning at offset in
+  der_data. Returns a tuple (tag_number, content_start, content_end), where
+  content_start and content_end delimit the element's contents.
+
+  Only the low-tag-number form (tag numbers up to 30) and definite lengths are
+  supported, which is all that DER and Uptane's ASN.1 definitions require.
+  Raises tuf.Error if the element is malformed or extends past the end of
+  der_data.
+  """
+  try:
+    identifier = six.indexbytes(der_data, offset)
+    if identifier & 0x1f == 0x1f:
+      raise tuf.Error('Unsupported DER: high tag number at offset ' +
+          repr(offset))
+
+    length = six.indexbytes(der_data, offset + 1)
+    content_start = offset + 2
+
+    if length & 0x80:
+      # Long form: the low bits give the number of length octets that follow.
+      number_of_octets = length & 0x7f
+      if number_of_octets == 0:
+        raise tuf.Error('Invalid DER: indefinite length at offset ' +
+            repr(offset))
+      length = 0
+      for i in range(number_of_octets):
+        length = (length << 8) | six.indexbytes(der_data, content_start + i)
+      content_start += number_of_octets
+
+  except IndexError:
+    raise tuf.Error('Invalid DER: truncated element at offset ' +
+        repr(offset))
+
+  content_end = content_start + length
+  if content_end > len(der_data):
+    raise tuf.Error('Invalid DER: element at offset ' + repr(offset) +
+        ' extends past the end of the data.')
+
+  return (identifier & 0x1f, content_start, content_end)
+
+
+
+
+
+def _iter_der_elements(der_data, start, end):
+  """
+  Iterates over the consecutive DER elements in der_data[start:end] (e.g. the
+  contents of a SEQUENCE), yielding a tuple (tag_number, element_start,
+  content_start, content_end) for each.
+  """
+  offset = start
+  while offset < end:
+    (tag_number, content_start, content_end) = _read_der_header(
+        der_data, offset)
+    if content_end > end:
+      raise tuf.Error('Invalid DER: element at offset ' + repr(offset) +
+          ' extends past the end of its enclosing element.')
+    yield (tag_number, offset, content_start, content_end)
+    offset = content_end
+
+
+
+
+
 # TODO: Remove default datatype and update calling modules to add this
 # parameter.
 def convert_signed_metadata_to_der(
@@ -0,0 +1,358 @@
+"""
+<Program Name>
+  manifest_records.py
+
+<Purpose>
+  Compact in-memory representations of signed ECU Manifests and Vehicle
+  Manifests, for keeping large numbers of them (e.g. the Director's manifest
+  history for a fleet).
+
+  A signed manifest in the form of uptane.formats.SIGNABLE_*_SCHEMA is a
+  nest of dictionaries and strings: hex keyids, signatures and hashes, and
+  ISO8601 times. The records here hold the same information in objects with
+  __slots__, with keyids, signatures and hashes as raw bytes, times as
+  integers (seconds since the epoch), and frequently repeated strings (ECU
+  Serials, filepaths, hash algorithm and signature method names) shared.
+
+  Conversion is lossless: for any manifest that matches its schema,
+
+    ecu_manifest_from_dict(m).to_dict() == m
+
+  (except that keys not in the schema are not kept). Values that have no
+  compact form that converts back exactly, e.g. hex strings in upper case,
+  are simply kept as given.
+
+  Usage:
+
+    record = ecu_manifest_from_dict(signed_ecu_manifest)
+    record.ecu_serial, record.timeserver_time, record.filepath, ...
+    signed_ecu_manifest = record.to_dict()
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane.formats
+
+import binascii
+import calendar
+import time
+
+from six.moves import intern
+
+
+_ISO8601_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+
+
+
+def _share(string):
+  """
+  Returns the shared copy of a string that recurs across many manifests (an
+  ECU Serial, VIN, filepath, or method or algorithm name), so that each
+  distinct one is held only once. Interned strings are freed when no longer
+  referenced, so the strings sent by ECUs cannot grow this without bound.
+  Free-form strings (e.g. attacks_detected) are not shared.
+  """
+  try:
+    return intern(string)
+  except TypeError: # Python 2 interns only byte strings.
+    return string
+
+
+
+
+
+def _hex_to_bytes(hex_string):
+  """
+  Returns the bytes the given hex string encodes, or the string itself if it
+  would not convert back exactly (e.g. it has upper case digits or an odd
+  length).
+  """
+  try:
+    raw = binascii.unhexlify(hex_string)
+  except (TypeError, ValueError, binascii.Error):
+    return hex_string
+
+  if binascii.hexlify(raw).decode('ascii') != hex_string:
+    return hex_string
+
+  return raw
+
+
+
+
+
+def _bytes_to_hex(raw):
+  if isinstance(raw, bytes):
+    return binascii.hexlify(raw).decode('ascii')
+  return raw
+
+
+
+
+
+def _iso8601_to_int(datetime_string):
+  """
+  Returns the given ISO8601 time as seconds since the epoch, or the string
+  itself if it would not convert back exactly.
+  """
+  try:
+    unix_time = calendar.timegm(time.strptime(datetime_string, _ISO8601_FORMAT))
+  except ValueError:
+    return datetime_string
+
+  if _int_to_iso8601(unix_time) != datetime_string:
+    return datetime_string
+
+  return unix_time
+
+
+
+
+
+def _int_to_iso8601(unix_time):
+  if isinstance(unix_time, int):
+    return time.strftime(_ISO8601_FORMAT, time.gmtime(unix_time))
+  return unix_time
+
+
+
+
+
+class _Record(object):
+  """
+  Base class for the records below: compares by value, over _fields.
+  """
+  __slots__ = []
+  _fields = ()
+
+  def __eq__(self, other):
+    return type(self) is type(other) and all(
+        getattr(self, f) == getattr(other, f) for f in self._fields)
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None
+
+  def __repr__(self):
+    return type(self).__name__ + '(' + ', '.join(
+        f + '=' + repr(getattr(self, f)) for f in self._fields) + ')'
+
+
+
+
+
+class SignatureRecord(_Record):
+  """
+  A signature (tuf.formats.SIGNATURE_SCHEMA). keyid and sig are bytes.
+  """
+  __slots__ = _fields = ('keyid', 'method', 'sig')
+
+  def __init__(self, keyid, method, sig):
+    self.keyid = keyid
+    self.method = method
+    self.sig = sig
+
+
+  def to_dict(self):
+    return {'keyid': _bytes_to_hex(self.keyid), 'method': self.method,
+        'sig': _bytes_to_hex(self.sig)}
+
+
+
+
+
+def signature_from_dict(signature):
+  return SignatureRecord(_hex_to_bytes(signature['keyid']),
+      _share(signature['method']), _hex_to_bytes(signature['sig']))
+
+
+
+
+
+class EcuManifestRecord(_Record):
+  """
+  <Purpose>
+    A signed ECU Manifest (uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA).
+
+  <Fields>
+    ecu_serial, attacks_detected
+      As in the manifest.
+
+    timeserver_time, previous_timeserver_time
+      Seconds since the epoch.
+
+    filepath, length, custom
+      The installed image's filepath, and its fileinfo's length and custom
+      data (None if there is none).
+
+    hashes
+      A tuple of (algorithm, hash as bytes) pairs, sorted by algorithm.
+
+    signatures
+      A tuple of SignatureRecords.
+  """
+  __slots__ = ('ecu_serial', 'timeserver_time', 'previous_timeserver_time',
+      'attacks_detected', 'filepath', 'length', 'hashes', 'custom',
+      'signatures', '__weakref__')
+  _fields = __slots__[:-1]
+
+  def __init__(self, ecu_serial, timeserver_time, previous_timeserver_time,
+      attacks_detected, filepath, length, hashes, custom, signatures):
+    self.ecu_serial = ecu_serial
+    self.timeserver_time = timeserver_time
+    self.previous_timeserver_time = previous_timeserver_time
+    self.attacks_detected = attacks_detected
+    self.filepath = filepath
+    self.length = length
+    self.hashes = hashes
+    self.custom = custom
+    self.signatures = signatures
+
+
+  def to_dict(self):
+    """
+    Returns the manifest as a dictionary conforming to
+    uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.
+    """
+    fileinfo = {'length': self.length, 'hashes':
+        {algorithm: _bytes_to_hex(digest) for algorithm, digest in self.hashes}}
+    if self.custom is not None:
+      fileinfo['custom'] = self.custom
+
+    return {
+        'signed': {
+            'ecu_serial': self.ecu_serial,
+            'timeserver_time': _int_to_iso8601(self.timeserver_time),
+            'previous_timeserver_time':
+                _int_to_iso8601(self.previous_timeserver_time),
+            'attacks_detected': self.attacks_detected,
+            'installed_image': {
+                'filepath': self.filepath,
+                'fileinfo': fileinfo}},
+        'signatures': [signature.to_dict() for signature in self.signatures]}
+
+
+
+
+
+def ecu_manifest_from_dict(signed_ecu_manifest):
+  """
+  <Purpose>
+    Returns an EcuManifestRecord holding the given signed ECU Manifest.
+
+  <Exceptions>
+    tuf.FormatError if signed_ecu_manifest does not conform to
+    uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.
+  """
+  uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.check_match(
+      signed_ecu_manifest)
+
+  return _ecu_manifest_from_checked_dict(signed_ecu_manifest)
+
+
+
+
+
+def _ecu_manifest_from_checked_dict(signed_ecu_manifest):
+  signed = signed_ecu_manifest['signed']
+  installed_image = signed['installed_image']
+  fileinfo = installed_image['fileinfo']
+
+  return EcuManifestRecord(
+      _share(signed['ecu_serial']),
+      _iso8601_to_int(signed['timeserver_time']),
+      _iso8601_to_int(signed['previous_timeserver_time']),
+      signed['attacks_detected'],
+      _share(installed_image['filepath']),
+      fileinfo['length'],
+      tuple(sorted((_share(algorithm), _hex_to_bytes(digest))
+          for algorithm, digest in fileinfo['hashes'].items())),
+      fileinfo.get('custom'),
+      tuple(signature_from_dict(s) for s in signed_ecu_manifest['signatures']))
+
+
+
+
+
+class VehicleManifestRecord(_Record):
+  """
+  <Purpose>
+    A signed Vehicle Manifest
+    (uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA).
+
+  <Fields>
+    vin, primary_ecu_serial
+      As in the manifest.
+
+    ecu_version_manifests
+      A tuple of (ECU Serial, tuple of EcuManifestRecords) pairs.
+
+    signatures
+      A tuple of SignatureRecords.
+  """
+  __slots__ = ('vin', 'primary_ecu_serial', 'ecu_version_manifests',
+      'signatures', '__weakref__')
+  _fields = __slots__[:-1]
+
+  def __init__(self, vin, primary_ecu_serial, ecu_version_manifests,
+      signatures):
+    self.vin = vin
+    self.primary_ecu_serial = primary_ecu_serial
+    self.ecu_version_manifests = ecu_version_manifests
+    self.signatures = signatures
+
+
+  def to_dict(self):
+    """
+    Returns the manifest as a dictionary conforming to
+    uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.
+    """
+    return {
+        'signed': {
+            'vin': self.vin,
+            'primary_ecu_serial': self.primary_ecu_serial,
+            'ecu_version_manifests': {
+                ecu_serial: [m.to_dict() for m in ecu_manifests]
+                for ecu_serial, ecu_manifests in self.ecu_version_manifests}},
+        'signatures': [signature.to_dict() for signature in self.signatures]}
+
+
+
+
+
+def vehicle_manifest_from_dict(signed_vehicle_manifest,
+    ecu_manifest_from_dict=_ecu_manifest_from_checked_dict):
+  """
+  <Purpose>
+    Returns a VehicleManifestRecord holding the given signed Vehicle Manifest.
+
+  <Arguments>
+    signed_vehicle_manifest
+      A dictionary conforming to
+      uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.
+
+    ecu_manifest_from_dict (optional)
+      The function used to convert each ECU Manifest in the Vehicle Manifest
+      to an EcuManifestRecord, e.g. one that returns a record already held
+      for the same manifest.
+
+  <Exceptions>
+    tuf.FormatError if signed_vehicle_manifest does not conform to the schema.
+  """
+  uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
+      signed_vehicle_manifest)
+
+  signed = signed_vehicle_manifest['signed']
+
+  return VehicleManifestRecord(
+      _share(signed['vin']),
+      _share(signed['primary_ecu_serial']),
+      tuple((_share(ecu_serial), tuple(ecu_manifest_from_dict(m)
+          for m in ecu_manifests)) for ecu_serial, ecu_manifests in
+          sorted(signed['ecu_version_manifests'].items())),
+      tuple(signature_from_dict(s)
+          for s in signed_vehicle_manifest['signatures']))
@@ -34,15 +34,21 @@ import uptane
 import uptane.formats
 import uptane.common
 import uptane.services.inventorydb as inventory
+import uptane.services.vehicle_metadata as vehicle_metadata
+import uptane.services.manifest_analysis as manifest_analysis
 import uptane.encoding.asn1_codec as asn1_codec
 import tuf
+import tuf.conf
 import tuf.formats
-import tuf.repository_tool as rt
 #import uptane.ber_encoder as ber_encoder
 from uptane import GREEN, RED, YELLOW, ENDCOLORS
 
 import os
 import hashlib
+import multiprocessing
+import multiprocessing.pool
+import threading
+import collections
 
 log = uptane.logging.getLogger('director')
 log.addHandler(uptane.file_handler)
@@ -51,6 +57,116 @@ log.setLevel(uptane.logging.DEBUG)
 
 
 
+class SignatureVerificationCache(object):
+  """
+  <Purpose>
+    A bounded, least-recently-used cache of the results of signature checks,
+    so that a signature over identical data by the same key (e.g. a manifest
+    resubmitted by a Primary retrying a request) is only verified once.
+
+    Entries are keyed on (SHA-256 digest of the public key's type and value,
+    SHA-256 digest of the data signed, signature value, signature method).
+    The key is identified by its material rather than by its keyid, which is
+    only a claim: a key registered under the same keyid, or a differently
+    computed keyid for the same key, must not share another key's results.
+    For ASN.1/DER metadata, the data signed is itself the SHA-256 digest of
+    the DER encoding of the 'signed' element.
+
+    Both valid and invalid results are cached. The cache may be used from
+    several threads.
+
+  <Fields>
+    max_entries
+      The maximum number of results retained. When the cache is full, the
+      least recently used entry is evicted. If 0, nothing is cached.
+
+    hits, misses
+      Counts of lookups that did and did not find a cached result.
+  """
+
+  def __init__(self, max_entries=10000):
+    tuf.formats.LENGTH_SCHEMA.check_match(max_entries)
+
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+    self._results = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+
+
+
+
+  @staticmethod
+  def make_key(public_key, signature, data_to_check):
+    """
+    Returns the cache key for a check of the given signature by the given key
+    over the given data (bytes, or for JSON metadata, a dictionary).
+    """
+    if not isinstance(data_to_check, bytes):
+      data_to_check = tuf.formats.encode_canonical(
+          data_to_check).encode('utf-8')
+
+    key_digest = hashlib.sha256((public_key['keytype'] + '\0' +
+        public_key['keyval']['public']).encode('utf-8')).digest()
+
+    return (key_digest, hashlib.sha256(data_to_check).digest(),
+        signature['sig'], signature['method'])
+
+
+
+
+
+  def get(self, cache_key):
+    """
+    Returns the cached result (True or False) for the given cache key, or None
+    if there is none.
+    """
+    with self._lock:
+      valid = self._results.get(cache_key)
+
+      if valid is None:
+        self.misses += 1
+
+      else:
+        self.hits += 1
+        # Mark the entry as the most recently used.
+        del self._results[cache_key]
+        self._results[cache_key] = valid
+
+      return valid
+
+
+
+
+
+  def put(self, cache_key, valid):
+    """Saves the result of a signature check under the given cache key."""
+    if not self.max_entries:
+      return
+
+    with self._lock:
+      self._results.pop(cache_key, None)
+      self._results[cache_key] = valid
+      while len(self._results) > self.max_entries:
+        self._results.popitem(last=False)
+
+
+
+
+
+  def stats(self):
+    """
+    Returns a dictionary with the number of hits, misses, and entries.
+    """
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses,
+          'entries': len(self._results), 'max_entries': self.max_entries}
+
+
+
+
+
 class Director:
   """
   See file's docstring.
@@ -69,13 +185,30 @@ class Director:
     key_dirtarg_pri
       Private signing key for the targets role in the Director's repositories
 
-    vehicle_repositories
-      A dictionary of tuf.repository_tool.Repository objects, indexed by VIN.
-      Each holds the Director metadata geared toward that particular vehicle.
+    vehicle_metadata
+      A vehicle_metadata.VehicleMetadataGenerator that holds the target
+      assignments for each vehicle and produces the Director metadata geared
+      toward that particular vehicle, signed with the keys above.
 
     director_repos_dir
       The root directory in which the repositories for each vehicle reside.
 
+    verification_pool
+      A multiprocessing.Pool of verification_processes worker processes, used
+      to validate the signatures on the ECU Manifests within a Vehicle
+      Manifest in parallel, or None if verification_processes was not given,
+      in which case they are validated one after another in this process.
+
+    signature_cache
+      A SignatureVerificationCache holding the results of recent signature
+      checks on Vehicle and ECU Manifests, so that resubmitted manifests are
+      not verified again.
+
+    manifest_analyzer
+      A manifest_analysis.ManifestAnalyzer that examines each valid ECU
+      Manifest as it is saved, and the images assigned to each ECU, for signs
+      of attacks. See analyze_vehicle().
+
   """
 
 
@@ -88,9 +221,30 @@ class Director:
     key_snapshot_pri,
     key_snapshot_pub,
     key_targets_pri,
-    key_targets_pub):
+    key_targets_pub,
+    verification_processes=None,
+    signature_cache_size=10000,
+    max_resident_vehicles=None,
+    signer=None):
 
     """
+    verification_processes, if given, is the number of worker processes to
+    start for validating ECU Manifest signatures in parallel. See the
+    verification_pool field above.
+
+    signature_cache_size is the number of signature check results to keep in
+    signature_cache. 0 disables caching.
+
+    max_resident_vehicles, if given, is the number of vehicles whose metadata
+    records are kept in memory at once. Others are loaded from
+    director_repos_dir when needed. See vehicle_metadata.
+
+    signer, if given, is the uptane.services.signing.Signer with which all of
+    the Director's metadata is signed, e.g. a signing.ProcessPoolSigner, or a
+    signing.RemoteSigner, in which case the private key arguments may be the
+    public keys, the private keys being held by the signing server. By
+    default, metadata is signed with the given private keys on the calling
+    thread. A signer given is not closed by close().
     """
 
     tuf.formats.RELPATH_SCHEMA.check_match(director_repos_dir)
@@ -111,7 +265,55 @@ class Director:
     self.key_dirtarg_pri = key_targets_pri
     self.key_dirtarg_pub = key_targets_pub
 
-    self.vehicle_repositories = dict()
+    self.vehicle_metadata = vehicle_metadata.VehicleMetadataGenerator(
+        director_repos_dir, key_root_pri, key_root_pub, key_timestamp_pri,
+        key_timestamp_pub, key_snapshot_pri, key_snapshot_pub, key_targets_pri,
+        key_targets_pub, max_resident_vehicles=max_resident_vehicles,
+        signer=signer)
+
+    self.signature_cache = SignatureVerificationCache(signature_cache_size)
+
+    self.manifest_analyzer = manifest_analysis.ManifestAnalyzer()
+
+    self.verification_processes = verification_processes
+
+    # Start the worker processes now, while this process is unlikely to have
+    # any other threads running yet (e.g. those of an XMLRPC server).
+    self.verification_pool = None
+    if verification_processes is not None:
+      tuf.formats.LENGTH_SCHEMA.check_match(verification_processes)
+      self.verification_pool = multiprocessing.Pool(verification_processes)
+
+    # Number of processes -> multiprocessing.Pool, for
+    # register_vehicle_manifests_batch calls that do not use
+    # verification_pool. Each is started when first needed and kept for later
+    # batches until close().
+    self._batch_pools = dict()
+    self._batch_pools_lock = threading.Lock()
+
+
+
+
+
+  def close(self):
+    """
+    Stops the worker processes of verification_pool and of any pools started
+    by register_vehicle_manifests_batch, and saves any vehicle metadata
+    records that have changed.
+    """
+    self.vehicle_metadata.flush()
+
+    with self._batch_pools_lock:
+      pools = list(self._batch_pools.values())
+      self._batch_pools.clear()
+
+    if self.verification_pool is not None:
+      pools.append(self.verification_pool)
+      self.verification_pool = None
+
+    for pool in pools:
+      pool.close()
+      pool.join()
 
 
 
@@ -144,10 +346,20 @@ class Director:
 
     inventory.check_vin_registered(vin)
 
+    try:
+      inventory.check_ecu_registered(ecu_serial)
+      newly_registered = False
+    except uptane.UnknownECU:
+      newly_registered = True
+
     # Register the public key and associate the ECU with the given VIN.
     inventory.register_ecu(
         is_primary, vin, ecu_serial, ecu_key, overwrite=False)
 
+    # Nothing known of an ECU by that serial before is relevant to this one.
+    if newly_registered:
+      self.manifest_analyzer.forget_ecu(vin, ecu_serial)
+
     log.info(
         GREEN + 'Registered a new ECU, ' + repr(ecu_serial) + ' in '
         'vehicle ' + repr(vin) + ' with ECU public key: ' + repr(ecu_key) +
@@ -157,71 +369,28 @@ class Director:
 
 
 
-  def validate_ecu_manifest(self, ecu_serial, signed_ecu_manifest):
+  def validate_ecu_manifest(
+      self, ecu_serial, signed_ecu_manifest, signed_der=None):
     """
     Arguments:
       ecuid: uptane.formats.ECU_SERIAL_SCHEMA
       manifest: uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA
+      signed_der: (optional) if the metadata format is ASN.1/DER, the DER
+                  encoding of the manifest's 'signed' element exactly as it
+                  was received (see asn1_codec.get_signed_der_slices). If
+                  provided, the signature is checked over it, rather than
+                  over a fresh encoding of signed_ecu_manifest['signed'].
     """
     uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.check_match(
         signed_ecu_manifest)
 
     # If it doesn't match expectations, error out here.
+    _check_ecu_manifest_origin(ecu_serial, signed_ecu_manifest)
 
-    if ecu_serial != signed_ecu_manifest['signed']['ecu_serial']:
-      raise uptane.Spoofing('Received a spoofed or mistaken manifest: supposed '
-          'origin ECU (' + repr(ecu_serial) + ') is not the same as what is '
-          'signed in the manifest itself (' +
-          repr(signed_ecu_manifest['signed']['ecu_serial']) + ').')
-
-    if ecu_serial not in inventory.ecu_public_keys:
-      log.info(
-          'Validation failed on an ECU Manifest: ECU ' + repr(ecu_serial) +
-          ' is not registered.')
-      # Raise a fault for the offending ECU's XMLRPC request.
-      raise uptane.UnknownECU('The Director is not aware of the given ECU '
-          'SERIAL (' + repr(ecu_serial) + '. Manifest rejected. If the ECU is '
-          'new, Register the new ECU with its key in order to be able to '
-          'submit its manifests.')
-
-    ecu_public_key = inventory.ecu_public_keys[ecu_serial]
+    ecu_public_key = _get_registered_ecu_public_key(ecu_serial)
 
-
-
-
-    # TODO: Generalize the following code slightly and stick it somewhere in
-    # perhaps common or asn1_codec. Call it here and in the verify_... function
-    # below as well. Check for other places it should be called (probably many).
-    if tuf.conf.METADATA_FORMAT == 'der':
-      # To check the signature, we have to make sure to encode the data as it
-      # was when the signature was made. If we're using ASN.1/DER as the
-      # data format/encoding, then we convert the 'signed' portion of the data
-      # back to ASN.1/DER to check it.
-      # Further, since for ASN.1/DER, a SHA256 hash is taken of the data and
-      # *that* is what is signed, we perform that hashing as well and retrieve
-      # the raw binary digest.
-      data_to_check = asn1_codec.convert_signed_metadata_to_der(
-          signed_ecu_manifest, only_signed=True, datatype='ecu_manifest')
-      data_to_check = hashlib.sha256(data_to_check).digest()
-
-    else:
-      data_to_check = signed_ecu_manifest['signed']
-
-    valid = tuf.keys.verify_signature(
-        ecu_public_key,
-        signed_ecu_manifest['signatures'][0], # TODO: Fix assumptions.
-        data_to_check,
-        is_binary_data=True)
-
-    if not valid:
-      log.info(
-          'Validation failed on an ECU Manifest: signature is not valid. '
-          'It must be correctly signed by the expected key for that ECU.')
-      # Raise a fault for the offending ECU's XMLRPC request.
-      raise tuf.BadSignatureError('Sender supplied an invalid signature. '
-          'ECU Manifest is unacceptable. If you see this persistently, it is '
-          'possible that the Primary is compromised or that there is a man in '
-          'the middle attack or misconfiguration.')
+    _check_ecu_manifest_signature(
+        ecu_public_key, signed_ecu_manifest, self.signature_cache, signed_der)
 
 
 
@@ -282,23 +451,32 @@ class Director:
     uptane.formats.VIN_SCHEMA.check_match(vin)
     uptane.formats.ECU_SERIAL_SCHEMA.check_match(primary_ecu_serial)
 
+    signed_der_slices = {'signed': None, 'ecu_version_manifests': {}}
+
     if tuf.conf.METADATA_FORMAT == 'der':
       # Check format and convert back to expected vehicle manifest format.
+      # Also locate the 'signed' elements in the DER as received, so that the
+      # signatures can be checked over them without encoding them again.
       uptane.formats.DER_DATA_SCHEMA.check_match(signed_vehicle_manifest)
+      signed_der_slices = asn1_codec.get_signed_der_slices(
+          signed_vehicle_manifest, datatype='vehicle_manifest')
       signed_vehicle_manifest = asn1_codec.convert_signed_der_to_dersigned_json(
           signed_vehicle_manifest, datatype='vehicle_manifest')
 
     uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
         signed_vehicle_manifest)
 
-    if vin not in inventory.ecus_by_vin:
+    try:
+      inventory.check_vin_registered(vin)
+    except uptane.UnknownVehicle:
       raise uptane.UnknownVehicle('Received a vehicle manifest purportedly '
           'from a vehicle with a VIN that is not known to this Director.')
 
     # Process Primary's signature on full manifest here.
     # If it doesn't match expectations, error out here.
     self.validate_primary_certification_in_vehicle_manifest(
-        vin, primary_ecu_serial, signed_vehicle_manifest)
+        vin, primary_ecu_serial, signed_vehicle_manifest,
+        signed_der_slices['signed'])
 
     # If the Primary's signature is valid, save the whole vehicle manifest to
     # the inventorydb.
@@ -313,42 +491,292 @@ class Director:
 
     # Validate signatures on and register all individual ECU manifests for each
     # ECU (may have multiple manifests per ECU).
+    self._register_ecu_manifests_in_vehicle_manifest(
+        vin, signed_vehicle_manifest,
+        signed_der_slices['ecu_version_manifests'])
+
+
+
+
+
+  def _register_ecu_manifests_in_vehicle_manifest(
+      self, vin, signed_vehicle_manifest, ecu_signed_der_slices):
+    """
+    Validates and saves each ECU Manifest within the given (already validated)
+    Vehicle Manifest, discarding with a warning those that are not valid.
+
+    ecu_signed_der_slices is the 'ecu_version_manifests' element of the
+    result of asn1_codec.get_signed_der_slices for the Vehicle Manifest, or an
+    empty dictionary if the Vehicle Manifest was not received as DER.
+
+    This has the same effect as calling register_ecu_manifest on each ECU
+    Manifest in turn, but if there is a verification_pool, the signature
+    checks (the expensive part) are spread over its worker processes. The
+    results are then saved or discarded here, in the original order.
+    """
+    # Check each ECU Manifest's origin and look up its key here, since the
+    # workers have no access to the inventory.
     all_ecu_manifests = \
         signed_vehicle_manifest['signed']['ecu_version_manifests']
 
+    to_check = []
     for ecu_serial in all_ecu_manifests:
-      ecu_manifests = all_ecu_manifests[ecu_serial]
-      for manifest in ecu_manifests:
+      signed_ders = _match_signed_der_slices(
+          all_ecu_manifests[ecu_serial], ecu_signed_der_slices.get(ecu_serial))
+      for manifest, signed_der in zip(
+          all_ecu_manifests[ecu_serial], signed_ders):
         try:
-          # This calls validate_ecu_manifest, which can raise the errors
-          # caught below.
-          self.register_ecu_manifest(vin, ecu_serial, manifest)
-        except uptane.Spoofing as e:
-          log.warning(
-              RED + 'Discarding a spoofed or malformed ECU Manifest. Error '
-              ' from validating that ECU manifest follows:\n' + ENDCOLORS +
-              repr(e))
+          _check_ecu_manifest_origin(ecu_serial, manifest)
+          ecu_public_key = _get_registered_ecu_public_key(ecu_serial)
+        except (uptane.Spoofing, uptane.UnknownECU) as e:
+          to_check.append((ecu_serial, manifest, None, signed_der, e))
+        else:
+          to_check.append(
+              (ecu_serial, manifest, ecu_public_key, signed_der, None))
+
+    # Consult the signature cache, and check the signatures not found there,
+    # in parallel if possible.
+    checks = []
+    for ecu_serial, manifest, key, signed_der, error in to_check:
+      if error is None:
+        checks.append(self._prepare_signature_check(key,
+            manifest['signatures'][0], # TODO: Fix assumptions.
+            _get_data_to_check(manifest, 'ecu_manifest', signed_der)))
+
+    self._run_signature_checks(checks, self.verification_pool)
+
+    checks = iter(checks)
+
+    for ecu_serial, manifest, key, signed_der, error in to_check:
+      try:
+        if error is not None:
+          raise error
+        elif not next(checks)[2]:
+          raise _ecu_manifest_signature_error()
+        self._save_checked_ecu_manifest(
+            vin, ecu_serial, manifest, key, signed_der)
+      except (uptane.Spoofing, uptane.UnknownECU, tuf.BadSignatureError) as e:
+        _warn_discarded_ecu_manifest(e)
+
+
+
+
+
+  def _prepare_signature_check(self, public_key, signature, data_to_check):
+    """
+    Returns a list [job, cache_key, valid] for a signature to be checked by
+    _run_signature_checks, where job is the argument to _verify_signature_job
+    and valid is the result from the signature cache, or None if the result is
+    not cached.
+    """
+    cache_key = self.signature_cache.make_key(
+        public_key, signature, data_to_check)
+
+    return [(public_key, signature, data_to_check), cache_key,
+        self.signature_cache.get(cache_key)]
+
+
+
+
+
+  def _run_signature_checks(self, checks, pool=None):
+    """
+    Checks the signatures in checks (a list of lists from
+    _prepare_signature_check) whose results were not cached, on the given
+    multiprocessing pool if there is one and there is more than one signature
+    to check. Each result is recorded in its list and in the signature cache.
+    """
+    unchecked = [check for check in checks if check[2] is None]
+
+    if pool is not None and len(unchecked) > 1:
+      results = pool.map(
+          _verify_signature_job, [check[0] for check in unchecked])
+    else:
+      results = [_verify_signature_job(check[0]) for check in unchecked]
+
+    for check, valid in zip(unchecked, results):
+      check[2] = valid
+      self.signature_cache.put(check[1], valid)
+
+
+
+
+
+  def register_vehicle_manifests_batch(self, vehicle_manifests, processes=None):
+    """
+    <Purpose>
+      Registers many Vehicle Manifests at once, as register_vehicle_manifest
+      does for one, but decodes them and checks their signatures in
+      parallel on a pool of processes. Keys are looked up, and results taken
+      from and added to signature_cache, in this process. Saving the
+      validated manifests in the inventory is then done in this process, in
+      the order given.
+
+      Each manifest is handled independently: a problem with one does not
+      prevent the others from being registered. As with
+      register_vehicle_manifest, invalid ECU Manifests inside an otherwise
+      valid Vehicle Manifest are discarded with a warning.
+
+    <Arguments>
+      vehicle_manifests
+        A list of (vin, primary_ecu_serial, signed_vehicle_manifest) tuples,
+        each holding the arguments one call to register_vehicle_manifest
+        would take.
+
+      processes (optional)
+        Number of worker processes to use. By default, verification_pool is
+        used if there is one; otherwise, a pool with one worker process per
+        CPU. A pool other than verification_pool is started by the first call
+        that needs it and kept for later calls until close().
+
+    <Exceptions>
+      None. Errors are reported per manifest in the return value.
+
+    <Returns>
+      A list with one element per tuple in vehicle_manifests, in the same
+      order: None if that Vehicle Manifest was registered, or otherwise the
+      exception that register_vehicle_manifest would have raised for it.
+    """
+    results = [None] * len(vehicle_manifests)
+    jobs = []
+    job_indices = []
+
+    for i, item in enumerate(vehicle_manifests):
+      try:
+        (vin, primary_ecu_serial, signed_vehicle_manifest) = item
+        uptane.formats.VIN_SCHEMA.check_match(vin)
+        uptane.formats.ECU_SERIAL_SCHEMA.check_match(primary_ecu_serial)
+
+        try:
+          inventory.check_vin_registered(vin)
+        except uptane.UnknownVehicle:
+          raise uptane.UnknownVehicle('Received a vehicle manifest purportedly '
+              'from a vehicle with a VIN that is not known to this Director.')
+
+      except (ValueError, TypeError, uptane.Error, tuf.Error) as e:
+        results[i] = e
+        continue
+
+      # The workers may have been started before the metadata format was
+      # set, so it is sent with each job.
+      jobs.append((primary_ecu_serial, signed_vehicle_manifest,
+          tuf.conf.METADATA_FORMAT))
+      job_indices.append(i)
+
+
+    if not jobs:
+      return results
+
+    if processes is None and self.verification_pool is not None:
+      pool = self.verification_pool
+      processes = self.verification_processes
+    else:
+      if processes is None:
+        processes = multiprocessing.cpu_count()
+      tuf.formats.LENGTH_SCHEMA.check_match(processes)
+      with self._batch_pools_lock:
+        pool = self._batch_pools.get(processes)
+        if pool is None:
+          pool = self._batch_pools[processes] = multiprocessing.Pool(processes)
+
+    chunksize = max(1, len(jobs) // (4 * processes))
+    decoded = pool.map(_decode_vehicle_manifest, jobs, chunksize)
+
+
+    # Look up the keys here, since the workers have no access to the
+    # inventory, and consult the signature cache. Only the signatures not
+    # found there are sent back to the workers to be checked.
+    to_save = []
+    checks = []
+    for i, (error, signed_vehicle_manifest, data_to_check, ecu_items) in zip(
+        job_indices, decoded):
+
+      if error is None:
+        try:
+          primary_public_key = _get_registered_primary_public_key(
+              vehicle_manifests[i][1])
         except uptane.UnknownECU as e:
-          log.warning(
-              RED + 'Discarding an ECU Manifest from unknown ECU. Error from '
-              'validation attempt follows:\n' + ENDCOLORS + repr(e))
-        except tuf.BadSignatureError as e:
-          log.warning(
-              RED + 'Rejecting an ECU Manifest whose signature is invalid, '
-              'from within an otherwise valid Vehicle Manifest. Error from '
-              'validation attempt follows:\n' + ENDCOLORS + repr(e))
+          error = e
+
+      if error is not None:
+        results[i] = error
+        continue
+
+      vehicle_check = self._prepare_signature_check(primary_public_key,
+          signed_vehicle_manifest['signatures'][0], # TODO: Fix assumptions.
+          data_to_check)
+      checks.append(vehicle_check)
+
+      ecu_checks = []
+      for ecu_serial, manifest, data_to_check, signed_der, ecu_error in \
+          ecu_items:
+        key = check = None
+        if ecu_error is None:
+          try:
+            key = _get_registered_ecu_public_key(ecu_serial)
+          except uptane.UnknownECU as e:
+            ecu_error = e
+          else:
+            check = self._prepare_signature_check(key,
+                manifest['signatures'][0], # TODO: Fix assumptions.
+                data_to_check)
+            checks.append(check)
+        ecu_checks.append(
+            (ecu_serial, manifest, key, check, signed_der, ecu_error))
+
+      to_save.append((i, signed_vehicle_manifest, vehicle_check, ecu_checks))
+
+    self._run_signature_checks(checks, pool)
+
+
+    # Save the valid manifests, in the order given.
+    for i, signed_vehicle_manifest, vehicle_check, ecu_checks in to_save:
+      (vin, primary_ecu_serial, unused) = vehicle_manifests[i]
+
+      if not vehicle_check[2]:
+        results[i] = _vehicle_manifest_signature_error()
+        continue
+
+      try:
+        inventory.save_vehicle_manifest(vin, signed_vehicle_manifest)
+      except uptane.Error as e:
+        results[i] = e
+        continue
+
+      log.info(GREEN + ' Received a Vehicle Manifest from Primary ECU ' +
+          repr(primary_ecu_serial) + ', with a valid signature from that ECU.' +
+          ENDCOLORS)
+
+      for ecu_serial, manifest, key, check, signed_der, ecu_error in \
+          ecu_checks:
+        try:
+          if ecu_error is not None:
+            raise ecu_error
+          elif not check[2]:
+            raise _ecu_manifest_signature_error()
+          self._save_checked_ecu_manifest(
+              vin, ecu_serial, manifest, key, signed_der)
+        except (uptane.Spoofing, uptane.UnknownECU, tuf.BadSignatureError) as e:
+          _warn_discarded_ecu_manifest(e)
+
+    return results
 
 
 
 
 
   def validate_primary_certification_in_vehicle_manifest(
-      self, vin, primary_ecu_serial, vehicle_manifest):
+      self, vin, primary_ecu_serial, vehicle_manifest, signed_der=None):
     """
     Check the Primary's signature on the Vehicle Manifest and any other data
     the Primary is certifying, without diving into the individual ECU Manifests
     in the Vehicle Manifest.
 
+    If the metadata format is ASN.1/DER, signed_der may be the DER encoding of
+    the Vehicle Manifest's 'signed' element exactly as it was received (see
+    asn1_codec.get_signed_der_slices), in which case the signature is checked
+    over it rather than over a fresh encoding of vehicle_manifest['signed'].
+
     Raises an exception if there is an issue with the Primary's signature.
     No return value.
     """
@@ -360,72 +788,71 @@ class Director:
         vehicle_manifest)
 
 
-    if primary_ecu_serial != vehicle_manifest['signed']['primary_ecu_serial']:
-      raise uptane.Spoofing('Received a spoofed or mistaken vehicle manifest: '
-          'the supposed origin Primary ECU (' + repr(primary_ecu_serial) + ') '
-          'is not the same as what is signed in the vehicle manifest itself ' +
-          '(' + repr(vehicle_manifest['signed']['primary_ecu_serial']) + ').')
+    _check_vehicle_manifest_origin(primary_ecu_serial, vehicle_manifest)
 
     # TODO: Consider mechanism for fetching keys from inventorydb itself,
     # rather than always registering them after Director svc starts up.
-    if primary_ecu_serial not in inventory.ecu_public_keys:
-      log.debug(
-          'Rejecting a vehicle manifest from a Primary ECU whose '
-          'key is not registered.')
-      # Raise a fault for the offending ECU's XMLRPC request.
-      raise uptane.UnknownECU('The Director is not aware of the given Primary '
-          'ECU Serial (' + repr(primary_ecu_serial) + '. Manifest rejected. If '
-          'the ECU is new, Register the new ECU with its key in order to be '
-          'able to submit its manifests.')
-
-    ecu_public_key = inventory.ecu_public_keys[primary_ecu_serial]
+    ecu_public_key = _get_registered_primary_public_key(primary_ecu_serial)
 
-    if tuf.conf.METADATA_FORMAT == 'der':
-      # To check the signature, we have to make sure to encode the data as it
-      # was when the signature was made. If we're using ASN.1/DER as the
-      # data format/encoding, then we convert the 'signed' portion of the data
-      # back to ASN.1/DER to check it.
-      # Further, since for ASN.1/DER, a SHA256 hash is taken of the data and
-      # *that* is what is signed, we perform that hashing as well and retrieve
-      # the raw binary digest.
-      data_to_check = asn1_codec.convert_signed_metadata_to_der(
-          vehicle_manifest, only_signed=True, datatype='vehicle_manifest')
-      data_to_check = hashlib.sha256(data_to_check).digest()
+    _check_vehicle_manifest_signature(
+        ecu_public_key, vehicle_manifest, self.signature_cache, signed_der)
 
-    else:
-      data_to_check = vehicle_manifest['signed']
 
 
-    valid = tuf.keys.verify_signature(
-        ecu_public_key,
-        vehicle_manifest['signatures'][0], # TODO: Fix assumptions.
-        data_to_check,
-        is_binary_data=True)
 
-    if not valid:
-      log.debug(
-          'Rejecting a vehicle manifest because the Primary signature on it is '
-          'not valid. It must be correctly signed by the expected Primary ECU '
-          'key.')
-      # Raise a fault for the offending ECU's XMLRPC request.
-      raise tuf.BadSignatureError('Sender supplied an invalid signature. '
-          'Vehicle Manifest is questionable; discarding. If you see this '
-          'persistently, it is possible that there is a man in the middle '
-          'attack or misconfiguration.')
 
+  def register_ecu_manifest(
+      self, vin, ecu_serial, signed_ecu_manifest, signed_der=None):
+    """
+    See validate_ecu_manifest regarding signed_der.
+    """
+    # Error out if the signature isn't valid and from the expected party.
+    # Also checks argument format.
+    self.validate_ecu_manifest(ecu_serial, signed_ecu_manifest, signed_der)
 
+    # Otherwise, we save it:
+    self._save_validated_ecu_manifest(vin, ecu_serial, signed_ecu_manifest)
 
 
 
-  def register_ecu_manifest(self, vin, ecu_serial, signed_ecu_manifest):
+
+
+  def _save_checked_ecu_manifest(
+      self, vin, ecu_serial, signed_ecu_manifest, public_key, signed_der=None):
     """
+    Saves an ECU Manifest whose signature has been found valid for public_key,
+    as _save_validated_ecu_manifest does, if public_key is still the key the
+    ECU is registered with. If the ECU has been registered again with another
+    key since, the ECU Manifest is validated again against the new key, as by
+    register_ecu_manifest, raising the same exceptions if it is not valid.
+    signed_der is as for validate_ecu_manifest.
     """
-    # Error out if the signature isn't valid and from the expected party.
-    # Also checks argument format.
-    self.validate_ecu_manifest(ecu_serial, signed_ecu_manifest)
+    if not self._save_validated_ecu_manifest(
+        vin, ecu_serial, signed_ecu_manifest, public_key):
+      log.debug('ECU ' + repr(ecu_serial) + ' was registered with a new key '
+          'while its ECU Manifest was being validated; validating it again.')
+      self.register_ecu_manifest(
+          vin, ecu_serial, signed_ecu_manifest, signed_der)
+
+
+
 
-    # Otherwise, we save it:
-    inventory.save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest)
+
+  def _save_validated_ecu_manifest(
+      self, vin, ecu_serial, signed_ecu_manifest, public_key=None):
+    """
+    Saves an ECU Manifest whose signature has already been validated, and
+    warns if it reports attacks or if analyzing it (see analyze_vehicle)
+    turns up anything unusual.
+
+    If public_key, the key the signature was validated with, is given, the ECU
+    Manifest is saved only if the ECU is still registered with that key (see
+    inventory.save_ecu_manifest). Returns True if the ECU Manifest was saved,
+    else False.
+    """
+    if not inventory.save_ecu_manifest(
+        vin, ecu_serial, signed_ecu_manifest, public_key):
+      return False
 
     log.debug('Stored a valid ECU manifest from ECU ' + repr(ecu_serial))
 
@@ -436,6 +863,15 @@ class Director:
           repr(ecu_serial) + ':\n' +
           signed_ecu_manifest['signed']['attacks_detected'] + ENDCOLORS)
 
+    for anomaly in self.manifest_analyzer.analyze_ecu_manifest(
+        vin, ecu_serial, signed_ecu_manifest):
+      if anomaly['type'] != 'attacks_reported': # Warned of above.
+        log.warning(YELLOW + 'Unusual ECU Manifest from ECU ' +
+            repr(ecu_serial) + ' in vehicle ' + repr(vin) + ' (' +
+            anomaly['type'] + '): ' + anomaly['detail'] + ENDCOLORS)
+
+    return True
+
 
 
 
@@ -455,23 +891,48 @@ class Director:
     # are pruned - or an error is raised when they are detected.)
     inventory.register_vehicle(vin, primary_ecu_serial=primary_ecu_serial)
 
+    # Registering the vehicle again discards its ECUs and manifests, so the
+    # analysis of them is discarded too.
+    self.manifest_analyzer.forget_vehicle(vin)
+
     self.create_director_repo_for_vehicle(vin)
 
 
 
 
 
+  def add_new_vehicles(self, vins, threads=8):
+    """
+    Adds many vehicles at once (see add_new_vehicle), using a pool of the
+    given number of threads, since creating each vehicle's repository is
+    mostly filesystem work. Stops at (and raises) the first error.
+    """
+    tuf.formats.LENGTH_SCHEMA.check_match(threads)
+
+    pool = multiprocessing.pool.ThreadPool(threads)
+    try:
+      pool.map(self.add_new_vehicle, vins)
+
+    finally:
+      pool.close()
+      pool.join()
+
+
+
+
+
   def create_director_repo_for_vehicle(self, vin):
     """
-    Creates a separate repository object for a given vehicle identifier.
-    Each uses the same keys.
-    Ideally, each would use the same root.json file, but that will have to
-    wait until TUF Augmentation Proposal 5 (when the hash of root.json ceases
-    to be included in snapshot.json).
+    Creates the Director repository for a given vehicle identifier: a
+    directory named by the VIN, in director_repos_dir, into which target files
+    for the vehicle can be placed, and a record in vehicle_metadata of the
+    targets assigned to the vehicle's ECUs. Every vehicle's metadata is signed
+    with the same keys and shares the same root metadata.
 
-    The name of each repository is the VIN string.
+    If the repository already exists, its target assignments are discarded.
 
-    If the repository already exists, it is overwritten.
+    This may be called from several threads at once. Only absolute paths are
+    used; the process's working directory is not changed.
 
     Usage:
 
@@ -479,10 +940,9 @@ class Director:
       d.create_director_repo_for_vehicle(vin)
       d.add_target_for_ecu(vin, ecu, target_filepath)
 
-    These repository objects can be manipulated as described in TUF
-    documentation; for example, to produce metadata files afterwards for that
-    vehicle:
-      d.vehicle_repositories[vin].write()
+    To produce metadata files afterwards for that vehicle (in
+    <director_repos_dir>/<vin>/metadata.staged):
+      d.vehicle_metadata.write_metadata(vin)
 
 
     # TODO: This may be outside of the scope of the reference implementation,
@@ -493,31 +953,7 @@ class Director:
 
     uptane.formats.VIN_SCHEMA.check_match(vin)
 
-    # Repository Tool expects to use the current directory.
-    # Figure out if this is impactful and needs to be changed.
-    os.chdir(self.director_repos_dir) # TODO: Is messing with cwd a bad idea?
-
-    # Generates absolute path for a subdirectory with name equal to vin,
-    # in the current directory, making (relatively) sure that there isn't
-    # anything suspect like "../" in the VIN.
-    # Then I strip the common prefix back off the absolute path to get a
-    # relative path and keep the guarantees.
-    # TODO: Clumsy and hacky; fix.
-    vin = uptane.common.scrub_filename(vin, self.director_repos_dir)
-    vin = os.path.relpath(vin, self.director_repos_dir)
-
-    self.vehicle_repositories[vin] = this_repo = rt.create_new_repository(
-        vin, repository_name=vin)
-
-
-    this_repo.root.add_verification_key(self.key_dirroot_pub)
-    this_repo.timestamp.add_verification_key(self.key_dirtime_pub)
-    this_repo.snapshot.add_verification_key(self.key_dirsnap_pub)
-    this_repo.targets.add_verification_key(self.key_dirtarg_pub)
-    this_repo.root.load_signing_key(self.key_dirroot_pri)
-    this_repo.timestamp.load_signing_key(self.key_dirtime_pri)
-    this_repo.snapshot.load_signing_key(self.key_dirsnap_pri)
-    this_repo.targets.load_signing_key(self.key_dirtarg_pri)
+    self.vehicle_metadata.add_vehicle(vin)
 
 
 
@@ -528,16 +964,17 @@ class Director:
     Add a target to the repository for a vehicle, marked as being for a
     specific ECU.
 
-    The target file at the provided path will be analyzed, and its hashes
-    and file length will be saved in target metadata in memory, which will then
-    be signed with the appropriate Director keys and written to disk when the
-    "write" method is called on the vehicle repository.
+    The target file at the provided path, which must be in the vehicle's
+    targets directory, will be analyzed, and its hashes and file length will
+    be saved in the vehicle's record in memory. Targets metadata listing it
+    will then be signed with the appropriate Director keys and written to disk
+    when vehicle_metadata.write_metadata() is called for the vehicle.
     """
     uptane.formats.VIN_SCHEMA.check_match(vin)
     uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
     tuf.formats.RELPATH_SCHEMA.check_match(target_filepath)
 
-    if vin not in self.vehicle_repositories:
+    if not self.vehicle_metadata.has_vehicle(vin):
       raise uptane.UnknownVehicle('The VIN provided, ' + repr(vin) + ' is not '
           'that of a vehicle known to this Director.')
 
@@ -547,8 +984,11 @@ class Director:
     #   raise uptane.UnknownECU('The ECU Serial provided, ' + repr(ecu_serial) +
     #       ' is not that of an ECU known to this Director.')
 
-    self.vehicle_repositories[vin].targets.add_target(
-        target_filepath, custom={'ecu_serial': ecu_serial})
+    self.vehicle_metadata.add_target(vin, ecu_serial, target_filepath)
+
+    # The fileinfo was just calculated and cached, so this does no I/O.
+    self.manifest_analyzer.set_assigned_image(vin, ecu_serial,
+        self.vehicle_metadata.fileinfo_cache.get_fileinfo(target_filepath))
 
 
 
@@ -558,9 +998,349 @@ class Director:
     """
     Make note of any unusual properties of the vehicle data and manifests.
     For example, try to detect freeze attacks and mix-and-match attacks.
+
+    The analysis is done incrementally: each ECU Manifest is examined as it is
+    saved (e.g. by register_vehicle_manifest), in constant time, against a
+    few facts remembered about its ECU (see manifest_analysis). This returns
+    the most recent anomalies noted for the vehicle, oldest first, each a
+    dictionary as described in
+    manifest_analysis.ManifestAnalyzer.analyze_ecu_manifest.
     """
-    pass
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+
+    return self.manifest_analyzer.get_anomalies(vin)
+
+
+
+
+
+def _check_ecu_manifest_origin(ecu_serial, signed_ecu_manifest):
+  """
+  Raises uptane.Spoofing if the ECU Manifest does not claim to be from the ECU
+  with the given ECU Serial.
+  """
+  if ecu_serial != signed_ecu_manifest['signed']['ecu_serial']:
+    raise uptane.Spoofing('Received a spoofed or mistaken manifest: supposed '
+        'origin ECU (' + repr(ecu_serial) + ') is not the same as what is '
+        'signed in the manifest itself (' +
+        repr(signed_ecu_manifest['signed']['ecu_serial']) + ').')
+
+
+
+
+
+def _check_vehicle_manifest_origin(primary_ecu_serial, vehicle_manifest):
+  """
+  Raises uptane.Spoofing if the Vehicle Manifest does not claim to be from the
+  Primary ECU with the given ECU Serial.
+  """
+  if primary_ecu_serial != vehicle_manifest['signed']['primary_ecu_serial']:
+    raise uptane.Spoofing('Received a spoofed or mistaken vehicle manifest: '
+        'the supposed origin Primary ECU (' + repr(primary_ecu_serial) + ') '
+        'is not the same as what is signed in the vehicle manifest itself ' +
+        '(' + repr(vehicle_manifest['signed']['primary_ecu_serial']) + ').')
+
+
+
+
+
+def _get_registered_ecu_public_key(ecu_serial):
+  """
+  Returns the public key registered for the ECU with the given ECU Serial, or
+  raises uptane.UnknownECU if there is none.
+  """
+  try:
+    return inventory.get_ecu_public_key(ecu_serial)
+  except uptane.UnknownECU:
+    log.info(
+        'Validation failed on an ECU Manifest: ECU ' + repr(ecu_serial) +
+        ' is not registered.')
+    # Raise a fault for the offending ECU's XMLRPC request.
+    raise uptane.UnknownECU('The Director is not aware of the given ECU '
+        'SERIAL (' + repr(ecu_serial) + '. Manifest rejected. If the ECU is '
+        'new, Register the new ECU with its key in order to be able to '
+        'submit its manifests.')
+
+
+
+
+
+def _get_registered_primary_public_key(primary_ecu_serial):
+  """
+  Returns the public key registered for the Primary ECU with the given ECU
+  Serial, or raises uptane.UnknownECU if there is none.
+  """
+  try:
+    return inventory.get_ecu_public_key(primary_ecu_serial)
+  except uptane.UnknownECU:
+    log.debug(
+        'Rejecting a vehicle manifest from a Primary ECU whose '
+        'key is not registered.')
+    # Raise a fault for the offending ECU's XMLRPC request.
+    raise uptane.UnknownECU('The Director is not aware of the given Primary '
+        'ECU Serial (' + repr(primary_ecu_serial) + '. Manifest rejected. If '
+        'the ECU is new, Register the new ECU with its key in order to be '
+        'able to submit its manifests.')
+
+
+
+
+
+def _get_data_to_check(signable, datatype, signed_der=None):
+  """
+  Returns the data over which the signatures on the given signable were made.
+
+  To check the signature, we have to make sure to use the data as it was
+  encoded when the signature was made. If we're using ASN.1/DER as the data
+  format/encoding, that is the DER encoding of the 'signed' portion. If
+  signed_der, the 'signed' portion exactly as it was received, is provided, we
+  use that; otherwise, we convert the 'signed' portion of the data back to
+  ASN.1/DER. Further, since for ASN.1/DER, a SHA256 hash is taken of the data
+  and *that* is what is signed, we perform that hashing as well and retrieve
+  the raw binary digest.
+  """
+  if tuf.conf.METADATA_FORMAT == 'der':
+    if signed_der is None:
+      signed_der = asn1_codec.convert_signed_metadata_to_der(
+          signable, only_signed=True, datatype=datatype)
+    return hashlib.sha256(signed_der).digest()
+
+  else:
+    return signable['signed']
+
+
+
+
+
+def _verify_signature(public_key, signature, data_to_check, cache=None):
+  """
+  Returns True if the signature over data_to_check was made by public_key,
+  else False, consulting and updating the SignatureVerificationCache cache if
+  one is given.
+  """
+  if cache is None:
+    return _verify_signature_job((public_key, signature, data_to_check))
+
+  cache_key = cache.make_key(public_key, signature, data_to_check)
+  valid = cache.get(cache_key)
+
+  if valid is None:
+    valid = _verify_signature_job((public_key, signature, data_to_check))
+    cache.put(cache_key, valid)
+
+  return valid
+
+
+
+
+
+def _verify_signature_job(job):
+  """
+  Checks a signature, possibly in a worker process. job is a tuple
+  (public_key, signature, data_to_check). Returns True if the signature is
+  valid, else False.
+  """
+  (public_key, signature, data_to_check) = job
+
+  return tuf.keys.verify_signature(
+      public_key, signature, data_to_check, is_binary_data=True)
+
+
+
+
+
+def _match_signed_der_slices(ecu_manifests, signed_der_slices):
+  """
+  Returns a list with one element per ECU Manifest in ecu_manifests (a list
+  of the decoded ECU Manifests from one ECU within a Vehicle Manifest): the
+  corresponding element of signed_der_slices, the slices of the received DER
+  for those ECU Manifests, in the same order. If signed_der_slices is None or
+  does not match ecu_manifests, the elements are None, and the signatures
+  will be checked over re-encoded DER instead.
+  """
+  if signed_der_slices is None or \
+      len(signed_der_slices) != len(ecu_manifests):
+    return [None] * len(ecu_manifests)
+
+  return signed_der_slices
+
+
+
+
+
+def _ecu_manifest_signature_error():
+  """
+  Logs and returns the error for an ECU Manifest whose signature is invalid.
+  """
+  log.info(
+      'Validation failed on an ECU Manifest: signature is not valid. '
+      'It must be correctly signed by the expected key for that ECU.')
+  # Raise a fault for the offending ECU's XMLRPC request.
+  return tuf.BadSignatureError('Sender supplied an invalid signature. '
+      'ECU Manifest is unacceptable. If you see this persistently, it is '
+      'possible that the Primary is compromised or that there is a man in '
+      'the middle attack or misconfiguration.')
+
+
+
+
+
+def _check_ecu_manifest_signature(
+    ecu_public_key, signed_ecu_manifest, cache=None, signed_der=None):
+  """
+  Raises tuf.BadSignatureError if the ECU Manifest is not signed by the given
+  key. cache is an optional SignatureVerificationCache. signed_der is as for
+  _get_data_to_check.
+  """
+  valid = _verify_signature(
+      ecu_public_key,
+      signed_ecu_manifest['signatures'][0], # TODO: Fix assumptions.
+      _get_data_to_check(signed_ecu_manifest, 'ecu_manifest', signed_der),
+      cache)
+
+  if not valid:
+    raise _ecu_manifest_signature_error()
+
+
+
+
+
+def _check_vehicle_manifest_signature(
+    ecu_public_key, vehicle_manifest, cache=None, signed_der=None):
+  """
+  Raises tuf.BadSignatureError if the Vehicle Manifest is not signed by the
+  given key. cache is an optional SignatureVerificationCache. signed_der is as
+  for _get_data_to_check.
+  """
+  valid = _verify_signature(
+      ecu_public_key,
+      vehicle_manifest['signatures'][0], # TODO: Fix assumptions.
+      _get_data_to_check(vehicle_manifest, 'vehicle_manifest', signed_der),
+      cache)
+
+  if not valid:
+    raise _vehicle_manifest_signature_error()
+
+
+
+
+
+def _vehicle_manifest_signature_error():
+  """
+  Logs and returns the error for a Vehicle Manifest whose signature is
+  invalid.
+  """
+  log.debug(
+      'Rejecting a vehicle manifest because the Primary signature on it is '
+      'not valid. It must be correctly signed by the expected Primary ECU '
+      'key.')
+  # Raise a fault for the offending ECU's XMLRPC request.
+  return tuf.BadSignatureError('Sender supplied an invalid signature. '
+      'Vehicle Manifest is questionable; discarding. If you see this '
+      'persistently, it is possible that there is a man in the middle '
+      'attack or misconfiguration.')
+
+
+
+
+
+def _warn_discarded_ecu_manifest(error):
+  """
+  Logs a warning about an ECU Manifest from within a valid Vehicle Manifest
+  being discarded because of the given validation error.
+  """
+  if isinstance(error, uptane.Spoofing):
+    log.warning(
+        RED + 'Discarding a spoofed or malformed ECU Manifest. Error '
+        ' from validating that ECU manifest follows:\n' + ENDCOLORS +
+        repr(error))
+  elif isinstance(error, uptane.UnknownECU):
+    log.warning(
+        RED + 'Discarding an ECU Manifest from unknown ECU. Error from '
+        'validation attempt follows:\n' + ENDCOLORS + repr(error))
+  else:
+    log.warning(
+        RED + 'Rejecting an ECU Manifest whose signature is invalid, '
+        'from within an otherwise valid Vehicle Manifest. Error from '
+        'validation attempt follows:\n' + ENDCOLORS + repr(error))
+
+
+
+
+
+def _decode_vehicle_manifest(job):
+  """
+  Worker for Director.register_vehicle_manifests_batch, run in a separate
+  process. Decodes the Vehicle Manifest if necessary, checks its format and
+  the claimed origin of it and of the ECU Manifests it contains, and prepares
+  the data over which their signatures are to be checked. The signatures
+  themselves are checked afterwards, since the keys to check them with are
+  looked up in the caller's process.
+
+  job is a tuple (primary_ecu_serial, signed_vehicle_manifest,
+  metadata_format), where metadata_format is the caller's
+  tuf.conf.METADATA_FORMAT, which the worker adopts.
+
+  Returns a tuple (error, signed_vehicle_manifest, data_to_check, ecu_items).
+  If the Vehicle Manifest as a whole is invalid, error is the exception
+  describing why, and the other elements are None. Otherwise, error is None,
+  signed_vehicle_manifest is the decoded Vehicle Manifest, data_to_check is
+  as returned by _get_data_to_check for it, and ecu_items is a list of
+  (ecu_serial, signed_ecu_manifest, data_to_check, signed_der, ecu_error)
+  tuples, one per ECU Manifest in the Vehicle Manifest. ecu_error is the
+  uptane.Spoofing error for an ECU Manifest not from the ECU it is listed
+  under, else None; signed_der is the DER of the ECU Manifest's 'signed'
+  element as received (or None), should it need to be validated again.
+  """
+  (primary_ecu_serial, signed_vehicle_manifest, metadata_format) = job
+
+  # This worker process may not have inherited the caller's setting.
+  tuf.conf.METADATA_FORMAT = metadata_format
+
+  signed_der_slices = {'signed': None, 'ecu_version_manifests': {}}
+
+  try:
+    if tuf.conf.METADATA_FORMAT == 'der':
+      # Check format and convert back to expected vehicle manifest format.
+      uptane.formats.DER_DATA_SCHEMA.check_match(signed_vehicle_manifest)
+      signed_der_slices = asn1_codec.get_signed_der_slices(
+          signed_vehicle_manifest, datatype='vehicle_manifest')
+      signed_vehicle_manifest = asn1_codec.convert_signed_der_to_dersigned_json(
+          signed_vehicle_manifest, datatype='vehicle_manifest')
+
+    uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
+        signed_vehicle_manifest)
+
+    _check_vehicle_manifest_origin(primary_ecu_serial, signed_vehicle_manifest)
+
+    data_to_check = _get_data_to_check(signed_vehicle_manifest,
+        'vehicle_manifest', signed_der_slices['signed'])
+
+  except Exception as e:
+    return (e, None, None, None)
+
+
+  ecu_items = []
+  all_ecu_manifests = \
+      signed_vehicle_manifest['signed']['ecu_version_manifests']
 
+  for ecu_serial in all_ecu_manifests:
+    signed_ders = _match_signed_der_slices(all_ecu_manifests[ecu_serial],
+        signed_der_slices['ecu_version_manifests'].get(ecu_serial))
 
+    for manifest, signed_der in zip(all_ecu_manifests[ecu_serial], signed_ders):
+      try:
+        _check_ecu_manifest_origin(ecu_serial, manifest)
+      except uptane.Spoofing as e:
+        ecu_items.append((ecu_serial, manifest, None, None, e))
+        continue
 
+      ecu_data_to_check = _get_data_to_check(
+          manifest, 'ecu_manifest', signed_der)
+      # memoryviews cannot be sent back to the parent process; copy.
+      if signed_der is not None:
+        signed_der = signed_der.tobytes()
+      ecu_items.append(
+          (ecu_serial, manifest, ecu_data_to_check, signed_der, None))
 
+  return (None, signed_vehicle_manifest, data_to_check, ecu_items)
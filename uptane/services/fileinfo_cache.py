@@ -0,0 +1,239 @@
+"""
+<Program Name>
+  fileinfo_cache.py
+
+<Purpose>
+  Caches the fileinfo (length and hashes, tuf.formats.FILEINFO_SCHEMA) of
+  target image files, so that assigning the same image many times (e.g. one
+  firmware image to thousands of vehicles) reads and hashes it only once.
+
+  An entry is keyed by the file's absolute path together with its size,
+  modification time, and inode (and device), as reported by os.stat(). If the
+  file is replaced or modified, at least one of those changes and the file is
+  hashed again; until then, a lookup costs one stat() call and no reads.
+
+  Entries are also indexed by (device, inode, size, modification time) alone,
+  so that a file that is hard-linked into several places (e.g. into many
+  vehicles' targets directories) is hashed only once for all of them, unless
+  links are created or removed in between (see below).
+
+  Since a file's modification time can be set back (e.g. by os.utime(), or by
+  a tool that preserves timestamps), its status change time (ctime), which
+  cannot, is checked as well, and any change to it causes the file to be
+  hashed again. Creating or removing a hard link to a file also changes its
+  ctime, so that costs one more hash of the file, which is cheap next to
+  signing metadata with a wrong hash. Times are compared in nanoseconds where
+  available.
+
+  Hashes are calculated using the algorithms in
+  tuf.conf.REPOSITORY_HASH_ALGORITHMS. If more algorithms are added there,
+  files whose cached fileinfo lacks any of them are hashed again.
+
+  Usage:
+
+    cache = FileinfoCache()
+    fileinfo = cache.get_fileinfo('/path/to/firmware.img')
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import tuf
+import tuf.conf
+import tuf.formats
+import tuf.util
+
+import os
+import collections
+import threading
+
+log = uptane.logging.getLogger('fileinfo_cache')
+
+
+
+
+
+class FileinfoCache(object):
+  """
+  <Purpose>
+    A thread-safe cache of the fileinfo of files. See the module docstring.
+
+  <Fields>
+
+    max_entries
+      The maximum number of files whose fileinfo is kept, or None for no
+      limit. When the cache is full, the least recently used entry is dropped.
+
+    hits, misses
+      The number of lookups answered from the cache, and the number for which
+      the file had to be read and hashed.
+  """
+
+  def __init__(self, max_entries=None):
+
+    if max_entries is not None:
+      tuf.formats.LENGTH_SCHEMA.check_match(max_entries)
+      if max_entries < 1:
+        raise tuf.FormatError('max_entries must be at least 1.')
+
+    self.max_entries = max_entries
+    self.hits = 0
+    self.misses = 0
+
+    # Absolute path -> ((device, inode, size, mtime), fileinfo), least
+    # recently used first. An entry is only valid while the file's stat()
+    # results still match.
+    self._by_path = collections.OrderedDict()
+
+    # (device, inode, size, mtime) -> [fileinfo, number of entries in
+    # _by_path referring to it, ctime when hashed]
+    self._by_inode = dict()
+
+    self._lock = threading.Lock()
+
+
+
+
+
+  def get_fileinfo(self, filepath):
+    """
+    <Purpose>
+      Returns the fileinfo (tuf.formats.FILEINFO_SCHEMA, without 'custom') of
+      the given file, hashing the file only if no fileinfo for its current
+      contents is cached. The dictionary returned is shared with the cache and
+      must not be modified.
+
+    <Arguments>
+      filepath
+        The path of the file, which must exist.
+
+    <Exceptions>
+      tuf.FormatError, if filepath is not a path.
+
+      tuf.Error, if filepath is not a file.
+    """
+    tuf.formats.PATH_SCHEMA.check_match(filepath)
+
+    filepath = os.path.abspath(filepath)
+
+    stat_results = _stat(filepath)
+    if stat_results is None or not os.path.isfile(filepath):
+      raise tuf.Error(repr(filepath) + ' is not a file.')
+    stat_key, ctime = stat_results
+
+    with self._lock:
+      fileinfo = None
+      inode_entry = self._by_inode.get(stat_key)
+      if inode_entry is not None and inode_entry[2] == ctime:
+        fileinfo = inode_entry[0]
+
+      if fileinfo is not None and self._has_all_hashes(fileinfo):
+        self.hits += 1
+        self._store(filepath, stat_key, ctime, fileinfo)
+        return fileinfo
+
+    # Hash the file without holding the lock. If two threads miss for the
+    # same file at once, both hash it, and the second result is kept.
+    length, hashes = tuf.util.get_file_details(
+        filepath, tuf.conf.REPOSITORY_HASH_ALGORITHMS)
+    fileinfo = tuf.formats.make_fileinfo(length, hashes)
+
+    # If the file changed while it was being read, what was hashed may not
+    # match the stat() results it would be cached under.
+    if _stat(filepath) != stat_results:
+      log.debug('Not caching fileinfo of ' + repr(filepath) + ', which '
+          'changed while being hashed.')
+      return fileinfo
+
+    with self._lock:
+      self.misses += 1
+      self._store(filepath, stat_key, ctime, fileinfo)
+
+    return fileinfo
+
+
+
+
+
+  def clear(self):
+    """
+    Discards all cached fileinfo.
+    """
+    with self._lock:
+      self._by_path.clear()
+      self._by_inode.clear()
+
+
+
+
+
+  def _store(self, filepath, stat_key, ctime, fileinfo):
+    """
+    Caches fileinfo for the file at filepath, with the given stat() results
+    (see _stat), as the most recently used entry, then drops the least
+    recently used entries if there are too many.
+    The caller holds _lock.
+    """
+    old_entry = self._by_path.pop(filepath, None)
+    if old_entry is not None:
+      self._release(old_entry[0])
+
+    self._by_path[filepath] = (stat_key, fileinfo)
+
+    if stat_key in self._by_inode:
+      self._by_inode[stat_key][0] = fileinfo
+      self._by_inode[stat_key][1] += 1
+      self._by_inode[stat_key][2] = ctime
+    else:
+      self._by_inode[stat_key] = [fileinfo, 1, ctime]
+
+    while self.max_entries is not None and \
+        len(self._by_path) > self.max_entries:
+      dropped_filepath, (dropped_stat_key, dropped_fileinfo) = \
+          self._by_path.popitem(last=False)
+      self._release(dropped_stat_key)
+
+
+
+
+
+  def _release(self, stat_key):
+    """
+    Notes that one fewer entry in _by_path refers to the given stat() results,
+    removing them from _by_inode if none do. The caller holds _lock.
+    """
+    self._by_inode[stat_key][1] -= 1
+    if self._by_inode[stat_key][1] == 0:
+      del self._by_inode[stat_key]
+
+
+
+
+
+  def _has_all_hashes(self, fileinfo):
+    for algorithm in tuf.conf.REPOSITORY_HASH_ALGORITHMS:
+      if algorithm not in fileinfo['hashes']:
+        return False
+    return True
+
+
+
+
+
+def _stat(filepath):
+  """
+  Returns ((device, inode, size, mtime), ctime) for the given file, or None if it cannot be stat()ed. The times are in nanoseconds where
+  os.stat() provides them (Python 3).
+  """
+  try:
+    stat = os.stat(filepath)
+  except OSError:
+    return None
+
+  if hasattr(stat, 'st_mtime_ns'):
+    mtime, ctime = stat.st_mtime_ns, stat.st_ctime_ns
+  else:
+    mtime, ctime = stat.st_mtime, stat.st_ctime
+
+  return (stat.st_dev, stat.st_ino, stat.st_size, mtime), ctime
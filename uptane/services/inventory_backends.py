@@ -0,0 +1,1340 @@
+"""
+<Program Name>
+  inventory_backends.py
+
+<Purpose>
+  Storage backends for uptane.services.inventorydb.
+
+  inventorydb exposes a function-level interface (register_ecu,
+  save_vehicle_manifest, get_last_ecu_manifest, etc.) and performs format and
+  registration checks. The actual storage of vehicle and ECU registrations,
+  ECU public keys, and Vehicle and ECU Manifests is delegated to one of the
+  backends in this module:
+
+    MemoryInventoryBackend
+      Keeps everything in Python dictionaries, as inventorydb always has. Fast,
+      but all state is lost when the process exits, and every manifest ever
+      received must fit in RAM.
+
+    SQLiteInventoryBackend
+      Keeps everything in a SQLite database (in WAL mode, so that readers do
+      not block the writer). Manifests are indexed by VIN, ECU Serial, and
+      the time at which they were submitted, so the Director need only hold
+      in memory the manifests it is actually working with.
+
+  A backend is selected by calling inventorydb.set_backend(). New backends
+  should subclass InventoryBackend and implement all of its methods.
+
+  Each backend applies a RetentionPolicy that bounds how much manifest history
+  it keeps for each vehicle and ECU. By default, all manifests are kept.
+  Pruning is done incrementally: whenever a manifest is saved, older manifests
+  from the same vehicle or ECU that the policy no longer covers are discarded.
+  prune_expired() (through inventorydb.prune_expired()) can be called
+  periodically to also discard manifests from vehicles and ECUs that have
+  stopped reporting.
+
+  Each backend also maintains an index from installed image (filepath and
+  sha256 hash) to the ECUs whose most recent ECU Manifest reports that image
+  installed, updated as each ECU Manifest is saved. Questions like "which
+  ECUs are running this image?" are answered from the index, without
+  scanning the stored manifests. ECU Manifests reporting an image without a
+  sha256 hash are not indexed.
+
+  MemoryInventoryBackend can also save all of its state to a snapshot file
+  (dump_snapshot()) and start from one (snapshot_fname), so that a Director
+  keeping its inventory in memory need not lose it on restart. The snapshot
+  format is:
+
+    an 8-byte magic string (_SNAPSHOT_MAGIC), then
+    the offset of the index record, as an 8-byte big-endian integer, then
+    a series of records, each a 4-byte big-endian length followed by that
+    many bytes of UTF-8 JSON.
+
+  There is one record holding all the manifests (with the times they were
+  received) of each vehicle and ECU that has any, and finally the index
+  record, which holds the registrations, public keys, installed images, and
+  the offsets of the other records. Starting from a snapshot reads only the
+  index; the file is mapped into memory with mmap, and each vehicle's or
+  ECU's manifests are decoded only when first needed.
+
+  Backends do not perform argument format checks or registration checks;
+  inventorydb does that before calling them.
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import sqlite3
+import threading
+import time
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import weakref
+import contextlib
+
+import uptane
+import uptane.manifest_records as manifest_records
+import tuf.formats
+
+_SNAPSHOT_MAGIC = b'UPTINV01'
+
+
+
+class RetentionPolicy(object):
+  """
+  <Purpose>
+    Describes how much manifest history an inventory backend keeps for each
+    vehicle and each ECU. Any combination of the limits below may be given.
+    The most recent manifest from a vehicle or ECU is always kept.
+
+  <Arguments>
+    max_manifests
+      If not None, keep at most this many manifests per vehicle and per ECU,
+      discarding the oldest first.
+
+    max_age
+      If not None, discard manifests that were received more than this many
+      seconds ago.
+
+    only_changes
+      If True, a manifest that reports the same state as the manifest stored
+      before it (the same installed images and attacks detected, ignoring
+      times and signatures) replaces that previous manifest instead of being
+      added after it. Only the most recent report of each distinct state is
+      therefore kept.
+
+  <Exceptions>
+    tuf.FormatError if the arguments are not of the correct types, or if
+    max_manifests is less than 1.
+  """
+
+  def __init__(self, max_manifests=None, max_age=None, only_changes=False):
+
+    if max_manifests is not None:
+      tuf.formats.LENGTH_SCHEMA.check_match(max_manifests)
+      if max_manifests < 1:
+        raise tuf.FormatError('max_manifests must be at least 1, or None.')
+
+    if max_age is not None:
+      if not isinstance(max_age, (int, float)) or max_age < 0:
+        raise tuf.FormatError('max_age must be a non-negative number of '
+            'seconds, or None; received ' + repr(max_age))
+
+    tuf.formats.BOOLEAN_SCHEMA.check_match(only_changes)
+
+    self.max_manifests = max_manifests
+    self.max_age = max_age
+    self.only_changes = only_changes
+
+
+
+
+
+def _ecu_manifest_state(signed_ecu_manifest):
+  """
+  Returns a string describing the state an ECU Manifest reports, ignoring its
+  times and signatures, for comparison under RetentionPolicy.only_changes.
+  """
+  signed = signed_ecu_manifest['signed']
+  return json.dumps([signed['installed_image'], signed['attacks_detected']],
+      sort_keys=True)
+
+
+
+
+
+def _vehicle_manifest_state(signed_vehicle_manifest):
+  """
+  Returns a string describing the state a Vehicle Manifest reports, ignoring
+  times and signatures, for comparison under RetentionPolicy.only_changes.
+  """
+  signed = signed_vehicle_manifest['signed']
+  ecu_states = {}
+  for ecu_serial, ecu_manifests in signed['ecu_version_manifests'].items():
+    ecu_states[ecu_serial] = [_ecu_manifest_state(m) for m in ecu_manifests]
+
+  return json.dumps([signed['primary_ecu_serial'], ecu_states],
+      sort_keys=True)
+
+
+
+
+
+def _installed_image_key(signed_ecu_manifest):
+  """
+  Returns the (filepath, sha256 hash) of the image an ECU Manifest reports
+  installed, under which the ECU is indexed, or None if no sha256 hash is
+  listed.
+  """
+  installed_image = signed_ecu_manifest['signed']['installed_image']
+  sha256 = installed_image['fileinfo']['hashes'].get('sha256')
+  if sha256 is None:
+    return None
+  return (installed_image['filepath'], sha256)
+
+
+
+
+
+class InventoryBackend(object):
+  """
+  <Purpose>
+    Abstract interface for inventorydb storage. See module docstring.
+
+    Manifests passed to and returned from a backend are signable dictionaries
+    conforming to uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA or
+    uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA. Lists of manifests are
+    always ordered from oldest to newest.
+
+    retention_policy is the RetentionPolicy the backend applies when saving
+    manifests.
+  """
+
+  def __init__(self, retention_policy=None):
+    if retention_policy is None:
+      retention_policy = RetentionPolicy()
+    elif not isinstance(retention_policy, RetentionPolicy):
+      raise tuf.FormatError('Expected a RetentionPolicy; received ' +
+          repr(retention_policy))
+
+    self.retention_policy = retention_policy
+
+
+  def vehicle_is_registered(self, vin):
+    raise NotImplementedError
+
+
+  def ecu_is_registered(self, ecu_serial):
+    raise NotImplementedError
+
+
+  def register_vehicle(self, vin, primary_ecu_serial):
+    """
+    Registers the given VIN, discarding any ECU associations and Vehicle
+    Manifests previously stored for it.
+    """
+    raise NotImplementedError
+
+
+  def register_ecu(self, vin, ecu_serial, public_key, is_primary):
+    """
+    Associates the ECU with the (already registered) vehicle, saves its public
+    key, marks it as the vehicle's Primary if is_primary is True, and discards
+    any ECU Manifests previously stored for that ECU Serial.
+    """
+    raise NotImplementedError
+
+
+  def get_registered_vins(self):
+    raise NotImplementedError
+
+
+  def get_ecu_serials_in_vehicle(self, vin):
+    raise NotImplementedError
+
+
+  def get_primary_ecu_serial(self, vin):
+    raise NotImplementedError
+
+
+  def get_ecu_public_key(self, ecu_serial):
+    """Returns the public key for the ECU, or None if it is not registered."""
+    raise NotImplementedError
+
+
+  def save_vehicle_manifest(self, vin, signed_vehicle_manifest):
+    raise NotImplementedError
+
+
+  def save_ecu_manifest(self, vin, ecu_serial, signed_ecu_manifest):
+    raise NotImplementedError
+
+
+  def get_vehicle_manifests(self, vin):
+    raise NotImplementedError
+
+
+  def get_last_vehicle_manifest(self, vin):
+    raise NotImplementedError
+
+
+  def get_ecu_manifests(self, ecu_serial):
+    raise NotImplementedError
+
+
+  def get_last_ecu_manifest(self, ecu_serial):
+    raise NotImplementedError
+
+
+  def get_ecus_with_image(self, filepath, sha256):
+    """
+    Returns a dictionary mapping the ECU Serial of each ECU whose most recent
+    ECU Manifest reports the given image installed to the VIN of the vehicle
+    the manifest was saved for.
+    """
+    raise NotImplementedError
+
+
+  def count_ecus_with_image(self, filepath, sha256):
+    """
+    Returns the number of ECUs whose most recent ECU Manifest reports the
+    given image installed.
+    """
+    raise NotImplementedError
+
+
+  def prune_expired(self, locked=None):
+    """
+    Discards all stored manifests older than retention_policy.max_age allows,
+    including those from vehicles and ECUs that have not reported recently.
+    (Manifests from vehicles and ECUs that are still reporting are already
+    pruned as new ones arrive.)
+
+    If given, locked(vin_or_ecu_serial) returns a context manager that
+    guards the manifests of that vehicle or ECU against concurrent updates
+    (inventorydb passes its striped locks), held while they are pruned.
+    """
+    raise NotImplementedError
+
+
+  def dump_snapshot(self, fname):
+    """
+    Saves all inventory data to a snapshot file (see module docstring), from
+    which MemoryInventoryBackend can start. Only backends that are not
+    persistent themselves support this.
+    """
+    raise NotImplementedError
+
+
+  def close(self):
+    pass
+
+
+
+
+
+def _signature_digest(record):
+  """
+  Returns a digest of the signatures on a manifest record, under which the
+  record is kept in MemoryInventoryBackend's manifest store.
+  """
+  digest = hashlib.sha256()
+  for signature in record.signatures:
+    for field in (signature.keyid, signature.method, signature.sig):
+      if not isinstance(field, bytes):
+        field = field.encode('utf-8')
+      digest.update(field)
+      digest.update(b'\0')
+  return digest.digest()
+
+
+
+
+
+def _ecu_record_state(record):
+  """
+  As _ecu_manifest_state, for an EcuManifestRecord.
+  """
+  return (record.filepath, record.length, record.hashes, record.custom,
+      record.attacks_detected)
+
+
+
+
+
+def _vehicle_record_state(record):
+  """
+  As _vehicle_manifest_state, for a VehicleManifestRecord.
+  """
+  return (record.primary_ecu_serial, tuple(
+      (ecu_serial, tuple(_ecu_record_state(m) for m in ecu_manifests))
+      for ecu_serial, ecu_manifests in record.ecu_version_manifests))
+
+
+
+
+
+class MemoryInventoryBackend(InventoryBackend):
+  """
+  <Purpose>
+    Stores inventory data in six dictionaries:
+
+      vehicle_manifests
+        VIN -> deque of the Vehicle Manifests from that vehicle, as
+        uptane.manifest_records.VehicleManifestRecords
+
+      ecu_manifests
+        ECU Serial -> deque of the ECU Manifests from that ECU, as
+        uptane.manifest_records.EcuManifestRecords
+
+      primary_ecus_by_vin
+        VIN -> ECU Serial of the vehicle's Primary ECU (or None)
+
+      ecus_by_vin
+        VIN -> list of ECU Serials of all ECUs associated with the vehicle
+
+      ecu_public_keys
+        ECU Serial -> public key (uptane.formats.ANYKEY_SCHEMA) of the ECU
+
+      ecus_by_installed_image
+        (filepath, sha256 hash) -> {ECU Serial -> VIN} for the ECUs whose
+        most recent ECU Manifest reports that image installed
+
+    All known vehicles have entries in the first four; all known ECUs have
+    entries in ecu_manifests and ecu_public_keys.
+
+    The times at which the manifests were received are kept in parallel
+    deques, in _vehicle_manifest_times and _ecu_manifest_times, so that
+    manifests can be expired from the old end of each deque as new ones are
+    appended to the other.
+
+    The key under which each ECU is currently indexed in
+    ecus_by_installed_image is kept in _installed_image_by_ecu, so that the
+    ECU can be moved when it reports a different image. Updates to the two
+    are serialized by _image_index_lock, since ECUs running the same image
+    share an entry.
+
+    Manifests are kept as compact records, converted back to dictionaries
+    when retrieved, and each is stored once. _ecu_manifest_store and
+    _vehicle_manifest_store map the digest of a manifest's signatures to its
+    record, and hold it only weakly. A manifest saved with the same
+    signatures and content as one already stored is replaced by the stored
+    record. That applies to a resubmitted manifest, and to an ECU Manifest
+    saved both inside its Vehicle Manifest and on its own. The ECU Manifest
+    records inside stored Vehicle Manifest records are therefore the very
+    objects in ecu_manifests, and identical submissions share storage.
+
+    If snapshot_fname is given, the backend starts with the state saved in
+    that snapshot file by dump_snapshot(). Registrations and the installed
+    image index are loaded at once. The manifests of each vehicle and ECU are
+    left in the (memory-mapped) file, their offsets in
+    _unloaded_vehicle_manifests and _unloaded_ecu_manifests, until that
+    vehicle or ECU is first accessed; until then, its deques in
+    vehicle_manifests or ecu_manifests are empty. The snapshot file must not
+    be modified or removed while the backend is open.
+  """
+
+  def __init__(self, retention_policy=None, snapshot_fname=None):
+    super(MemoryInventoryBackend, self).__init__(retention_policy)
+
+    self.vehicle_manifests = {}
+    self._vehicle_manifest_times = {}
+    self._ecu_manifest_times = {}
+    self.ecu_manifests = {}
+    self.primary_ecus_by_vin = {}
+    self.ecus_by_vin = {}
+    self.ecu_public_keys = {}
+    self.ecus_by_installed_image = {}
+    self._installed_image_by_ecu = {}
+    self._image_index_lock = threading.Lock()
+
+    self._snapshot = None
+    self._unloaded_vehicle_manifests = {}
+    self._unloaded_ecu_manifests = {}
+    self._snapshot_lock = threading.Lock()
+
+    self._ecu_manifest_store = weakref.WeakValueDictionary()
+    self._vehicle_manifest_store = weakref.WeakValueDictionary()
+    self._manifest_store_lock = threading.Lock()
+
+    if snapshot_fname is not None:
+      self._open_snapshot(snapshot_fname)
+
+
+
+
+
+  def _open_snapshot(self, fname):
+    """
+    Loads the index of the given snapshot file and maps the file into memory.
+    See the class docstring.
+    """
+    with open(fname, 'rb') as fileobj:
+      snapshot = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if snapshot[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+      snapshot.close()
+      raise uptane.Error(repr(fname) + ' is not an inventory snapshot.')
+
+    (index_offset,) = struct.unpack_from(
+        '>Q', snapshot, len(_SNAPSHOT_MAGIC))
+    index = json.loads(
+        _read_snapshot_record(snapshot, index_offset).decode('utf-8'))
+
+    self._snapshot = snapshot
+
+    for vin, (primary_ecu_serial, ecu_serials, offset) in \
+        index['vehicles'].items():
+      self.ecus_by_vin[vin] = ecu_serials
+      self.primary_ecus_by_vin[vin] = primary_ecu_serial
+      self.vehicle_manifests[vin] = collections.deque()
+      self._vehicle_manifest_times[vin] = collections.deque()
+      if offset is not None:
+        self._unloaded_vehicle_manifests[vin] = offset
+
+    for ecu_serial, (public_key, offset, installed_image) in \
+        index['ecus'].items():
+      self.ecu_public_keys[ecu_serial] = public_key
+      self.ecu_manifests[ecu_serial] = collections.deque()
+      self._ecu_manifest_times[ecu_serial] = collections.deque()
+      if offset is not None:
+        self._unloaded_ecu_manifests[ecu_serial] = offset
+      if installed_image is not None:
+        filepath, sha256, vin = installed_image
+        self._index_installed_image(ecu_serial, vin, (filepath, sha256))
+
+
+
+
+
+  def _load_from_snapshot(self, unloaded, manifests_by_key, times_by_key,
+      key, store):
+    """
+    If the manifests for the given VIN or ECU Serial have not yet been loaded
+    from the snapshot (i.e. key is in unloaded), decodes them into the deques
+    in manifests_by_key and times_by_key, passing each through store (see
+    _store_ecu_manifest), and applies the retention policy.
+    """
+    if key not in unloaded:
+      return
+
+    with self._snapshot_lock:
+      offset = unloaded.get(key)
+      if offset is None:
+        return # Loaded by another thread meanwhile.
+
+      manifests = manifests_by_key[key]
+      times = times_by_key[key]
+      for received, manifest in json.loads(
+          _read_snapshot_record(self._snapshot, offset).decode('utf-8')):
+        manifests.append(store(manifest))
+        times.append(received)
+      self._apply_retention_policy(manifests, times, time.time())
+
+      unloaded.pop(key, None)
+
+
+
+
+
+  def _load_vehicle_manifests(self, vin):
+    self._load_from_snapshot(self._unloaded_vehicle_manifests,
+        self.vehicle_manifests, self._vehicle_manifest_times, vin,
+        self._store_vehicle_manifest)
+
+
+
+
+
+  def _load_ecu_manifests(self, ecu_serial):
+    self._load_from_snapshot(self._unloaded_ecu_manifests,
+        self.ecu_manifests, self._ecu_manifest_times, ecu_serial,
+        self._store_ecu_manifest)
+
+
+
+
+
+  def _store_record(self, store, record):
+    """
+    Returns the record in the given manifest store with the same signatures
+    and content as the given record, adding the given record to the store if
+    there is none. See the class docstring.
+    """
+    digest = _signature_digest(record)
+
+    with self._manifest_store_lock:
+      stored = store.get(digest)
+      if stored is None:
+        store[digest] = record
+      elif stored == record:
+        return stored
+      # Otherwise, the signatures match but the content does not (so at
+      # least one is not validly signed). Keep the stored one and don't share
+      # this one.
+
+    return record
+
+
+
+
+
+  def _store_ecu_manifest(self, signed_ecu_manifest):
+    """
+    Returns the EcuManifestRecord to keep for the given signed ECU Manifest.
+    """
+    return self._store_record(self._ecu_manifest_store,
+        manifest_records.ecu_manifest_from_dict(signed_ecu_manifest))
+
+
+
+
+
+  def _store_vehicle_manifest(self, signed_vehicle_manifest):
+    """
+    Returns the VehicleManifestRecord to keep for the given signed Vehicle
+    Manifest, its ECU Manifests also kept in the manifest store.
+    """
+    return self._store_record(self._vehicle_manifest_store,
+        manifest_records.vehicle_manifest_from_dict(signed_vehicle_manifest,
+        ecu_manifest_from_dict=self._store_ecu_manifest))
+
+
+
+
+
+  def vehicle_is_registered(self, vin):
+    # A VIN may be in either none or all three of these dictionaries, and
+    # nowhere in between, or there is a bug.
+    assert (vin in self.vehicle_manifests) == (vin in self.ecus_by_vin) == (
+        vin in self.primary_ecus_by_vin), 'Programming error.'
+
+    return vin in self.vehicle_manifests
+
+
+
+
+
+  def ecu_is_registered(self, ecu_serial):
+    assert (ecu_serial in self.ecu_public_keys) == \
+        (ecu_serial in self.ecu_manifests), \
+        'Programming error: ECU registration is not consistent.'
+
+    return ecu_serial in self.ecu_public_keys
+
+
+
+
+
+  def register_vehicle(self, vin, primary_ecu_serial):
+    self.ecus_by_vin[vin] = []
+    self.vehicle_manifests[vin] = collections.deque()
+    self._vehicle_manifest_times[vin] = collections.deque()
+    self.primary_ecus_by_vin[vin] = primary_ecu_serial
+    with self._snapshot_lock:
+      self._unloaded_vehicle_manifests.pop(vin, None)
+
+
+
+
+
+  def register_ecu(self, vin, ecu_serial, public_key, is_primary):
+    # Will not add the same ECU Serial to a vehicle's list of ECUs twice.
+    if ecu_serial not in self.ecus_by_vin[vin]:
+      self.ecus_by_vin[vin].append(ecu_serial)
+
+    if is_primary:
+      self.primary_ecus_by_vin[vin] = ecu_serial
+
+    self.ecu_public_keys[ecu_serial] = public_key
+    self.ecu_manifests[ecu_serial] = collections.deque()
+    self._ecu_manifest_times[ecu_serial] = collections.deque()
+    with self._snapshot_lock:
+      self._unloaded_ecu_manifests.pop(ecu_serial, None)
+    self._index_installed_image(ecu_serial, None, None)
+
+
+
+
+
+  def get_registered_vins(self):
+    return list(self.ecus_by_vin)
+
+
+
+
+
+  def get_ecu_serials_in_vehicle(self, vin):
+    return list(self.ecus_by_vin[vin])
+
+
+
+
+
+  def get_primary_ecu_serial(self, vin):
+    return self.primary_ecus_by_vin[vin]
+
+
+
+
+
+  def get_ecu_public_key(self, ecu_serial):
+    return self.ecu_public_keys.get(ecu_serial)
+
+
+
+
+
+  def _append_manifest(self, manifests, times, manifest, get_state):
+    """
+    Appends the manifest to the given deque of manifests (and the current time
+    to the parallel deque of times), then discards manifests from the old end
+    of the deques until they satisfy the retention policy.
+    """
+    policy = self.retention_policy
+    now = time.time()
+
+    if policy.only_changes and manifests and \
+        get_state(manifests[-1]) == get_state(manifest):
+      # Same state as last time: replace the previous manifest.
+      manifests.pop()
+      times.pop()
+
+    manifests.append(manifest)
+    times.append(now)
+
+    self._apply_retention_policy(manifests, times, now)
+
+
+
+
+
+  def _apply_retention_policy(self, manifests, times, now):
+    """
+    Discards manifests from the old end of the given deques (and the parallel
+    deque of times) until they satisfy the retention policy.
+    """
+    policy = self.retention_policy
+
+    if policy.max_manifests is not None:
+      while len(manifests) > policy.max_manifests:
+        manifests.popleft()
+        times.popleft()
+
+    if policy.max_age is not None:
+      while len(manifests) > 1 and times[0] < now - policy.max_age:
+        manifests.popleft()
+        times.popleft()
+
+
+
+
+
+  def save_vehicle_manifest(self, vin, signed_vehicle_manifest):
+    self._load_vehicle_manifests(vin)
+    self._append_manifest(self.vehicle_manifests[vin],
+        self._vehicle_manifest_times[vin],
+        self._store_vehicle_manifest(signed_vehicle_manifest),
+        _vehicle_record_state)
+
+
+
+
+
+  def save_ecu_manifest(self, vin, ecu_serial, signed_ecu_manifest):
+    self._load_ecu_manifests(ecu_serial)
+    self._append_manifest(self.ecu_manifests[ecu_serial],
+        self._ecu_manifest_times[ecu_serial],
+        self._store_ecu_manifest(signed_ecu_manifest),
+        _ecu_record_state)
+    self._index_installed_image(
+        ecu_serial, vin, _installed_image_key(signed_ecu_manifest))
+
+
+
+
+
+  def _index_installed_image(self, ecu_serial, vin, key):
+    """
+    Moves the ECU to the given key (or, if key is None, out of) the installed
+    image index. Constant time.
+    """
+    with self._image_index_lock:
+      old_key = self._installed_image_by_ecu.pop(ecu_serial, None)
+      if old_key is not None:
+        ecus = self.ecus_by_installed_image[old_key]
+        del ecus[ecu_serial]
+        if not ecus:
+          del self.ecus_by_installed_image[old_key]
+
+      if key is not None:
+        self.ecus_by_installed_image.setdefault(key, {})[ecu_serial] = vin
+        self._installed_image_by_ecu[ecu_serial] = key
+
+
+
+
+
+  def get_vehicle_manifests(self, vin):
+    self._load_vehicle_manifests(vin)
+    return [record.to_dict() for record in self.vehicle_manifests[vin]]
+
+
+
+
+
+  def get_last_vehicle_manifest(self, vin):
+    self._load_vehicle_manifests(vin)
+    if not self.vehicle_manifests[vin]:
+      return None
+    return self.vehicle_manifests[vin][-1].to_dict()
+
+
+
+
+
+  def get_ecu_manifests(self, ecu_serial):
+    self._load_ecu_manifests(ecu_serial)
+    return [record.to_dict() for record in self.ecu_manifests[ecu_serial]]
+
+
+
+
+
+  def get_last_ecu_manifest(self, ecu_serial):
+    self._load_ecu_manifests(ecu_serial)
+    if not self.ecu_manifests[ecu_serial]:
+      return None
+    return self.ecu_manifests[ecu_serial][-1].to_dict()
+
+
+
+
+
+  def get_ecus_with_image(self, filepath, sha256):
+    with self._image_index_lock:
+      return dict(self.ecus_by_installed_image.get((filepath, sha256), {}))
+
+
+
+
+
+  def count_ecus_with_image(self, filepath, sha256):
+    return len(self.ecus_by_installed_image.get((filepath, sha256), {}))
+
+
+
+
+
+  def prune_expired(self, locked=None):
+    if self.retention_policy.max_age is None:
+      return
+
+    if locked is None:
+      locked = _not_locked
+
+    cutoff = time.time() - self.retention_policy.max_age
+
+    # Manifests not yet loaded from a snapshot are pruned when they are loaded.
+    # Vehicles and ECUs registered meanwhile are skipped; there is nothing to
+    # prune yet.
+    for manifests_by_key, times_by_key in [
+        (self.vehicle_manifests, self._vehicle_manifest_times),
+        (self.ecu_manifests, self._ecu_manifest_times)]:
+      for key in list(manifests_by_key):
+        with locked(key):
+          manifests = manifests_by_key.get(key)
+          times = times_by_key.get(key)
+          if manifests is None or times is None:
+            continue
+          while len(manifests) > 1 and times[0] < cutoff:
+            manifests.popleft()
+            times.popleft()
+
+
+
+
+
+  def dump_snapshot(self, fname):
+    """
+    Writes a snapshot file (see module docstring) to fname + '.tmp' and then
+    renames it to fname, so that an existing snapshot is replaced only by a
+    complete one. The caller must prevent concurrent updates. Manifests not
+    yet loaded from this backend's own snapshot are copied over without being
+    decoded.
+    """
+    temp_fname = fname + '.tmp'
+
+    with open(temp_fname, 'wb') as fileobj:
+      fileobj.write(_SNAPSHOT_MAGIC + struct.pack('>Q', 0))
+
+      def write_manifests(unloaded, manifests_by_key, times_by_key, key):
+        offset = unloaded.get(key)
+        if offset is not None:
+          record = _read_snapshot_record(self._snapshot, offset)
+        elif manifests_by_key[key]:
+          record = json.dumps([(received, manifest.to_dict()) for
+              received, manifest in zip(times_by_key[key],
+              manifests_by_key[key])]).encode('utf-8')
+        else:
+          return None
+        return _write_snapshot_record(fileobj, record)
+
+      vehicles = {}
+      for vin in self.ecus_by_vin:
+        vehicles[vin] = [self.primary_ecus_by_vin[vin], self.ecus_by_vin[vin],
+            write_manifests(self._unloaded_vehicle_manifests,
+            self.vehicle_manifests, self._vehicle_manifest_times, vin)]
+
+      ecus = {}
+      with self._image_index_lock:
+        installed_images = dict(self._installed_image_by_ecu)
+      for ecu_serial in self.ecu_public_keys:
+        installed_image = None
+        key = installed_images.get(ecu_serial)
+        if key is not None:
+          installed_image = list(key) + [
+              self.ecus_by_installed_image[key][ecu_serial]]
+
+        ecus[ecu_serial] = [self.ecu_public_keys[ecu_serial],
+            write_manifests(self._unloaded_ecu_manifests, self.ecu_manifests,
+            self._ecu_manifest_times, ecu_serial), installed_image]
+
+      index_offset = _write_snapshot_record(fileobj, json.dumps(
+          {'vehicles': vehicles, 'ecus': ecus}).encode('utf-8'))
+
+      fileobj.seek(len(_SNAPSHOT_MAGIC))
+      fileobj.write(struct.pack('>Q', index_offset))
+
+    os.rename(temp_fname, fname)
+
+
+
+
+
+  def close(self):
+    # Whatever has not been loaded from the snapshot is no longer available.
+    if self._snapshot is not None:
+      self._snapshot.close()
+      self._snapshot = None
+
+
+
+
+
+@contextlib.contextmanager
+def _not_locked(vin_or_ecu_serial):
+  """
+  The default for prune_expired()'s locked argument, for callers that already
+  prevent concurrent updates.
+  """
+  yield
+
+
+
+
+
+def _write_snapshot_record(fileobj, record):
+  """
+  Appends a length-prefixed record (bytes) to the snapshot file being written
+  and returns its offset.
+  """
+  offset = fileobj.tell()
+  fileobj.write(struct.pack('>I', len(record)))
+  fileobj.write(record)
+  return offset
+
+
+
+
+
+def _read_snapshot_record(snapshot, offset):
+  """
+  Returns the bytes of the record at the given offset of the snapshot (an
+  mmap, or other buffer).
+  """
+  (length,) = struct.unpack_from('>I', snapshot, offset)
+  return snapshot[offset + 4 : offset + 4 + length]
+
+
+
+
+
+class SQLiteInventoryBackend(InventoryBackend):
+  """
+  <Purpose>
+    Stores inventory data in a SQLite database file, so that it survives
+    Director restarts and need not be held in memory.
+
+    The database is opened in WAL (write-ahead logging) mode. Manifests are
+    stored as JSON text, one row per manifest, and indexed by VIN or ECU
+    Serial and by submission time. Retrieving the last manifest from a vehicle
+    or ECU is an index lookup rather than a scan. Each manifest row also holds
+    a digest of the state the manifest reports, so that
+    RetentionPolicy.only_changes can be applied without decoding the previous
+    manifest. The installed image index is the installed_images table, which
+    holds one row per ECU, indexed by (filepath, sha256), and is updated in
+    the same transaction as the ECU Manifest it derives from.
+
+    A single connection is shared between threads and serialized with a lock;
+    SQLite connections are not safe for concurrent use otherwise.
+
+  <Arguments>
+    db_fname
+      Path to the database file. It is created if it does not exist. Passing
+      ':memory:' yields a non-persistent database (useful for testing).
+
+    retention_policy
+      See RetentionPolicy. If None, all manifests are kept.
+  """
+
+  _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS vehicles (
+      vin TEXT PRIMARY KEY,
+      primary_ecu_serial TEXT);
+
+    CREATE TABLE IF NOT EXISTS ecus (
+      ecu_serial TEXT PRIMARY KEY,
+      vin TEXT NOT NULL,
+      public_key TEXT NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS vehicle_ecus (
+      vin TEXT NOT NULL,
+      ecu_serial TEXT NOT NULL,
+      position INTEGER NOT NULL,
+      PRIMARY KEY (vin, ecu_serial));
+
+    CREATE TABLE IF NOT EXISTS vehicle_manifests (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      vin TEXT NOT NULL,
+      submitted REAL NOT NULL,
+      state_digest TEXT NOT NULL,
+      manifest TEXT NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS ecu_manifests (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      ecu_serial TEXT NOT NULL,
+      vin TEXT NOT NULL,
+      submitted REAL NOT NULL,
+      state_digest TEXT NOT NULL,
+      manifest TEXT NOT NULL);
+
+    CREATE TABLE IF NOT EXISTS installed_images (
+      ecu_serial TEXT PRIMARY KEY,
+      vin TEXT NOT NULL,
+      filepath TEXT NOT NULL,
+      sha256 TEXT NOT NULL);
+
+    CREATE INDEX IF NOT EXISTS vehicle_manifests_by_vin
+      ON vehicle_manifests (vin, id);
+    CREATE INDEX IF NOT EXISTS vehicle_manifests_by_time
+      ON vehicle_manifests (submitted);
+    CREATE INDEX IF NOT EXISTS ecu_manifests_by_serial
+      ON ecu_manifests (ecu_serial, id);
+    CREATE INDEX IF NOT EXISTS ecu_manifests_by_vin
+      ON ecu_manifests (vin, id);
+    CREATE INDEX IF NOT EXISTS ecu_manifests_by_time
+      ON ecu_manifests (submitted);
+    CREATE INDEX IF NOT EXISTS installed_images_by_image
+      ON installed_images (filepath, sha256);
+    """
+
+  def __init__(self, db_fname, retention_policy=None):
+    super(SQLiteInventoryBackend, self).__init__(retention_policy)
+
+    self.db_fname = db_fname
+    self._lock = threading.RLock()
+    self._db = sqlite3.connect(
+        db_fname, check_same_thread=False, isolation_level=None)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute('PRAGMA synchronous=NORMAL')
+
+    index_existed = bool(self._query('SELECT 1 FROM sqlite_master WHERE '
+        'type = ? AND name = ?', ('table', 'installed_images')))
+    self._db.executescript(self._SCHEMA)
+
+    if not index_existed:
+      self._build_installed_image_index()
+
+
+
+
+
+  def _build_installed_image_index(self):
+    """
+    Fills the installed_images table from the most recent manifest of each
+    ECU, for databases created before the table existed. This is the only
+    time the ECU Manifests are scanned.
+    """
+    statements = []
+    for ecu_serial, vin, manifest in self._query('SELECT ecu_serial, vin, '
+        'manifest FROM ecu_manifests WHERE id IN (SELECT MAX(id) FROM '
+        'ecu_manifests GROUP BY ecu_serial)'):
+      key = _installed_image_key(json.loads(manifest))
+      if key is not None:
+        statements.append(('INSERT OR REPLACE INTO installed_images '
+            '(ecu_serial, vin, filepath, sha256) VALUES (?, ?, ?, ?)',
+            (ecu_serial, vin) + key))
+
+    if statements:
+      self._write(statements)
+
+
+
+
+
+  def _query(self, sql, params=()):
+    with self._lock:
+      return self._db.execute(sql, params).fetchall()
+
+
+
+
+
+  def _write(self, statements):
+    """
+    Executes the given (sql, params) pairs in a single transaction.
+    """
+    with self._lock:
+      self._db.execute('BEGIN IMMEDIATE')
+      try:
+        for sql, params in statements:
+          self._db.execute(sql, params)
+      except:
+        self._db.execute('ROLLBACK')
+        raise
+      self._db.execute('COMMIT')
+
+
+
+
+
+  def _save_manifest(self, table, key_column, key, vin, manifest, state,
+      extra_statements=()):
+    """
+    Saves the manifest in the given table (vehicle_manifests or ecu_manifests)
+    under the given key (a VIN or ECU Serial), then deletes older manifests
+    under that key that the retention policy no longer covers, all in a single
+    transaction. Only rows under the one key are touched, through the index on
+    (key, id), so the cost does not grow with the size of the table.
+
+    The given extra (sql, params) pairs are executed in the same transaction.
+    """
+    policy = self.retention_policy
+    now = time.time()
+    manifest = json.dumps(manifest)
+    state_digest = hashlib.sha256(state.encode('utf-8')).hexdigest()
+
+    if key_column == 'vin':
+      id_columns, id_values = 'vin', (vin,)
+    else:
+      id_columns, id_values = key_column + ', vin', (key, vin)
+
+    with self._lock:
+      self._db.execute('BEGIN IMMEDIATE')
+      try:
+        last = None
+        if policy.only_changes:
+          last = self._db.execute('SELECT id, state_digest FROM ' + table +
+              ' WHERE ' + key_column + ' = ? ORDER BY id DESC LIMIT 1',
+              (key,)).fetchone()
+
+        if last is not None and last[1] == state_digest:
+          # Same state as last time: replace the previous manifest.
+          self._db.execute('UPDATE ' + table + ' SET submitted = ?, '
+              'manifest = ? WHERE id = ?', (now, manifest, last[0]))
+
+        else:
+          self._db.execute('INSERT INTO ' + table + ' (' + id_columns +
+              ', submitted, state_digest, manifest) VALUES (' +
+              ', '.join('?' * (len(id_values) + 3)) + ')',
+              id_values + (now, state_digest, manifest))
+
+        if policy.max_manifests is not None:
+          self._db.execute('DELETE FROM ' + table + ' WHERE ' + key_column +
+              ' = ? AND id <= (SELECT id FROM ' + table + ' WHERE ' +
+              key_column + ' = ? ORDER BY id DESC LIMIT 1 OFFSET ?)',
+              (key, key, policy.max_manifests))
+
+        if policy.max_age is not None:
+          self._db.execute('DELETE FROM ' + table + ' WHERE ' + key_column +
+              ' = ? AND submitted < ? AND id < (SELECT MAX(id) FROM ' +
+              table + ' WHERE ' + key_column + ' = ?)',
+              (key, now - policy.max_age, key))
+
+        for sql, params in extra_statements:
+          self._db.execute(sql, params)
+
+      except:
+        self._db.execute('ROLLBACK')
+        raise
+      self._db.execute('COMMIT')
+
+
+
+
+
+  def vehicle_is_registered(self, vin):
+    return bool(self._query('SELECT 1 FROM vehicles WHERE vin = ?', (vin,)))
+
+
+
+
+
+  def ecu_is_registered(self, ecu_serial):
+    return bool(self._query(
+        'SELECT 1 FROM ecus WHERE ecu_serial = ?', (ecu_serial,)))
+
+
+
+
+
+  def register_vehicle(self, vin, primary_ecu_serial):
+    self._write([
+        ('INSERT OR REPLACE INTO vehicles (vin, primary_ecu_serial) '
+        'VALUES (?, ?)', (vin, primary_ecu_serial)),
+        ('DELETE FROM vehicle_ecus WHERE vin = ?', (vin,)),
+        ('DELETE FROM vehicle_manifests WHERE vin = ?', (vin,))])
+
+
+
+
+
+  def register_ecu(self, vin, ecu_serial, public_key, is_primary):
+    statements = [
+        ('INSERT OR IGNORE INTO vehicle_ecus (vin, ecu_serial, position) '
+        'SELECT ?, ?, COUNT(*) FROM vehicle_ecus WHERE vin = ?',
+        (vin, ecu_serial, vin)),
+        ('INSERT OR REPLACE INTO ecus (ecu_serial, vin, public_key) '
+        'VALUES (?, ?, ?)', (ecu_serial, vin, json.dumps(public_key))),
+        ('DELETE FROM ecu_manifests WHERE ecu_serial = ?', (ecu_serial,)),
+        ('DELETE FROM installed_images WHERE ecu_serial = ?', (ecu_serial,))]
+
+    if is_primary:
+      statements.append(('UPDATE vehicles SET primary_ecu_serial = ? '
+          'WHERE vin = ?', (ecu_serial, vin)))
+
+    self._write(statements)
+
+
+
+
+
+  def get_registered_vins(self):
+    return [row[0] for row in self._query('SELECT vin FROM vehicles')]
+
+
+
+
+
+  def get_ecu_serials_in_vehicle(self, vin):
+    return [row[0] for row in self._query('SELECT ecu_serial FROM '
+        'vehicle_ecus WHERE vin = ? ORDER BY position', (vin,))]
+
+
+
+
+
+  def get_primary_ecu_serial(self, vin):
+    rows = self._query(
+        'SELECT primary_ecu_serial FROM vehicles WHERE vin = ?', (vin,))
+    return rows[0][0] if rows else None
+
+
+
+
+
+  def get_ecu_public_key(self, ecu_serial):
+    rows = self._query(
+        'SELECT public_key FROM ecus WHERE ecu_serial = ?', (ecu_serial,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+
+
+
+  def save_vehicle_manifest(self, vin, signed_vehicle_manifest):
+    self._save_manifest('vehicle_manifests', 'vin', vin, vin,
+        signed_vehicle_manifest,
+        _vehicle_manifest_state(signed_vehicle_manifest))
+
+
+
+
+
+  def save_ecu_manifest(self, vin, ecu_serial, signed_ecu_manifest):
+    key = _installed_image_key(signed_ecu_manifest)
+    if key is None:
+      index_statement = ('DELETE FROM installed_images WHERE ecu_serial = ?',
+          (ecu_serial,))
+    else:
+      index_statement = ('INSERT OR REPLACE INTO installed_images '
+          '(ecu_serial, vin, filepath, sha256) VALUES (?, ?, ?, ?)',
+          (ecu_serial, vin) + key)
+
+    self._save_manifest('ecu_manifests', 'ecu_serial', ecu_serial, vin,
+        signed_ecu_manifest, _ecu_manifest_state(signed_ecu_manifest),
+        [index_statement])
+
+
+
+
+
+  def get_vehicle_manifests(self, vin):
+    return [json.loads(row[0]) for row in self._query('SELECT manifest FROM '
+        'vehicle_manifests WHERE vin = ? ORDER BY id', (vin,))]
+
+
+
+
+
+  def get_last_vehicle_manifest(self, vin):
+    rows = self._query('SELECT manifest FROM vehicle_manifests WHERE vin = ? '
+        'ORDER BY id DESC LIMIT 1', (vin,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+
+
+
+  def get_ecu_manifests(self, ecu_serial):
+    return [json.loads(row[0]) for row in self._query('SELECT manifest FROM '
+        'ecu_manifests WHERE ecu_serial = ? ORDER BY id', (ecu_serial,))]
+
+
+
+
+
+  def get_last_ecu_manifest(self, ecu_serial):
+    rows = self._query('SELECT manifest FROM ecu_manifests '
+        'WHERE ecu_serial = ? ORDER BY id DESC LIMIT 1', (ecu_serial,))
+    return json.loads(rows[0][0]) if rows else None
+
+
+
+
+
+  def get_ecus_with_image(self, filepath, sha256):
+    return dict(self._query('SELECT ecu_serial, vin FROM installed_images '
+        'WHERE filepath = ? AND sha256 = ?', (filepath, sha256)))
+
+
+
+
+
+  def count_ecus_with_image(self, filepath, sha256):
+    return self._query('SELECT COUNT(*) FROM installed_images '
+        'WHERE filepath = ? AND sha256 = ?', (filepath, sha256))[0][0]
+
+
+
+
+
+  def prune_expired(self, locked=None):
+    """
+    Deletes all manifests older than retention_policy.max_age allows, except
+    the most recent manifest from each vehicle and ECU. Uses the indices on
+    submission time. This is a single transaction, so locked is not needed.
+    """
+    if self.retention_policy.max_age is None:
+      return
+
+    cutoff = time.time() - self.retention_policy.max_age
+
+    self._write([
+        ('DELETE FROM vehicle_manifests WHERE submitted < ? AND id NOT IN '
+        '(SELECT MAX(id) FROM vehicle_manifests GROUP BY vin)', (cutoff,)),
+        ('DELETE FROM ecu_manifests WHERE submitted < ? AND id NOT IN '
+        '(SELECT MAX(id) FROM ecu_manifests GROUP BY ecu_serial)', (cutoff,))])
+
+
+
+
+
+  def close(self):
+    with self._lock:
+      self._db.close()
@@ -7,101 +7,91 @@
   by the Director.
 
 
-  # TODO: <~> This is not properly thread-safe: there may be race conditions if
-  Primaries are being switched frequently. The windows are extremely small, but
-  assertions related to VIN registration in _check_registration_is_sane() are
-  likely to fail if such a race   condition is encountered. Similar race
-  conditions may exist. Cautious use of mutexes or a queue is probably
-  necessary.
+  Thread safety:
+  Updates are serialized per vehicle and per ECU using lock striping: each VIN
+  and each ECU Serial maps to one of a fixed number of locks (_LOCK_STRIPES).
+  register_vehicle, register_ecu, save_vehicle_manifest, and save_ecu_manifest
+  hold the locks for the VINs and ECU Serials they modify, and
+  check_vin_registered holds the lock for the VIN it checks, so registration
+  invariants are never observed half-updated. Manifests from different
+  vehicles can be saved in parallel without contending on one global lock.
+  (Storage backends must additionally tolerate concurrent calls concerning
+  different vehicles and ECUs.)
 
 
 
 <Globals>
-  The following five global dictionaries store information about ECUs and
-  vehicles, including their serials, keys, and manifests submitted from
-  (ostensibly) them to the Director.
+  _backend
+    The storage backend (see uptane.services.inventory_backends) in which
+    information about ECUs and vehicles is kept, including their serials,
+    keys, and manifests submitted from (ostensibly) them to the Director.
+    Defaults to an in-memory backend, which keeps it all in dictionaries. Use
+    set_backend() to use a different backend, e.g. a persistent one:
 
-    vehicle_manifests
+      inventorydb.set_backend(
+          inventory_backends.SQLiteInventoryBackend('director_inventory.db'))
 
-      A dictionary indexed by the VINs (vehicle identification numbers) of
-      known vehicles (uptane.format.VIN_SCHEMA), with values each being lists
-      of vehicle manifests from that vehicle - each list element is a manifest
-      with structure complying with the format specification
-      uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.
-
-      All known vehicles should be in this dictionary.
+    Backends take an optional inventory_backends.RetentionPolicy, which bounds
+    the manifest history kept for each vehicle and ECU, e.g. to the last 10
+    manifests received in the last 24 hours:
 
-      e.g. {'vin1': [<vehiclemanifest>, <vehiclemanifest>, ...}], 'vin2': []}
+      inventory_backends.MemoryInventoryBackend(
+          inventory_backends.RetentionPolicy(max_manifests=10, max_age=86400))
 
+    The following data is stored:
 
-    ecu_manifests
+    Vehicle Manifests, indexed by the VINs (vehicle identification numbers) of
+      known vehicles (uptane.format.VIN_SCHEMA). Each complies with
+      uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.
 
-      A dictionary indexed by the ECU Serials of known ECUs
-      (uptane.format.ECU_SERIAL_SCHEMA), with values each being lists of ECU
-      manifests from that ECU. Individual list elements comply with
+    ECU Manifests, indexed by the ECU Serials of known ECUs
+      (uptane.format.ECU_SERIAL_SCHEMA). Each complies with
       uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.
 
       This is duplicated data, as all ECU Manifests were extracted from Vehicle
-      Manifests which are also saved in full in global vehicle_manifests.
-
-      All known ECU Serials should be in this dictionary.
-
-      e.g. {'ecuserial1': [<ecumanifest>, <ecumanifest>], 'ecuserial2': []}
-
-
-    primary_ecus_by_vin
-
-      A dictionary mapping VIN of a vehicle (uptane.formats.VIN_SCHEMA) to the
-      ECU Serial (uptane.formats.ECU_SERIAL_SCHEMA) of the vehicle's Primary
-      ECU.
-
-      All known vehicles should be in this dictionary. If a vehicle has no
-      registered Primary ECU for some reason, the value should be set to None.
-
-      e.g. {'vin1': 'ecuserial1', 'vin2': 'ecuserial2'}
+      Manifests which are also saved in full. (The in-memory backend stores
+      each distinct manifest only once, though; see
+      inventory_backends.MemoryInventoryBackend.)
 
+    The ECU Serial of the Primary ECU of each known vehicle (or None, if a
+      vehicle has no registered Primary ECU for some reason).
 
-    ecus_by_vin
+    The ECU Serials of all ECUs associated with each known vehicle.
 
-      A dictionary mapping VIN of a vehicle (uptane.formats.VIN_SCHEMA) to a
-      list of the ECU Serials (uptane.formats.ECU_SERIAL_SCHEMA) of all ECUs
-      associated with that vehicle.
+    The public key (conforming to uptane.formats.ANYKEY_SCHEMA) that
+      corresponds to the signing key we expect each known ECU to use.
 
-      All known vehicles should have their VIN in this dictionary.
 
-      e.g.
-          {'vin1': ['ecuserial1', 'ecuserial9'],
-           'vin2': ['ecuserial2']}
-
-      This is used to both identify known VINs and associate ECUs with VINs.
-      Identifying known ECUs is generally done instead by checking the
-      ecu_public_keys field, since that is flat.
-
-
-    ecu_public_keys
-
-      A dictionary mapping ECU Serial (uptane.formats.ECU_SERIAL_SCHEMA) of an
-      ECU to the public key (conforming to uptane.formats.ANYKEY_SCHEMA) that
-      corresponds to the signing key we expect that ECU to use.
-
-      All known ECUs should have their ECU Serial in this dictionary.
+<Public Functions>
 
-      e.g. {'ecuserial1': <key>, 'ecuserial2': <key>, ...}
+  Storage Backend:
+    set_backend(backend)
+    get_backend()
 
+  Snapshots:
+    dump_snapshot(fname)
+    load_snapshot(fname, retention_policy=None)
 
-<Public Functions>
+  Retention:
+    prune_expired()
 
   Registration:
     register_ecu(is_primary, vin, ecu_serial, public_key, overwrite=True)
+    register_vehicle(vin, primary_ecu_serial=None, overwrite=True)
     check_ecu_registered(ecu_serial)
     check_vin_registered(vin)
 
+  Get Registration Info:
+    get_registered_vins()
+    get_ecu_serials_in_vehicle(vin)
+    get_primary_ecu_serial(vin)
+
   Get Public Key:
     get_ecu_public_key(ecu_serial)
 
   Save Manifests:
     save_vehicle_manifest(vin, signed_vehicle_manifest)
-    save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest)
+    save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest, public_key=None)
 
   Get Manifests:
     get_vehicle_manifests(vin)
@@ -110,6 +100,11 @@
     get_last_ecu_manifest(ecu_serial)
     get_all_ecu_manifests_from_vehicle(vin)
 
+  Query Installed Images:
+    get_ecus_with_image(filepath, sha256)
+    count_ecus_with_image(filepath, sha256)
+    get_vehicles_with_image(filepath, sha256)
+
 """
 from __future__ import print_function
 from __future__ import unicode_literals
@@ -117,14 +112,196 @@ from io import open
 
 import uptane
 import uptane.formats
+import uptane.services.inventory_backends as inventory_backends
 import tuf
+import tuf.formats
+import threading
+import contextlib
+
+# Storage backend. See set_backend().
+_backend = inventory_backends.MemoryInventoryBackend()
+
+# Striped locks guarding updates concerning particular VINs and ECU Serials.
+# See module docstring. A VIN or ECU Serial is guarded by
+# _locks[hash(vin_or_serial) % _LOCK_STRIPES].
+_LOCK_STRIPES = 256
+_locks = [threading.RLock() for i in range(_LOCK_STRIPES)]
+
+
+
+@contextlib.contextmanager
+def _locked(*identifiers):
+  """
+  Holds the striped locks for all of the given VINs and/or ECU Serials while
+  the with-block runs. Locks are always acquired in ascending stripe order, so
+  that two threads locking overlapping sets of identifiers cannot deadlock.
+  """
+  stripes = sorted(set(hash(i) % _LOCK_STRIPES for i in identifiers))
+
+  for stripe in stripes:
+    _locks[stripe].acquire()
+
+  try:
+    yield
+
+  finally:
+    for stripe in reversed(stripes):
+      _locks[stripe].release()
+
+
+
+
+
+@contextlib.contextmanager
+def _all_locked():
+  """
+  Holds every striped lock while the with-block runs, so that no update is in
+  progress. Locks are acquired in ascending stripe order, as in _locked().
+  """
+  for lock in _locks:
+    lock.acquire()
+
+  try:
+    yield
+
+  finally:
+    for lock in reversed(_locks):
+      lock.release()
+
+
+
+
+
+
+def set_backend(backend):
+  """
+  <Purpose>
+    Replaces the storage backend used by this module. Data stored in the
+    previous backend is not copied to the new one.
+
+  <Arguments>
+    backend
+      An instance of a subclass of
+      uptane.services.inventory_backends.InventoryBackend.
+
+  <Exceptions>
+    uptane.Error if backend is not an InventoryBackend.
+
+  <Returns>
+    None
+  """
+  global _backend
+
+  if not isinstance(backend, inventory_backends.InventoryBackend):
+    raise uptane.Error('Expected an InventoryBackend; received ' +
+        repr(backend))
+
+  _backend = backend
+
+
+
+
+
+def get_backend():
+  """Returns the storage backend currently used by this module."""
+  return _backend
+
+
+
+
+
+def dump_snapshot(fname):
+  """
+  <Purpose>
+    Saves the state of the inventory (registrations, public keys, and all
+    stored manifests) to a compact snapshot file, from which load_snapshot()
+    can quickly restore it, e.g. when the Director restarts. Updates are
+    blocked while the snapshot is written. The file format is described in
+    uptane.services.inventory_backends.
+
+  <Arguments>
+    fname
+      Path of the snapshot file. An existing file there is replaced only once
+      the new snapshot is complete.
+
+  <Exceptions>
+    uptane.Error if the current backend does not support snapshots (i.e. it
+    is already persistent, as the SQLite backend is).
+
+  <Returns>
+    None
+  """
+  tuf.formats.PATH_SCHEMA.check_match(fname)
+
+  with _all_locked():
+    try:
+      _backend.dump_snapshot(fname)
+    except NotImplementedError:
+      raise uptane.Error('The current inventory backend, ' + repr(_backend) +
+          ', does not support snapshots.')
+
+
+
+
+
+def load_snapshot(fname, retention_policy=None):
+  """
+  <Purpose>
+    Replaces the storage backend with an in-memory backend holding the state
+    saved in the given snapshot file by dump_snapshot(). Only the snapshot's
+    index (registrations, public keys and installed images) is read now; the
+    file is memory-mapped and each vehicle's and ECU's manifests are decoded
+    when first used. The file must be left in place while the backend is in
+    use.
+
+  <Arguments>
+    fname
+      Path of the snapshot file.
+
+    retention_policy
+      The inventory_backends.RetentionPolicy for the new backend. It is also
+      applied to manifests from the snapshot as they are loaded.
+
+  <Exceptions>
+    uptane.Error if the file is not an inventory snapshot.
+
+  <Returns>
+    None
+  """
+  tuf.formats.PATH_SCHEMA.check_match(fname)
+
+  backend = inventory_backends.MemoryInventoryBackend(
+      retention_policy, snapshot_fname=fname)
+
+  with _all_locked():
+    set_backend(backend)
+
+
+
+
+
+def prune_expired():
+  """
+  <Purpose>
+    Discards stored manifests older than the backend's retention policy
+    allows (see inventory_backends.RetentionPolicy), including those from
+    vehicles and ECUs that have stopped reporting. Each vehicle's and ECU's
+    manifests are pruned while holding its lock, so this can be called
+    periodically while manifests are being saved.
+
+  <Arguments>
+    None
+
+  <Exceptions>
+    None
+
+  <Returns>
+    None
+  """
+  _backend.prune_expired(_locked)
+
+
 
-# Global dictionaries
-vehicle_manifests = {}
-ecu_manifests = {}
-primary_ecus_by_vin = {}
-ecus_by_vin = {}
-ecu_public_keys = {}
 
 
 def get_ecu_public_key(ecu_serial):
@@ -142,11 +319,13 @@ def get_ecu_public_key(ecu_serial):
 
   uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
 
-  if ecu_serial not in ecu_public_keys:
+  public_key = _backend.get_ecu_public_key(ecu_serial)
+
+  if public_key is None:
     raise uptane.UnknownECU('The given ECU Serial, ' + repr(ecu_serial) +
         ' is not known. It must be registered.')
 
-  return ecu_public_keys[ecu_serial]
+  return public_key
 
 
 
@@ -154,7 +333,7 @@ def get_ecu_public_key(ecu_serial):
 
 def get_vehicle_manifests(vin):
   check_vin_registered(vin)
-  return vehicle_manifests[vin]
+  return _backend.get_vehicle_manifests(vin)
 
 
 
@@ -162,10 +341,7 @@ def get_vehicle_manifests(vin):
 
 def get_last_vehicle_manifest(vin):
   check_vin_registered(vin)
-  if not vehicle_manifests[vin]:
-    return None
-  else:
-    return vehicle_manifests[vin][-1]
+  return _backend.get_last_vehicle_manifest(vin)
 
 
 
@@ -173,7 +349,7 @@ def get_last_vehicle_manifest(vin):
 
 def get_ecu_manifests(ecu_serial):
   check_ecu_registered(ecu_serial)
-  return ecu_manifests[ecu_serial]
+  return _backend.get_ecu_manifests(ecu_serial)
 
 
 
@@ -181,10 +357,7 @@ def get_ecu_manifests(ecu_serial):
 
 def get_last_ecu_manifest(ecu_serial):
   check_ecu_registered(ecu_serial)
-  if not ecu_manifests[ecu_serial]:
-    return None
-  else:
-    return ecu_manifests[ecu_serial][-1]
+  return _backend.get_last_ecu_manifest(ecu_serial)
 
 
 
@@ -200,7 +373,9 @@ def save_vehicle_manifest(vin, signed_vehicle_manifest):
   uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
        signed_vehicle_manifest)
 
-  vehicle_manifests[vin].append(signed_vehicle_manifest)
+  with _locked(vin):
+    check_vin_registered(vin) # in case it was re-registered meanwhile
+    _backend.save_vehicle_manifest(vin, signed_vehicle_manifest)
 
 
   # Not doing it this way because the Director is going to pass through a
@@ -222,9 +397,7 @@ def save_vehicle_manifest(vin, signed_vehicle_manifest):
 def get_all_ecu_manifests_from_vehicle(vin):
   """
   Returns a dictionary of lists of manifests, indexed by the ECU Serial of each
-  ECU associated with the given VIN. (This is the same format as the
-  ecu_manifests global, but only includes those ECUs associated with the
-  vehicle.)
+  ECU associated with the given VIN.
 
   e.g.
     {'ecuserial1': [<ecumanifest>, <ecumanifest>],
@@ -233,22 +406,44 @@ def get_all_ecu_manifests_from_vehicle(vin):
 
   check_vin_registered(vin) # check arg format and registration
 
-  ecus_in_vehicle = ecus_by_vin[vin]
+  return {serial: _backend.get_ecu_manifests(serial)
+      for serial in _backend.get_ecu_serials_in_vehicle(vin)}
 
-  return {serial: ecu_manifests[serial] for serial in ecus_in_vehicle}
 
 
 
 
+def save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest, public_key=None):
+  """
+  Saves the given ECU Manifest from the ECU with the given ECU Serial.
 
-def save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest):
+  If public_key is given (the key the ECU Manifest's signature was checked
+  against), the ECU Manifest is saved only if that is still the key the ECU is
+  registered with, so that an ECU Manifest validated just before its ECU was
+  registered again with a new key is not saved. Returns True if the ECU
+  Manifest was saved, else False.
+  """
 
   check_ecu_registered(ecu_serial) # check format and registration
 
   uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.check_match(
        signed_ecu_manifest)
 
-  ecu_manifests[ecu_serial].append(signed_ecu_manifest)
+  if public_key is not None:
+    tuf.formats.ANYKEY_SCHEMA.check_match(public_key)
+
+  with _locked(ecu_serial):
+    check_ecu_registered(ecu_serial) # in case it was re-registered meanwhile
+
+    if public_key is not None:
+      registered_key = _backend.get_ecu_public_key(ecu_serial)
+      if registered_key['keytype'] != public_key['keytype'] or \
+          registered_key['keyval']['public'] != public_key['keyval']['public']:
+        return False
+
+    _backend.save_ecu_manifest(vin, ecu_serial, signed_ecu_manifest)
+
+  return True
 
 
 
@@ -260,8 +455,7 @@ def register_ecu(is_primary, vin, ecu_serial, public_key, overwrite=True):
   note of the vehicle with which it is associated, and, if is_primary is True,
   marks it as the Primary ECU for the vehicle.
 
-  Also registers the given VIN if it was not previously known (creating
-  appropriate entries in the global dictionaries).
+  Also registers the given VIN if it was not previously known.
 
   If overwrite is False:
     if it is given an already-known ECU Serial, or if is_primary is True and
@@ -279,8 +473,7 @@ def register_ecu(is_primary, vin, ecu_serial, public_key, overwrite=True):
     along with all its ECU Manifests, and its association with the VIN is not
     removed, but it is no longer marked as the Primary for that VIN.
 
-  Will not add the same ECU Serial to a vehicle's list of ECUs
-  (ecus_by_vin[vin]) twice.
+  Will not add the same ECU Serial to a vehicle's list of ECUs twice.
   """
 
   tuf.formats.BOOLEAN_SCHEMA.check_match(is_primary)
@@ -288,107 +481,161 @@ def register_ecu(is_primary, vin, ecu_serial, public_key, overwrite=True):
   uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
   tuf.formats.ANYKEY_SCHEMA.check_match(public_key)
 
-  assert (ecu_serial in ecu_public_keys) == (ecu_serial in ecu_manifests), \
-      'Programming error: ECU registration is not consistent.'
+  with _locked(vin, ecu_serial):
+    if not overwrite:
+
+      # If we aren't supposed to be overwriting public keys or Primary
+      # associations, make sure we don't.
+
+      if is_primary and _backend.vehicle_is_registered(vin) and \
+          _backend.get_primary_ecu_serial(vin) is not None:
+        raise uptane.Spoofing('The given VIN, ' + repr(vin) + ', is already '
+            'associated with a Primary ECU.')
+
+      if _backend.ecu_is_registered(ecu_serial):
+
+        # Demo website hack.
+        print('The given ECU Serial, ' + repr(ecu_serial) +
+            ', is already associated with a public key.')
+        return
+
+        # raise uptane.Spoofing('The given ECU Serial, ' + repr(ecu_serial) +
+        #     ', is already associated with a public key.')
+
+
+    # Register the VIN if it is unknown.
+    if not _backend.vehicle_is_registered(vin):
+      register_vehicle(vin, overwrite=overwrite)
+
+
+    # Associate the ECU with the vehicle, set it as the vehicle's Primary ECU
+    # if appropriate, save its public key, and prepare to store future
+    # manifests from it.
+    _backend.register_ecu(vin, ecu_serial, public_key, is_primary)
+
+
+
+
+
+def register_vehicle(vin, primary_ecu_serial=None, overwrite=True):
 
-  if not overwrite:
+  uptane.formats.VIN_SCHEMA.check_match(vin)
 
-    # If we aren't supposed to be overwriting public keys or Primary
-    # associations, make sure we don't.
+  with _locked(vin):
 
-    if is_primary and vin in primary_ecus_by_vin and \
-        primary_ecus_by_vin[vin] is not None:
+    if not overwrite and _backend.vehicle_is_registered(vin):
       raise uptane.Spoofing('The given VIN, ' + repr(vin) + ', is already '
-          'associated with a Primary ECU.')
+          'registered.')
 
-    if ecu_serial in ecu_public_keys:
+    _backend.register_vehicle(vin, primary_ecu_serial)
 
-      # Demo website hack.
-      print('The given ECU Serial, ' + repr(ecu_serial) +
-          ', is already associated with a public key.')
-      return
 
-      # raise uptane.Spoofing('The given ECU Serial, ' + repr(ecu_serial) +
-      #     ', is already associated with a public key.')
 
 
-  # Register the VIN if it is unknown.
-  # No VIN should ever be in only one or the other of ecus_by_vin or
-  # vehicle_manifests, or there is a bug.
-  if vin not in ecus_by_vin:
-    register_vehicle(vin, overwrite=overwrite)
 
+def get_registered_vins():
+  """
+  Returns a list of the VINs of all registered vehicles.
+  """
+  return _backend.get_registered_vins()
 
-  # Associate the ECU with the vehicle.
-  if ecu_serial not in ecus_by_vin[vin]:
-    ecus_by_vin[vin].append(ecu_serial)
 
-  if is_primary:
-    # Set the ECU as the vehicle's Primary ECU.
-    primary_ecus_by_vin[vin] = ecu_serial
 
 
-  # Save the ECU's public key.
-  ecu_public_keys[ecu_serial] = public_key
 
+def get_ecu_serials_in_vehicle(vin):
+  """
+  Returns a list of the ECU Serials of all ECUs associated with the vehicle
+  with the given VIN.
 
-  # Create an entry in the ecu_manifests dictionary for future manifests from
-  # the ECU.
-  ecu_manifests[ecu_serial] = []
+  <Exceptions>
+    uptane.UnknownVehicle if the VIN is not registered.
+  """
+  check_vin_registered(vin)
+  return _backend.get_ecu_serials_in_vehicle(vin)
 
 
 
 
 
-def register_vehicle(vin, primary_ecu_serial=None, overwrite=True):
+def get_primary_ecu_serial(vin):
+  """
+  Returns the ECU Serial of the Primary ECU of the vehicle with the given VIN,
+  or None if no Primary has been registered for it.
 
-  _check_registration_is_sane(vin)
+  <Exceptions>
+    uptane.UnknownVehicle if the VIN is not registered.
+  """
+  check_vin_registered(vin)
+  return _backend.get_primary_ecu_serial(vin)
 
-  if not overwrite and vin in ecus_by_vin:
-    raise uptane.Spoofing('The given VIN, ' + repr(vin) + ', is already '
-        'registered.')
 
-  ecus_by_vin[vin] = []
-  vehicle_manifests[vin] = []
-  primary_ecus_by_vin[vin] = primary_ecu_serial
 
 
 
+def get_ecus_with_image(filepath, sha256):
+  """
+  Returns a list of the ECU Serials of the ECUs whose most recent ECU Manifest
+  reports the image with the given filepath and sha256 hash installed. Answered
+  from the backend's installed image index, without scanning manifests.
 
+  <Exceptions>
+    tuf.FormatError if filepath or sha256 is not correctly formatted.
+  """
+  tuf.formats.RELPATH_SCHEMA.check_match(filepath)
+  tuf.formats.HASH_SCHEMA.check_match(sha256)
+  return sorted(_backend.get_ecus_with_image(filepath, sha256))
 
 
-def check_vin_registered(vin):
 
-  _check_registration_is_sane(vin)
 
-  if vin not in vehicle_manifests:
-    # TODO: Should we also log here? Review logging before exceptions
-    # throughout the reference implementation.
-    raise uptane.UnknownVehicle('The given VIN, ' + repr(vin) + ', is not '
-        'known.')
+
+def count_ecus_with_image(filepath, sha256):
+  """
+  Returns the number of ECUs whose most recent ECU Manifest reports the image
+  with the given filepath and sha256 hash installed.
+
+  <Exceptions>
+    tuf.FormatError if filepath or sha256 is not correctly formatted.
+  """
+  tuf.formats.RELPATH_SCHEMA.check_match(filepath)
+  tuf.formats.HASH_SCHEMA.check_match(sha256)
+  return _backend.count_ecus_with_image(filepath, sha256)
 
 
 
 
 
-def _check_registration_is_sane(vin):
+def get_vehicles_with_image(filepath, sha256):
   """
-  Asserts that a data structure invariant remains correct. A vehicle must be
-  in all three of the relevant global dictionaries if it is registered, and in
-  none of them if it is not.
+  Returns a list of the VINs of the vehicles with at least one ECU whose most
+  recent ECU Manifest reports the image with the given filepath and sha256
+  hash installed, e.g. the vehicles an update campaign replacing that image
+  should target.
+
+  <Exceptions>
+    tuf.FormatError if filepath or sha256 is not correctly formatted.
   """
+  tuf.formats.RELPATH_SCHEMA.check_match(filepath)
+  tuf.formats.HASH_SCHEMA.check_match(sha256)
+  return sorted(set(_backend.get_ecus_with_image(filepath, sha256).values()))
+
+
+
+
+
+def check_vin_registered(vin):
 
   uptane.formats.VIN_SCHEMA.check_match(vin)
 
-  # # A VIN may be in either none or all three of these dictionaries, and nowhere
-  # # in between, or there is a bug.
-  # if vin in vehicle_manifests != vin in ecus_by_vin or vin in ecus_by_vin != \
-  #     vin in primary_ecus_by_vin:
-  #   import pdb
-  #   pdb.set_trace()
+  with _locked(vin):
+    is_registered = _backend.vehicle_is_registered(vin)
 
-  assert (vin in vehicle_manifests) == (vin in ecus_by_vin) == (
-      vin in primary_ecus_by_vin), 'Programming error.'
+  if not is_registered:
+    # TODO: Should we also log here? Review logging before exceptions
+    # throughout the reference implementation.
+    raise uptane.UnknownVehicle('The given VIN, ' + repr(vin) + ', is not '
+        'known.')
 
 
 
@@ -396,6 +643,6 @@ def _check_registration_is_sane(vin):
 
 def check_ecu_registered(ecu_serial):
 
-  if ecu_serial not in ecu_public_keys:
+  if not _backend.ecu_is_registered(ecu_serial):
     raise uptane.UnknownECU('The given ECU serial, ' + repr(ecu_serial) +
         ', is not known.')
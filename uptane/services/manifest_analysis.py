@@ -0,0 +1,385 @@
+"""
+<Program Name>
+  manifest_analysis.py
+
+<Purpose>
+  Incremental analysis of the ECU Manifests the Director receives, to notice
+  signs of attacks (e.g. freeze attacks and mix-and-match attacks) as
+  manifests arrive, without rescanning any vehicle's manifest history.
+
+  For each ECU, a ManifestAnalyzer keeps a small, fixed amount of state
+  (EcuAnalysisState): the latest timeserver time the ECU has reported, the
+  image it reported installed and the one before that, when (by the
+  Director's clock) its installed image last changed, and the image the
+  Director most recently assigned it. Each validated ECU Manifest is compared
+  against that state and then folded into it, in constant time.
+
+  The anomalies noted are:
+
+    'attacks_reported'
+      The ECU itself reported having detected attacks.
+
+    'time_regression'
+      The ECU reported a timeserver time earlier than one it reported
+      before: a replayed manifest, or a replayed time attestation.
+
+    'stale_time'
+      The ECU's latest timeserver time is more than MAX_TIME_LAG seconds
+      behind the Director's clock, so the ECU cannot tell whether the
+      metadata it is given is current: a possible freeze attack. Noted once
+      until the ECU reports a current time again.
+
+    'image_reverted'
+      The ECU's installed image changed back to the image it reported before
+      the current one: a possible rollback.
+
+    'unassigned_image'
+      The ECU's installed image changed to an image other than the one the
+      Director assigned it: a possible mix-and-match or arbitrary software
+      attack.
+
+    'update_not_installed'
+      The Director assigned the ECU an image more than UPDATE_DEADLINE
+      seconds ago, and the ECU still reports a different image: a possible
+      freeze attack. Noted once per assignment.
+
+  The most recent anomalies for each vehicle (up to
+  MAX_ANOMALIES_PER_VEHICLE) are kept, and can be retrieved with
+  get_anomalies().
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.formats
+
+import time
+import calendar
+import collections
+import threading
+
+log = uptane.logging.getLogger('manifest_analysis')
+
+
+# A timeserver time older than this (in seconds) is considered stale. Director
+# timestamp metadata expires after a day; an ECU whose clock is further behind
+# than that cannot detect expired metadata.
+MAX_TIME_LAG = 86400 # 1 day
+
+# An ECU still not reporting an image this long (in seconds) after the
+# Director assigned it is considered not to be receiving updates.
+UPDATE_DEADLINE = 604800 # 1 week
+
+MAX_ANOMALIES_PER_VEHICLE = 100
+
+
+
+
+
+class EcuAnalysisState(object):
+  """
+  What the analyzer remembers about one ECU. Times are in seconds since the
+  epoch; those not yet known are None.
+
+  Fields:
+
+    last_timeserver_time
+      The latest timeserver time the ECU has reported.
+
+    image_hash, previous_image_hash
+      A hash of the image the ECU last reported installed, and of the
+      different image it reported installed before that.
+
+    last_change_time
+      When (by the Director's clock) the ECU's installed image last changed.
+
+    assigned_image_hash, assigned_time
+      A hash of the image the Director most recently assigned to the ECU,
+      and when it was assigned.
+
+    stale_reported
+      True if a 'stale_time' anomaly has been noted since the ECU last
+      reported a current time.
+
+    overdue_reported
+      True if an 'update_not_installed' anomaly has already been noted for
+      the current assignment.
+  """
+  __slots__ = ['last_timeserver_time', 'image_hash', 'previous_image_hash',
+      'last_change_time', 'assigned_image_hash', 'assigned_time',
+      'stale_reported', 'overdue_reported']
+
+  def __init__(self):
+    self.last_timeserver_time = None
+    self.image_hash = None
+    self.previous_image_hash = None
+    self.last_change_time = None
+    self.assigned_image_hash = None
+    self.assigned_time = None
+    self.stale_reported = False
+    self.overdue_reported = False
+
+
+
+
+
+class ManifestAnalyzer(object):
+  """
+  <Purpose>
+    Keeps an EcuAnalysisState for each ECU, grouped by vehicle, and the recent
+    anomalies noted for each vehicle. See the module docstring. Safe to use
+    from several threads at once.
+  """
+
+  def __init__(self):
+    # VIN -> {ECU Serial -> EcuAnalysisState}
+    self._states = dict()
+
+    # VIN -> collections.deque of anomalies, oldest first
+    self._anomalies = dict()
+
+    self._lock = threading.Lock()
+
+
+
+
+
+  def analyze_ecu_manifest(self, vin, ecu_serial, signed_ecu_manifest,
+      now=None):
+    """
+    <Purpose>
+      Compares the given (already validated) ECU Manifest with what is known
+      of the ECU, notes any anomalies, and updates the ECU's state. Takes
+      constant time.
+
+    <Arguments>
+      vin, ecu_serial
+        The vehicle and ECU the manifest is from.
+
+      signed_ecu_manifest
+        The ECU Manifest, conforming to
+        uptane.formats.SIGNABLE_ECU_VERSION_MANIFEST_SCHEMA.
+
+      now
+        The current time, in seconds since the epoch. Defaults to the current
+        time.
+
+    <Returns>
+      A list of the anomalies noted in this manifest, each a dictionary with
+      keys 'vin', 'ecu_serial', 'type' (see the module docstring), 'detail'
+      (a human-readable description), and 'time' (now).
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+    uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
+
+    if now is None:
+      now = time.time()
+
+    manifest = signed_ecu_manifest['signed']
+    timeserver_time = _iso8601_to_unix(manifest['timeserver_time'])
+    image_hash = _image_hash(manifest['installed_image']['fileinfo'])
+
+    anomalies = []
+
+    def note(anomaly_type, detail):
+      anomalies.append({'vin': vin, 'ecu_serial': ecu_serial,
+          'type': anomaly_type, 'detail': detail, 'time': now})
+
+    if manifest['attacks_detected']:
+      note('attacks_reported', manifest['attacks_detected'])
+
+    with self._lock:
+      state = self._get_state(vin, ecu_serial)
+
+      if state.last_timeserver_time is not None and \
+          timeserver_time < state.last_timeserver_time:
+        note('time_regression', 'Reported timeserver time ' +
+            manifest['timeserver_time'] + ' is earlier than one previously '
+            'reported.')
+
+      else:
+        state.last_timeserver_time = timeserver_time
+
+      if now - state.last_timeserver_time <= MAX_TIME_LAG:
+        state.stale_reported = False
+
+      elif not state.stale_reported:
+        state.stale_reported = True
+        note('stale_time', 'The latest timeserver time reported is ' +
+            str(int(now - state.last_timeserver_time)) + ' seconds old.')
+
+      if image_hash != state.image_hash:
+        if state.image_hash is not None:
+          if image_hash == state.previous_image_hash:
+            note('image_reverted', 'Installed image ' +
+                repr(manifest['installed_image']['filepath']) + ' is the '
+                'image previously replaced.')
+
+          if state.assigned_image_hash is not None and \
+              image_hash != state.assigned_image_hash:
+            note('unassigned_image', 'Installed image ' +
+                repr(manifest['installed_image']['filepath']) + ' is not '
+                'the image assigned by the Director.')
+
+          state.previous_image_hash = state.image_hash
+
+        state.image_hash = image_hash
+        state.last_change_time = now
+
+      if state.assigned_image_hash is not None and \
+          image_hash != state.assigned_image_hash and \
+          not state.overdue_reported and \
+          now - state.assigned_time > UPDATE_DEADLINE:
+        state.overdue_reported = True
+        note('update_not_installed', 'The image assigned ' +
+            str(int(now - state.assigned_time)) + ' seconds ago has not been '
+            'installed.')
+
+      if anomalies:
+        recent = self._anomalies.setdefault(
+            vin, collections.deque(maxlen=MAX_ANOMALIES_PER_VEHICLE))
+        recent.extend(anomalies)
+
+    return anomalies
+
+
+
+
+
+  def set_assigned_image(self, vin, ecu_serial, fileinfo, now=None):
+    """
+    Notes that the Director has assigned the image with the given fileinfo
+    (tuf.formats.FILEINFO_SCHEMA) to the given ECU.
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+    uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
+
+    if now is None:
+      now = time.time()
+
+    image_hash = _image_hash(fileinfo)
+
+    with self._lock:
+      state = self._get_state(vin, ecu_serial)
+      if image_hash != state.assigned_image_hash:
+        state.assigned_image_hash = image_hash
+        state.assigned_time = now
+        state.overdue_reported = False
+
+
+
+
+
+  def clear_assigned_images(self, vin):
+    """
+    Notes that the Director no longer assigns any images to the given
+    vehicle's ECUs.
+    """
+    with self._lock:
+      for state in self._states.get(vin, {}).values():
+        state.assigned_image_hash = None
+        state.assigned_time = None
+        state.overdue_reported = False
+
+
+
+
+
+  def get_anomalies(self, vin):
+    """
+    Returns a list of the most recent anomalies noted for the given vehicle
+    (see analyze_ecu_manifest), oldest first.
+    """
+    with self._lock:
+      return list(self._anomalies.get(vin, []))
+
+
+
+
+
+  def get_ecu_state(self, vin, ecu_serial):
+    """
+    Returns the EcuAnalysisState for the given ECU, or None if nothing is
+    known about it. The object returned must not be modified.
+    """
+    with self._lock:
+      return self._states.get(vin, {}).get(ecu_serial)
+
+
+
+
+
+  def forget_vehicle(self, vin):
+    """
+    Discards all state and anomalies for the given vehicle.
+    """
+    with self._lock:
+      self._states.pop(vin, None)
+      self._anomalies.pop(vin, None)
+
+
+
+
+
+  def forget_ecu(self, vin, ecu_serial):
+    """
+    Discards the state of the given ECU in the given vehicle, and the
+    anomalies noted for it.
+    """
+    with self._lock:
+      ecu_states = self._states.get(vin)
+      if ecu_states is not None:
+        ecu_states.pop(ecu_serial, None)
+        if not ecu_states:
+          del self._states[vin]
+
+      recent = self._anomalies.get(vin)
+      if recent is not None:
+        kept = [anomaly for anomaly in recent
+            if anomaly['ecu_serial'] != ecu_serial]
+        if kept:
+          self._anomalies[vin] = collections.deque(
+              kept, maxlen=MAX_ANOMALIES_PER_VEHICLE)
+        else:
+          del self._anomalies[vin]
+
+
+
+
+
+  def _get_state(self, vin, ecu_serial):
+    """
+    Returns the state for the given ECU, creating it if necessary. _lock must
+    be held.
+    """
+    ecu_states = self._states.setdefault(vin, dict())
+    state = ecu_states.get(ecu_serial)
+    if state is None:
+      state = ecu_states[ecu_serial] = EcuAnalysisState()
+    return state
+
+
+
+
+
+def _iso8601_to_unix(datetime_string):
+  """
+  Converts an ISO8601 time as found in ECU Manifests (e.g.
+  '2017-01-01T12:00:00Z') to seconds since the epoch.
+  """
+  return calendar.timegm(time.strptime(datetime_string, '%Y-%m-%dT%H:%M:%SZ'))
+
+
+
+
+
+def _image_hash(fileinfo):
+  """
+  Returns a single hash identifying the image with the given fileinfo: its
+  sha256 hash if listed, otherwise the first listed by algorithm name.
+  """
+  hashes = fileinfo['hashes']
+  if 'sha256' in hashes:
+    return hashes['sha256']
+  return hashes[min(hashes)]
@@ -0,0 +1,324 @@
+"""
+<Program Name>
+  manifest_ingestion.py
+
+<Purpose>
+  A pipeline for accepting Vehicle Manifests faster than they can be
+  validated. Rather than validating each Vehicle Manifest while the
+  submitting Primary waits (which, in a single-threaded RPC server, also
+  makes every other vehicle wait), the service calls
+  ManifestIngestionQueue.submit(), which does only cheap checks and places
+  the manifest in a bounded queue. Worker threads drain the queue into
+  Director.register_vehicle_manifest (or, if the Director has a
+  verification_pool, into Director.register_vehicle_manifests_batch, a batch
+  at a time).
+
+  If the queue is full, submit() returns BUSY instead of waiting, so that
+  the Primary can resubmit later, and the Director's memory use stays bounded
+  under load.
+
+  Since manifests are validated after submit() returns, a manifest that
+  fails validation is not reported to the Primary; it is logged and counted
+  (see get_stats()), as an invalid ECU Manifest inside a Vehicle Manifest
+  already is.
+
+  Usage:
+
+    ingestion_queue = ManifestIngestionQueue(director_instance)
+    ingestion_queue.start()
+    result = ingestion_queue.submit(vin, primary_ecu_serial, manifest)
+    if result == BUSY:
+      ...
+    ingestion_queue.stop()
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.formats
+import uptane.services.inventorydb as inventory
+import tuf
+import tuf.conf
+import tuf.formats
+
+import time
+import threading
+
+from six.moves import queue
+
+log = uptane.logging.getLogger('manifest_ingestion')
+
+
+# Results of submit().
+ACCEPTED = uptane.MANIFEST_ACCEPTED
+BUSY = uptane.MANIFEST_BUSY
+
+DEFAULT_MAX_QUEUE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 50
+
+
+
+
+
+class ManifestIngestionQueue(object):
+  """
+  <Purpose>
+    A bounded queue of submitted Vehicle Manifests, and the worker threads
+    that register them with a Director. See the module docstring.
+
+  <Fields>
+
+    director
+      The uptane.services.director.Director the manifests are registered
+      with.
+
+    max_queue_size
+      The most manifests that can be waiting at once. Submissions beyond
+      this are refused with BUSY.
+
+    workers
+      The number of worker threads.
+
+    batch_size
+      The most manifests a worker takes from the queue at once. These are
+      passed together to Director.register_vehicle_manifests_batch if the
+      Director has a verification_pool, and otherwise registered one by one.
+  """
+
+  def __init__(self, director, max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+      workers=1, batch_size=DEFAULT_BATCH_SIZE):
+
+    for value in (max_queue_size, workers, batch_size):
+      tuf.formats.LENGTH_SCHEMA.check_match(value)
+      if value < 1:
+        raise tuf.FormatError('max_queue_size, workers, and batch_size must '
+            'each be at least 1.')
+
+    self.director = director
+    self.max_queue_size = max_queue_size
+    self.workers = workers
+    self.batch_size = batch_size
+
+    self._queue = queue.Queue(max_queue_size)
+    self._threads = []
+
+    # Counters reported by get_stats(), guarded by _stats_lock.
+    self._stats_lock = threading.Lock()
+    self._accepted = 0
+    self._rejected_busy = 0
+    self._registered = 0
+    self._failed = 0
+    self._peak_depth = 0
+    self._total_wait = 0.0
+
+
+
+
+
+  def start(self):
+    """
+    Starts the worker threads, if they are not already running.
+    """
+    if self._threads:
+      return
+
+    for i in range(self.workers):
+      thread = threading.Thread(target=self._work)
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+
+
+
+
+  def stop(self):
+    """
+    Stops the worker threads once they have registered every manifest
+    already queued.
+    """
+    for thread in self._threads:
+      self._queue.put(None)
+    for thread in self._threads:
+      thread.join()
+    self._threads = []
+
+
+
+
+
+  def join(self):
+    """
+    Blocks until every manifest queued so far has been processed.
+    """
+    self._queue.join()
+
+
+
+
+
+  def submit(self, vin, primary_ecu_serial, signed_vehicle_manifest):
+    """
+    <Purpose>
+      Queues a Vehicle Manifest to be registered, taking the same arguments
+      as Director.register_vehicle_manifest. Only checks that are cheap
+      (formats, and that the vehicle is known) are done before this returns;
+      signatures are checked later, by a worker thread.
+
+    <Exceptions>
+      tuf.FormatError, if the arguments are not correctly formatted.
+
+      uptane.UnknownVehicle, if the VIN is not known to the Director.
+
+    <Returns>
+      ACCEPTED if the manifest was queued, or BUSY if the queue is full and
+      the manifest should be submitted again later.
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+    uptane.formats.ECU_SERIAL_SCHEMA.check_match(primary_ecu_serial)
+
+    if tuf.conf.METADATA_FORMAT == 'der':
+      uptane.formats.DER_DATA_SCHEMA.check_match(signed_vehicle_manifest)
+    else:
+      uptane.formats.SIGNABLE_VEHICLE_VERSION_MANIFEST_SCHEMA.check_match(
+          signed_vehicle_manifest)
+
+    try:
+      inventory.check_vin_registered(vin)
+    except uptane.UnknownVehicle:
+      raise uptane.UnknownVehicle('Received a vehicle manifest purportedly '
+          'from a vehicle with a VIN that is not known to this Director.')
+
+    try:
+      self._queue.put_nowait((vin, primary_ecu_serial, signed_vehicle_manifest,
+          time.time()))
+
+    except queue.Full:
+      with self._stats_lock:
+        self._rejected_busy += 1
+      log.debug('Ingestion queue full; refused Vehicle Manifest from vehicle ' +
+          repr(vin))
+      return BUSY
+
+    with self._stats_lock:
+      self._accepted += 1
+      # qsize() is approximate, which is fine for a statistic.
+      self._peak_depth = max(self._peak_depth, self._queue.qsize())
+
+    return ACCEPTED
+
+
+
+
+
+  def get_stats(self):
+    """
+    <Purpose>
+      Returns a dictionary of statistics about the queue, for monitoring:
+
+        'queue_depth': the number of manifests currently waiting
+        'max_queue_size': as given to the constructor
+        'peak_queue_depth': the most manifests seen waiting at once
+        'accepted': the number of submissions queued
+        'rejected_busy': the number of submissions refused with BUSY
+        'registered': the number of manifests registered successfully
+        'failed': the number of manifests that failed validation
+        'mean_wait': the mean time, in seconds, between the submission of a
+            manifest and the start of its processing
+    """
+    with self._stats_lock:
+      processed = self._registered + self._failed
+      return {
+          'queue_depth': self._queue.qsize(),
+          'max_queue_size': self.max_queue_size,
+          'peak_queue_depth': self._peak_depth,
+          'accepted': self._accepted,
+          'rejected_busy': self._rejected_busy,
+          'registered': self._registered,
+          'failed': self._failed,
+          'mean_wait': self._total_wait / processed if processed else 0.0}
+
+
+
+
+
+  def _work(self):
+    while True:
+      batch = [self._queue.get()]
+
+      while len(batch) < self.batch_size and batch[-1] is not None:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+
+      stopping = batch[-1] is None
+      if stopping:
+        batch.pop()
+
+      started = time.time()
+
+      try:
+        if batch:
+          self._register(batch, started)
+
+      except Exception as e:
+        # Keep the worker running whatever happens to one batch.
+        log.error('Failed to process ' + str(len(batch)) + ' queued Vehicle '
+            'Manifests: ' + type(e).__name__ + ': ' + str(e))
+        with self._stats_lock:
+          self._failed += len(batch)
+          self._total_wait += sum(started - item[3] for item in batch)
+
+      finally:
+        for i in range(len(batch) + stopping):
+          self._queue.task_done()
+
+      if stopping:
+        return
+
+
+
+
+
+  def _register(self, batch, started):
+    """
+    Registers the given (vin, primary_ecu_serial, manifest, time queued)
+    tuples, taken from the queue at time started, with the Director, logging
+    and counting any failures.
+    """
+    vehicle_manifests = [item[:3] for item in batch]
+
+    if self.director.verification_pool is not None:
+      errors = self.director.register_vehicle_manifests_batch(
+          vehicle_manifests)
+
+    else:
+      errors = []
+      for vin, primary_ecu_serial, signed_vehicle_manifest in \
+          vehicle_manifests:
+        # Whatever goes wrong with one manifest (e.g. a decoding error from a
+        # malformed DER blob) affects only that manifest, as when a batch is
+        # validated by the Director's pool.
+        try:
+          self.director.register_vehicle_manifest(
+              vin, primary_ecu_serial, signed_vehicle_manifest)
+        except Exception as e:
+          errors.append(e)
+        else:
+          errors.append(None)
+
+    for (vin, primary_ecu_serial, unused), error in zip(
+        vehicle_manifests, errors):
+      if error is not None:
+        log.warning('Discarded the queued Vehicle Manifest from vehicle ' +
+            repr(vin) + ', Primary ' + repr(primary_ecu_serial) + ': ' +
+            type(error).__name__ + ': ' + str(error))
+
+    failed = len([error for error in errors if error is not None])
+
+    with self._stats_lock:
+      self._failed += failed
+      self._registered += len(batch) - failed
+      self._total_wait += sum(started - item[3] for item in batch)
@@ -0,0 +1,469 @@
+"""
+<Program Name>
+  signing.py
+
+<Purpose>
+  Signing services for the Director's metadata. The Director does not call
+  tuf.keys.create_signature itself; it asks a signer for a signature by a
+  given key (identified by keyid) over given data, so that where and how
+  signatures are made can be chosen when the Director is set up:
+
+    LocalSigner
+      Signs on the calling thread, in the calling process. This is the
+      default, and matches the Director's original behavior.
+
+    ProcessPoolSigner
+      Signs in a pool of worker processes, so that signing throughput scales
+      with the number of cores. Requests made concurrently (e.g. by threads
+      publishing metadata for different vehicles) are collected into batches
+      and each batch is spread over the pool.
+
+    RemoteSigner
+      Sends batches of requests over XML-RPC to a SigningServer running in a
+      separate process (or on a separate host), which holds the private keys.
+      The process that uses a RemoteSigner (e.g. the Director's XML-RPC
+      service) never holds the private keys at all.
+
+  The data to be signed is either a dictionary (the 'signed' portion of JSON
+  metadata, which is canonicalized before signing) or bytes (e.g. the hash of
+  the DER encoding of metadata), matching how the metadata is signed when a
+  key is used directly.
+
+  Usage:
+
+    signer = ProcessPoolSigner([key_timestamp_pri, key_snapshot_pri])
+    signature = signer.sign(key_timestamp_pri['keyid'], signable['signed'])
+    signable['signatures'].append(signature)
+    ...
+    signer.close()
+
+    # In a separate process:
+    SigningServer([key_timestamp_pri, key_snapshot_pri]).listen(
+        'localhost', 30901)
+    # In the Director's process:
+    signer = RemoteSigner('http://localhost:30901')
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import tuf
+import tuf.formats
+import tuf.keys
+
+import threading
+import multiprocessing
+
+from six.moves import queue
+from six.moves import xmlrpc_client
+from six.moves import xmlrpc_server
+
+log = uptane.logging.getLogger('signing')
+
+# The maximum number of requests sent to the worker processes or signing
+# server at once.
+DEFAULT_MAX_BATCH_SIZE = 256
+
+
+
+
+
+class Signer(object):
+  """
+  <Purpose>
+    The interface provided by all signers. Subclasses implement sign_batch()
+    and, if they hold private keys themselves, add_key().
+  """
+
+  def sign(self, keyid, data):
+    """
+    <Purpose>
+      Returns a signature (tuf.formats.SIGNATURE_SCHEMA) by the key with the
+      given keyid over the given data.
+
+    <Arguments>
+      keyid
+        The keyid of the key to sign with (tuf.formats.KEYID_SCHEMA).
+
+      data
+        Either a dictionary to be canonicalized and signed, or bytes.
+
+    <Exceptions>
+      uptane.Error, if the signer does not have the key.
+    """
+    return self.sign_batch([(keyid, data)])[0]
+
+
+
+
+
+  def sign_batch(self, requests):
+    """
+    Given a list of 2-tuples (keyid, data), each as would be given to sign(),
+    returns a list of the corresponding signatures, in the same order.
+    """
+    raise NotImplementedError
+
+
+
+
+
+  def add_key(self, key):
+    """
+    Makes the given private key (tuf.formats.ANYKEY_SCHEMA, including its
+    private value) available for signing.
+    """
+    raise uptane.Error('This signer does not accept keys: its keys are '
+        'managed elsewhere.')
+
+
+
+
+
+  def close(self):
+    """
+    Releases any resources (e.g. processes or threads) held by the signer.
+    """
+    pass
+
+
+
+
+
+class LocalSigner(Signer):
+  """
+  <Purpose>
+    Signs on the calling thread. See the module docstring.
+  """
+
+  def __init__(self, keys=[]):
+    self._keys = dict()
+    for key in keys:
+      self.add_key(key)
+
+
+
+
+
+  def add_key(self, key):
+    _check_private_key(key)
+    self._keys[key['keyid']] = key
+
+
+
+
+
+  def sign_batch(self, requests):
+    return [_create_signature(_get_key(self._keys, keyid), data)
+        for keyid, data in requests]
+
+
+
+
+
+class _SignRequest(object):
+  """
+  A request passed to a _BatchingSigner's dispatcher thread, and on which the
+  requesting thread waits.
+  """
+  __slots__ = ['keyid', 'data', 'signature', 'error', 'done']
+
+  def __init__(self, keyid, data):
+    self.keyid = keyid
+    self.data = data
+    self.signature = None
+    self.error = None
+    self.done = threading.Event()
+
+
+
+
+
+class _BatchingSigner(Signer):
+  """
+  <Purpose>
+    Collects the requests made by all threads into batches of up to
+    max_batch_size, which a dispatcher thread passes to _sign_requests(). While
+    one batch is being signed, further requests queue up for the next.
+  """
+
+  def __init__(self, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    tuf.formats.LENGTH_SCHEMA.check_match(max_batch_size)
+    if max_batch_size < 1:
+      raise tuf.FormatError('max_batch_size must be at least 1.')
+
+    self.max_batch_size = max_batch_size
+
+    self._queue = queue.Queue()
+    self._dispatcher = threading.Thread(target=self._dispatch)
+    self._dispatcher.daemon = True
+    self._dispatcher.start()
+
+
+
+
+
+  def sign_batch(self, requests):
+    sign_requests = [_SignRequest(keyid, data) for keyid, data in requests]
+
+    for sign_request in sign_requests:
+      self._queue.put(sign_request)
+
+    signatures = []
+    for sign_request in sign_requests:
+      sign_request.done.wait()
+      if sign_request.error is not None:
+        raise sign_request.error
+      signatures.append(sign_request.signature)
+
+    return signatures
+
+
+
+
+
+  def close(self):
+    if self._dispatcher is not None:
+      self._queue.put(None)
+      self._dispatcher.join()
+      self._dispatcher = None
+
+
+
+
+
+  def _dispatch(self):
+    while True:
+      batch = [self._queue.get()]
+
+      while len(batch) < self.max_batch_size and batch[-1] is not None:
+        try:
+          batch.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+
+      stopping = batch[-1] is None
+      if stopping:
+        batch.pop()
+
+      if batch:
+        try:
+          signatures = self._sign_requests(
+              [(request.keyid, request.data) for request in batch])
+
+        except Exception as e:
+          # Let the requesting threads raise it.
+          for request in batch:
+            request.error = e
+            request.done.set()
+
+        else:
+          for request, signature in zip(batch, signatures):
+            request.signature = signature
+            request.done.set()
+
+      if stopping:
+        return
+
+
+
+
+
+  def _sign_requests(self, requests):
+    raise NotImplementedError
+
+
+
+
+
+class ProcessPoolSigner(_BatchingSigner):
+  """
+  <Purpose>
+    Signs in a pool of worker processes. See the module docstring.
+
+    As with any multiprocessing.Pool, create it while the process has as few
+    other threads running as possible (e.g. before starting an XML-RPC
+    server).
+  """
+
+  def __init__(self, keys=[], processes=None,
+      max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+
+    self._keys = dict()
+    for key in keys:
+      self.add_key(key)
+
+    self.processes = processes or multiprocessing.cpu_count()
+    self._pool = multiprocessing.Pool(self.processes)
+
+    _BatchingSigner.__init__(self, max_batch_size)
+
+
+
+
+
+  def add_key(self, key):
+    _check_private_key(key)
+    self._keys[key['keyid']] = key
+
+
+
+
+
+  def close(self):
+    _BatchingSigner.close(self)
+    if self._pool is not None:
+      self._pool.close()
+      self._pool.join()
+      self._pool = None
+
+
+
+
+
+  def _sign_requests(self, requests):
+    # Keys are sent along with each request rather than given to the workers
+    # when they start, so that keys added later are available to them too.
+    work = [(_get_key(self._keys, keyid), data) for keyid, data in requests]
+
+    chunksize = max(1, len(work) // (4 * self.processes))
+    return self._pool.map(_create_signature_star, work, chunksize)
+
+
+
+
+
+class RemoteSigner(_BatchingSigner):
+  """
+  <Purpose>
+    Has a SigningServer, at the given URL, sign. See the module docstring.
+  """
+
+  def __init__(self, url, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+    self.url = url
+    # Only used by the dispatcher thread.
+    self._server = xmlrpc_client.ServerProxy(url)
+
+    _BatchingSigner.__init__(self, max_batch_size)
+
+
+
+
+
+  def _sign_requests(self, requests):
+    encoded_requests = []
+    for keyid, data in requests:
+      if isinstance(data, bytes):
+        data = xmlrpc_client.Binary(data)
+      encoded_requests.append([keyid, data])
+
+    try:
+      return self._server.sign_batch(encoded_requests)
+
+    except xmlrpc_client.Fault as e:
+      raise uptane.Error('Signing server at ' + repr(self.url) + ' was unable '
+          'to sign: ' + e.faultString)
+
+
+
+
+
+class SigningServer(object):
+  """
+  <Purpose>
+    Holds private keys and signs on behalf of RemoteSigners, over XML-RPC.
+    Intended to run in its own process. See the module docstring.
+  """
+
+  def __init__(self, keys):
+    self._signer = LocalSigner(keys)
+
+
+
+
+
+  def sign_batch(self, requests):
+    """
+    The XML-RPC method called by RemoteSigner: given a list of [keyid, data]
+    pairs, data being a dictionary or xmlrpc Binary, returns a list of
+    signatures.
+    """
+    decoded_requests = []
+    for keyid, data in requests:
+      if isinstance(data, xmlrpc_client.Binary):
+        data = data.data
+      decoded_requests.append((keyid, data))
+
+    return self._signer.sign_batch(decoded_requests)
+
+
+
+
+
+  def get_keyids(self):
+    """
+    The XML-RPC method returning the keyids of the keys this server holds.
+    """
+    return sorted(self._signer._keys)
+
+
+
+
+
+  def listen(self, host, port):
+    """
+    Serves sign_batch() and get_keyids() over XML-RPC at the given address,
+    until the process is interrupted.
+    """
+    server = xmlrpc_server.SimpleXMLRPCServer(
+        (host, port), logRequests=False, allow_none=True)
+    server.register_function(self.sign_batch, 'sign_batch')
+    server.register_function(self.get_keyids, 'get_keyids')
+
+    log.info('Signing server listening on ' + repr(host) + ':' + str(port))
+    server.serve_forever()
+
+
+
+
+
+def _check_private_key(key):
+  tuf.formats.ANYKEY_SCHEMA.check_match(key)
+  if 'private' not in key['keyval'] or not key['keyval']['private']:
+    raise tuf.FormatError('Key ' + repr(key['keyid']) + ' lacks a private key '
+        'value, and so cannot be used for signing.')
+
+
+
+
+
+def _get_key(keys, keyid):
+  try:
+    return keys[keyid]
+  except KeyError:
+    raise uptane.Error('No private key with keyid ' + repr(keyid) +
+        ' is available for signing.')
+
+
+
+
+
+def _create_signature(key, data):
+  """
+  Signs data (a dictionary to be canonicalized, or bytes) with key, as the
+  Director does when signing with a key directly.
+  """
+  if isinstance(data, bytes):
+    return tuf.keys.create_signature(
+        key, data, force_non_json=True, is_binary_data=True)
+
+  return tuf.keys.create_signature(key, data, force_treat_as_pydict=True)
+
+
+
+
+
+def _create_signature_star(key_and_data):
+  # For multiprocessing.Pool.map, which passes a single argument.
+  return _create_signature(*key_and_data)
@@ -0,0 +1,1654 @@
+"""
+<Program Name>
+  vehicle_metadata.py
+
+<Purpose>
+  Generates the Director's per-vehicle TUF metadata (root, targets, snapshot,
+  and timestamp) without a tuf.repository_tool.Repository object per vehicle.
+
+  Every vehicle's Director repository uses the same four role keys and so the
+  same root metadata. The only thing that differs from one vehicle to the next
+  is which target images are assigned to which of its ECUs. This module
+  therefore keeps:
+
+    - one shared set of role keys and one signed root metadata file, and
+
+    - for each vehicle, a small VehicleMetadataRecord holding that vehicle's
+      target assignments and role versions.
+
+  Signed targets, snapshot, and timestamp metadata are produced from those
+  records only when a vehicle's metadata is written.
+
+  The signed root metadata and its version are saved in director_repos_dir
+  (see ROOT_RECORD_FNAME), and reused when the generator is next created with
+  the same role keys, so that restarting the Director does not produce new
+  root metadata, nor oblige every vehicle's metadata to be published in full
+  again. New root metadata is given the version following the saved one.
+
+  Target fileinfo (length and hashes) is shared between records, so assigning
+  the same image to many vehicles stores its fileinfo only once, and is
+  obtained through a fileinfo_cache.FileinfoCache, so an unchanged image
+  (e.g. one hard-linked into many vehicles' targets directories) is not read
+  and hashed again each time it is assigned.
+
+  Each record is also saved in its vehicle's repository directory (see
+  RECORD_FNAME). Records are loaded from there when first needed rather than
+  at startup, and if max_resident_vehicles is given, only that many records
+  are kept in memory: when another is needed, the least recently used one is
+  dropped, first being saved if it has changed.
+
+  Publishing:
+
+  The generator keeps track of which vehicles' metadata has changed since it
+  was last published, and publish() writes only those. Each vehicle's live
+  metadata directory, <director_repos_dir>/<vin>/metadata, is a symlink to a
+  versioned directory, metadata.<timestamp version>. New metadata is written
+  to a new versioned directory and the symlink is then atomically replaced,
+  so there is no moment at which the live metadata is missing or incomplete.
+  The previously published directory is kept for clients that are part way
+  through an update; older ones are removed.
+
+  Refreshing:
+
+  Published timestamp metadata expires after a day (TIMESTAMP_EXPIRATION),
+  and must be re-signed before then even if nothing else has changed. Rather
+  than republishing the whole fleet periodically, the generator keeps a
+  priority queue of published vehicles ordered by when their timestamp
+  metadata should be refreshed, shortly before it expires.
+  refresh_due_metadata() refreshes those that are due: only timestamp
+  metadata is re-signed, plus snapshot metadata if it would otherwise expire
+  first, and the other published files are hard-linked into the new
+  versioned directory. A MetadataRefresher runs this in a background thread,
+  in batches, so that the work is spread over time. Since each vehicle is
+  refreshed about a day after it was last published or refreshed, with some
+  randomness, the load tends to even out over the day.
+
+  Thread safety:
+
+  A VehicleMetadataGenerator may be used from many threads at once, e.g. to
+  provision many new vehicles concurrently. Only absolute paths are used; the
+  process's working directory is never changed. Each VIN maps to one of a
+  fixed number of locks (_LOCK_STRIPES), held while that vehicle's record is
+  read or modified, so that work on different vehicles proceeds in parallel.
+  A record in use is never evicted from memory. A separate lock briefly
+  guards the structures shared by all vehicles.
+
+  Usage:
+
+    generator = VehicleMetadataGenerator(
+        director_repos_dir, key_root_pri, key_root_pub, key_timestamp_pri,
+        key_timestamp_pub, key_snapshot_pri, key_snapshot_pub,
+        key_targets_pri, key_targets_pub)
+    generator.add_vehicle('111')
+    generator.add_target('111', 'ecu11111',
+        os.path.join(generator.get_vehicle_directory('111'), 'targets',
+        'firmware.img'))
+    # Write <director_repos_dir>/111/metadata.staged/*
+    generator.write_metadata('111')
+    # Or: write and publish every changed vehicle's metadata to
+    # <director_repos_dir>/<vin>/metadata
+    generator.publish()
+    # Keep published metadata from expiring.
+    refresher = MetadataRefresher(generator)
+    refresher.start()
+
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import uptane
+import uptane.formats
+import uptane.common
+import uptane.services.fileinfo_cache as fileinfo_cache
+import uptane.services.signing as signing
+import tuf
+import tuf.conf
+import tuf.formats
+import tuf.keys
+
+import os
+import shutil
+import json
+import time
+import hashlib
+import heapq
+import multiprocessing.pool
+import random
+import collections
+import itertools
+import contextlib
+import threading
+
+log = uptane.logging.getLogger('vehicle_metadata')
+
+
+# Default expiration periods, in seconds, matching those of
+# tuf.repository_tool.
+ROOT_EXPIRATION = 31556900 # about 1 year
+TARGETS_EXPIRATION = 7889230 # about 3 months
+SNAPSHOT_EXPIRATION = 604800 # 1 week
+TIMESTAMP_EXPIRATION = 86400 # 1 day
+
+# By default, a vehicle's published timestamp metadata is refreshed (see
+# VehicleMetadataGenerator.refresh_due_metadata) between
+# TIMESTAMP_REFRESH_MARGIN and TIMESTAMP_REFRESH_MARGIN +
+# TIMESTAMP_REFRESH_SPREAD seconds before it expires, the exact time being
+# chosen at random so that vehicles whose metadata was published together
+# are not all refreshed together.
+TIMESTAMP_REFRESH_MARGIN = 3600 # 1 hour
+TIMESTAMP_REFRESH_SPREAD = 7200 # 2 hours
+
+# How long to wait before trying again to refresh a vehicle's metadata after
+# failing to.
+REFRESH_RETRY_DELAY = 300 # 5 minutes
+
+TOP_LEVEL_ROLES = ['root', 'targets', 'snapshot', 'timestamp']
+
+STAGED_METADATA_DIRNAME = 'metadata.staged'
+LIVE_METADATA_DIRNAME = 'metadata'
+
+# The name of the file in each vehicle's repository directory in which its
+# VehicleMetadataRecord is saved.
+RECORD_FNAME = 'vehicle_record.json'
+
+# The name (without extension) of the file in each vehicle's repository
+# directory holding its most recently signed targets metadata, which is copied
+# into each metadata directory written until the targets change.
+SIGNED_TARGETS_BASENAME = 'signed_targets'
+
+# The name of the file in director_repos_dir noting the version, role keys,
+# and expiration of the current root metadata, which is saved in
+# director_repos_dir as SIGNED_ROOT_BASENAME.<version>.<format>.
+ROOT_RECORD_FNAME = 'root_record.json'
+SIGNED_ROOT_BASENAME = 'signed_root'
+
+# Operations on a vehicle's record hold
+# _vehicle_locks[hash(vin) % _LOCK_STRIPES].
+_LOCK_STRIPES = 256
+
+
+
+
+
+class VehicleMetadataRecord(object):
+  """
+  The Director metadata state of a single vehicle.
+
+  Fields:
+
+    targets
+      A dictionary mapping the path of each target (relative to the vehicle's
+      targets directory) to the fileinfo (tuf.formats.FILEINFO_SCHEMA, without
+      'custom') of the image and the ECU Serial of the ECU it is assigned to,
+      as a 2-tuple (fileinfo, ecu_serial).
+
+    targets_version, snapshot_version, timestamp_version
+      The version numbers of the most recently generated metadata for each
+      role, or 0 if it has not been generated yet.
+
+    targets_modified
+      True if the target assignments have changed since targets metadata was
+      last generated.
+
+    root_version
+      The version of the root metadata in effect when targets metadata was
+      last generated. If the root metadata has changed since (i.e. keys were
+      replaced), targets metadata must be generated again.
+
+    targets_expires
+      The expiration time (seconds since the epoch) of the most recently
+      generated targets metadata.
+
+    live
+      None if the vehicle's metadata has never been published. Otherwise, a
+      dictionary describing the published metadata: the versions of the root,
+      targets, and snapshot metadata it contains ('root_version',
+      'targets_version', 'snapshot_version') and the expiration times of its
+      targets, snapshot, and timestamp metadata ('targets_expires',
+      'snapshot_expires', 'timestamp_expires').
+
+    unsaved
+      True if the record has changed since it was last saved to disk.
+  """
+  __slots__ = ['targets', 'targets_version', 'snapshot_version',
+      'timestamp_version', 'targets_modified', 'root_version',
+      'targets_expires', 'live', 'unsaved']
+
+  def __init__(self):
+    self.targets = {}
+    self.targets_version = 0
+    self.snapshot_version = 0
+    self.timestamp_version = 0
+    self.targets_modified = True
+    self.root_version = 0
+    self.targets_expires = 0
+    self.live = None
+    self.unsaved = True
+
+
+
+
+
+class VehicleMetadataGenerator(object):
+  """
+  <Purpose>
+    Holds the Director's role keys, the shared root metadata, and a
+    VehicleMetadataRecord for each vehicle, and produces signed metadata for
+    individual vehicles on demand. See the module docstring.
+
+  <Fields>
+
+    director_repos_dir
+      The absolute path of the directory in which each vehicle's repository
+      directory (named by VIN) resides.
+
+    vehicles
+      A collections.OrderedDict of the VehicleMetadataRecord objects currently
+      in memory, indexed by VIN, from least to most recently used. Records
+      for other vehicles are loaded from disk as needed.
+
+    max_resident_vehicles
+      The maximum number of records kept in vehicles, or None for no limit.
+
+    root_version
+      The version of the current (shared) root metadata. Saved root metadata
+      is reused, and versions continue from it; see the module docstring.
+
+    fileinfo_cache
+      The fileinfo_cache.FileinfoCache from which the length and hashes of
+      target images are obtained, so that an unchanged image is hashed only
+      once however many times it is assigned.
+
+    signer
+      The signing.Signer with which all metadata is signed. By default, a
+      signing.LocalSigner holding the given private keys. If another signer
+      is given (e.g. a signing.RemoteSigner), the private key arguments may
+      be public keys, the signer holding the private keys.
+
+    timestamp_refresh_margin, timestamp_refresh_spread
+      A published vehicle's timestamp metadata is scheduled to be refreshed
+      between timestamp_refresh_margin and timestamp_refresh_margin +
+      timestamp_refresh_spread seconds before it expires. Default to
+      TIMESTAMP_REFRESH_MARGIN and TIMESTAMP_REFRESH_SPREAD.
+  """
+
+  def __init__(self,
+    director_repos_dir,
+    key_root_pri,
+    key_root_pub,
+    key_timestamp_pri,
+    key_timestamp_pub,
+    key_snapshot_pri,
+    key_snapshot_pub,
+    key_targets_pri,
+    key_targets_pub,
+    max_resident_vehicles=None,
+    target_fileinfo_cache=None,
+    signer=None):
+
+    tuf.formats.PATH_SCHEMA.check_match(director_repos_dir)
+    if max_resident_vehicles is not None:
+      tuf.formats.LENGTH_SCHEMA.check_match(max_resident_vehicles)
+      if max_resident_vehicles < 1:
+        raise tuf.FormatError('max_resident_vehicles must be at least 1.')
+
+    for key in [
+        key_root_pri, key_root_pub, key_timestamp_pri, key_timestamp_pub,
+        key_snapshot_pri, key_snapshot_pub, key_targets_pri, key_targets_pub]:
+      tuf.formats.ANYKEY_SCHEMA.check_match(key)
+
+    self.director_repos_dir = os.path.abspath(director_repos_dir)
+
+    self.vehicles = collections.OrderedDict()
+    self.max_resident_vehicles = max_resident_vehicles
+
+    if target_fileinfo_cache is None:
+      target_fileinfo_cache = fileinfo_cache.FileinfoCache()
+    self.fileinfo_cache = target_fileinfo_cache
+
+    if signer is None:
+      signer = signing.LocalSigner([key for key in [key_root_pri,
+          key_timestamp_pri, key_snapshot_pri, key_targets_pri]
+          if key['keyval'].get('private')])
+    self.signer = signer
+
+    # Role name -> (public key, private key). Signing is done by the signer;
+    # the private keys are not used directly.
+    self._role_keys = {
+        'root': (key_root_pub, key_root_pri),
+        'timestamp': (key_timestamp_pub, key_timestamp_pri),
+        'snapshot': (key_snapshot_pub, key_snapshot_pri),
+        'targets': (key_targets_pub, key_targets_pri)}
+
+    # Fileinfo for each distinct image that has been assigned, so that
+    # records assigning the same image share the same fileinfo object.
+    self._fileinfos = dict()
+
+    # VINs of vehicles whose metadata has changed since it was last published.
+    self._unpublished_vins = set()
+
+    self.timestamp_refresh_margin = TIMESTAMP_REFRESH_MARGIN
+    self.timestamp_refresh_spread = TIMESTAMP_REFRESH_SPREAD
+
+    # A heap of (refresh time, VIN) for published vehicles, and the current
+    # refresh time of each VIN in it. Heap entries whose time does not match
+    # _refresh_times are stale and are skipped.
+    self._refresh_queue = []
+    self._refresh_times = dict()
+
+    # See "Thread safety" in the module docstring. _lock guards vehicles,
+    # _pins, _fileinfos, _unpublished_vins, the refresh queue, and the root
+    # metadata. Where both are needed, a vehicle lock is always acquired
+    # before _lock.
+    self._vehicle_locks = [threading.RLock() for i in range(_LOCK_STRIPES)]
+    self._lock = threading.RLock()
+
+    # VIN -> number of operations currently using the record (which may
+    # therefore not be evicted)
+    self._pins = dict()
+
+    self.root_version = 0
+    self._root_metadata_file = None
+    self._root_metadata_fname = None
+    self._load_root_metadata()
+
+
+
+
+
+  def set_role_keys(self, role_keys):
+    """
+    Replaces the keys for the given top-level roles (e.g. to revoke
+    compromised keys), generating new root metadata listing the new keys.
+    Every vehicle's metadata will be re-signed the next time it is written.
+
+    role_keys is a dictionary mapping role names ('root', 'targets',
+    'snapshot', 'timestamp') to 2-tuples (public key, private key). Private
+    keys are given to the signer (see signing.Signer.add_key); if the signer
+    already holds a private key, the public key may be given in its place.
+    """
+    for rolename in role_keys:
+      if rolename not in TOP_LEVEL_ROLES:
+        raise tuf.Error('Unknown top-level role: ' + repr(rolename))
+      key_pub, key_pri = role_keys[rolename]
+      tuf.formats.ANYKEY_SCHEMA.check_match(key_pub)
+      tuf.formats.ANYKEY_SCHEMA.check_match(key_pri)
+
+    for key_pub, key_pri in role_keys.values():
+      if key_pri['keyval'].get('private'):
+        self.signer.add_key(key_pri)
+
+    with self._lock:
+      self._role_keys.update(role_keys)
+
+      # Each record notes the root version its targets metadata was generated
+      # under, so that there is no need to load every record here.
+      self._generate_root_metadata()
+
+    vins = self.get_vins()
+
+    with self._lock:
+      self._unpublished_vins.update(vins)
+
+
+
+
+
+  def add_vehicle(self, vin):
+    """
+    Creates an (empty) record and repository directory for the given vehicle.
+    If the vehicle already has a record, it is replaced.
+
+    Returns the absolute path of the vehicle's repository directory.
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+
+    # Make (relatively) sure that there isn't anything suspect like "../" in
+    # the VIN, since it is used as a directory name.
+    vehicle_dir = uptane.common.scrub_filename(vin, self.director_repos_dir)
+
+    with self._vehicle_locks[hash(vin) % _LOCK_STRIPES]:
+      targets_dir = os.path.join(vehicle_dir, 'targets')
+      if not os.path.exists(targets_dir):
+        os.makedirs(targets_dir)
+
+      record = VehicleMetadataRecord()
+      self._save_record(vin, record)
+
+      with self._lock:
+        self.vehicles.pop(vin, None)
+        self.vehicles[vin] = record
+        self._unpublished_vins.add(vin)
+
+    self._evict()
+
+    return vehicle_dir
+
+
+
+
+
+  def has_vehicle(self, vin):
+    with self._lock:
+      if vin in self.vehicles:
+        return True
+
+    return os.path.exists(self._record_fname(vin))
+
+
+
+
+
+  def get_vins(self):
+    """
+    Returns a list of the VINs of all vehicles that have records. This lists
+    the contents of director_repos_dir.
+    """
+    with self._lock:
+      vins = set(self.vehicles)
+
+    for vin in os.listdir(self.director_repos_dir):
+      if os.path.exists(self._record_fname(vin)):
+        vins.add(vin)
+
+    return sorted(vins)
+
+
+
+
+
+  def get_vehicle_directory(self, vin):
+    """
+    Returns the absolute path of the repository directory for the given
+    vehicle, in which its targets/ and metadata directories reside.
+    """
+    with self._vehicle(vin):
+      return self._vehicle_directory(vin)
+
+
+
+
+
+  def add_target(self, vin, ecu_serial, target_filepath):
+    """
+    Assigns the image at target_filepath, which must be within the vehicle's
+    targets directory, to the ECU with the given serial. The file's length and
+    hashes are calculated now; signed metadata listing it will be produced
+    the next time write_metadata() is called for the vehicle.
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+    uptane.formats.ECU_SERIAL_SCHEMA.check_match(ecu_serial)
+    tuf.formats.PATH_SCHEMA.check_match(target_filepath)
+
+    targets_dir = os.path.join(self._vehicle_directory(vin), 'targets')
+    target_filepath = os.path.abspath(target_filepath)
+    if not target_filepath.startswith(targets_dir + os.sep):
+      raise tuf.Error('Target ' + repr(target_filepath) + ' is not in the '
+          'targets directory for vehicle ' + repr(vin) + ', ' +
+          repr(targets_dir))
+
+    filepath_in_repo = os.path.relpath(target_filepath, targets_dir)
+
+    # Hash the file (unless its fileinfo is cached) without holding the
+    # vehicle's lock.
+    fileinfo = self._share_fileinfo(
+        self.fileinfo_cache.get_fileinfo(target_filepath))
+
+    with self._vehicle(vin) as record:
+      record.targets[filepath_in_repo] = (fileinfo, ecu_serial)
+      record.targets_modified = True
+      record.unsaved = True
+
+      with self._lock:
+        self._unpublished_vins.add(vin)
+
+
+
+
+
+  def clear_targets(self, vin):
+    """
+    Removes all target assignments for the given vehicle.
+    """
+    with self._vehicle(vin) as record:
+      record.targets.clear()
+      record.targets_modified = True
+      record.unsaved = True
+
+      with self._lock:
+        self._unpublished_vins.add(vin)
+
+
+
+
+
+  def get_targets(self, vin):
+    """
+    Returns the targets that would be listed in the vehicle's targets metadata
+    (tuf.formats.FILEDICT_SCHEMA), each with its assigned ECU Serial in
+    'custom'.
+    """
+    filedict = {}
+
+    with self._vehicle(vin) as record:
+      for filepath_in_repo, (fileinfo, ecu_serial) in record.targets.items():
+        filedict[filepath_in_repo] = tuf.formats.make_fileinfo(
+            fileinfo['length'], fileinfo['hashes'],
+            custom={'ecu_serial': ecu_serial})
+
+    return filedict
+
+
+
+
+
+  def write_metadata(self, vin, metadata_dirname=STAGED_METADATA_DIRNAME):
+    """
+    <Purpose>
+      Generates and signs the given vehicle's metadata and writes it to the
+      directory metadata_dirname in the vehicle's repository directory
+      (metadata.staged by default), in format tuf.conf.METADATA_FORMAT.
+
+      New snapshot and timestamp metadata are always produced. New targets
+      metadata is produced only if the vehicle's target assignments have
+      changed (or a role key has been replaced) since targets metadata was
+      last written, or if it would expire before the new timestamp metadata;
+      otherwise, the previously written targets metadata is kept.
+
+    <Returns>
+      The absolute path of the directory written to.
+    """
+    with self._vehicle(vin) as record:
+      metadata_dir, metadata_info = self._write_metadata(
+          vin, record, metadata_dirname)
+      # Save the new versions now rather than on eviction, so that versions
+      # are never reused even if this process does not exit cleanly.
+      self._save_record(vin, record)
+      return metadata_dir
+
+
+
+
+
+  def _write_metadata(self, vin, record, metadata_dirname):
+    """
+    Does the work of write_metadata(), except for saving the record. The
+    vehicle's lock must be held.
+
+    Returns the absolute path of the directory written to and a dictionary
+    describing the metadata written (see VehicleMetadataRecord.live).
+    """
+    vehicle_dir = self._vehicle_directory(vin)
+
+    metadata_dir = os.path.join(vehicle_dir, metadata_dirname)
+    if not os.path.exists(metadata_dir):
+      os.makedirs(metadata_dir)
+
+    extension = '.' + tuf.conf.METADATA_FORMAT
+    now = int(time.time())
+
+    with self._lock:
+      root_version = self.root_version
+      root_metadata_file = self._root_metadata_file
+
+    signed_targets_fname = os.path.join(
+        vehicle_dir, SIGNED_TARGETS_BASENAME + extension)
+
+    # Targets metadata is also re-signed if it would expire before the new
+    # timestamp metadata (see refresh_metadata).
+    if record.targets_modified or record.root_version != root_version \
+        or record.targets_expires <= now + TIMESTAMP_EXPIRATION \
+        or not os.path.exists(signed_targets_fname):
+      record.targets_version += 1
+      record.targets_expires = now + TARGETS_EXPIRATION
+      targets_metadata_file = self._sign_and_encode('targets',
+          tuf.formats.TargetsFile.make_metadata(
+          record.targets_version, _format_expiration(record.targets_expires),
+          self.get_targets(vin)))
+      _write_file(signed_targets_fname, targets_metadata_file)
+      record.targets_modified = False
+      record.root_version = root_version
+
+    else:
+      with open(signed_targets_fname, 'rb') as fobj:
+        targets_metadata_file = fobj.read()
+
+    _write_file(
+        os.path.join(metadata_dir, 'targets' + extension),
+        targets_metadata_file)
+
+    _write_file(
+        os.path.join(metadata_dir, 'root' + extension),
+        root_metadata_file)
+
+    record.snapshot_version += 1
+    snapshot_expires = now + SNAPSHOT_EXPIRATION
+    snapshot_metadata_file = self._make_snapshot_metadata(
+        record.snapshot_version, snapshot_expires,
+        root_metadata_file, root_version,
+        targets_metadata_file, record.targets_version)
+    _write_file(
+        os.path.join(metadata_dir, 'snapshot' + extension),
+        snapshot_metadata_file)
+
+    record.timestamp_version += 1
+    timestamp_expires = now + TIMESTAMP_EXPIRATION
+    timestamp_metadata_file = self._make_timestamp_metadata(
+        record.timestamp_version, timestamp_expires,
+        snapshot_metadata_file, record.snapshot_version)
+    _write_file(
+        os.path.join(metadata_dir, 'timestamp' + extension),
+        timestamp_metadata_file)
+
+    record.unsaved = True
+
+    return metadata_dir, {
+        'root_version': root_version,
+        'targets_version': record.targets_version,
+        'snapshot_version': record.snapshot_version,
+        'targets_expires': record.targets_expires,
+        'snapshot_expires': snapshot_expires,
+        'timestamp_expires': timestamp_expires}
+
+
+
+
+
+  def publish_metadata(self, vin):
+    """
+    <Purpose>
+      Generates the given vehicle's metadata and makes it live: it is written
+      to a new versioned directory in the vehicle's repository directory, and
+      the live metadata symlink is then atomically switched to that directory.
+      See the module docstring.
+
+    <Returns>
+      The absolute path of the new versioned directory.
+    """
+    with self._vehicle(vin) as record:
+      return self._publish_metadata(vin, record)
+
+
+
+
+
+  def _publish_metadata(self, vin, record):
+    """
+    Does the work of publish_metadata(). The vehicle's lock must be held.
+    """
+    # _write_metadata() increments the timestamp version, which names the
+    # directory.
+    versioned_dirname = self._new_versioned_dirname(vin, record)
+    metadata_dir, metadata_info = self._write_metadata(
+        vin, record, versioned_dirname)
+
+    self._make_live(vin, record, versioned_dirname, metadata_info)
+
+    with self._lock:
+      self._unpublished_vins.discard(vin)
+
+    return metadata_dir
+
+
+
+
+
+  def refresh_metadata(self, vin):
+    """
+    <Purpose>
+      Re-signs the given vehicle's published timestamp metadata with a new
+      expiration time, and its published snapshot metadata too if that would
+      otherwise expire before the new timestamp metadata. Nothing else is
+      regenerated, and changes to the vehicle's target assignments since its
+      metadata was last published are not published. The result is made live
+      as by publish_metadata(), with the unchanged files hard-linked (or, if
+      that is not possible, copied) into the new versioned directory.
+
+      If the published targets metadata would expire before the new timestamp
+      metadata, or role keys have been replaced since the vehicle's metadata
+      was published, its metadata is instead published in full, as by
+      publish_metadata().
+
+    <Returns>
+      The absolute path of the new versioned directory, or None if the
+      vehicle's metadata has never been published.
+    """
+    with self._vehicle(vin) as record:
+      return self._refresh_metadata(vin, record)
+
+
+
+
+
+  def _refresh_metadata(self, vin, record):
+    """
+    Does the work of refresh_metadata(). The vehicle's lock must be held.
+    """
+    if record.live is None:
+      return None
+
+    now = int(time.time())
+    timestamp_expires = now + TIMESTAMP_EXPIRATION
+
+    with self._lock:
+      root_version = self.root_version
+
+    if record.live['targets_expires'] <= timestamp_expires:
+      log.info('Targets metadata for vehicle ' + repr(vin) + ' is about to '
+          'expire; publishing all of its metadata.')
+      return self._publish_metadata(vin, record)
+
+    elif record.live['root_version'] != root_version:
+      # Role keys have been replaced, so the published metadata cannot simply
+      # be re-signed.
+      log.info('Root metadata for vehicle ' + repr(vin) + ' has changed; '
+          'publishing all of its metadata.')
+      return self._publish_metadata(vin, record)
+
+    vehicle_dir = self._vehicle_directory(vin)
+    live_dir = os.path.join(vehicle_dir, LIVE_METADATA_DIRNAME)
+    extension = '.' + tuf.conf.METADATA_FORMAT
+    metadata_info = dict(record.live)
+
+    versioned_dirname = self._new_versioned_dirname(vin, record)
+    metadata_dir = os.path.join(vehicle_dir, versioned_dirname)
+    os.makedirs(metadata_dir)
+
+    resign_snapshot = metadata_info['snapshot_expires'] <= timestamp_expires
+
+    for rolename in ['root', 'targets', 'snapshot']:
+      if rolename == 'snapshot' and resign_snapshot:
+        continue
+      _link_or_copy(os.path.join(live_dir, rolename + extension),
+          os.path.join(metadata_dir, rolename + extension))
+
+    if resign_snapshot:
+      with open(os.path.join(live_dir, 'root' + extension), 'rb') as fobj:
+        root_metadata_file = fobj.read()
+      with open(os.path.join(live_dir, 'targets' + extension), 'rb') as fobj:
+        targets_metadata_file = fobj.read()
+
+      record.snapshot_version += 1
+      metadata_info['snapshot_version'] = record.snapshot_version
+      metadata_info['snapshot_expires'] = now + SNAPSHOT_EXPIRATION
+      snapshot_metadata_file = self._make_snapshot_metadata(
+          metadata_info['snapshot_version'], metadata_info['snapshot_expires'],
+          root_metadata_file, metadata_info['root_version'],
+          targets_metadata_file, metadata_info['targets_version'])
+      _write_file(
+          os.path.join(metadata_dir, 'snapshot' + extension),
+          snapshot_metadata_file)
+
+    else:
+      with open(os.path.join(live_dir, 'snapshot' + extension), 'rb') as fobj:
+        snapshot_metadata_file = fobj.read()
+
+    record.timestamp_version += 1
+    metadata_info['timestamp_expires'] = timestamp_expires
+    timestamp_metadata_file = self._make_timestamp_metadata(
+        record.timestamp_version, timestamp_expires,
+        snapshot_metadata_file, metadata_info['snapshot_version'])
+    _write_file(
+        os.path.join(metadata_dir, 'timestamp' + extension),
+        timestamp_metadata_file)
+
+    self._make_live(vin, record, versioned_dirname, metadata_info)
+
+    return metadata_dir
+
+
+
+
+
+  def _new_versioned_dirname(self, vin, record):
+    """
+    Returns the name of the versioned directory to which the vehicle's next
+    published metadata is to be written, named for its next timestamp
+    version. If an earlier attempt that failed part way (e.g. before this
+    process restarted) left a directory of that name, it is removed: it may
+    hold hard links to the live metadata files, which must not be written
+    through. It cannot be live, since the record is saved before metadata is
+    made live. The vehicle's lock must be held.
+    """
+    versioned_dirname = \
+        LIVE_METADATA_DIRNAME + '.' + str(record.timestamp_version + 1)
+
+    metadata_dir = os.path.join(self._vehicle_directory(vin), versioned_dirname)
+    if os.path.exists(metadata_dir):
+      shutil.rmtree(metadata_dir)
+
+    return versioned_dirname
+
+
+
+
+
+  def _make_live(self, vin, record, versioned_dirname, metadata_info):
+    """
+    Atomically switches the vehicle's live metadata symlink to the given
+    versioned directory, which holds the metadata described by metadata_info
+    (see VehicleMetadataRecord.live), removes versioned directories no
+    longer needed, and schedules the metadata to be refreshed. The record is
+    saved first, so that versions are never reused even if this process does
+    not exit cleanly. The vehicle's lock must be held.
+    """
+    vehicle_dir = self._vehicle_directory(vin)
+
+    record.live = metadata_info
+    self._save_record(vin, record)
+
+    live_link = os.path.join(vehicle_dir, LIVE_METADATA_DIRNAME)
+    temp_link = os.path.join(vehicle_dir, LIVE_METADATA_DIRNAME + '.livetemp')
+
+    # This shouldn't exist, but just in case something was interrupted, remove
+    # it.
+    if os.path.lexists(temp_link):
+      os.remove(temp_link)
+
+    # A relative link, so that the repository directory can be moved.
+    os.symlink(versioned_dirname, temp_link)
+
+    previous_dirname = None
+    if os.path.islink(live_link):
+      previous_dirname = os.readlink(live_link)
+
+    elif os.path.isdir(live_link):
+      # Live metadata written as a plain directory (not by this module), which
+      # a symlink cannot atomically replace. Move it aside only now, so that
+      # it is missing just until the rename below, and keep it as though it
+      # were the previously published versioned directory.
+      previous_dirname = LIVE_METADATA_DIRNAME + '.0'
+      previous_dir = os.path.join(vehicle_dir, previous_dirname)
+      if os.path.exists(previous_dir):
+        shutil.rmtree(previous_dir)
+      os.rename(live_link, previous_dir)
+
+    # Atomically replace the live metadata.
+    os.rename(temp_link, live_link)
+
+    # Remove old versioned directories, keeping the one just replaced for any
+    # client part way through an update from it.
+    for dirname in os.listdir(vehicle_dir):
+      if dirname.startswith(LIVE_METADATA_DIRNAME + '.') and \
+          dirname[len(LIVE_METADATA_DIRNAME) + 1:].isdigit() and \
+          dirname not in (versioned_dirname, previous_dirname):
+        shutil.rmtree(os.path.join(vehicle_dir, dirname))
+
+    self._schedule_refresh(vin, metadata_info['timestamp_expires'])
+
+
+
+
+
+  def publish(self, threads=1):
+    """
+    Publishes (see publish_metadata) the metadata of every vehicle whose
+    target assignments have changed, or which has been added, since its
+    metadata was last published. Work done is proportional to the number of
+    such vehicles, not to the size of the fleet.
+
+    If threads is more than 1, vehicles are published concurrently by a pool
+    of that many threads, so that a signer that batches requests (e.g. a
+    signing.ProcessPoolSigner) can sign for many vehicles at once. Stops at
+    (and raises) the first error.
+
+    Returns a sorted list of the VINs published.
+    """
+    with self._lock:
+      published = sorted(self._unpublished_vins)
+
+    _map_in_threads(self.publish_metadata, published, threads)
+
+    return published
+
+
+
+
+
+  def get_unpublished_vins(self):
+    """
+    Returns a sorted list of the VINs of vehicles whose metadata has changed
+    since it was last published.
+    """
+    with self._lock:
+      return sorted(self._unpublished_vins)
+
+
+
+
+
+  def refresh_due_metadata(self, max_vehicles=None, threads=1):
+    """
+    <Purpose>
+      Refreshes (see refresh_metadata) the metadata of published vehicles
+      that are due to be refreshed, soonest-expiring first: those whose
+      timestamp metadata expires within the next timestamp_refresh_margin
+      seconds, plus (at random) timestamp_refresh_spread seconds.
+
+      If a vehicle cannot be refreshed, the error is logged and it is tried
+      again after REFRESH_RETRY_DELAY seconds.
+
+    <Arguments>
+      max_vehicles
+        If given, at most this many vehicles are refreshed; the others remain
+        due.
+
+      threads
+        The number of threads with which to refresh vehicles concurrently, as
+        in publish().
+
+    <Returns>
+      A list of the VINs of the vehicles refreshed, in the order refreshed.
+    """
+    now = time.time()
+    due_vins = []
+
+    with self._lock:
+      while self._refresh_queue and (
+          max_vehicles is None or len(due_vins) < max_vehicles):
+        refresh_time, vin = self._refresh_queue[0]
+
+        if self._refresh_times.get(vin) != refresh_time:
+          heapq.heappop(self._refresh_queue) # stale
+          continue
+
+        elif refresh_time > now:
+          break
+
+        heapq.heappop(self._refresh_queue)
+        del self._refresh_times[vin]
+        due_vins.append(vin)
+
+    def refresh(vin):
+      try:
+        return self.refresh_metadata(vin) is not None
+
+      except uptane.UnknownVehicle:
+        log.info('Not refreshing metadata for vehicle ' + repr(vin) + ', '
+            'which is no longer known.')
+
+      # Anything else (e.g. a signing service's own errors, or a damaged
+      # record) must not stop the vehicle from being tried again, or stop
+      # other vehicles from being refreshed.
+      except Exception as e:
+        log.error('Unable to refresh metadata for vehicle ' + repr(vin) +
+            '; will try again later. Error: ' + repr(e))
+        with self._lock:
+          # Unless it has been published (and so rescheduled) in the meantime
+          if vin not in self._refresh_times:
+            self._push_refresh(vin, now + REFRESH_RETRY_DELAY)
+
+      return False
+
+    refreshed = _map_in_threads(refresh, due_vins, threads)
+
+    return [vin for vin, was_refreshed in zip(due_vins, refreshed)
+        if was_refreshed]
+
+
+
+
+
+  def get_next_refresh_time(self):
+    """
+    Returns the time (seconds since the epoch) at which the next vehicle is
+    due to be refreshed (see refresh_due_metadata), or None if no vehicles'
+    metadata has been published.
+    """
+    with self._lock:
+      while self._refresh_queue:
+        refresh_time, vin = self._refresh_queue[0]
+        if self._refresh_times.get(vin) == refresh_time:
+          return refresh_time
+        heapq.heappop(self._refresh_queue) # stale
+
+    return None
+
+
+
+
+
+  def schedule_refreshes(self):
+    """
+    Schedules the refreshing of the metadata of every published vehicle with
+    a record on disk, e.g. those published before this process started.
+    Vehicles published by this generator are scheduled as they are
+    published. Each record is read, but records are not kept in memory.
+    """
+    for vin in self.get_vins():
+      with self._vehicle_locks[hash(vin) % _LOCK_STRIPES]:
+        with self._lock:
+          if vin in self._refresh_times:
+            continue
+          record = self.vehicles.get(vin)
+
+        if record is None:
+          try:
+            record = self._load_record(vin)
+          except uptane.UnknownVehicle:
+            continue
+          except Exception as e:
+            # e.g. a damaged record. Keep trying, in case it is repaired.
+            log.error('Unable to read the record of vehicle ' + repr(vin) +
+                '; will try again later. Error: ' + repr(e))
+            with self._lock:
+              self._push_refresh(vin, time.time() + REFRESH_RETRY_DELAY)
+            continue
+
+        if record.live is not None:
+          self._schedule_refresh(vin, record.live['timestamp_expires'])
+
+
+
+
+
+  def flush(self):
+    """
+    Saves to disk every record in memory that has changed since it was last
+    saved. Records are otherwise saved when they are evicted from memory.
+    """
+    with self._lock:
+      vins = list(self.vehicles)
+
+    for vin in vins:
+      # While the vehicle's lock is held, its record cannot be evicted (and
+      # saved) by another thread, nor modified.
+      with self._vehicle_locks[hash(vin) % _LOCK_STRIPES]:
+        with self._lock:
+          record = self.vehicles.get(vin)
+        if record is not None and record.unsaved:
+          self._save_record(vin, record)
+
+
+
+
+
+  @contextlib.contextmanager
+  def _vehicle(self, vin):
+    """
+    Holds the lock for the given vehicle while the with-block runs, yielding
+    its record. The record is loaded from disk if it is not in memory, marked
+    as the most recently used, and not evicted until the with-block exits.
+    Raises uptane.UnknownVehicle if the vehicle has no record.
+    """
+    with self._vehicle_locks[hash(vin) % _LOCK_STRIPES]:
+
+      with self._lock:
+        record = self.vehicles.pop(vin, None)
+
+      if record is None:
+        # Records are only saved and evicted while this lock is held, so the
+        # saved record is up to date.
+        record = self._load_record(vin)
+
+      with self._lock:
+        self.vehicles[vin] = record
+        self._pins[vin] = self._pins.get(vin, 0) + 1
+
+      try:
+        yield record
+
+      finally:
+        with self._lock:
+          self._pins[vin] -= 1
+          if not self._pins[vin]:
+            del self._pins[vin]
+
+        self._evict()
+
+
+
+
+
+  def _evict(self):
+    """
+    Evicts the least recently used records that are not in use (saving those
+    that have changed) until there are no more than max_resident_vehicles.
+
+    Each record is saved and evicted while its vehicle's lock is held, so that
+    it is neither modified nor loaded again from disk in the meantime, but
+    without holding _lock, which must not be held by the caller. Records whose
+    vehicle locks are held by other threads are skipped, to be evicted later.
+    """
+    if self.max_resident_vehicles is None:
+      return
+
+    with self._lock:
+      excess = len(self.vehicles) - self.max_resident_vehicles
+      if excess <= 0:
+        return
+      # Least recently used first
+      candidate_vins = list(itertools.islice(
+          (vin for vin in self.vehicles if vin not in self._pins), excess))
+
+    for vin in candidate_vins:
+      vehicle_lock = self._vehicle_locks[hash(vin) % _LOCK_STRIPES]
+
+      # Don't wait, as the caller may hold another vehicle's lock.
+      if not vehicle_lock.acquire(False):
+        continue
+
+      try:
+        with self._lock:
+          record = self.vehicles.get(vin)
+          if record is None or vin in self._pins:
+            continue
+
+        if record.unsaved:
+          self._save_record(vin, record)
+
+        with self._lock:
+          if vin not in self._pins and self.vehicles.get(vin) is record:
+            del self.vehicles[vin]
+
+      finally:
+        vehicle_lock.release()
+
+
+
+
+
+  def _schedule_refresh(self, vin, timestamp_expires):
+    """
+    Schedules the vehicle's metadata, whose published timestamp metadata
+    expires at the given time, to be refreshed. Replaces any earlier schedule.
+    """
+    refresh_time = timestamp_expires - self.timestamp_refresh_margin - \
+        random.uniform(0, self.timestamp_refresh_spread)
+
+    with self._lock:
+      self._push_refresh(vin, refresh_time)
+
+
+
+
+
+  def _push_refresh(self, vin, refresh_time):
+    """
+    Adds the vehicle to the refresh queue at the given time, making any
+    existing entry stale. _lock must be held.
+    """
+    self._refresh_times[vin] = refresh_time
+    heapq.heappush(self._refresh_queue, (refresh_time, vin))
+
+    # Don't let stale entries pile up (e.g. when vehicles are published
+    # repeatedly).
+    if len(self._refresh_queue) > 2 * len(self._refresh_times) + 1024:
+      self._refresh_queue = [(refresh_time, vin) for vin, refresh_time
+          in self._refresh_times.items()]
+      heapq.heapify(self._refresh_queue)
+
+
+
+
+
+  def _vehicle_directory(self, vin):
+    return os.path.join(self.director_repos_dir, vin)
+
+
+
+
+
+  def _record_fname(self, vin):
+    return os.path.join(self.director_repos_dir, vin, RECORD_FNAME)
+
+
+
+
+
+  def _save_record(self, vin, record):
+    """
+    Writes the given record to the vehicle's repository directory. The file
+    is replaced atomically, so a record is never left partially written. The
+    vehicle's lock must be held.
+    """
+    targets = {}
+    for filepath_in_repo, (fileinfo, ecu_serial) in record.targets.items():
+      targets[filepath_in_repo] = {'length': fileinfo['length'],
+          'hashes': fileinfo['hashes'], 'ecu_serial': ecu_serial}
+
+    fname = self._record_fname(vin)
+    # A temporary file of its own for each writer, in case another process
+    # saves the same record.
+    temp_fname = fname + '.' + str(os.getpid()) + '.' + \
+        str(threading.current_thread().ident) + '.tmp'
+    _write_file(temp_fname, json.dumps({
+        'targets': targets,
+        'targets_version': record.targets_version,
+        'snapshot_version': record.snapshot_version,
+        'timestamp_version': record.timestamp_version,
+        'targets_modified': record.targets_modified,
+        'root_version': record.root_version,
+        'targets_expires': record.targets_expires,
+        'live': record.live}, sort_keys=True).encode('utf-8'))
+    os.rename(temp_fname, fname)
+
+    record.unsaved = False
+
+
+
+
+
+  def _load_record(self, vin):
+    """
+    Reads the given vehicle's record from its repository directory.
+    Raises uptane.UnknownVehicle if there is none.
+    """
+    uptane.formats.VIN_SCHEMA.check_match(vin)
+
+    # The VIN names a directory; make sure it cannot point elsewhere.
+    try:
+      uptane.common.scrub_filename(vin, self.director_repos_dir)
+    except (AssertionError, ValueError):
+      raise uptane.UnknownVehicle('The VIN provided, ' + repr(vin) + ' is not '
+          'that of a vehicle known to this Director.')
+
+    try:
+      with open(self._record_fname(vin), 'rb') as fobj:
+        saved = json.loads(fobj.read().decode('utf-8'))
+    except (IOError, OSError):
+      raise uptane.UnknownVehicle('The VIN provided, ' + repr(vin) + ' is not '
+          'that of a vehicle known to this Director.')
+
+    record = VehicleMetadataRecord()
+    for filepath_in_repo, target in saved['targets'].items():
+      fileinfo = tuf.formats.make_fileinfo(target['length'], target['hashes'])
+      record.targets[filepath_in_repo] = (
+          self._share_fileinfo(fileinfo), target['ecu_serial'])
+    record.targets_version = saved['targets_version']
+    record.snapshot_version = saved['snapshot_version']
+    record.timestamp_version = saved['timestamp_version']
+    record.targets_modified = saved['targets_modified']
+    record.root_version = saved['root_version']
+    record.targets_expires = saved.get('targets_expires', 0)
+    record.live = saved.get('live')
+    record.unsaved = False
+
+    return record
+
+
+
+
+
+  def _share_fileinfo(self, fileinfo):
+    """
+    Returns the fileinfo object already in use for an image with the same
+    length and hashes as fileinfo, or fileinfo itself if there is none.
+    """
+    fileinfo_key = (
+        fileinfo['length'], tuple(sorted(fileinfo['hashes'].items())))
+
+    with self._lock:
+      return self._fileinfos.setdefault(fileinfo_key, fileinfo)
+
+
+
+
+
+  def _load_root_metadata(self):
+    """
+    Loads the root metadata saved in director_repos_dir, if it lists the
+    current role keys, is in format tuf.conf.METADATA_FORMAT, and will not
+    expire within TARGETS_EXPIRATION. Otherwise, generates new root metadata
+    with the version following the saved one.
+    """
+    record_fname = os.path.join(self.director_repos_dir, ROOT_RECORD_FNAME)
+
+    try:
+      with open(record_fname, 'rb') as fobj:
+        saved = json.loads(fobj.read().decode('utf-8'))
+    except (IOError, OSError):
+      saved = None
+
+    # A record that cannot be parsed is an error rather than a reason to start
+    # again from version 1, which would reuse versions clients have seen.
+    if saved is not None:
+      self.root_version = saved['version']
+      self._root_metadata_fname = saved['fname']
+
+      if saved['keys_digest'] == self._role_keys_digest() and \
+          saved['format'] == tuf.conf.METADATA_FORMAT and \
+          saved['expires'] > time.time() + TARGETS_EXPIRATION:
+        try:
+          with open(os.path.join(
+              self.director_repos_dir, saved['fname']), 'rb') as fobj:
+            self._root_metadata_file = fobj.read()
+          return
+        except (IOError, OSError):
+          log.warning('Saved root metadata ' + repr(saved['fname']) + ' '
+              'could not be read; generating new root metadata.')
+
+    self._generate_root_metadata()
+
+
+
+
+
+  def _role_keys_digest(self):
+    """
+    Returns a hex digest identifying the public keys of the top-level roles.
+    """
+    role_keys = {}
+    for rolename, (key_pub, key_pri) in self._role_keys.items():
+      role_keys[rolename] = [key_pub['keytype'], key_pub['keyval']['public']]
+
+    return hashlib.sha256(
+        json.dumps(role_keys, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+
+
+
+  def _generate_root_metadata(self):
+    """
+    Generates, signs, and encodes new root metadata listing the current role
+    keys, incrementing root_version, and saves it in director_repos_dir. The
+    result is shared by every vehicle.
+    """
+    keydict = {}
+    roledict = {}
+
+    for rolename in TOP_LEVEL_ROLES:
+      key_pub = self._role_keys[rolename][0]
+      keydict[key_pub['keyid']] = tuf.keys.format_keyval_to_metadata(
+          key_pub['keytype'], key_pub['keyval'], private=False)
+      roledict[rolename] = tuf.formats.make_role_metadata(
+          [key_pub['keyid']], 1)
+
+    root_version = self.root_version + 1
+    expires = int(time.time()) + ROOT_EXPIRATION
+    root_metadata_file = self._sign_and_encode('root',
+        tuf.formats.RootFile.make_metadata(
+        root_version, _format_expiration(expires),
+        keydict, roledict,
+        False))
+
+    if not os.path.exists(self.director_repos_dir):
+      os.makedirs(self.director_repos_dir)
+
+    fname = SIGNED_ROOT_BASENAME + '.' + str(root_version) + '.' + \
+        tuf.conf.METADATA_FORMAT
+    _write_file(os.path.join(self.director_repos_dir, fname),
+        root_metadata_file)
+
+    # Replacing the record atomically is what makes the new root metadata
+    # current, so that if this is interrupted, the saved record still names
+    # the previous (intact) root metadata.
+    record_fname = os.path.join(self.director_repos_dir, ROOT_RECORD_FNAME)
+    _write_file(record_fname + '.tmp', json.dumps({
+        'version': root_version,
+        'fname': fname,
+        'format': tuf.conf.METADATA_FORMAT,
+        'expires': expires,
+        'keys_digest': self._role_keys_digest()},
+        sort_keys=True).encode('utf-8'))
+    os.rename(record_fname + '.tmp', record_fname)
+
+    previous_fname = self._root_metadata_fname
+    if previous_fname is not None and previous_fname != fname and \
+        os.path.exists(os.path.join(self.director_repos_dir, previous_fname)):
+      os.remove(os.path.join(self.director_repos_dir, previous_fname))
+
+    self.root_version = root_version
+    self._root_metadata_file = root_metadata_file
+    self._root_metadata_fname = fname
+
+
+
+
+
+  def _make_snapshot_metadata(self, version, expires, root_metadata_file,
+      root_version, targets_metadata_file, targets_version):
+    """
+    Returns signed, encoded snapshot metadata listing the given encoded root
+    and targets metadata files.
+    """
+    extension = '.' + tuf.conf.METADATA_FORMAT
+
+    return self._sign_and_encode('snapshot',
+        tuf.formats.SnapshotFile.make_metadata(
+        version, _format_expiration(expires), {
+        'root' + extension: _make_metadata_fileinfo(
+            root_metadata_file, root_version),
+        'targets' + extension: _make_metadata_fileinfo(
+            targets_metadata_file, targets_version)}))
+
+
+
+
+
+  def _make_timestamp_metadata(self, version, expires, snapshot_metadata_file,
+      snapshot_version):
+    """
+    Returns signed, encoded timestamp metadata listing the given encoded
+    snapshot metadata file.
+    """
+    extension = '.' + tuf.conf.METADATA_FORMAT
+
+    return self._sign_and_encode('timestamp',
+        tuf.formats.TimestampFile.make_metadata(
+        version, _format_expiration(expires), {
+        'snapshot' + extension: _make_metadata_fileinfo(
+            snapshot_metadata_file, snapshot_version)}))
+
+
+
+
+
+  def _sign_and_encode(self, rolename, metadata):
+    """
+    Has the signer sign the given role metadata with that role's key and
+    returns it as it should be written to a file, in format
+    tuf.conf.METADATA_FORMAT.
+    """
+    signable = tuf.formats.make_signable(metadata)
+    keyid = self._role_keys[rolename][0]['keyid']
+
+    if tuf.conf.METADATA_FORMAT == 'der':
+      # The DER encoding of TUF role metadata is provided by TUF, as it is what
+      # TUF clients expect to read. The signature is over the hash of the DER
+      # encoding of 'signed', as when TUF signs it itself.
+      import tuf.asn1_codec as tuf_asn1_codec
+      der_signed = tuf_asn1_codec.convert_signed_metadata_to_der(
+          signable, only_signed=True)
+      signable['signatures'].append(
+          self.signer.sign(keyid, hashlib.sha256(der_signed).digest()))
+      return tuf_asn1_codec.convert_signed_metadata_to_der(signable)
+
+    signable['signatures'].append(self.signer.sign(keyid, signable['signed']))
+
+    # Same layout as that written by tuf.repository_lib.
+    return json.dumps(signable, indent=1, separators=(',', ': '),
+        sort_keys=True).encode('utf-8')
+
+
+
+
+
+class MetadataRefresher(object):
+  """
+  <Purpose>
+    Runs a background thread that keeps published vehicle metadata from
+    expiring, calling VehicleMetadataGenerator.refresh_due_metadata() as
+    vehicles become due. At most batch_size vehicles are refreshed at a time,
+    with at least batch_interval seconds between batches, so that a backlog
+    (e.g. after the Director has been down) is worked through gradually
+    rather than all at once.
+
+  <Fields>
+
+    generator
+      The VehicleMetadataGenerator whose vehicles are refreshed.
+
+    batch_size
+      The maximum number of vehicles refreshed in one batch.
+
+    batch_interval
+      The number of seconds to wait between batches while vehicles are due.
+
+    max_sleep
+      The maximum number of seconds to wait before checking again for due
+      vehicles, so that vehicles published in the meantime are noticed.
+
+    threads
+      The number of threads with which each batch is refreshed (see
+      VehicleMetadataGenerator.refresh_due_metadata).
+  """
+
+  def __init__(self, generator, batch_size=100, batch_interval=1,
+      max_sleep=60, threads=1):
+
+    tuf.formats.LENGTH_SCHEMA.check_match(batch_size)
+    if batch_size < 1:
+      raise tuf.FormatError('batch_size must be at least 1.')
+
+    self.generator = generator
+    self.batch_size = batch_size
+    self.batch_interval = batch_interval
+    self.max_sleep = max_sleep
+    self.threads = threads
+
+    self._stop_event = threading.Event()
+    self._thread = None
+
+
+
+
+
+  def start(self):
+    """
+    Schedules the refreshing of every published vehicle (see
+    VehicleMetadataGenerator.schedule_refreshes) and starts the refresh
+    thread.
+    """
+    if self._thread is not None:
+      raise uptane.Error('MetadataRefresher is already running.')
+
+    self.generator.schedule_refreshes()
+
+    self._stop_event.clear()
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+
+
+
+
+  def stop(self):
+    """
+    Stops the refresh thread, waiting for any batch in progress to finish.
+    """
+    if self._thread is None:
+      return
+
+    self._stop_event.set()
+    self._thread.join()
+    self._thread = None
+
+
+
+
+
+  def _run(self):
+    while not self._stop_event.is_set():
+
+      # If this thread stopped, no vehicle's metadata would be refreshed again,
+      # so an unexpected error is logged, and tried again after a while.
+      try:
+        refreshed_vins = self.generator.refresh_due_metadata(
+            self.batch_size, self.threads)
+        if refreshed_vins:
+          log.debug('Refreshed metadata for ' + str(len(refreshed_vins)) +
+              ' vehicles.')
+
+        next_refresh_time = self.generator.get_next_refresh_time()
+        now = time.time()
+
+        if next_refresh_time is None:
+          delay = self.max_sleep
+        elif next_refresh_time <= now:
+          delay = self.batch_interval
+        else:
+          delay = min(next_refresh_time - now, self.max_sleep)
+
+      except Exception as e:
+        log.error('Unable to refresh vehicle metadata; will try again later. '
+            'Error: ' + repr(e))
+        delay = self.max_sleep
+
+      self._stop_event.wait(delay)
+
+
+
+
+
+def _format_expiration(expires):
+  """
+  Returns the given time (seconds since the epoch) as an ISO8601 time
+  (tuf.formats.ISO8601_DATETIME_SCHEMA).
+  """
+  return tuf.formats.unix_timestamp_to_datetime(
+      int(expires)).isoformat() + 'Z'
+
+
+
+
+
+def _make_metadata_fileinfo(metadata_file, version):
+  """
+  Returns the fileinfo, with version, of the given encoded metadata file, for
+  listing in snapshot or timestamp metadata.
+  """
+  hashes = {}
+  for algorithm in tuf.conf.REPOSITORY_HASH_ALGORITHMS:
+    hashes[algorithm] = hashlib.new(algorithm, metadata_file).hexdigest()
+
+  fileinfo = tuf.formats.make_fileinfo(len(metadata_file), hashes)
+  fileinfo['version'] = version
+
+  return fileinfo
+
+
+
+
+
+def _write_file(fname, data):
+  with open(fname, 'wb') as fobj:
+    fobj.write(data)
+
+
+
+
+
+def _map_in_threads(function, items, threads):
+  """
+  Returns [function(item) for item in items], calling function from a pool of
+  the given number of threads if that is more than 1.
+  """
+  tuf.formats.LENGTH_SCHEMA.check_match(threads)
+
+  if threads <= 1 or len(items) <= 1:
+    return [function(item) for item in items]
+
+  pool = multiprocessing.pool.ThreadPool(min(threads, len(items)))
+  try:
+    return pool.map(function, items)
+
+  finally:
+    pool.close()
+    pool.join()
+
+
+
+
+
+def _link_or_copy(source_fname, destination_fname):
+  """
+  Hard-links source_fname to destination_fname if possible, and otherwise
+  copies it.
+  """
+  try:
+    os.link(source_fname, destination_fname)
+  except (OSError, AttributeError): # e.g. across filesystems, or on Windows
+    shutil.copy(source_fname, destination_fname)